@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark do envio de logs do terminal para o WebSocket.
+
+Compara o modelo antigo do SafeLogCapture (uma thread e um event loop novos
+por escrita) com o LogPump (fila limitada e um único consumidor no event
+loop), simulando o verbose do CrewAI escrito por uma thread da crew.
+Mede linhas/s até a última linha ser entregue e o tempo de CPU do processo.
+
+Também compara o volume enviado pelo WebSocket: um frame JSON por linha
+(como o runner fazia) contra os frames do LogPump, sem e com compressão
+permessage-deflate (DEFLATE com contexto compartilhado entre frames).
+
+Uso:
+    python benchmark_logs.py --linhas 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.log_pump import LogPump
+
+
+class BroadcastFalso:
+    """Conta as linhas entregues, como o ConnectionManager com um cliente conectado"""
+
+    def __init__(self):
+        self.linhas = 0
+        self.frames = 0
+        self.mensagens = []
+        self.trava = threading.Lock()
+
+    async def broadcast(self, mensagem: dict, topicos=None):
+        with self.trava:
+            self.linhas += mensagem["data"]["message"].count("\n")
+            self.frames += 1
+            self.mensagens.append(mensagem)
+
+
+LINHAS_VERBOSE = [
+    "# Agent: Executor de Consultas",
+    "## Thought: Preciso agregar o valor total das notas por UF do emitente",
+    "## Using tool: pandas_query_tool",
+    "## Tool Input: {\"operacao\": \"groupby\", \"colunas\": [\"UF EMITENTE\"], \"valor\": \"VALOR NOTA FISCAL\"}",
+    "## Tool Output: UF EMITENTE  VALOR NOTA FISCAL",
+    "SP    1234567.89",
+    "MG     345678.90",
+]
+
+
+def escrever(destino, linhas: int) -> None:
+    for indice in range(linhas):
+        destino(f"{LINHAS_VERBOSE[indice % len(LINHAS_VERBOSE)]} [{indice}]\n")
+
+
+def bytes_frames(frames) -> tuple:
+    """Bytes em JSON e com permessage-deflate (contexto mantido entre frames)"""
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    bruto = comprimido = 0
+    for frame in frames:
+        texto = json.dumps(frame, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        bruto += len(texto)
+        comprimido += len(compressor.compress(texto) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return bruto, comprimido
+
+
+def frames_por_linha(linhas: int) -> list:
+    """Um frame por linha, com timestamp, como o runner enviava"""
+    frames = []
+    escrever(lambda texto: frames.append({
+        "type": "agent_log",
+        "data": {"message": texto, "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3], "raw_terminal": True}
+    }), linhas)
+    return frames
+
+
+async def frames_log_pump(linhas: int) -> list:
+    """Frames do LogPump para um verbose escrito em rajadas ao longo da execução"""
+    envio = BroadcastFalso()
+    pump = LogPump(envio.broadcast, max_linhas=linhas)
+    pump.iniciar()
+    for inicio in range(0, linhas, 100):
+        escrever(pump.publicar, min(100, linhas - inicio))
+        await asyncio.sleep(0.01)
+    await pump.encerrar()
+    return envio.mensagens
+
+
+async def medir_thread_por_escrita(linhas: int):
+    """Modelo antigo: cada write() cria uma thread com um event loop próprio"""
+    envio = BroadcastFalso()
+
+    def write(texto):
+        def send_in_thread():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(envio.broadcast({"data": {"message": texto}}))
+            loop.close()
+        threading.Thread(target=send_in_thread, daemon=True).start()
+
+    inicio, cpu = time.perf_counter(), time.process_time()
+    await asyncio.to_thread(escrever, write, linhas)
+    while envio.linhas < linhas:
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - inicio, time.process_time() - cpu, envio.frames
+
+
+async def medir_log_pump(linhas: int):
+    envio = BroadcastFalso()
+    # Fila do tamanho do teste: a escrita sintética é muito mais rápida que o verbose
+    # real e, com o limite padrão, as linhas mais antigas seriam descartadas
+    pump = LogPump(envio.broadcast, max_linhas=linhas)
+    pump.iniciar()
+
+    inicio, cpu = time.perf_counter(), time.process_time()
+    await asyncio.to_thread(escrever, pump.publicar, linhas)
+    while envio.linhas < linhas:
+        await asyncio.sleep(0.01)
+    duracao, tempo_cpu = time.perf_counter() - inicio, time.process_time() - cpu
+    await pump.encerrar()
+    return duracao, tempo_cpu, envio.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"📊 {args.linhas:,} linhas de log")
+    print(f"{'modelo':<22}{'linhas/s':>12}{'CPU (s)':>10}{'frames':>10}")
+    for nome, medir in (("thread por escrita", medir_thread_por_escrita), ("LogPump", medir_log_pump)):
+        duracao, cpu, frames = asyncio.run(medir(args.linhas))
+        print(f"{nome:<22}{args.linhas / duracao:>12,.0f}{cpu:>10.2f}{frames:>10,}")
+
+    print()
+    print(f"{'frames WebSocket':<22}{'frames':>10}{'JSON (KB)':>12}{'deflate (KB)':>14}")
+    for nome, frames in (("um por linha", frames_por_linha(args.linhas)),
+                         ("LogPump", asyncio.run(frames_log_pump(args.linhas)))):
+        bruto, comprimido = bytes_frames(frames)
+        print(f"{nome:<22}{len(frames):>10,}{bruto / 1024:>12,.0f}{comprimido / 1024:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
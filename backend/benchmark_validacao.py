@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark da validação de itens de notas fiscais por número de processos.
+
+Gera um CSV sintético de itens (milhões de linhas) e mede a vazão de
+validar_dataframe_itens (DataFrame em memória) e de validar_csv_em_blocos
+(arquivo em streaming) com 1, 2, 4, ... workers.
+
+Uso:
+    python benchmark_validacao.py --linhas 2000000 --workers 1 2 4 8 16
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tools.functions import validar_csv_em_blocos, DTYPE_CSV
+from models.notas_fiscais import (
+    validar_bloco, validar_dataframe_itens, resolver_workers,
+    obter_pool_validacao, encerrar_pool_validacao
+)
+
+
+def gerar_itens_sinteticos(caminho: str, linhas: int, seed: int = 42) -> None:
+    """Gera um CSV de itens com ~1% de linhas inválidas."""
+    rng = np.random.default_rng(seed)
+    quantidade = rng.integers(1, 50, linhas).astype(float)
+    unitario = np.round(rng.uniform(0.5, 500.0, linhas), 2)
+    total = np.round(quantidade * unitario, 2)
+
+    # Injeta inconsistências e valores negativos
+    invalidas = rng.random(linhas) < 0.01
+    total[invalidas] = total[invalidas] + 10.0
+    negativas = rng.random(linhas) < 0.001
+    quantidade[negativas] = -quantidade[negativas]
+
+    df = pd.DataFrame({
+        'CHAVE DE ACESSO': np.char.zfill((np.arange(linhas) // 5).astype(str), 44),
+        'NÚMERO': (np.arange(linhas) // 5).astype(str),
+        'CPF/CNPJ Emitente': rng.choice(['12345678000190', '98765432000110', '11222333000181'], linhas),
+        'RAZÃO SOCIAL EMITENTE': rng.choice(['EMPRESA A LTDA', 'EMPRESA B SA', 'EMPRESA C ME'], linhas),
+        'NÚMERO PRODUTO': rng.integers(1, 1000, linhas).astype(str),
+        'DESCRIÇÃO DO PRODUTO/SERVIÇO': rng.choice(['PAPEL A4', 'CANETA AZUL', 'TONER', 'CADEIRA'], linhas),
+        'NCM/SH (TIPO DE PRODUTO)': rng.choice(['48025610 - Papel', '96081000 - Canetas'], linhas),
+        'QUANTIDADE': quantidade,
+        'VALOR UNITÁRIO': unitario,
+        'VALOR TOTAL': total,
+    })
+    df.to_csv(caminho, index=False)
+
+
+def aquecer_pool(workers: int) -> None:
+    """Cria o pool e carrega os módulos nos processos para não medir a inicialização."""
+    if workers > 1:
+        pool = obter_pool_validacao(workers)
+        list(pool.map(validar_bloco, [pd.DataFrame()] * workers, ["itens"] * workers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da validação paralela de itens")
+    parser.add_argument("--linhas", type=int, default=2_000_000, help="Linhas do CSV sintético")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Números de processos a medir")
+    parser.add_argument("--chunk-size", type=int, default=250_000, help="Linhas por bloco")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        entrada = os.path.join(diretorio, "sintetico_NFs_Itens.csv")
+
+        print(f"📝 Gerando {args.linhas:,} itens sintéticos...")
+        gerar_itens_sinteticos(entrada, args.linhas)
+        print(f"📁 Arquivo: {os.path.getsize(entrada) / 1024 / 1024:.1f} MB")
+        df = pd.read_csv(entrada, dtype=DTYPE_CSV, keep_default_na=False)
+        print(f"🖥️ Núcleos disponíveis: {os.cpu_count()}")
+        print("=" * 72)
+        print(f"{'workers':>8} {'efetivos':>9} {'DataFrame (linhas/s)':>22} {'CSV em blocos (linhas/s)':>26}")
+
+        for workers in args.workers:
+            efetivos = resolver_workers(workers)
+            aquecer_pool(efetivos)
+
+            inicio = time.perf_counter()
+            validar_dataframe_itens(df, workers=efetivos)
+            vazao_memoria = len(df) / (time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            resultado, total = validar_csv_em_blocos(entrada, "itens", diretorio, args.chunk_size,
+                                                     limite_erros=10, workers=efetivos,
+                                                     reutilizar=False)
+            vazao_arquivo = total / (time.perf_counter() - inicio)
+
+            print(f"{workers:>8} {efetivos:>9} {vazao_memoria:>22,.0f} {vazao_arquivo:>26,.0f}")
+
+        print("=" * 72)
+        print(f"✅ Itens válidos: {resultado.total_itens:,} de {total:,}")
+        print(f"⚠️ Erros por regra: {resultado.erros_por_regra}")
+        print("ℹ️ 'efetivos' é limitado ao número de núcleos; no modo CSV a leitura do arquivo")
+        print("   continua no processo principal e limita o ganho do paralelismo.")
+
+    encerrar_pool_validacao()
+
+
+if __name__ == "__main__":
+    main()
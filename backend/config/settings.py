@@ -1,7 +1,7 @@
 """
 Configurações centralizadas do sistema Instaprice com validação robusta.
 """
-from pydantic import BaseSettings, Field, validator
+from pydantic import BaseSettings, Field, ValidationError, validator
 from typing import Optional
 import os
 from pathlib import Path
@@ -19,6 +19,28 @@ class InstapriceSettings(BaseSettings):
     max_workers: int = Field(default=4, ge=1, le=16, description="Máximo de workers")
     cache_size: int = Field(default=10, ge=1, le=100, description="Tamanho do cache")
     timeout_seconds: int = Field(default=300, ge=30, le=3600, description="Timeout em segundos")
+    fast_path_preparation: bool = Field(default=True, description="Extração e validação direto em Python, sem os agentes dessas etapas")
+    max_concurrent_jobs: int = Field(default=2, ge=1, le=16, description="Análises executadas ao mesmo tempo pelo servidor")
+    session_ttl_minutes: int = Field(default=60, ge=1, le=7 * 24 * 60, description="Minutos sem uso até a sessão de análise expirar")
+    session_max_memory_mb: int = Field(default=512, ge=16, description="Memória estimada (MB) das sessões antes de remover as menos usadas")
+    session_max_count: int = Field(default=100, ge=1, description="Sessões de análise mantidas em memória")
+    dataset_registry_max_mb: int = Field(default=1024, ge=16, description="Memória estimada (MB) dos datasets mantidos carregados para as ferramentas")
+    dataset_registry_max_count: int = Field(default=16, ge=1, description="Datasets de sessões mantidos carregados por processo")
+    jobs_max_pending: int = Field(default=100, ge=1, description="Jobs aguardando na fila antes de recusar novos envios")
+    jobs_interactive_reserved: int = Field(default=1, ge=0, le=8, description="Consumidores reservados para perguntas seguintes")
+    jobs_retention_hours: int = Field(default=24, ge=1, le=30 * 24, description="Horas que status e resultado de jobs finalizados ficam guardados antes de serem apagados")
+    websocket_client_queue_size: int = Field(default=1000, ge=10, le=100_000, description="Eventos pendentes por cliente WebSocket antes de juntar ou descartar logs")
+    websocket_log_batch_ms: int = Field(default=50, ge=5, le=2000, description="Janela (ms) para juntar linhas de log em um frame")
+    websocket_log_batch_lines: int = Field(default=200, ge=1, le=10_000, description="Máximo de linhas de log por frame")
+    websocket_replay_events: int = Field(default=1000, ge=0, le=100_000, description="Eventos guardados por tópico (job/sessão/arquivo) para reenviar a quem reconecta")
+    websocket_replay_topics: int = Field(default=64, ge=1, le=10_000, description="Tópicos com histórico de eventos mantidos em memória")
+    crew_workers: int = Field(default=2, ge=1, le=16, description="Workers persistentes que executam a crew")
+    crew_worker_max_jobs: int = Field(default=20, ge=1, description="Execuções por worker antes de reciclá-lo")
+    crew_worker_max_memory_mb: int = Field(default=2048, ge=256, description="Memória residente (MB) que faz o worker ser reciclado")
+    
+    # Validation Configuration
+    validation_chunk_size: int = Field(default=100_000, ge=1_000, le=5_000_000, description="Linhas por bloco na validação em streaming")
+    validation_max_error_details: int = Field(default=1000, ge=10, le=100_000, description="Máximo de mensagens de erro mantidas por arquivo")
     
     # File Configuration
     max_file_size_mb: int = Field(default=100, ge=1, le=1000, description="Tamanho máximo de arquivo em MB")
@@ -95,17 +117,32 @@ class InstapriceSettings(BaseSettings):
         except Exception as e:
             raise EnvironmentError(f"Erro na validação do ambiente: {e}")
 
-# Instância global das configurações
-settings = InstapriceSettings()
+# Instância global das configurações (criada no primeiro acesso)
+_settings: Optional[InstapriceSettings] = None
 
 def get_settings() -> InstapriceSettings:
     """Retorna as configurações do sistema."""
-    return settings
+    global _settings
+    if _settings is None:
+        _settings = InstapriceSettings()
+    return _settings
+
+def get_setting(nome: str):
+    """
+    Retorna uma configuração individual.
+    
+    Ferramentas e workers podem rodar antes de a GROQ_API_KEY ser definida;
+    nesse caso o valor padrão declarado em InstapriceSettings é usado.
+    """
+    try:
+        return getattr(get_settings(), nome)
+    except ValidationError:
+        return InstapriceSettings.__fields__[nome].default
 
 def validate_startup_config():
     """Valida configurações na inicialização do sistema."""
     try:
-        settings.validate_environment()
+        get_settings().validate_environment()
         return True
     except Exception as e:
         print(f"❌ Erro na configuração: {e}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Worker persistente para executar a crew do Instaprice.
+
+O processo importa CrewAI, pandas e litellm uma única vez e depois atende
+execuções recebidas pelo stdin, uma por linha em JSON:
+
+    {"job_id": "...", "inputs": {...}, "somente_consulta": false,
+     "preparacao_direta": true, "api_key": "..."}
+
+As respostas saem pelo stdout original, também uma mensagem JSON por linha:
+
+    {"tipo": "pronto", "pid": 123}                      worker carregado
+    {"tipo": "log", "linha": "..."}                     saída do terminal da execução
+    {"tipo": "resultado", "job_id": "...", "success": true, "result": "...",
+     "memoria_mb": 512.3, "jobs": 4}                    fim da execução
+
+Tudo o que a execução escreve em stdout/stderr (prints, verbose do CrewAI,
+logs do litellm) é redirecionado no nível do descritor e vira mensagens "log",
+enviadas antes do "resultado" da mesma execução.
+"""
+
+import json
+import os
+import sys
+import threading
+import traceback
+
+# Adiciona o diretório backend ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Marca o fim da saída de uma execução dentro do fluxo de logs
+MARCADOR_FIM = "\x00__INSTAPRICE_FIM__"
+
+
+def memoria_rss_mb() -> float:
+    """Memória residente atual do processo em MB"""
+    try:
+        with open("/proc/self/statm") as arquivo:
+            paginas = int(arquivo.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        import resource
+        # Pico de memória (KB no Linux) quando /proc não está disponível
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class CanalProtocolo:
+    """Mensagens JSON, uma por linha, no stdout original do worker"""
+
+    def __init__(self, descritor: int):
+        self.saida = os.fdopen(descritor, "w", buffering=1, encoding="utf-8")
+        self.trava = threading.Lock()
+
+    def enviar(self, mensagem: dict):
+        with self.trava:
+            self.saida.write(json.dumps(mensagem, ensure_ascii=False) + "\n")
+            self.saida.flush()
+
+
+def redirecionar_terminal(canal: CanalProtocolo, resultados: dict):
+    """
+    Redireciona os descritores 1 e 2 para um pipe lido por uma thread que
+    repassa cada linha como log. Ao encontrar o marcador de fim, envia o
+    resultado da execução, garantindo que ele chegue depois dos seus logs.
+    """
+    leitura, escrita = os.pipe()
+    os.dup2(escrita, 1)
+    os.dup2(escrita, 2)
+    os.close(escrita)
+    sys.stdout = os.fdopen(1, "w", buffering=1, encoding="utf-8", closefd=False)
+    sys.stderr = os.fdopen(2, "w", buffering=1, encoding="utf-8", closefd=False)
+
+    def encaminhar():
+        with os.fdopen(leitura, "r", encoding="utf-8", errors="replace") as terminal:
+            for linha in terminal:
+                linha = linha.rstrip("\n")
+                if linha.startswith(MARCADOR_FIM):
+                    canal.enviar(resultados.pop(linha[len(MARCADOR_FIM):]))
+                else:
+                    canal.enviar({"tipo": "log", "linha": linha})
+
+    threading.Thread(target=encaminhar, daemon=True).start()
+
+
+def executar(job: dict, jobs_executados: int) -> dict:
+    """Executa a crew de uma requisição e retorna a mensagem de resultado"""
+    from instaprice import Instaprice, obter_llm
+
+    inputs = job["inputs"]
+    diretorio_original = os.getcwd()
+    print("🚀 [WORKER] Iniciando execução do CrewAI...")
+    print(f"📋 [WORKER] Configurações:")
+    print(f"   • Arquivo ZIP: {inputs['caminho_zip']}")
+    print(f"   • Pergunta: {inputs['pergunta_usuario']}")
+    print(f"   • Diretório: {inputs['diretorio_dados']}")
+    print("=" * 60)
+
+    try:
+        diretorio_saida = inputs.get("diretorio_saida")
+        if diretorio_saida and os.path.isdir(diretorio_saida):
+            os.chdir(diretorio_saida)
+
+        instaprice = Instaprice()
+        instaprice.diretorio_saida = diretorio_saida or "."
+        # A chave vai só para o LLM desta execução (nunca para o ambiente do worker, que é
+        # reaproveitado); sem chave no job, vale a do .env
+        instaprice.llm = obter_llm(job.get("api_key"))
+        crew, inputs = instaprice.montar_crew(inputs, job.get("somente_consulta", False),
+                                              job.get("preparacao_direta", False))
+        resultado = crew.kickoff(inputs=inputs)
+
+        print("=" * 60)
+        print("✅ [WORKER] Execução concluída!")
+        print(f"📊 [WORKER] Resultado obtido: {len(str(resultado))} caracteres")
+
+        # Lê apenas a resposta final do Porta-Voz do arquivo gerado
+        porta_voz_file = instaprice.caminho_resposta_final()
+        if os.path.exists(porta_voz_file):
+            with open(porta_voz_file, "r", encoding="utf-8") as f:
+                final_response = f.read().strip()
+            print(f"📝 [WORKER] Resposta final capturada: {len(final_response)} caracteres")
+        else:
+            print("⚠️ [WORKER] Arquivo da resposta final não encontrado, usando resultado completo")
+            final_response = str(resultado)
+
+        mensagem = {"success": True, "result": final_response}
+    except Exception as e:
+        print("=" * 60)
+        print(f"❌ [WORKER] Erro durante execução: {e}")
+        traceback.print_exc()
+        mensagem = {"success": False, "error": str(e)}
+    finally:
+        os.chdir(diretorio_original)
+
+    return {
+        "tipo": "resultado",
+        "job_id": job["job_id"],
+        **mensagem,
+        "memoria_mb": round(memoria_rss_mb(), 1),
+        "jobs": jobs_executados + 1,
+    }
+
+
+def main():
+    canal = CanalProtocolo(os.dup(1))
+    resultados = {}
+    redirecionar_terminal(canal, resultados)
+
+    # Importações pesadas (CrewAI, litellm, pandas, pyarrow) uma única vez por worker
+    import instaprice  # noqa: F401
+
+    canal.enviar({"tipo": "pronto", "pid": os.getpid()})
+
+    jobs_executados = 0
+    for linha in sys.stdin:
+        if not linha.strip():
+            continue
+        job = json.loads(linha)
+        resultados[job["job_id"]] = executar(job, jobs_executados)
+        jobs_executados += 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        print(MARCADOR_FIM + job["job_id"], flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 from crewai.llm import LLM
 import sys
 import os
+from functools import lru_cache
+from typing import Tuple
 
 # Importa as tools personalizadas
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
@@ -11,6 +13,8 @@ from tools.zip_extractor_tool import zip_extractor_tool
 from tools.csv_validator_tool import csv_validator_tool
 from tools.pandas_query_tool import pandas_query_executor_tool
 from tools.rag_tool import rag_semantic_search_tool
+from utils.workspace import ARQUIVO_RESPOSTA_FINAL
+from utils.exceptions import ExtractionError, DataValidationError
 
 # Carrega variáveis de ambiente - busca em múltiplos locais
 env_paths = ['.env', '../.env', os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')]
@@ -23,21 +27,36 @@ if groq_api_key:
     os.environ["GROQ_API_KEY"] = groq_api_key
 modelo_llm = os.getenv("MODEL", "llama-3.1-8b-instant")
 
-# Configuração robusta do LLM com tratamento de erro
-try:
-    llm = LLM(
-        model=f"groq/{modelo_llm}",
-        api_key=groq_api_key,
-        temperature=0.1,  # Mais determinista
-        max_tokens=3000   # Aumentado para respostas completas
-    )
-except Exception as e:
-    print(f"⚠️ Erro na configuração do LLM: {e}")
-    print(f"🔄 Tentando configuração alternativa...")
-    llm = LLM(
-        model=f"groq/{modelo_llm}",
-        api_key=groq_api_key
-    )
+def criar_llm(api_key=None):
+    """Configuração robusta do LLM com tratamento de erro"""
+    try:
+        return LLM(
+            model=f"groq/{modelo_llm}",
+            api_key=api_key,
+            temperature=0.1,  # Mais determinista
+            max_tokens=3000   # Aumentado para respostas completas
+        )
+    except Exception as e:
+        print(f"⚠️ Erro na configuração do LLM: {e}")
+        print(f"🔄 Tentando configuração alternativa...")
+        return LLM(
+            model=f"groq/{modelo_llm}",
+            api_key=api_key
+        )
+
+@lru_cache(maxsize=8)
+def _llm_da_chave(api_key):
+    return criar_llm(api_key)
+
+def obter_llm(api_key=None):
+    """
+    LLM por chave de API, reaproveitado entre execuções de um mesmo processo
+    (workers da crew); sem chave, usa a do .env. A chave é passada ao LLM,
+    sem alterar os.environ.
+    """
+    return _llm_da_chave(api_key or groq_api_key)
+
+llm = obter_llm(groq_api_key)
 
 @CrewBase
 class Instaprice:
@@ -45,13 +64,19 @@ class Instaprice:
     
     agents_config = 'config/agents.yaml'
     tasks_config = 'config/tasks.yaml'
+    
+    # Onde a resposta final é gravada; o servidor aponta para o workspace da sessão
+    diretorio_saida = "."
+    
+    # LLM dos agentes; os workers da crew trocam pelo LLM da chave de API de cada execução
+    llm = llm
 
     @agent
     def zip_desbravador(self) -> Agent:
         """Agente especialista em extração de arquivos compactados"""
         return Agent(
             config=self.agents_config['zip_desbravador'],
-            llm=llm,
+            llm=self.llm,
             tools=[zip_extractor_tool],
             verbose=True
         )
@@ -61,7 +86,7 @@ class Instaprice:
         """Agente validador e estruturador de dados usando Pydantic"""
         return Agent(
             config=self.agents_config['guardiao_pydantic'],
-            llm=llm,
+            llm=self.llm,
             tools=[csv_validator_tool],
             verbose=True
         )
@@ -71,7 +96,7 @@ class Instaprice:
         """Agente intérprete de perguntas em linguagem natural"""
         return Agent(
             config=self.agents_config['linguista_lucido'],
-            llm=llm,
+            llm=self.llm,
             tools=[rag_semantic_search_tool],
             verbose=True
         )
@@ -81,7 +106,7 @@ class Instaprice:
         """Agente executor de operações Pandas sobre dados validados"""
         return Agent(
             config=self.agents_config['executor_de_consultas'],
-            llm=llm,
+            llm=self.llm,
             tools=[pandas_query_executor_tool],
             verbose=True
         )
@@ -91,7 +116,7 @@ class Instaprice:
         """Agente comunicador que gera respostas humanizadas e divertidas"""
         return Agent(
             config=self.agents_config['rp_ludico'],
-            llm=llm,
+            llm=self.llm,
             verbose=True
         )
 
@@ -100,7 +125,7 @@ class Instaprice:
         """Agente que sugere novas perguntas relevantes"""
         return Agent(
             config=self.agents_config['sugestor_visionario'],
-            llm=llm,
+            llm=self.llm,
             verbose=True
         )
 
@@ -109,7 +134,7 @@ class Instaprice:
         """Agente embaixador final responsável pela resposta definitiva ao usuário"""
         return Agent(
             config=self.agents_config['porta_voz_eloquente'],
-            llm=llm,
+            llm=self.llm,
             verbose=True
         )
 
@@ -173,9 +198,102 @@ class Instaprice:
             config=self.tasks_config['resposta_final_task'],
             agent=self.porta_voz_eloquente(),
             context=[self.comunicacao_task(), self.sugestoes_task()],
-            output_file="resposta_final_porta_voz.md"
+            output_file=self.caminho_resposta_final()
         )
 
+    def caminho_resposta_final(self) -> str:
+        return os.path.join(self.diretorio_saida, ARQUIVO_RESPOSTA_FINAL)
+
+    def _config_tarefa(self, nome: str) -> dict:
+        """Configuração da tarefa sem o contexto do YAML (as dependências são montadas na crew)"""
+        return {chave: valor for chave, valor in self.tasks_config[nome].items() if chave != 'context'}
+
+    def _crew_perguntas(self, complemento_interpretacao: str) -> Crew:
+        """
+        Crew que começa na interpretação. O complemento é acrescentado à descrição
+        da interpretação no lugar do contexto das tarefas de extração e validação.
+        """
+        config_interpretacao = self._config_tarefa('interpretacao_task')
+        config_interpretacao['description'] += complemento_interpretacao
+        interpretacao = Task(config=config_interpretacao, agent=self.linguista_lucido())
+        execucao = Task(config=self._config_tarefa('execucao_task'), agent=self.executor_de_consultas(),
+                        context=[interpretacao])
+        comunicacao = Task(config=self._config_tarefa('comunicacao_task'), agent=self.rp_ludico(),
+                           context=[execucao])
+        sugestoes = Task(config=self._config_tarefa('sugestoes_task'), agent=self.sugestor_visionario(),
+                         context=[comunicacao])
+        resposta_final = Task(config=self._config_tarefa('resposta_final_task'), agent=self.porta_voz_eloquente(),
+                              context=[comunicacao, sugestoes], output_file=self.caminho_resposta_final())
+        
+        return Crew(
+            agents=[self.linguista_lucido(), self.executor_de_consultas(), self.rp_ludico(),
+                    self.sugestor_visionario(), self.porta_voz_eloquente()],
+            tasks=[interpretacao, execucao, comunicacao, sugestoes, resposta_final],
+            process=Process.sequential,
+            verbose=True,
+            memory=False
+        )
+
+    def crew_consulta(self) -> Crew:
+        """
+        Crew apenas de perguntas e respostas, para arquivos já extraídos e validados.
+        
+        No lugar dos relatórios de extração e validação, a interpretação recebe
+        o perfil do dataset pelo input `perfil_dados`.
+        """
+        return self._crew_perguntas(
+            "\n\nOs dados já foram extraídos e validados anteriormente. "
+            "PERFIL DOS DADOS VALIDADOS:\n{perfil_dados}"
+        )
+
+    def preparar_dados(self, inputs: dict) -> dict:
+        """
+        Executa extração e validação direto em Python, com as mesmas ferramentas
+        dos agentes zip_desbravador e guardiao_pydantic, sem chamadas ao LLM.
+        
+        Returns:
+            Os inputs acrescidos de `relatorio_extracao` e `relatorio_validacao`,
+            usados pela crew_pipeline
+        """
+        relatorio_extracao = zip_extractor_tool.run(
+            caminho_arquivo_zip=inputs['caminho_zip'],
+            diretorio_destino=inputs['diretorio_dados']
+        )
+        if relatorio_extracao.startswith("❌"):
+            raise ExtractionError(relatorio_extracao, file_path=inputs['caminho_zip'])
+        
+        relatorio_validacao = csv_validator_tool.run(diretorio_dados=inputs['diretorio_dados'])
+        if relatorio_validacao.startswith("❌"):
+            raise DataValidationError(relatorio_validacao)
+        
+        return {**inputs, 'relatorio_extracao': relatorio_extracao, 'relatorio_validacao': relatorio_validacao}
+
+    def crew_pipeline(self) -> Crew:
+        """
+        Crew sem os agentes de extração e validação: essas etapas rodam antes em
+        preparar_dados e os relatórios entram no contexto da interpretação.
+        """
+        return self._crew_perguntas(
+            "\n\nA extração e a validação já foram executadas. "
+            "RELATÓRIO DA EXTRAÇÃO:\n{relatorio_extracao}\n\n"
+            "RELATÓRIO DA VALIDAÇÃO:\n{relatorio_validacao}"
+        )
+
+    def montar_crew(self, inputs: dict, somente_consulta: bool = False,
+                    preparacao_direta: bool = False) -> Tuple[Crew, dict]:
+        """
+        Escolhe a crew da execução e devolve-a com os inputs para o kickoff.
+        
+        - somente_consulta: dados já validados (perfil em `perfil_dados`) -> crew_consulta
+        - preparacao_direta: extração e validação em Python -> crew_pipeline
+        - caso contrário: crew completa, com os agentes de extração e validação
+        """
+        if somente_consulta:
+            return self.crew_consulta(), inputs
+        if preparacao_direta:
+            return self.crew_pipeline(), self.preparar_dados(inputs)
+        return self.crew(), inputs
+
     @crew
     def crew(self) -> Crew:
         """Configura e retorna a crew completa do Instaprice com novo Porta-Voz"""
@@ -0,0 +1,237 @@
+"""
+Especificação estruturada de consultas sobre as notas fiscais validadas.
+
+O agente de interpretação descreve a pergunta como JSON (filtros, dimensões,
+medidas, período, ordenação e top-k) e o planejador (`utils/query_planner.py`)
+executa a especificação sobre os DataFrames da sessão, sem depender de
+palavras-chave da pergunta. Os nomes aceitos são fixos (dimensões, métricas e
+colunas conhecidas do dataset), de modo que nenhum texto do LLM vira código.
+
+Exemplo (10 maiores fornecedores de SP em valor, por mês):
+
+    {"tabela": "cabecalho",
+     "filtros": [{"campo": "uf_emitente", "operador": "=", "valor": "SP"}],
+     "dimensoes": ["emitente"], "periodo": "mes",
+     "medidas": [{"metrica": "valor", "agregacao": "soma"}, {"metrica": "notas"}],
+     "top_k": 10}
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, validator
+
+TABELA_CABECALHO = "cabecalho"
+TABELA_ITENS = "itens"
+TABELAS = (TABELA_CABECALHO, TABELA_ITENS)
+
+# Dimensões de agrupamento: colunas do dataset (nome e CNPJ andam juntos) e tabelas onde existem
+DIMENSOES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "emitente": (("RAZÃO SOCIAL EMITENTE", "CPF/CNPJ Emitente"), TABELAS),
+    "destinatario": (("NOME DESTINATÁRIO", "CNPJ DESTINATÁRIO"), TABELAS),
+    "uf_emitente": (("UF EMITENTE",), TABELAS),
+    "municipio_emitente": (("MUNICÍPIO EMITENTE",), TABELAS),
+    "uf_destinatario": (("UF DESTINATÁRIO",), TABELAS),
+    "natureza_operacao": (("NATUREZA DA OPERAÇÃO",), TABELAS),
+    "nota": (("NÚMERO",), TABELAS),
+    "produto": (("DESCRIÇÃO DO PRODUTO/SERVIÇO",), (TABELA_ITENS,)),
+    "ncm": (("NCM/SH (TIPO DE PRODUTO)",), (TABELA_ITENS,)),
+    "cfop": (("CFOP",), (TABELA_ITENS,)),
+}
+
+# Campos aceitos nos filtros além das dimensões (o filtro usa a primeira coluna da dimensão)
+CAMPOS_FILTRO: Dict[str, str] = {
+    "cnpj_emitente": "CPF/CNPJ Emitente",
+    "cnpj_destinatario": "CNPJ DESTINATÁRIO",
+    "data": "DATA EMISSÃO",
+    "valor_nota": "VALOR NOTA FISCAL",
+    "valor_item": "VALOR TOTAL",
+    "quantidade": "QUANTIDADE",
+}
+
+COLUNA_DATA = "DATA EMISSÃO"
+
+# Métricas por tabela: coluna de origem (None conta linhas) e agregações permitidas
+AGREGACOES = ("soma", "media", "min", "max", "contagem")
+METRICAS: Dict[str, Dict[str, Tuple[Optional[str], Tuple[str, ...]]]] = {
+    TABELA_CABECALHO: {
+        "valor": ("VALOR NOTA FISCAL", AGREGACOES),
+        "notas": (None, ("contagem",)),
+    },
+    TABELA_ITENS: {
+        "valor": ("VALOR TOTAL", AGREGACOES),
+        "quantidade": ("QUANTIDADE", AGREGACOES),
+        "valor_unitario": ("VALOR UNITÁRIO", ("media", "min", "max")),
+        "itens": (None, ("contagem",)),
+        "notas": ("NÚMERO", ("contagem",)),  # notas distintas com itens
+    },
+}
+
+OPERADORES = ("=", "!=", ">", ">=", "<", "<=", "em", "contem", "entre")
+PERIODOS = {"dia": "D", "semana": "W", "mes": "M", "ano": "Y"}
+
+
+def coluna_do_campo(campo: str) -> str:
+    """Coluna do dataset filtrada por um campo da especificação"""
+    if campo in DIMENSOES:
+        return DIMENSOES[campo][0][0]
+    return CAMPOS_FILTRO[campo]
+
+
+class Filtro(BaseModel):
+    """Condição sobre um campo: `entre` recebe [início, fim] e `em`, uma lista"""
+    campo: str
+    operador: str = "="
+    valor: Any
+
+    class Config:
+        extra = "forbid"
+
+    @validator('campo')
+    def validar_campo(cls, v):
+        if v not in DIMENSOES and v not in CAMPOS_FILTRO:
+            raise ValueError(f"campo de filtro desconhecido: {v}")
+        return v
+
+    @validator('operador')
+    def validar_operador(cls, v):
+        if v not in OPERADORES:
+            raise ValueError(f"operador desconhecido: {v} (use {', '.join(OPERADORES)})")
+        return v
+
+    @validator('valor')
+    def validar_valor(cls, v, values):
+        operador = values.get('operador')
+        if operador == "entre" and not (isinstance(v, list) and len(v) == 2):
+            raise ValueError("o operador 'entre' espera [início, fim]")
+        if operador == "em" and not isinstance(v, list):
+            raise ValueError("o operador 'em' espera uma lista")
+        return v
+
+
+class Medida(BaseModel):
+    """Métrica agregada; o resultado sai na coluna `nome` (padrão `<metrica>_<agregacao>`)"""
+    metrica: str
+    agregacao: str = "soma"
+    nome: Optional[str] = None
+
+    class Config:
+        extra = "forbid"
+
+    @validator('agregacao')
+    def validar_agregacao(cls, v):
+        if v not in AGREGACOES:
+            raise ValueError(f"agregação desconhecida: {v}")
+        return v
+
+    @property
+    def coluna_resultado(self) -> str:
+        return self.nome or f"{self.metrica}_{self.agregacao}"
+
+
+MEDIDAS_PADRAO = [Medida(metrica="valor", agregacao="soma"), Medida(metrica="notas", agregacao="contagem")]
+
+
+class ConsultaSpec(BaseModel):
+    """Uma consulta: filtra a tabela, agrupa pelas dimensões (e período), agrega, ordena e corta"""
+    tabela: str = TABELA_CABECALHO
+    filtros: List[Filtro] = []
+    dimensoes: List[str] = []
+    medidas: List[Medida] = Field(default_factory=lambda: [medida.copy() for medida in MEDIDAS_PADRAO])
+    periodo: Optional[str] = None
+    ordenar_por: Optional[str] = None
+    ordem: str = "desc"
+    top_k: Optional[int] = Field(None, ge=1, le=1000)
+    titulo: Optional[str] = None
+
+    class Config:
+        extra = "forbid"
+
+    @validator('tabela')
+    def validar_tabela(cls, v):
+        if v not in TABELAS:
+            raise ValueError(f"tabela desconhecida: {v} (use {', '.join(TABELAS)})")
+        return v
+
+    @validator('dimensoes', each_item=True)
+    def validar_dimensao(cls, v, values):
+        if v not in DIMENSOES:
+            raise ValueError(f"dimensão desconhecida: {v} (use {', '.join(DIMENSOES)})")
+        if 'tabela' in values and values['tabela'] not in DIMENSOES[v][1]:
+            raise ValueError(f"a dimensão {v} não existe na tabela {values['tabela']}")
+        return v
+
+    @validator('medidas')
+    def validar_medidas(cls, v, values):
+        metricas = METRICAS.get(values.get('tabela'), {})
+        for medida in v:
+            if medida.metrica not in metricas:
+                raise ValueError(f"métrica {medida.metrica} não existe na tabela {values.get('tabela')} "
+                                 f"(use {', '.join(metricas)})")
+            if medida.agregacao not in metricas[medida.metrica][1]:
+                # Contagens aceitam só "contagem"; corrige em vez de recusar
+                if metricas[medida.metrica][1] == ("contagem",):
+                    medida.agregacao = "contagem"
+                else:
+                    raise ValueError(f"agregação {medida.agregacao} não se aplica a {medida.metrica}")
+        if not v:
+            raise ValueError("informe ao menos uma medida")
+        return v
+
+    @validator('periodo')
+    def validar_periodo(cls, v):
+        if v is not None and v not in PERIODOS:
+            raise ValueError(f"período desconhecido: {v} (use {', '.join(PERIODOS)})")
+        return v
+
+    @validator('ordem')
+    def validar_ordem(cls, v):
+        if v not in ("asc", "desc"):
+            raise ValueError("ordem deve ser 'asc' ou 'desc'")
+        return v
+
+    @validator('ordenar_por')
+    def validar_ordenacao(cls, v, values):
+        if v is None:
+            return v
+        validas = {medida.coluna_resultado for medida in values.get('medidas', [])}
+        validas.update(values.get('dimensoes', []))
+        if values.get('periodo'):
+            validas.add("periodo")
+        if v not in validas:
+            raise ValueError(f"ordenar_por deve ser uma medida ou dimensão da consulta: {v}")
+        return v
+
+    def colunas_agrupamento(self) -> List[str]:
+        return [coluna for dimensao in self.dimensoes for coluna in DIMENSOES[dimensao][0]]
+
+    def colunas_necessarias(self) -> List[str]:
+        """Colunas do dataset lidas pela consulta"""
+        colunas = self.colunas_agrupamento()
+        colunas += [coluna_do_campo(filtro.campo) for filtro in self.filtros]
+        colunas += [METRICAS[self.tabela][medida.metrica][0] for medida in self.medidas]
+        if self.periodo:
+            colunas.append(COLUNA_DATA)
+        return list(dict.fromkeys(coluna for coluna in colunas if coluna))
+
+
+def interpretar_consultas(texto: str) -> List[ConsultaSpec]:
+    """
+    Extrai as consultas do primeiro JSON do texto: um objeto, uma lista de
+    objetos ou {"consultas": [...]}. Devolve [] se o texto não traz JSON;
+    JSON com campos inválidos levanta ValueError (ValidationError).
+    """
+    decodificador = json.JSONDecoder()
+    for indice, caractere in enumerate(texto):
+        if caractere not in "{[":
+            continue
+        try:
+            dados, _ = decodificador.raw_decode(texto[indice:])
+        except ValueError:
+            continue
+        if isinstance(dados, dict) and "consultas" in dados:
+            dados = dados["consultas"]
+        itens = dados if isinstance(dados, list) else [dados]
+        if not itens or not all(isinstance(item, dict) for item in itens):
+            continue
+        return [ConsultaSpec(**item) for item in itens]
+    return []
@@ -1,8 +1,43 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, ValidationError, validator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
+import atexit
+import multiprocessing as mp
+import os
+import threading
+import numpy as np
 import pandas as pd
 
+# Modos de validação disponíveis
+MODO_VETORIZADO = "vetorizado"  # Regras aplicadas coluna a coluna (padrão)
+MODO_PYDANTIC = "pydantic"      # Referência: um modelo Pydantic por linha
+
+# Regras de validação (chaves de ProcessamentoResult.erros_por_regra)
+REGRA_CAMPO_OBRIGATORIO = "campo_obrigatorio"
+REGRA_CNPJ_INVALIDO = "cnpj_invalido"
+REGRA_DATA_INVALIDA = "data_emissao_invalida"
+REGRA_VALOR_INVALIDO = "valor_invalido"
+REGRA_VALOR_NEGATIVO = "valor_negativo"
+REGRA_TOTAL_INCONSISTENTE = "valor_total_inconsistente"
+
+FORMATOS_DATA_EMISSAO = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+TOLERANCIA_VALOR_TOTAL = 0.01  # Tolerância para arredondamento
+MIN_LINHAS_POR_PROCESSO = 50_000  # Abaixo disso o custo de enviar o bloco ao pool não compensa
+
+COLUNAS_OBRIGATORIAS_CABECALHO = [
+    'NÚMERO', 'DATA EMISSÃO', 'CPF/CNPJ Emitente', 'RAZÃO SOCIAL EMITENTE', 'VALOR NOTA FISCAL'
+]
+COLUNAS_OBRIGATORIAS_ITENS = [
+    'NÚMERO', 'NÚMERO PRODUTO', 'DESCRIÇÃO DO PRODUTO/SERVIÇO',
+    'QUANTIDADE', 'VALOR UNITÁRIO', 'VALOR TOTAL'
+]
+COLUNAS_VALORES_ITENS = ['QUANTIDADE', 'VALOR UNITÁRIO', 'VALOR TOTAL']
+
+# Valores monetários somados nas análises, guardados no dataset como centavos inteiros (int64);
+# o VALOR UNITÁRIO da NF-e tem até 10 casas decimais e continua em float
+COLUNAS_CENTAVOS = ('VALOR NOTA FISCAL', 'VALOR TOTAL')
+
 class NotaFiscalCabecalho(BaseModel):
     """Modelo para validação dos cabeçalhos de notas fiscais baseado nos campos reais do CSV"""
     NUMERO: str = Field(..., description="Número da nota fiscal", alias="NÚMERO")
@@ -104,43 +139,365 @@ class ProcessamentoResult(BaseModel):
     total_cabecalhos: int = Field(0, description="Total de cabeçalhos processados")
     total_itens: int = Field(0, description="Total de itens processados")
     erros: list = Field(default_factory=list, description="Lista de erros encontrados")
+    erros_por_regra: dict = Field(default_factory=dict, description="Quantidade de linhas reprovadas por regra")
+    linhas_invalidas: list = Field(default_factory=list, description="Índices das linhas que falharam na validação "
+                                                                     "(limitados como as mensagens de erro)")
+    total_invalidas: Optional[int] = Field(None, description="Total de linhas que falharam (sem limite)")
+    
+    @validator('total_invalidas', always=True)
+    def contar_invalidas(cls, v, values):
+        """Sem total explícito (resultados antigos, sem limite), conta as linhas inválidas listadas"""
+        return v if v is not None else len(values.get('linhas_invalidas') or [])
 
-def validar_dataframe_cabecalho(df: pd.DataFrame) -> ProcessamentoResult:
-    """Valida um DataFrame de cabeçalhos de notas fiscais"""
+def _normalizar_cnpjs_distintos(serie: pd.Series) -> tuple:
+    """Normaliza apenas os CNPJs distintos (eles se repetem muito entre notas)"""
+    codigos, distintos = pd.factorize(serie.astype(str))
+    normalizados = pd.Index(distintos).str.replace(r'\D', '', regex=True).str.zfill(14)
+    return codigos, normalizados
+
+def normalizar_cnpj(serie: pd.Series) -> pd.Series:
+    """Remove caracteres não numéricos e completa o CNPJ com zeros à esquerda (versão vetorizada)"""
+    codigos, normalizados = _normalizar_cnpjs_distintos(serie)
+    return pd.Series(np.asarray(normalizados, dtype=object).take(codigos), index=serie.index)
+
+def converter_data_emissao(serie: pd.Series) -> pd.Series:
+    """Converte DATA EMISSÃO aceitando os mesmos formatos do modelo Pydantic; inválidas viram NaT"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    
+    if pd.api.types.infer_dtype(serie, skipna=True) == 'string':
+        eh_texto = serie.notna().to_numpy(dtype=bool)
+    else:
+        eh_texto = serie.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    
+    convertida = np.full(len(serie), np.datetime64('NaT'), dtype='datetime64[ns]')
+    pendentes = np.flatnonzero(eh_texto)
+    for formato in FORMATOS_DATA_EMISSAO:
+        if len(pendentes) == 0:
+            break
+        parcial = pd.to_datetime(serie.iloc[pendentes], format=formato, errors='coerce').to_numpy(dtype='datetime64[ns]')
+        convertidas = ~np.isnat(parcial)
+        convertida[pendentes[convertidas]] = parcial[convertidas]
+        pendentes = pendentes[~convertidas]
+    
+    # Valores já em formato de data (datetime/Timestamp) são aceitos como no Pydantic
+    outros = np.flatnonzero(~eh_texto & serie.notna().to_numpy(dtype=bool))
+    if len(outros):
+        convertida[outros] = pd.to_datetime(serie.iloc[outros], errors='coerce').to_numpy(dtype='datetime64[ns]')
+    
+    return pd.Series(convertida, index=serie.index)
+
+def converter_centavos(serie: pd.Series) -> pd.Series:
+    """Converte valores em reais para centavos inteiros (Int64); não numéricos viram nulos"""
+    reais = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+    centavos = np.round(np.where(np.isfinite(reais), reais, np.nan) * 100)
+    return pd.Series(pd.array(centavos, dtype="Int64"), index=serie.index)
+
+def centavos_para_reais(centavos) -> float:
+    """Centavos (inteiro ou agregado) em reais, apenas para exibição"""
+    return float(centavos) / 100
+
+class _ColetorErros:
+    """
+    Acumula falhas de validação por regra como máscaras do bloco inteiro.
+    
+    As mensagens só são montadas no resultado, e apenas para as primeiras
+    `limite_erros` linhas reprovadas: com muitas falhas, o custo continua
+    vetorizado.
+    """
+    
+    def __init__(self, df: pd.DataFrame, limite_erros: Optional[int] = None):
+        self.df = df
+        self.limite_erros = limite_erros
+        self.reprovadas = np.zeros(len(df), dtype=bool)
+        self.por_regra: Dict[str, np.ndarray] = {}
+        self.regras: List[tuple] = []  # (máscara, mensagem) na ordem de registro
+    
+    def registrar(self, regra: str, mascara, mensagem) -> None:
+        """Registra uma regra; `mensagem` é um texto fixo ou uma função que recebe a posição da linha"""
+        mascara = np.asarray(mascara, dtype=bool)
+        if not mascara.any():
+            return
+        
+        self.reprovadas |= mascara
+        if regra in self.por_regra:
+            self.por_regra[regra] |= mascara
+        else:
+            self.por_regra[regra] = mascara.copy()
+        self.regras.append((mascara, mensagem))
+    
+    def _mensagem(self, posicao: int) -> str:
+        textos = [mensagem(posicao) if callable(mensagem) else mensagem
+                  for mascara, mensagem in self.regras if mascara[posicao]]
+        return f"Linha {self.df.index[posicao] + 1}: {'; '.join(textos)}"
+    
+    def resultado(self, tipo: str) -> ProcessamentoResult:
+        """Monta o ProcessamentoResult no mesmo formato do modo Pydantic"""
+        posicoes = np.flatnonzero(self.reprovadas)
+        exibidas = posicoes if self.limite_erros is None else posicoes[:self.limite_erros]
+        linhas_invalidas = self.df.index[exibidas].tolist()
+        erros = [self._mensagem(posicao) for posicao in exibidas]
+        registros_validos = len(self.df) - len(posicoes)
+        
+        return ProcessamentoResult(
+            sucesso=len(posicoes) == 0,
+            mensagem=f"Processados {registros_validos} {tipo} válidos de {len(self.df)} total",
+            total_cabecalhos=registros_validos if tipo == "cabeçalhos" else 0,
+            total_itens=registros_validos if tipo == "itens" else 0,
+            erros=erros,
+            erros_por_regra={regra: int(mascara.sum()) for regra, mascara in self.por_regra.items()},
+            linhas_invalidas=linhas_invalidas,
+            total_invalidas=len(posicoes)
+        )
+
+def _validar_obrigatorios(coletor: _ColetorErros, colunas: List[str]) -> Dict[str, np.ndarray]:
+    """Valida presença das colunas obrigatórias; retorna a máscara de ausência de cada uma"""
+    df = coletor.df
+    ausentes = {}
+    for coluna in colunas:
+        if coluna in df.columns:
+            ausentes[coluna] = df[coluna].isna().to_numpy()
+        else:
+            ausentes[coluna] = np.ones(len(df), dtype=bool)
+        coletor.registrar(REGRA_CAMPO_OBRIGATORIO, ausentes[coluna], f"{coluna}: campo obrigatório")
+    return ausentes
+
+def _validar_valores(coletor: _ColetorErros, coluna: str, ausente: np.ndarray, mensagem_negativo: str) -> tuple:
+    """Converte uma coluna numérica e registra valores não numéricos ou negativos"""
+    df = coletor.df
+    if coluna not in df.columns:
+        return np.full(len(df), np.nan), np.zeros(len(df), dtype=bool)
+    
+    valores = pd.to_numeric(df[coluna], errors='coerce').to_numpy(dtype=float)
+    invalidos = np.isnan(valores) & ~ausente
+    negativos = valores < 0
+    coletor.registrar(REGRA_VALOR_INVALIDO, invalidos, f"{coluna}: valor numérico inválido")
+    coletor.registrar(REGRA_VALOR_NEGATIVO, negativos, f"{coluna}: {mensagem_negativo}")
+    
+    validos = ~np.isnan(valores) & ~negativos
+    return valores, validos
+
+def _validar_cabecalho_vetorizado(df: pd.DataFrame, limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """Aplica as regras de NotaFiscalCabecalho sobre colunas inteiras"""
+    coletor = _ColetorErros(df, limite_erros)
+    ausentes = _validar_obrigatorios(coletor, COLUNAS_OBRIGATORIAS_CABECALHO)
+    
+    if 'DATA EMISSÃO' in df.columns:
+        datas_originais = df['DATA EMISSÃO']
+        datas = converter_data_emissao(datas_originais)
+        invalidas = datas.isna().to_numpy() & ~ausentes['DATA EMISSÃO']
+        coletor.registrar(REGRA_DATA_INVALIDA, invalidas,
+                          lambda p: f"DATA EMISSÃO: Formato de data inválido: {datas_originais.iat[p]}")
+    
+    if 'CPF/CNPJ Emitente' in df.columns:
+        cnpjs_originais = df['CPF/CNPJ Emitente']
+        codigos, normalizados = _normalizar_cnpjs_distintos(cnpjs_originais)
+        invalidos = np.asarray(normalizados.str.len() != 14).take(codigos) & ~ausentes['CPF/CNPJ Emitente']
+        coletor.registrar(REGRA_CNPJ_INVALIDO, invalidos,
+                          lambda p: f"CPF/CNPJ Emitente: CNPJ deve ter 14 dígitos: {cnpjs_originais.iat[p]}")
+    
+    _validar_valores(coletor, 'VALOR NOTA FISCAL', ausentes['VALOR NOTA FISCAL'], "Valor total deve ser positivo")
+    
+    return coletor.resultado("cabeçalhos")
+
+def _validar_itens_vetorizado(df: pd.DataFrame, limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """Aplica as regras de NotaFiscalItem sobre colunas inteiras"""
+    coletor = _ColetorErros(df, limite_erros)
+    ausentes = _validar_obrigatorios(coletor, COLUNAS_OBRIGATORIAS_ITENS)
+    
+    valores = {}
+    validos = {}
+    for coluna in COLUNAS_VALORES_ITENS:
+        valores[coluna], validos[coluna] = _validar_valores(
+            coletor, coluna, ausentes[coluna], "Valores devem ser positivos"
+        )
+    
+    # Assim como no validator do Pydantic, a conferência só ocorre quando os três valores são válidos
+    quantidade = valores['QUANTIDADE']
+    unitario = valores['VALOR UNITÁRIO']
+    total = valores['VALOR TOTAL']
+    comparaveis = validos['QUANTIDADE'] & validos['VALOR UNITÁRIO'] & validos['VALOR TOTAL']
+    with np.errstate(invalid='ignore'):
+        calculado = quantidade * unitario
+        inconsistentes = comparaveis & (np.abs(total - calculado) > TOLERANCIA_VALOR_TOTAL)
+    coletor.registrar(REGRA_TOTAL_INCONSISTENTE, inconsistentes,
+                      lambda p: f"VALOR TOTAL: Valor total inconsistente: {total[p]} != {calculado[p]}")
+    
+    return coletor.resultado("itens")
+
+def _regra_do_erro_pydantic(erro: dict) -> str:
+    """Classifica um erro do Pydantic na regra equivalente do modo vetorizado"""
+    campo = erro['loc'][0] if erro.get('loc') else ''
+    mensagem = erro.get('msg', '')
+    if erro.get('type') in ('value_error.missing', 'type_error.none.not_allowed'):
+        return REGRA_CAMPO_OBRIGATORIO
+    if campo == 'DATA EMISSÃO':
+        return REGRA_DATA_INVALIDA
+    if campo == 'CPF/CNPJ Emitente':
+        return REGRA_CNPJ_INVALIDO
+    if 'inconsistente' in mensagem:
+        return REGRA_TOTAL_INCONSISTENTE
+    if 'positivo' in mensagem:
+        return REGRA_VALOR_NEGATIVO
+    return REGRA_VALOR_INVALIDO
+
+def _validar_com_pydantic(df: pd.DataFrame, modelo, tipo: str,
+                          limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """Modo de referência: instancia um modelo Pydantic por linha"""
     erros = []
+    erros_por_regra: Dict[str, int] = {}
+    linhas_invalidas = []
+    total_invalidas = 0
     registros_validos = 0
     
     for index, row in df.iterrows():
         try:
-            NotaFiscalCabecalho(**row.to_dict())
+            modelo(**row.to_dict())
             registros_validos += 1
         except Exception as e:
-            erros.append(f"Linha {index + 1}: {str(e)}")
+            total_invalidas += 1
+            if limite_erros is None or len(erros) < limite_erros:
+                erros.append(f"Linha {index + 1}: {str(e)}")
+                linhas_invalidas.append(index)
+            if isinstance(e, ValidationError):
+                for regra in {_regra_do_erro_pydantic(erro) for erro in e.errors()}:
+                    erros_por_regra[regra] = erros_por_regra.get(regra, 0) + 1
     
     return ProcessamentoResult(
-        sucesso=len(erros) == 0,
-        mensagem=f"Processados {registros_validos} cabeçalhos válidos de {len(df)} total",
-        total_cabecalhos=registros_validos,
-        erros=erros
+        sucesso=total_invalidas == 0,
+        mensagem=f"Processados {registros_validos} {tipo} válidos de {len(df)} total",
+        total_cabecalhos=registros_validos if tipo == "cabeçalhos" else 0,
+        total_itens=registros_validos if tipo == "itens" else 0,
+        erros=erros,
+        erros_por_regra=erros_por_regra,
+        linhas_invalidas=linhas_invalidas,
+        total_invalidas=total_invalidas
     )
 
-def validar_dataframe_itens(df: pd.DataFrame) -> ProcessamentoResult:
+def _verificar_modo(modo: str) -> None:
+    if modo not in (MODO_VETORIZADO, MODO_PYDANTIC):
+        raise ValueError(f"Modo de validação desconhecido: {modo}. Use '{MODO_VETORIZADO}' ou '{MODO_PYDANTIC}'")
+
+def validar_bloco(df: pd.DataFrame, tipo: str, modo: str = MODO_VETORIZADO,
+                  limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """
+    Valida um bloco de linhas no processo atual (também é a unidade de trabalho do pool).
+    
+    Com `limite_erros`, só as primeiras mensagens de erro são montadas; contagens seguem exatas.
+    """
+    if tipo == "cabeçalhos":
+        if modo == MODO_PYDANTIC:
+            return _validar_com_pydantic(df, NotaFiscalCabecalho, tipo, limite_erros)
+        return _validar_cabecalho_vetorizado(df, limite_erros)
+    if modo == MODO_PYDANTIC:
+        return _validar_com_pydantic(df, NotaFiscalItem, tipo, limite_erros)
+    return _validar_itens_vetorizado(df, limite_erros)
+
+# Pool de processos compartilhado pelas validações (criado sob demanda)
+_pool_validacao: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def resolver_workers(workers: Optional[int] = None) -> int:
+    """Número de processos de validação: explícito ou InstapriceSettings.max_workers, limitado aos núcleos"""
+    if workers is None:
+        from config.settings import get_setting
+        workers = get_setting('max_workers')
+    return max(1, min(int(workers), os.cpu_count() or 1))
+
+def obter_pool_validacao(workers: int) -> ProcessPoolExecutor:
+    """Retorna o pool de validação, recriando-o se o número de workers mudou"""
+    global _pool_validacao, _pool_workers
+    with _pool_lock:
+        if _pool_validacao is None or _pool_workers != workers:
+            if _pool_validacao is not None:
+                _pool_validacao.shutdown(wait=True)
+            # spawn evita herdar threads/locks do servidor via fork
+            _pool_validacao = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+            _pool_workers = workers
+        return _pool_validacao
+
+def encerrar_pool_validacao() -> None:
+    """Encerra o pool de validação (chamado automaticamente na saída do interpretador)"""
+    global _pool_validacao, _pool_workers
+    with _pool_lock:
+        if _pool_validacao is not None:
+            _pool_validacao.shutdown(wait=True)
+            _pool_validacao = None
+            _pool_workers = 0
+
+atexit.register(encerrar_pool_validacao)
+
+def _validar(df: pd.DataFrame, tipo: str, modo: str, workers: Optional[int],
+             limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """Valida no processo atual ou divide as linhas em fatias contíguas entre os processos do pool"""
+    _verificar_modo(modo)
+    workers = resolver_workers(workers)
+    fatias = min(workers, len(df) // MIN_LINHAS_POR_PROCESSO)
+    if fatias <= 1:
+        return validar_bloco(df, tipo, modo, limite_erros)
+    
+    limites = np.linspace(0, len(df), fatias + 1, dtype=int)
+    blocos = [df.iloc[inicio:fim] for inicio, fim in zip(limites[:-1], limites[1:])]
+    pool = obter_pool_validacao(workers)
+    # map preserva a ordem das fatias: erros e linhas inválidas saem na ordem do arquivo
+    resultados = list(pool.map(validar_bloco, blocos, [tipo] * fatias, [modo] * fatias,
+                               [limite_erros] * fatias))
+    return mesclar_resultados(resultados, tipo, limite_erros)
+
+def validar_dataframe_cabecalho(df: pd.DataFrame, modo: str = MODO_VETORIZADO,
+                                workers: Optional[int] = None,
+                                limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """Valida um DataFrame de cabeçalhos de notas fiscais"""
+    return _validar(df, "cabeçalhos", modo, workers, limite_erros)
+
+def validar_dataframe_itens(df: pd.DataFrame, modo: str = MODO_VETORIZADO,
+                            workers: Optional[int] = None,
+                            limite_erros: Optional[int] = None) -> ProcessamentoResult:
     """Valida um DataFrame de itens de notas fiscais"""
+    return _validar(df, "itens", modo, workers, limite_erros)
+
+def mesclar_resultados(resultados: List[ProcessamentoResult], tipo: str,
+                       limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """
+    Combina os resultados da validação de vários blocos de um mesmo arquivo.
+    
+    Contagens por regra e totais são somados integralmente; mensagens de erro e
+    índices das linhas inválidas são limitados a `limite_erros`, para que a
+    memória e o manifesto não cresçam com o número de linhas reprovadas.
+    """
+    total_validos = 0
+    total_registros = 0
+    total_invalidas = 0
     erros = []
-    registros_validos = 0
+    erros_por_regra: Dict[str, int] = {}
+    linhas_invalidas = []
     
-    for index, row in df.iterrows():
-        try:
-            NotaFiscalItem(**row.to_dict())
-            registros_validos += 1
-        except Exception as e:
-            erros.append(f"Linha {index + 1}: {str(e)}")
+    for resultado in resultados:
+        validos = resultado.total_cabecalhos if tipo == "cabeçalhos" else resultado.total_itens
+        total_validos += validos
+        total_invalidas += resultado.total_invalidas
+        total_registros += validos + resultado.total_invalidas
+        for regra, quantidade in resultado.erros_por_regra.items():
+            erros_por_regra[regra] = erros_por_regra.get(regra, 0) + quantidade
+        if limite_erros is None or len(erros) < limite_erros:
+            erros.extend(resultado.erros)
+        if limite_erros is None or len(linhas_invalidas) < limite_erros:
+            linhas_invalidas.extend(resultado.linhas_invalidas)
+    
+    if limite_erros is not None:
+        erros = erros[:limite_erros]
+        linhas_invalidas = linhas_invalidas[:limite_erros]
     
     return ProcessamentoResult(
-        sucesso=len(erros) == 0,
-        mensagem=f"Processados {registros_validos} itens válidos de {len(df)} total",
-        total_itens=registros_validos,
-        erros=erros
+        sucesso=total_invalidas == 0,
+        mensagem=f"Processados {total_validos} {tipo} válidos de {total_registros} total",
+        total_cabecalhos=total_validos if tipo == "cabeçalhos" else 0,
+        total_itens=total_validos if tipo == "itens" else 0,
+        erros=erros,
+        erros_por_regra=erros_por_regra,
+        linhas_invalidas=linhas_invalidas,
+        total_invalidas=total_invalidas
     )
 
 # Modelos de compatibilidade para manter funcionamento das ferramentas existentes
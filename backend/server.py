@@ -5,6 +5,7 @@ Integra com a lógica existente do Instaprice
 """
 
 import os
+import json
 import asyncio
 import tempfile
 import shutil
@@ -15,18 +16,34 @@ import threading
 import time
 import logging
 import subprocess
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Union
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.requests import ClientDisconnect
 
 # Importa a lógica existente do Instaprice
-from instaprice import Instaprice
+from instaprice import Instaprice, obter_llm
 from utils.logger import setup_logger
+from utils.upload_store import UploadStore
+from utils.input_validator import InputValidator
+from utils.columnar_dataset import carregar_perfil, resumo_perfil, gerar_perfil
+from utils.archive_backends import estatisticas_backends
+from utils.exceptions import FileProcessingError, DataIntegrityError, UploadOffsetError, RateLimitError
+from utils.job_queue import (JobQueue, JobStore, FILA_INTERATIVA, FILA_LOTE,
+                             CONCLUIDO as JOB_CONCLUIDO, CANCELADO as JOB_CANCELADO)
+from utils.workspace import WorkspaceManager
+from utils.session_store import SessionStore
+from utils.log_pump import LogPump
+from utils.websocket_channels import (ConnectionManager, CanalSSE, definir_canais, adicionar_canal,
+                                      negociar_codificacao)
+from config.settings import get_setting
+from tools.functions import ingerir_arquivo
 
 # Configuração
 app = FastAPI(title="Instaprice API", description="API para análise de notas fiscais", version="1.0.0")
@@ -45,36 +62,27 @@ logger = setup_logger()
 
 # Handler de log customizado para WebSocket
 class WebSocketLogHandler(logging.Handler):
-    def __init__(self, manager):
+    def __init__(self, pump: LogPump):
         super().__init__()
-        self.manager = manager
+        self.pump = pump
         
     def emit(self, record):
-        if self.manager:
-            try:
-                # Cria uma task assíncrona para enviar via WebSocket
-                loop = asyncio.get_event_loop()
-                loop.create_task(self.manager.broadcast({
-                    "type": "agent_log", 
-                    "data": {
-                        "message": self.format(record),
-                        "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3],
-                        "raw_terminal": True
-                    }
-                }))
-            except Exception:
-                pass
+        # Pode ser chamado de qualquer thread: apenas enfileira para o envio em lote
+        try:
+            self.pump.publicar(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
 
 # Capturador de logs SEGURO - sem recursão
 class SafeLogCapture:
     def __init__(self):
         self.original_stdout = sys.stdout
         self.original_stderr = sys.stderr
-        self.manager = None
+        self.pump = None
         self.capturing = False
         
-    def set_manager(self, manager):
-        self.manager = manager
+    def set_pump(self, pump: LogPump):
+        self.pump = pump
         
     def start_capture(self):
         """Substitui stdout por este objeto"""
@@ -92,117 +100,212 @@ class SafeLogCapture:
         self.original_stdout.write(text)
         self.original_stdout.flush()
         
-        # Se estamos capturando e há um manager, tenta enviar
-        if self.capturing and self.manager and text.strip():
-            try:
-                # Desabilita captura temporariamente para evitar recursão
-                self.capturing = False
-                
-                # Envia via WebSocket de forma simples e segura
-                import threading
-                def send_in_thread():
-                    try:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        loop.run_until_complete(self.manager.broadcast({
-                            "type": "agent_log",
-                            "data": {
-                                "message": text,
-                                "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3],
-                                "raw_terminal": True
-                            }
-                        }))
-                        loop.close()
-                    except:
-                        pass
-                
-                thread = threading.Thread(target=send_in_thread, daemon=True)
-                thread.start()
-                
-            except:
-                pass
-            finally:
-                # Reabilita captura
-                self.capturing = True
+        # Só enfileira: o envio pelo WebSocket é feito pelo LogPump no event loop
+        if self.capturing and self.pump:
+            self.pump.publicar(text)
+        return len(text)
                 
     def flush(self):
         """Implementa flush para compatibilidade"""
         self.original_stdout.flush()
 
-# Gerenciamento de conexões WebSocket
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"Nova conexão WebSocket estabelecida. Total: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info(f"Conexão WebSocket encerrada. Total: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        """Broadcast com tratamento robusto de erros"""
-        dead_connections = []
-        
-        for connection in self.active_connections.copy():
-            try:
-                await asyncio.wait_for(
-                    connection.send_json(message), 
-                    timeout=5.0
-                )
-            except (Exception, asyncio.TimeoutError) as e:
-                logger.warning(f"Removendo conexão morta: {e}")
-                dead_connections.append(connection)
-        
-        # Remove conexões mortas
-        for dead_conn in dead_connections:
-            try:
-                self.active_connections.remove(dead_conn)
-            except ValueError:
-                pass  # Já foi removida
-
 # Gerenciador de sessões de análise
 class AnalysisSession:
-    def __init__(self):
-        self.sessions = {}  # {session_id: {file_id, dados_dir, extracted_data, instaprice_instance}}
+    """
+    Sessões de análise sobre o SessionStore: ids UUID, expiração por inatividade e
+    limite de memória; o workspace de uma sessão removida é apagado assim que
+    nenhuma execução o estiver usando.
+    """
+    def __init__(self, workspaces: WorkspaceManager):
+        self.workspaces = workspaces
+        # {session_id: {file_id, dados_dir, workspace, extracted_data, instaprice_instance}}
+        self.sessions = SessionStore(
+            ttl_segundos=get_setting('session_ttl_minutes') * 60,
+            max_memoria_mb=get_setting('session_max_memory_mb'),
+            max_sessoes=get_setting('session_max_count'),
+            ao_remover=lambda session_id, _: self.workspaces.encerrar(session_id),
+            # Além da referência da própria sessão, há uma execução usando o workspace
+            ocupada=lambda session_id: self.workspaces.referencias(session_id) > 1
+        )
     
-    def create_session(self, file_id: str, dados_dir: str) -> str:
-        """Cria nova sessão de análise"""
-        session_id = f"session_{int(datetime.now().timestamp())}"
-        self.sessions[session_id] = {
+    def create_session(self, file_id: str, dados_dir: Optional[str] = None) -> str:
+        """
+        Cria nova sessão de análise com workspace próprio.
+        
+        Sem dados_dir, a extração e a validação usam o diretório de dados do workspace;
+        com ele (dataset já validado e compartilhado), a sessão apenas lê esses dados.
+        """
+        session_id = self.sessions.criar({
             'file_id': file_id,
-            'dados_dir': dados_dir,
             'extracted_data': None,
+            'perfil_dados': None,
             'instaprice_instance': None,
+            'api_key': None,
             'created_at': datetime.now(),
             'ready': False
-        }
+        })
+        workspace = self.workspaces.criar(session_id)
+        self.sessions.atualizar(session_id, workspace=workspace,
+                                dados_dir=dados_dir or workspace.diretorio_dados)
         return session_id
     
     def get_session(self, session_id: str):
-        """Recupera sessão existente"""
-        return self.sessions.get(session_id)
+        """Recupera sessão existente (renovando o prazo de inatividade)"""
+        return self.sessions.obter(session_id)
+    
+    def update_session(self, session_id: str, **campos) -> bool:
+        """Altera campos da sessão, recalculando a memória que ela ocupa"""
+        return self.sessions.atualizar(session_id, **campos)
     
-    def set_session_ready(self, session_id: str, instaprice_instance=None):
-        """Marca sessão como pronta para consultas"""
-        if session_id in self.sessions:
-            self.sessions[session_id]['ready'] = True
-            if instaprice_instance:
-                self.sessions[session_id]['instaprice_instance'] = instaprice_instance
+    def set_session_ready(self, session_id: str, instaprice_instance=None, api_key: Optional[str] = None):
+        """Marca sessão como pronta para consultas (a chave da API fica só em memória)"""
+        campos = {'ready': True}
+        if instaprice_instance:
+            campos['instaprice_instance'] = instaprice_instance
+        if api_key:
+            campos['api_key'] = api_key
+        self.sessions.atualizar(session_id, **campos)
+    
+    def get_perfil_dados(self, session_id: str) -> Optional[str]:
+        """
+        Resumo do dataset validado da sessão, usado pela crew de consulta nas perguntas
+        seguintes; gerado uma vez a partir do dataset se a execução não deixou perfil.
+        """
+        session = self.sessions.obter(session_id)
+        if session is None:
+            return None
+        if session['perfil_dados'] is None:
+            perfil = carregar_perfil(session['dados_dir']) or gerar_perfil(session['dados_dir'])
+            if perfil is not None:
+                self.sessions.atualizar(session_id, perfil_dados=resumo_perfil(perfil))
+        return session['perfil_dados']
     
     def is_session_ready(self, session_id: str) -> bool:
         """Verifica se sessão está pronta"""
-        session = self.sessions.get(session_id)
-        return session and session.get('ready', False)
+        session = self.sessions.obter(session_id)
+        return bool(session and session.get('ready', False))
+    
+    def close_session(self, session_id: str) -> bool:
+        """Encerra a sessão; o workspace é apagado quando a última execução em andamento terminar"""
+        return self.sessions.remover(session_id)
+
+    def limpar_expiradas(self) -> int:
+        return self.sessions.limpar_expiradas()
 
-manager = ConnectionManager()
+    def estatisticas(self) -> dict:
+        return self.sessions.estatisticas()
+
+# Ingestão em segundo plano logo após o upload
+class IngestionManager:
+    """
+    Extrai, valida, converte para o dataset colunar e gera o perfil de cada upload
+    assim que ele termina, sem agentes, informando o progresso pelo WebSocket.
+    
+    Cada conteúdo (SHA-256) tem no máximo uma ingestão em andamento; quando
+    /api/process é chamado, resta apenas a crew de consulta.
+    """
+    
+    def __init__(self, manager: ConnectionManager, max_concorrentes: int):
+        self.manager = manager
+        self.tarefas: Dict[str, asyncio.Task] = {}
+        self.estados: Dict[str, dict] = {}
+        self.semaforo = asyncio.Semaphore(max_concorrentes)
+    
+    def iniciar(self, entrada) -> Optional[asyncio.Task]:
+        """Agenda a ingestão do upload, a menos que ela já exista ou esteja em andamento"""
+        tarefa = self.tarefas.get(entrada.sha256)
+        if tarefa is not None and not tarefa.done():
+            return tarefa
+        if carregar_perfil(entrada.diretorio_dados) is not None:
+            self.estados[entrada.sha256] = {"status": "concluida", "etapa": "perfil", "reaproveitada": True}
+            return None
+        
+        self.estados[entrada.sha256] = {"status": "pendente", "etapa": None, "registros": {}}
+        tarefa = asyncio.create_task(self._executar(entrada))
+        self.tarefas[entrada.sha256] = tarefa
+        return tarefa
+    
+    def status(self, sha256: str) -> Optional[dict]:
+        return self.estados.get(sha256)
+    
+    async def aguardar(self, sha256: str) -> bool:
+        """Espera a ingestão em andamento; True se os dados ficaram prontos"""
+        tarefa = self.tarefas.get(sha256)
+        if tarefa is not None:
+            await asyncio.shield(tarefa)
+        estado = self.estados.get(sha256)
+        return bool(estado) and estado["status"] == "concluida"
+    
+    async def _notificar(self, tipo: str, sha256: str, **dados):
+        await self.manager.broadcast({
+            "type": tipo,
+            "data": {"file_id": sha256, **dados, "timestamp": datetime.now().isoformat()}
+        }, [f"file:{sha256}"])
+    
+    async def _executar(self, entrada):
+        sha256 = entrada.sha256
+        estado = self.estados[sha256]
+        loop = asyncio.get_running_loop()
+        
+        # Chamado pela thread de ingestão: atualiza o estado e envia o evento pelo event loop
+        def progresso(etapa: str, detalhes: dict):
+            def publicar():
+                estado["etapa"] = etapa
+                if "tipo" in detalhes:
+                    estado["registros"][detalhes["tipo"]] = detalhes.get("registros", 0)
+                asyncio.create_task(self._notificar("ingestion_progress", sha256, etapa=etapa, **detalhes))
+            loop.call_soon_threadsafe(publicar)
+        
+        try:
+            async with self.semaforo:
+                estado["status"] = "executando"
+                estado["inicio"] = datetime.now().isoformat()
+                await self._notificar("ingestion_started", sha256, filename=entrada.nome_arquivo)
+                perfil = await asyncio.to_thread(
+                    ingerir_arquivo,
+                    entrada.caminho_arquivo,
+                    entrada.diretorio_dados,
+                    get_setting('validation_chunk_size'),
+                    get_setting('validation_max_error_details'),
+                    None,
+                    progresso
+                )
+            estado.update(status="concluida", fim=datetime.now().isoformat())
+            linhas = {tipo: tabela["linhas"] for tipo, tabela in perfil["tabelas"].items()}
+            logger.info(f"Ingestão concluída: {entrada.nome_arquivo} (sha256 {sha256}) {linhas}")
+            await self._notificar("ingestion_completed", sha256, linhas=linhas)
+        except Exception as e:
+            # Sem ingestão, /api/process volta a usar a crew completa no workspace da sessão
+            estado.update(status="falhou", erro=str(e), fim=datetime.now().isoformat())
+            logger.warning(f"Ingestão de {entrada.nome_arquivo} falhou: {e}")
+            await self._notificar("ingestion_failed", sha256, error=str(e))
+        finally:
+            self.tarefas.pop(sha256, None)
+
+# Diretório para uploads temporários
+UPLOAD_DIR = Path(__file__).parent / "uploads"
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# Workspaces por sessão: as sessões vivem em memória, então os que sobraram
+# de uma execução anterior do servidor são removidos na inicialização
+workspaces = WorkspaceManager(UPLOAD_DIR / "sessoes")
+workspaces.limpar_orfaos()
+
+manager = ConnectionManager(
+    get_setting('websocket_client_queue_size'),
+    max_eventos_topico=get_setting('websocket_replay_events'),
+    max_topicos_historico=get_setting('websocket_replay_topics')
+)
+# Logs do terminal (threads do servidor e workers da crew) saem por uma única fila,
+# em frames de várias linhas
+log_pump = LogPump(
+    manager.broadcast,
+    intervalo=get_setting('websocket_log_batch_ms') / 1000,
+    max_linhas_frame=get_setting('websocket_log_batch_lines')
+)
 log_capture = SafeLogCapture()
-log_capture.set_manager(manager)
-analysis_sessions = AnalysisSession()
+log_capture.set_pump(log_pump)
+analysis_sessions = AnalysisSession(workspaces)
 
 # Modelos Pydantic
 class UploadResponse(BaseModel):
@@ -210,6 +313,20 @@ class UploadResponse(BaseModel):
     message: str
     file_id: Optional[str] = None
     filename: Optional[str] = None
+    sha256: Optional[str] = None
+    duplicate: bool = False
+
+class ChunkedUploadRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+class ChunkedUploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int
+    size: Optional[int] = None
+    chunk_size: int
 
 class ProcessResponse(BaseModel):
     success: bool
@@ -226,6 +343,17 @@ class QueryResponse(BaseModel):
     message: str
     results: Optional[dict] = None
 
+class JobStatus(BaseModel):
+    job_id: str
+    tipo: str
+    fila: str
+    status: str
+    posicao: Optional[int] = None
+    criado_em: str
+    iniciado_em: Optional[str] = None
+    concluido_em: Optional[str] = None
+    erro: Optional[str] = None
+
 class ApiTestRequest(BaseModel):
     apiKey: str
     model: str
@@ -235,9 +363,40 @@ class ProcessRequest(BaseModel):
     model: str
     pergunta: str = "Analise os dados das notas fiscais"
 
-# Diretório para uploads temporários
-UPLOAD_DIR = Path(__file__).parent / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Uploads endereçados pelo SHA-256 do conteúdo (file_id = hash)
+upload_store = UploadStore(UPLOAD_DIR / "conteudo")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+ingestao = IngestionManager(manager, get_setting('max_concurrent_jobs'))
+
+@app.on_event("startup")
+async def aquecer_workers_crew():
+    """Inicia os workers da crew em segundo plano, já com CrewAI importado"""
+    from subprocess_runner import obter_pool
+    asyncio.create_task(obter_pool().aquecer())
+
+@app.on_event("startup")
+async def iniciar_fila_jobs():
+    log_pump.iniciar()
+    await job_queue.iniciar()
+
+@app.on_event("startup")
+async def iniciar_limpeza_sessoes():
+    """Remove periodicamente as sessões inativas além do TTL (e os seus workspaces)"""
+    async def limpar():
+        while True:
+            await asyncio.sleep(60)
+            removidas = analysis_sessions.limpar_expiradas()
+            if removidas:
+                logger.info(f"🧹 {removidas} sessão(ões) expirada(s) removida(s)")
+    asyncio.create_task(limpar())
+
+@app.on_event("shutdown")
+async def encerrar_workers_crew():
+    await job_queue.encerrar()
+    from subprocess_runner import obter_pool
+    await obter_pool().encerrar()
+    await log_pump.encerrar()
 
 @app.get("/")
 async def root():
@@ -247,65 +406,273 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+ALLOWED_UPLOAD_EXTENSIONS = {'.zip', '.7z', '.rar', '.tar', '.gz', '.tgz', '.csv', '.xlsx', '.xls'}
+
+def validar_extensao_upload(filename: str):
+    file_extension = Path(filename).suffix.lower()
+    if file_extension not in ALLOWED_UPLOAD_EXTENSIONS:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Tipo de arquivo não suportado: {file_extension}"
+        )
+
+def erro_upload_http(erro: Exception) -> HTTPException:
+    """Converte erros do armazenamento de uploads em respostas HTTP"""
+    if isinstance(erro, UploadOffsetError):
+        return HTTPException(status_code=409, detail={"message": erro.message, "offset": erro.expected_offset})
+    if isinstance(erro, DataIntegrityError):
+        return HTTPException(status_code=422, detail=erro.message)
+    if isinstance(erro, FileProcessingError):
+        return HTTPException(status_code=413 if erro.file_size else 400, detail=erro.message)
+    return HTTPException(status_code=500, detail=f"Erro no upload: {str(erro)}")
+
+async def concluir_upload(gravador, filename: str) -> UploadResponse:
+    """Move o arquivo recebido para o armazenamento e avisa o frontend"""
+    entrada = await asyncio.to_thread(gravador.finalizar)
+    file_id = entrada.sha256
+
+    if entrada.duplicado:
+        logger.info(f"Arquivo já armazenado: {entrada.caminho_arquivo} (sha256 {file_id})")
+    else:
+        logger.info(f"Arquivo salvo: {entrada.caminho_arquivo} ({entrada.tamanho} bytes, sha256 {file_id})")
+
+    # Envia notificação via WebSocket
+    await manager.broadcast({
+        "type": "file_uploaded",
+        "data": {
+            "file_id": file_id,
+            "filename": filename,
+            "size": entrada.tamanho,
+            "duplicate": entrada.duplicado,
+            "timestamp": datetime.now().isoformat()
+        }
+    }, [f"file:{file_id}"])
+
+    # Extração, validação e perfil começam já, enquanto o usuário escolhe modelo e pergunta
+    ingestao.iniciar(entrada)
+
+    return UploadResponse(
+        success=True,
+        message="Arquivo já enviado anteriormente, dados reaproveitados!" if entrada.duplicado
+        else "Arquivo enviado com sucesso!",
+        file_id=file_id,
+        filename=filename,
+        sha256=entrada.sha256,
+        duplicate=entrada.duplicado
+    )
+
+def status_upload(gravador) -> ChunkedUploadStatus:
+    return ChunkedUploadStatus(
+        upload_id=gravador.upload_id,
+        filename=gravador.nome_arquivo,
+        offset=gravador.tamanho,
+        size=gravador.tamanho_esperado,
+        chunk_size=UPLOAD_CHUNK_SIZE
+    )
+
+async def obter_upload_pendente(upload_id: str):
+    # Após reiniciar o servidor o arquivo parcial é relido para refazer o hash: fora do event loop
+    gravador = await asyncio.to_thread(upload_store.retomar_upload, upload_id)
+    if gravador is None:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+    return gravador
+
 @app.post("/api/upload", response_model=UploadResponse)
 async def upload_file(file: UploadFile = File(...)):
     """Upload de arquivo para análise"""
     try:
         # Valida tipo de arquivo
-        allowed_extensions = {'.zip', '.csv', '.xlsx', '.xls'}
-        file_extension = Path(file.filename).suffix.lower()
-        
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Tipo de arquivo não suportado: {file_extension}"
-            )
+        validar_extensao_upload(file.filename)
 
-        # Gera ID único para o arquivo
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_id = f"{timestamp}_{file.filename}"
-        file_path = UPLOAD_DIR / file_id
+        # Salva arquivo calculando o SHA-256 durante a recepção; o hash é o file_id.
+        # A gravação em disco roda em thread para não bloquear o event loop
+        gravador = upload_store.novo_upload(file.filename, limite_bytes=InputValidator.MAX_ZIP_SIZE)
+        try:
+            while bloco := await file.read(UPLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(gravador.escrever, bloco)
+        except Exception:
+            gravador.descartar()
+            raise
 
-        logger.info(f"UPLOAD_DIR: {UPLOAD_DIR.absolute()}")
-        logger.info(f"file_path: {file_path.absolute()}")
-        logger.info(f"file_path existe: {file_path.exists()}")
+        return await concluir_upload(gravador, file.filename)
 
-        # Salva arquivo
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro no upload: {str(e)}")
+        raise erro_upload_http(e)
 
-        logger.info(f"Arquivo salvo: {file_path.absolute()} ({file.size} bytes)")
+# Upload retomável em partes:
+#   POST   /api/uploads                      -> cria o upload (nome, tamanho e SHA-256 opcional)
+#   PUT    /api/uploads/{id}?offset=N        -> corpo bruto gravado a partir do byte N
+#   GET    /api/uploads/{id}                 -> offset atual, para retomar após queda de conexão
+#   POST   /api/uploads/{id}/finalize        -> confere tamanho/hash e devolve o file_id
+#   DELETE /api/uploads/{id}                 -> cancela e apaga o arquivo parcial
 
-        # Envia notificação via WebSocket
-        await manager.broadcast({
-            "type": "file_uploaded",
-            "data": {
-                "file_id": file_id,
-                "filename": file.filename,
-                "size": file.size,
-                "timestamp": datetime.now().isoformat()
-            }
-        })
-
-        return UploadResponse(
-            success=True,
-            message="Arquivo enviado com sucesso!",
-            file_id=file_id,
-            filename=file.filename
+@app.post("/api/uploads", response_model=ChunkedUploadStatus)
+async def create_chunked_upload(request: ChunkedUploadRequest):
+    """Inicia um upload em partes"""
+    validar_extensao_upload(request.filename)
+    if request.size < 0:
+        raise HTTPException(status_code=400, detail="Tamanho inválido")
+    try:
+        gravador = await asyncio.to_thread(
+            upload_store.novo_upload,
+            request.filename,
+            InputValidator.MAX_ZIP_SIZE,
+            request.size,
+            request.sha256
         )
+    except Exception as e:
+        logger.error(f"Erro ao iniciar upload: {str(e)}")
+        raise erro_upload_http(e)
+
+    logger.info(f"Upload em partes iniciado: {gravador.nome_arquivo} ({request.size} bytes, id {gravador.upload_id})")
+    return status_upload(gravador)
 
+@app.get("/api/uploads/{upload_id}", response_model=ChunkedUploadStatus)
+async def get_chunked_upload(upload_id: str):
+    """Offset atual de um upload em partes"""
+    return status_upload(await obter_upload_pendente(upload_id))
+
+@app.put("/api/uploads/{upload_id}", response_model=ChunkedUploadStatus)
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """Grava o corpo da requisição a partir de `offset`"""
+    gravador = await obter_upload_pendente(upload_id)
+    if offset != gravador.tamanho:
+        raise erro_upload_http(UploadOffsetError(
+            f"Bloco fora de ordem: esperado offset {gravador.tamanho}, recebido {offset}",
+            expected_offset=gravador.tamanho
+        ))
+
+    # O corpo é acumulado até UPLOAD_CHUNK_SIZE e gravado em thread; cada gravação confere
+    # o offset, então PUTs concorrentes no mesmo upload são recusados em vez de intercalados
+    recebido = bytearray()
+    posicao = offset
+    try:
+        try:
+            async for parte in request.stream():
+                recebido += parte
+                if len(recebido) >= UPLOAD_CHUNK_SIZE:
+                    posicao = await asyncio.to_thread(gravador.escrever, bytes(recebido), posicao)
+                    recebido.clear()
+        except ClientDisconnect:
+            # O que já chegou é mantido; o cliente consulta o offset e retoma dali
+            logger.info(f"Conexão perdida durante upload {upload_id} após {posicao + len(recebido)} bytes")
+        if recebido:
+            await asyncio.to_thread(gravador.escrever, bytes(recebido), posicao)
     except Exception as e:
-        logger.error(f"Erro no upload: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erro no upload: {str(e)}")
+        logger.error(f"Erro no upload {upload_id}: {str(e)}")
+        raise erro_upload_http(e)
 
-@app.post("/api/process/{file_id}", response_model=ProcessResponse)
-async def process_file(file_id: str, request: ProcessRequest):
-    """Processa arquivo com a lógica do Instaprice"""
+    return status_upload(gravador)
+
+@app.post("/api/uploads/{upload_id}/finalize", response_model=UploadResponse)
+async def finalize_chunked_upload(upload_id: str):
+    """Conclui um upload em partes"""
+    gravador = await obter_upload_pendente(upload_id)
     try:
-        file_path = UPLOAD_DIR / file_id
-        
-        if not file_path.exists():
+        return await concluir_upload(gravador, gravador.nome_arquivo)
+    except Exception as e:
+        logger.error(f"Erro ao finalizar upload {upload_id}: {str(e)}")
+        raise erro_upload_http(e)
+
+@app.delete("/api/uploads/{upload_id}")
+async def cancel_chunked_upload(upload_id: str):
+    """Cancela um upload em partes"""
+    gravador = await obter_upload_pendente(upload_id)
+    await asyncio.to_thread(gravador.descartar)
+    return {"success": True, "upload_id": upload_id}
+
+@app.get("/api/files/{file_id}/ingestion")
+async def ingestion_status(file_id: str):
+    """Andamento da ingestão em segundo plano de um upload"""
+    estado = ingestao.status(file_id)
+    if estado is None:
+        entrada = upload_store.obter(file_id)
+        if entrada is None:
             raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+        estado = {"status": "concluida" if carregar_perfil(entrada.diretorio_dados) is not None else "pendente"}
+    return {"file_id": file_id, **estado}
+
+def localizar_arquivo(file_id: str):
+    """Upload pelo SHA-256 (entrada do UploadStore) ou, para nomes antigos, direto em UPLOAD_DIR"""
+    entrada = upload_store.obter(file_id)
+    if entrada is not None:
+        file_path = Path(entrada.caminho_arquivo)
+    else:
+        file_path = UPLOAD_DIR / Path(file_id).name
+    
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    return entrada, file_path
+
+def chave_api_job(parametros: dict) -> str:
+    """A chave da API fica só em memória; jobs retomados após reinício usam a do ambiente"""
+    api_key = parametros.get('apiKey') or os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise HTTPException(status_code=400, detail="Chave da API indisponível para o job (servidor reiniciado)")
+    return api_key
+
+async def executar_crew(instaprice: Instaprice, inputs: dict, somente_consulta: bool,
+                        api_key: Optional[str], preparacao_direta: bool = False):
+    """
+    Executa a crew sem bloquear o event loop: em um worker do pool (logs do
+    terminal pelo WebSocket) ou, se o runner não estiver disponível, em uma
+    thread com a captura de stdout.
+    """
+    try:
+        from subprocess_runner import run_crewai_subprocess
+    except ImportError:
+        # Fallback para método original se subprocess não disponível
+        await manager.broadcast({
+            "type": "log",
+            "data": {
+                "message": "⚠️ Subprocess não disponível, usando método padrão...",
+                "level": "warning",
+                "timestamp": datetime.now().strftime("%H:%M:%S")
+            }
+        })
+        
+        def kickoff():
+            crew, inputs_crew = instaprice.montar_crew(inputs, somente_consulta, preparacao_direta)
+            return crew.kickoff(inputs=inputs_crew)
+        
+        log_capture.start_capture()
+        try:
+            return await asyncio.to_thread(kickoff)
+        finally:
+            log_capture.stop_capture()
+    
+    # Executa via subprocess e captura output real do terminal
+    resultado_subprocess = await run_crewai_subprocess(
+        inputs, manager, somente_consulta, api_key=api_key,
+        preparacao_direta=preparacao_direta, log_pump=log_pump
+    )
+    if not resultado_subprocess["success"]:
+        error_msg = resultado_subprocess.get("error", "Erro desconhecido no subprocess")
+        raise Exception(f"Erro no subprocess: {error_msg}")
+    
+    await manager.broadcast({
+        "type": "log",
+        "data": {
+            "message": "✅ Subprocess executado com sucesso!",
+            "level": "success",
+            "timestamp": datetime.now().strftime("%H:%M:%S")
+        }
+    })
+    return resultado_subprocess["result"]
+
+async def executar_processamento(parametros: dict) -> dict:
+    """Processa arquivo com a lógica do Instaprice (job da fila de lote)"""
+    file_id = parametros['file_id']
+    # Eventos e logs deste job vão só para quem assina o job ou o arquivo (e, depois, a sessão)
+    definir_canais(f"job:{parametros['job_id']}", f"file:{file_id}")
+    request = ProcessRequest(apiKey=chave_api_job(parametros), model=parametros['model'],
+                             pergunta=parametros['pergunta'])
+    session_id = None
+    try:
+        entrada, file_path = localizar_arquivo(file_id)
 
         # Envia notificação de início do processamento
         await manager.broadcast({
@@ -317,21 +684,36 @@ async def process_file(file_id: str, request: ProcessRequest):
             }
         })
 
-        # Usa o diretório de uploads como base (onde o tool extrairá)
-        base_dir = UPLOAD_DIR
-        dados_dir = base_dir / "dados" / "notasfiscais"
-        dados_dir.mkdir(parents=True, exist_ok=True)
+        # A ingestão em segundo plano pode ainda estar validando o arquivo
+        if entrada is not None and ingestao.tarefas.get(entrada.sha256) is not None:
+            await manager.broadcast({
+                "type": "log",
+                "data": {
+                    "message": "⏳ Aguardando a validação do arquivo iniciada no upload...",
+                    "level": "info",
+                    "timestamp": datetime.now().strftime("%H:%M:%S")
+                }
+            })
+            await ingestao.aguardar(entrada.sha256)
 
-        logger.info(f"Processando arquivo: {file_path.absolute()}")
-        logger.info(f"Base dir: {base_dir.absolute()}")
-        logger.info(f"Diretório dados: {dados_dir.absolute()}")
+        # Dados já ingeridos: reaproveita (só leitura) o dataset validado e o perfil
+        perfil = carregar_perfil(entrada.diretorio_dados) if entrada is not None else None
+        somente_consulta = perfil is not None
         
-        # Verifica se arquivo existe
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"Arquivo não encontrado: {file_path.absolute()}")
+        # Sem dados prontos, extração e validação rodam em Python antes da crew (sem agentes)
+        preparacao_direta = not somente_consulta and get_setting('fast_path_preparation')
+
+        # Cria sessão de análise com workspace próprio (dados e saída isolados)
+        session_id = analysis_sessions.create_session(
+            file_id, entrada.diretorio_dados if somente_consulta else None
+        )
+        adicionar_canal(f"session:{session_id}")
+        session = analysis_sessions.get_session(session_id)
+        workspace = session['workspace']
+        dados_dir = Path(session['dados_dir'])
 
-        # Cria sessão de análise
-        session_id = analysis_sessions.create_session(file_id, str(dados_dir.absolute()))
+        logger.info(f"Processando arquivo: {file_path.absolute()}")
+        logger.info(f"Diretório dados: {dados_dir} (workspace {workspace.raiz})")
         
         # Envia logs via WebSocket
         await manager.broadcast({
@@ -345,60 +727,51 @@ async def process_file(file_id: str, request: ProcessRequest):
 
         # Instancia o Instaprice com configuração da API
         instaprice = Instaprice()
-        
-        # Configura a chave API dinamicamente
-        import os
-        os.environ["GROQ_API_KEY"] = request.apiKey
+        instaprice.diretorio_saida = workspace.diretorio_saida
+        # Chave do job só no LLM desta execução: jobs concorrentes não compartilham os.environ
+        # (no worker da crew ela segue no payload do job)
+        instaprice.llm = obter_llm(request.apiKey)
         
         # Prepara inputs para o CrewAI com caminhos absolutos
         inputs = {
             'caminho_zip': str(file_path.absolute()),
             'pergunta_usuario': request.pergunta,
-            'diretorio_dados': str(dados_dir.absolute())
+            'diretorio_dados': str(dados_dir),
+            'diretorio_saida': workspace.diretorio_saida
         }
         
-        # NOVA ABORDAGEM: Executa CrewAI via subprocess para capturar terminal real
-        try:
-            from subprocess_runner import run_crewai_subprocess
-            
-            # Executa via subprocess e captura output real do terminal
-            resultado_subprocess = await run_crewai_subprocess(inputs, manager)
-            
-            if resultado_subprocess["success"]:
-                # Cria instância local do Instaprice para a sessão
-                instaprice = Instaprice()
-                analysis_sessions.set_session_ready(session_id, instaprice)
-                resultado = resultado_subprocess["result"]
-                
-                await manager.broadcast({
-                    "type": "log",
-                    "data": {
-                        "message": "✅ Subprocess executado com sucesso!",
-                        "level": "success",
-                        "timestamp": datetime.now().strftime("%H:%M:%S")
-                    }
-                })
-            else:
-                error_msg = resultado_subprocess.get("error", "Erro desconhecido no subprocess")
-                raise Exception(f"Erro no subprocess: {error_msg}")
-                
-        except ImportError:
-            # Fallback para método original se subprocess não disponível
+        if somente_consulta:
+            inputs['perfil_dados'] = resumo_perfil(perfil)
+            analysis_sessions.update_session(session_id, perfil_dados=inputs['perfil_dados'])
             await manager.broadcast({
                 "type": "log",
                 "data": {
-                    "message": "⚠️ Subprocess não disponível, usando método padrão...",
-                    "level": "warning",
+                    "message": "♻️ Arquivo já processado anteriormente: reaproveitando dados validados, indo direto para a pergunta",
+                    "level": "info",
                     "timestamp": datetime.now().strftime("%H:%M:%S")
                 }
             })
-            
-            log_capture.start_capture()
-            try:
-                resultado = instaprice.crew().kickoff(inputs=inputs)
-                analysis_sessions.set_session_ready(session_id, instaprice)
-            finally:
-                log_capture.stop_capture()
+        elif preparacao_direta:
+            await manager.broadcast({
+                "type": "log",
+                "data": {
+                    "message": "⚡ Extração e validação executadas direto em Python; os agentes cuidam apenas da pergunta",
+                    "level": "info",
+                    "timestamp": datetime.now().strftime("%H:%M:%S")
+                }
+            })
+        
+        # NOVA ABORDAGEM: Executa CrewAI via subprocess para capturar terminal real
+        # (quantas análises rodam ao mesmo tempo é limitado pelos consumidores da fila de jobs)
+        with workspaces.em_uso(session_id):
+            resultado = await executar_crew(instaprice, inputs, somente_consulta, request.apiKey,
+                                            preparacao_direta)
+            analysis_sessions.set_session_ready(session_id, instaprice, api_key=request.apiKey)
+
+            # Dataset validado no workspace passa a ser reaproveitado por reenvios do mesmo arquivo
+            # (ainda com o workspace em uso, para a sessão não ser removida durante a cópia)
+            if entrada is not None and not somente_consulta:
+                await asyncio.to_thread(upload_store.publicar_dados, entrada.sha256, dados_dir)
 
         await manager.broadcast({
             "type": "log", 
@@ -411,7 +784,7 @@ async def process_file(file_id: str, request: ProcessRequest):
 
         # Procura arquivo de sugestões
         suggestions_file = None
-        for file in dados_dir.rglob("sugestoes_instaprice.md"):
+        for file in Path(workspace.raiz).rglob("sugestoes_instaprice.md"):
             suggestions_file = str(file)
             break
 
@@ -431,11 +804,22 @@ async def process_file(file_id: str, request: ProcessRequest):
             results={"resposta": resultado},
             suggestions_file=suggestions_file,
             session_id=session_id
-        )
+        ).dict()
 
+    except HTTPException:
+        raise
+    except asyncio.CancelledError:
+        # Job cancelado: a sessão não chegou a ficar pronta
+        if session_id:
+            analysis_sessions.close_session(session_id)
+        raise
     except Exception as e:
         logger.error(f"Erro no processamento: {str(e)}")
         
+        # Sessão que falhou não recebe consultas: libera o workspace
+        if session_id:
+            analysis_sessions.close_session(session_id)
+        
         await manager.broadcast({
             "type": "log",
             "data": {
@@ -447,17 +831,24 @@ async def process_file(file_id: str, request: ProcessRequest):
 
         raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
 
-@app.post("/api/query/{session_id}", response_model=QueryResponse)
-async def query_session(session_id: str, request: QueryRequest):
-    """Executa nova pergunta usando sessão existente sem reprocessar arquivo"""
+def validar_sessao_consulta(session_id: str) -> dict:
+    """Sessão existente e pronta para receber perguntas"""
+    session = analysis_sessions.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    
+    if not analysis_sessions.is_session_ready(session_id):
+        raise HTTPException(status_code=400, detail="Sessão ainda não está pronta para consultas")
+    return session
+
+async def executar_consulta(parametros: dict) -> dict:
+    """Executa nova pergunta usando sessão existente sem reprocessar arquivo (job da fila interativa)"""
+    session_id = parametros['session_id']
+    definir_canais(f"job:{parametros['job_id']}", f"session:{session_id}")
+    request = QueryRequest(question=parametros['question'])
     try:
         # Verifica se sessão existe e está pronta
-        session = analysis_sessions.get_session(session_id)
-        if not session:
-            raise HTTPException(status_code=404, detail="Sessão não encontrada")
-        
-        if not analysis_sessions.is_session_ready(session_id):
-            raise HTTPException(status_code=400, detail="Sessão ainda não está pronta para consultas")
+        session = validar_sessao_consulta(session_id)
         
         # Recupera instância do Instaprice da sessão
         instaprice_instance = session.get('instaprice_instance')
@@ -478,18 +869,26 @@ async def query_session(session_id: str, request: QueryRequest):
         inputs = {
             'caminho_zip': session['file_id'],  # Mantém referência do arquivo original
             'pergunta_usuario': request.question,
-            'diretorio_dados': session['dados_dir']
+            'diretorio_dados': session['dados_dir'],
+            'diretorio_saida': session['workspace'].diretorio_saida
         }
         
-        # Inicia captura de logs
-        log_capture.start_capture()
-        
-        try:
+        # O workspace não é apagado enquanto a consulta usa os dados da sessão
+        with workspaces.em_uso(session_id) as workspace:
+            if workspace is None:
+                raise HTTPException(status_code=404, detail="Sessão encerrada")
+            
+            # Perguntas seguintes começam na interpretação, sobre o dataset já validado:
+            # sem extração nem validação, o tempo depende só da pergunta
+            perfil_dados = await asyncio.to_thread(analysis_sessions.get_perfil_dados, session_id)
+            if perfil_dados is not None:
+                inputs['perfil_dados'] = perfil_dados
+            else:
+                logger.warning(f"Sessão {session_id} sem dataset validado: usando a crew completa")
+            
             # Executa apenas a análise da nova pergunta
-            resultado = instaprice_instance.crew().kickoff(inputs=inputs)
-        finally:
-            # Para captura de logs
-            log_capture.stop_capture()
+            resultado = await executar_crew(instaprice_instance, inputs, perfil_dados is not None,
+                                            session.get('api_key'))
         
         await manager.broadcast({
             "type": "log",
@@ -504,8 +903,10 @@ async def query_session(session_id: str, request: QueryRequest):
             success=True,
             message="Consulta processada com sucesso!",
             results={"resposta": resultado}
-        )
+        ).dict()
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro na consulta da sessão: {str(e)}")
         
@@ -520,6 +921,177 @@ async def query_session(session_id: str, request: QueryRequest):
         
         raise HTTPException(status_code=500, detail=f"Erro na consulta: {str(e)}")
 
+async def notificar_job(job):
+    await manager.broadcast({
+        "type": "job_status",
+        "data": {
+            "job_id": job.job_id,
+            "tipo": job.tipo,
+            "status": job.status,
+            "erro": job.erro,
+            "timestamp": datetime.now().isoformat()
+        }
+    }, [f"job:{job.job_id}"] + [
+        f"{topico}:{job.parametros[chave]}"
+        for topico, chave in (("file", "file_id"), ("session", "session_id")) if chave in job.parametros
+    ])
+
+# Jobs persistidos em SQLite: os pendentes sobrevivem a um reinício do servidor
+job_queue = JobQueue(
+    JobStore(UPLOAD_DIR / "jobs.sqlite3"),
+    {"process": executar_processamento, "query": executar_consulta},
+    consumidores=get_setting('max_concurrent_jobs'),
+    reservados_interativos=get_setting('jobs_interactive_reserved'),
+    max_pendentes=get_setting('jobs_max_pending'),
+    ao_mudar=notificar_job,
+    retencao_segundos=get_setting('jobs_retention_hours') * 3600
+)
+
+async def aguardar_job_http(job):
+    """Mantém a resposta síncrona dos endpoints antigos: espera o job e devolve o seu resultado"""
+    try:
+        job = await job_queue.aguardar(job.job_id)
+    except asyncio.CancelledError:
+        # Cliente desconectou: o job é cancelado junto com a requisição
+        await job_queue.cancelar(job.job_id)
+        raise
+    if job.status == JOB_CONCLUIDO:
+        return job.resultado
+    if job.status == JOB_CANCELADO:
+        raise HTTPException(status_code=409, detail="Job cancelado")
+    # Erros do executor (400, 404...) mantêm o status que os endpoints sempre devolveram
+    raise HTTPException(status_code=job.codigo_erro or 500, detail=job.erro)
+
+@app.post("/api/process/{file_id}", response_model=ProcessResponse)
+async def process_file(file_id: str, request: ProcessRequest):
+    """Processa arquivo com a lógica do Instaprice, esperando o job terminar"""
+    job = await submeter_job("process", {
+        'file_id': file_id, 'model': request.model, 'pergunta': request.pergunta
+    }, FILA_LOTE, {'apiKey': request.apiKey})
+    return await aguardar_job_http(job)
+
+@app.post("/api/query/{session_id}", response_model=QueryResponse)
+async def query_session(session_id: str, request: QueryRequest):
+    """Executa nova pergunta na sessão, esperando o job terminar"""
+    job = await submeter_job("query", {'session_id': session_id, 'question': request.question}, FILA_INTERATIVA)
+    return await aguardar_job_http(job)
+
+# Jobs assíncronos: o envio devolve o id na hora; status, resultado e cancelamento por id
+async def submeter_job(tipo: str, parametros: dict, fila: str, segredos: Optional[dict] = None):
+    # Requisições inválidas falham na hora, sem ocupar a fila
+    if tipo == "process":
+        localizar_arquivo(parametros['file_id'])
+    else:
+        validar_sessao_consulta(parametros['session_id'])
+    try:
+        return await job_queue.submeter(tipo, parametros, fila, segredos)
+    except RateLimitError as e:
+        raise HTTPException(status_code=429, detail=e.message, headers={"Retry-After": str(e.retry_after)})
+
+def status_job(job) -> JobStatus:
+    return JobStatus(
+        job_id=job.job_id,
+        tipo=job.tipo,
+        fila=job.fila,
+        status=job.status,
+        posicao=job_queue.posicao(job.job_id),
+        criado_em=job.criado_em,
+        iniciado_em=job.iniciado_em,
+        concluido_em=job.concluido_em,
+        erro=job.erro
+    )
+
+async def obter_job(job_id: str):
+    job = await job_queue.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@app.post("/api/jobs/process/{file_id}", response_model=JobStatus, status_code=202)
+async def submit_process_job(file_id: str, request: ProcessRequest):
+    job = await submeter_job("process", {
+        'file_id': file_id, 'model': request.model, 'pergunta': request.pergunta
+    }, FILA_LOTE, {'apiKey': request.apiKey})
+    return status_job(job)
+
+@app.post("/api/jobs/query/{session_id}", response_model=JobStatus, status_code=202)
+async def submit_query_job(session_id: str, request: QueryRequest):
+    job = await submeter_job("query", {'session_id': session_id, 'question': request.question}, FILA_INTERATIVA)
+    return status_job(job)
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    return status_job(await obter_job(job_id))
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Resultado do job finalizado (o mesmo corpo de /api/process ou /api/query)"""
+    job = await obter_job(job_id)
+    if not job.finalizado:
+        return JSONResponse(status_code=202, content=status_job(job).dict())
+    return {"job_id": job.job_id, "status": job.status, "resultado": job.resultado, "erro": job.erro}
+
+@app.delete("/api/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    await obter_job(job_id)
+    return status_job(await job_queue.cancelar(job_id))
+
+def seq_retomada(valor: Union[str, int, None]) -> Optional[int]:
+    """Último `seq` recebido pelo cliente (Last-Event-ID, `?since=`); None se ausente ou inválido"""
+    try:
+        return int(valor) if valor not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+async def fluxo_sse(request: Request, topicos: list) -> StreamingResponse:
+    """Eventos dos tópicos por SSE, retomando do Last-Event-ID (ou `?since=`) se informado"""
+    desde = seq_retomada(request.headers.get("last-event-id") or request.query_params.get("since"))
+    canal = CanalSSE()
+    cliente = await manager.connect(canal)
+    manager.assinar(canal, topicos, desde)
+
+    async def eventos():
+        try:
+            async for bloco in canal.eventos(cliente):
+                yield bloco
+        finally:
+            manager.disconnect(canal)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/events")
+async def stream_events(request: Request, topics: str):
+    """Alternativa ao WebSocket: eventos dos tópicos em `?topics=a,b` por Server-Sent Events"""
+    topicos = [topico for topico in topics.split(",") if topico]
+    if not topicos:
+        raise HTTPException(status_code=400, detail="Informe ao menos um tópico")
+    return await fluxo_sse(request, topicos)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Eventos (logs e status) de um job por SSE"""
+    await obter_job(job_id)
+    return await fluxo_sse(request, [f"job:{job_id}"])
+
+@app.get("/api/sessions/stats")
+async def session_stats():
+    """Sessões em memória, memória estimada e remoções por TTL ou limite"""
+    return analysis_sessions.estatisticas()
+
+@app.get("/api/extraction/stats")
+async def extraction_stats():
+    """Vazão acumulada de cada backend de arquivo compactado neste processo"""
+    return {formato: {**estatisticas.dict(), "bytes_por_segundo": estatisticas.bytes_por_segundo}
+            for formato, estatisticas in estatisticas_backends().items()}
+
+@app.delete("/api/sessions/{session_id}")
+async def close_session(session_id: str):
+    """Encerra a sessão e remove o seu workspace"""
+    if not analysis_sessions.close_session(session_id):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return {"success": True, "session_id": session_id}
+
 @app.post("/api/groq/test")
 async def test_groq_connection(request: ApiTestRequest):
     """Testa conexão com Groq API de forma rápida"""
@@ -534,9 +1106,9 @@ async def test_groq_connection(request: ApiTestRequest):
             max_tokens=10  # Mínimo possível para ser rápido
         )
         
-        # Faz uma chamada direta simples via LLM do CrewAI
-        test_response = test_llm.call(
-            messages=[{"role": "user", "content": "OK"}]
+        # Faz uma chamada direta simples via LLM do CrewAI (fora do event loop)
+        test_response = await asyncio.to_thread(
+            test_llm.call, messages=[{"role": "user", "content": "OK"}]
         )
         
         return {
@@ -591,8 +1163,27 @@ async def download_file(file_id: str):
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket para logs em tempo real com heartbeat"""
-    await manager.connect(websocket)
+    """
+    WebSocket para logs em tempo real com heartbeat.
+    
+    O cliente recebe só os eventos dos tópicos que assina (`job:<id>`, `session:<id>`,
+    `file:<file_id>`), em `?topics=a,b` na conexão ou com mensagens
+    {"type": "subscribe"|"unsubscribe", "topics": [...]}. Com `?encoding=msgpack`
+    os frames seguem em MessagePack binário (a mensagem "connected" informa a
+    codificação aceita).
+
+    Os eventos trazem `seq`; ao reconectar, o cliente informa o último recebido
+    (`?since=` ou "since" no subscribe) e recebe antes os eventos perdidos que
+    ainda estão no histórico. Se o `stream` da mensagem "connected" mudou, o
+    servidor reiniciou e a numeração recomeçou.
+    """
+    topicos = [topico for topico in websocket.query_params.get("topics", "").split(",") if topico]
+    codificacao = negociar_codificacao(websocket.query_params.get("encoding"))
+    cliente = await manager.connect(websocket, (), codificacao)
+    cliente.enfileirar({"type": "connected", "encoding": codificacao, "topics": sorted(set(topicos)),
+                        "stream": manager.historico.fluxo, "seq": manager.historico.seq})
+    manager.assinar(websocket, topicos, seq_retomada(websocket.query_params.get("since")))
+    heartbeat_task = None
     try:
         # Enviar heartbeat a cada 30 segundos
         async def heartbeat():
@@ -612,8 +1203,20 @@ async def websocket_endpoint(websocket: WebSocket):
                     websocket.receive_text(), 
                     timeout=60.0
                 )
-                # Echo da mensagem para manter viva
-                await websocket.send_json({
+                try:
+                    pedido = json.loads(message)
+                except ValueError:
+                    pedido = {}
+                if pedido.get("type") in ("subscribe", "unsubscribe"):
+                    pedidos = [str(topico) for topico in pedido.get("topics", [])]
+                    if pedido["type"] == "subscribe":
+                        assinados = manager.assinar(websocket, pedidos, seq_retomada(pedido.get("since")))
+                    else:
+                        assinados = manager.cancelar_assinatura(websocket, pedidos)
+                    cliente.enfileirar({"type": "subscribed", "topics": sorted(assinados)})
+                    continue
+                # Echo da mensagem para manter viva (pela fila do cliente, em ordem com os eventos)
+                cliente.enfileirar({
                     "type": "pong",
                     "timestamp": datetime.now().isoformat()
                 })
@@ -643,6 +1246,7 @@ if __name__ == "__main__":
         port=8000,
         reload=True,
         log_level="info",
+        ws_per_message_deflate=True,  # Frames de log comprimidos (permessage-deflate)
         timeout_keep_alive=120,  # Keep-alive timeout
         timeout_graceful_shutdown=30,  # Graceful shutdown timeout
         limit_concurrency=100,  # Limit concurrent connections
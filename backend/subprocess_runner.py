@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 """
 Runner subprocess para executar CrewAI e capturar output real do terminal
+
+As execuções rodam em um pool de workers persistentes (crew_worker.py), que já
+têm CrewAI, pandas e litellm importados. Cada worker recebe jobs pelo stdin e
+devolve logs e resultado linha a linha pelo stdout; ele é reciclado após um
+número de execuções ou quando a memória passa do limite.
 """
 
 import sys
 import os
 import json
-import subprocess
+import uuid
 import asyncio
 from datetime import datetime
 from pathlib import Path
@@ -14,222 +19,321 @@ from pathlib import Path
 # Adiciona o diretório backend ao path
 sys.path.insert(0, os.path.dirname(__file__))
 
-class SubprocessCrewAIRunner:
-    def __init__(self, websocket_manager=None):
-        self.websocket_manager = websocket_manager
-        
-    async def run_instaprice(self, inputs):
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+WORKER_SCRIPT = str(Path(__file__).resolve().parent / "crew_worker.py")
+LIMITE_LINHA_IPC = 16 * 1024 * 1024  # respostas finais longas chegam em uma única linha JSON
+
+
+class CrewWorker:
+    """Processo Python de longa duração que executa a crew, um job por vez"""
+
+    def __init__(self):
+        self.processo = None
+        self.pid = None
+        self.jobs = 0
+        self.memoria_mb = 0.0
+
+    @property
+    def vivo(self) -> bool:
+        return self.processo is not None and self.processo.returncode is None
+
+    async def iniciar(self):
+        """Inicia o processo e espera as importações pesadas terminarem"""
+        self.processo = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=os.path.dirname(WORKER_SCRIPT),
+            limit=LIMITE_LINHA_IPC
+        )
+        logs_inicio = []
+        while True:
+            mensagem = await self._ler()
+            if mensagem is None:
+                detalhes = "\n".join(logs_inicio[-20:])
+                raise RuntimeError(f"Worker da crew encerrou durante a inicialização:\n{detalhes}")
+            if mensagem["tipo"] == "pronto":
+                self.pid = mensagem["pid"]
+                logger.info(f"Worker da crew pronto (pid {self.pid})")
+                return
+            if mensagem["tipo"] == "log":
+                logs_inicio.append(mensagem["linha"])
+
+    async def _ler(self):
+        linha = await self.processo.stdout.readline()
+        if not linha:
+            await self.processo.wait()
+            return None
+        return json.loads(linha)
+
+    async def executar(self, job: dict, ao_log) -> dict:
         """
-        Executa o Instaprice em subprocess e captura output real do terminal
+        Envia o job e repassa cada linha de log a `ao_log` até o resultado chegar.
+
+        Se a espera for cancelada, o worker é encerrado: a crew não tem como ser
+        interrompida no meio e o processo não pode voltar ao pool ocupado.
         """
         try:
-            # Cria script Python temporário para execução
-            script_content = f'''#!/usr/bin/env python3
-import sys
-import os
-import json
+            self.processo.stdin.write((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+            await self.processo.stdin.drain()
+            while True:
+                mensagem = await self._ler()
+                if mensagem is None:
+                    return {
+                        "success": False,
+                        "error": f"Worker da crew encerrou inesperadamente (código {self.processo.returncode})",
+                        "return_code": self.processo.returncode
+                    }
+                if mensagem["tipo"] == "log":
+                    await ao_log(mensagem["linha"])
+                elif mensagem["tipo"] == "resultado" and mensagem["job_id"] == job["job_id"]:
+                    self.jobs = mensagem["jobs"]
+                    self.memoria_mb = mensagem["memoria_mb"]
+                    return {**mensagem, "return_code": 0}
+        except (asyncio.CancelledError, ConnectionError):
+            await self.encerrar(imediato=True)
+            raise
 
-# Adiciona o diretório backend ao path
-sys.path.insert(0, "{os.path.dirname(__file__)}")
-
-from instaprice import Instaprice
-
-def main():
-    print("🚀 [SUBPROCESS] Iniciando execução do CrewAI...")
-    
-    # Inputs recebidos
-    inputs = {repr(inputs)}
-    
-    print(f"📋 [SUBPROCESS] Configurações:")
-    print(f"   • Arquivo ZIP: {{inputs['caminho_zip']}}")
-    print(f"   • Pergunta: {{inputs['pergunta_usuario']}}")
-    print(f"   • Diretório: {{inputs['diretorio_dados']}}")
-    print("=" * 60)
-    
-    try:
-        # Instancia e executa o Instaprice
-        instaprice = Instaprice()
-        resultado = instaprice.crew().kickoff(inputs=inputs)
-        
-        print("=" * 60)
-        print("✅ [SUBPROCESS] Execução concluída!")
-        print(f"📊 [SUBPROCESS] Resultado obtido: {{len(str(resultado))}} caracteres")
-        
-        # Lê apenas a resposta final do Porta-Voz do arquivo gerado
-        porta_voz_file = "resposta_final_porta_voz.md"
-        final_response = ""
-        
-        if os.path.exists(porta_voz_file):
-            with open(porta_voz_file, "r", encoding="utf-8") as f:
-                final_response = f.read().strip()
-            print(f"📝 [SUBPROCESS] Resposta final capturada: {{len(final_response)}} caracteres")
+    async def encerrar(self, imediato: bool = False):
+        if not self.vivo:
+            return
+        if imediato:
+            self.processo.kill()
         else:
-            print("⚠️ [SUBPROCESS] Arquivo da resposta final não encontrado, usando resultado completo")
-            final_response = str(resultado)
-        
-        # Retorna resultado como JSON na última linha
-        print("__RESULT_START__")
-        print(json.dumps({{"success": True, "result": final_response}}))
-        print("__RESULT_END__")
-        
-    except Exception as e:
-        print("=" * 60)
-        print(f"❌ [SUBPROCESS] Erro durante execução: {{e}}")
-        print("__RESULT_START__")
-        print(json.dumps({{"success": False, "error": str(e)}}))
-        print("__RESULT_END__")
+            # Fim do stdin encerra o laço de jobs do worker
+            self.processo.stdin.close()
+        try:
+            await asyncio.wait_for(self.processo.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            self.processo.kill()
+            await self.processo.wait()
 
-if __name__ == "__main__":
-    main()
-'''
-            
-            # Salva script temporário
-            script_path = "/tmp/instaprice_subprocess.py"
-            with open(script_path, "w") as f:
-                f.write(script_content)
-            
-            # Torna o script executável
-            os.chmod(script_path, 0o755)
-            
-            # Executa o script e captura output em tempo real
-            process = subprocess.Popen(
-                [sys.executable, script_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1  # Line buffered
-            )
-            
-            # Captura output linha por linha em tempo real
-            output_lines = []
-            resultado_final = None
-            capturing_result = False
-            seen_lines = set()  # Cache para detectar duplicatas
-            
-            try:
-                while True:
-                    output = process.stdout.readline()
-                    
-                    # Se não há mais output e processo terminou
-                    if output == '' and process.poll() is not None:
-                        break
-                        
-                    if output:
-                        line = output.rstrip('\n')
-                        
-                        # Detecta início/fim do resultado
-                        if line == "__RESULT_START__":
-                            capturing_result = True
-                            continue
-                        elif line == "__RESULT_END__":
-                            capturing_result = False
-                            continue
-                        elif capturing_result:
-                            try:
-                                resultado_final = json.loads(line)
-                            except:
-                                pass
-                            continue
-                        
-                        # Sistema inteligente de filtro de duplicação
-                        skip_line = False
-                        
-                        # Remove prefixos e limpa a linha para comparação
-                        clean_line = line.replace("[SUBPROCESS] ", "").strip()
-                        
-                        # Permite logs de progresso dos agentes (verbose)
-                        is_agent_progress = any(marker in line for marker in [
-                            "Agent", "Working Agent", "Task", "Tool", "Action:", "Observation:",
-                            "Thought:", "🔄", "🚀", "✅", "❌", "⚠️", "📊", "🧠", "🎭", "💡", "🎩"
-                        ])
-                        
-                        # Permite logs de sistema importantes
-                        is_system_log = any(marker in line for marker in [
-                            "[SUBPROCESS]", "Initiating", "Starting", "Completed", "Error", "Warning"
-                        ])
-                        
-                        # Ignora linhas vazias ou apenas separadores
-                        if not clean_line or clean_line == "=" * 60:
-                            skip_line = True
-                        
-                        # Permite logs importantes sem verificar duplicação
-                        elif is_agent_progress or is_system_log:
-                            skip_line = False
-                        
-                        # Verifica duplicação apenas para conteúdo de resposta final
-                        elif clean_line in seen_lines:
-                            # Se é conteúdo longo (provável resposta de agente), bloqueia duplicação
-                            if len(clean_line) > 50:
-                                skip_line = True
-                        
-                        # Verifica duplicação de linhas consecutivas idênticas
-                        elif output_lines and len(output_lines) > 0:
-                            if output_lines[-1] == line:
-                                skip_line = True
-                        
-                        if not skip_line:
-                            # Adiciona linha limpa ao cache
-                            seen_lines.add(clean_line)
-                            
-                            # Adiciona à lista de output
-                            output_lines.append(line)
-                            
-                            # Envia para WebSocket em tempo real se disponível
-                            if self.websocket_manager:
-                                await self.websocket_manager.broadcast({
-                                    "type": "agent_log",
-                                    "data": {
-                                        "message": output,  # Output exato com quebra de linha
-                                        "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3],
-                                        "raw_terminal": True
-                                    }
-                                })
-                            
-                            # Também imprime no console atual para debug
-                            print(f"[SUBPROCESS] {line}")
-                        
-            except Exception as e:
-                print(f"❌ Erro durante captura: {e}")
-            
-            # Aguarda conclusão do processo
-            return_code = process.wait()
-            
-            # Remove script temporário
-            try:
-                os.remove(script_path)
-            except:
-                pass
-            
-            # Retorna resultado
-            if resultado_final:
-                return {
-                    "success": resultado_final.get("success", False),
-                    "result": resultado_final.get("result", ""),
-                    "error": resultado_final.get("error", ""),
-                    "output_lines": output_lines,
-                    "return_code": return_code
-                }
+
+class CrewWorkerPool:
+    """
+    Pool de workers aquecidos. Um worker atende um job por vez e é substituído
+    depois de `max_jobs` execuções, se passar de `max_memoria_mb` ou se morrer.
+    """
+
+    def __init__(self, tamanho: int, max_jobs: int, max_memoria_mb: int):
+        self.tamanho = tamanho
+        self.max_jobs = max_jobs
+        self.max_memoria_mb = max_memoria_mb
+        self._livres = asyncio.Queue()
+        self._total = 0
+        self._trava = asyncio.Lock()
+        self.reciclados = 0
+
+    async def _novo_worker(self) -> CrewWorker:
+        worker = CrewWorker()
+        try:
+            await worker.iniciar()
+        except Exception:
+            await worker.encerrar(imediato=True)
+            async with self._trava:
+                self._total -= 1
+            raise
+        return worker
+
+    async def aquecer(self):
+        """Inicia os workers que faltam para completar o pool"""
+        async with self._trava:
+            faltando = self.tamanho - self._total
+            self._total += faltando
+        resultados = await asyncio.gather(*(self._novo_worker() for _ in range(faltando)), return_exceptions=True)
+        for resultado in resultados:
+            if isinstance(resultado, CrewWorker):
+                self._livres.put_nowait(resultado)
             else:
-                return {
-                    "success": False,
-                    "error": f"Processo terminou com código {return_code}",
-                    "output_lines": output_lines,
-                    "return_code": return_code
-                }
-                
+                logger.error(f"Falha ao iniciar worker da crew: {resultado}")
+
+    async def _obter(self) -> CrewWorker:
+        async with self._trava:
+            criar = self._livres.empty() and self._total < self.tamanho
+            if criar:
+                self._total += 1
+        if criar:
+            return await self._novo_worker()
+        return await self._livres.get()
+
+    def _precisa_reciclar(self, worker: CrewWorker) -> bool:
+        return (
+            not worker.vivo
+            or worker.jobs >= self.max_jobs
+            or worker.memoria_mb >= self.max_memoria_mb
+        )
+
+    async def _devolver(self, worker: CrewWorker):
+        if not self._precisa_reciclar(worker):
+            self._livres.put_nowait(worker)
+            return
+
+        logger.info(
+            f"Reciclando worker da crew (pid {worker.pid}, {worker.jobs} jobs, {worker.memoria_mb:.0f} MB)"
+        )
+        self.reciclados += 1
+        await worker.encerrar()
+        async with self._trava:
+            self._total -= 1
+        # Substituto aquecido em segundo plano para a próxima requisição
+        asyncio.create_task(self.aquecer())
+
+    async def executar(self, job: dict, ao_log) -> dict:
+        worker = await self._obter()
+        try:
+            return await worker.executar(job, ao_log)
+        finally:
+            await self._devolver(worker)
+
+    async def encerrar(self):
+        while not self._livres.empty():
+            await self._livres.get_nowait().encerrar()
+
+    def estatisticas(self) -> dict:
+        return {
+            "tamanho": self.tamanho,
+            "workers": self._total,
+            "livres": self._livres.qsize(),
+            "reciclados": self.reciclados,
+        }
+
+
+_pool = None
+
+def obter_pool() -> CrewWorkerPool:
+    """Pool global de workers, dimensionado pelas configurações do Instaprice"""
+    global _pool
+    if _pool is None:
+        from config.settings import get_setting
+        _pool = CrewWorkerPool(
+            get_setting('crew_workers'),
+            get_setting('crew_worker_max_jobs'),
+            get_setting('crew_worker_max_memory_mb')
+        )
+    return _pool
+
+
+class SubprocessCrewAIRunner:
+    def __init__(self, websocket_manager=None, pool=None, log_pump=None):
+        self.websocket_manager = websocket_manager
+        self.pool = pool or obter_pool()
+        # Com log_pump, as linhas seguem em frames de várias linhas (ver utils/log_pump.py)
+        self.log_pump = log_pump
+
+    async def run_instaprice(self, inputs, somente_consulta=False, api_key=None, preparacao_direta=False):
+        """
+        Executa o Instaprice em um worker do pool e captura output real do terminal
+
+        Com somente_consulta=True usa a crew de perguntas e respostas
+        (dados já extraídos e validados; requer o input 'perfil_dados').
+        Com preparacao_direta=True a extração e a validação rodam em Python
+        antes da crew, sem os agentes dessas etapas (ver Instaprice.montar_crew).
+
+        A execução roda dentro de inputs['diretorio_saida'] (workspace da sessão),
+        onde também é gravada a resposta final. A chave da API vale só para o job.
+        """
+        # Captura output linha por linha em tempo real
+        output_lines = []
+        seen_lines = set()  # Cache para detectar duplicatas
+
+        async def ao_log(line):
+            # Sistema inteligente de filtro de duplicação
+            skip_line = False
+
+            # Remove prefixos e limpa a linha para comparação
+            clean_line = line.replace("[WORKER] ", "").strip()
+
+            # Permite logs de progresso dos agentes (verbose)
+            is_agent_progress = any(marker in line for marker in [
+                "Agent", "Working Agent", "Task", "Tool", "Action:", "Observation:",
+                "Thought:", "🔄", "🚀", "✅", "❌", "⚠️", "📊", "🧠", "🎭", "💡", "🎩"
+            ])
+
+            # Permite logs de sistema importantes
+            is_system_log = any(marker in line for marker in [
+                "[WORKER]", "Initiating", "Starting", "Completed", "Error", "Warning"
+            ])
+
+            # Ignora linhas vazias ou apenas separadores
+            if not clean_line or clean_line == "=" * 60:
+                skip_line = True
+
+            # Permite logs importantes sem verificar duplicação
+            elif is_agent_progress or is_system_log:
+                skip_line = False
+
+            # Verifica duplicação apenas para conteúdo de resposta final
+            elif clean_line in seen_lines:
+                # Se é conteúdo longo (provável resposta de agente), bloqueia duplicação
+                if len(clean_line) > 50:
+                    skip_line = True
+
+            # Verifica duplicação de linhas consecutivas idênticas
+            elif output_lines and len(output_lines) > 0:
+                if output_lines[-1] == line:
+                    skip_line = True
+
+            if not skip_line:
+                # Adiciona linha limpa ao cache
+                seen_lines.add(clean_line)
+
+                # Adiciona à lista de output
+                output_lines.append(line)
+
+                # Envia para WebSocket em tempo real se disponível
+                if self.log_pump:
+                    self.log_pump.publicar(line + "\n")
+                elif self.websocket_manager:
+                    await self.websocket_manager.broadcast({
+                        "type": "agent_log",
+                        "data": {
+                            "message": line + "\n",  # Output exato com quebra de linha
+                            "timestamp": datetime.now().strftime("%H:%M:%S.%f")[:-3],
+                            "raw_terminal": True
+                        }
+                    })
+
+                # Também imprime no console atual para debug
+                print(f"[WORKER] {line}")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "inputs": inputs,
+            "somente_consulta": somente_consulta,
+            "preparacao_direta": preparacao_direta,
+            "api_key": api_key,
+        }
+
+        try:
+            resultado_final = await self.pool.executar(job, ao_log)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e),
-                "output_lines": [],
+                "output_lines": output_lines,
                 "return_code": -1
             }
 
+        # Retorna resultado
+        return {
+            "success": resultado_final.get("success", False),
+            "result": resultado_final.get("result", ""),
+            "error": resultado_final.get("error", ""),
+            "output_lines": output_lines,
+            "return_code": resultado_final.get("return_code", -1)
+        }
+
 # Função helper para uso direto
-async def run_crewai_subprocess(inputs, websocket_manager=None):
+async def run_crewai_subprocess(inputs, websocket_manager=None, somente_consulta=False, api_key=None,
+                                preparacao_direta=False, log_pump=None):
     """Função helper para executar CrewAI via subprocess"""
-    runner = SubprocessCrewAIRunner(websocket_manager)
-    return await runner.run_instaprice(inputs)
+    runner = SubprocessCrewAIRunner(websocket_manager, log_pump=log_pump)
+    return await runner.run_instaprice(inputs, somente_consulta, api_key, preparacao_direta)
 
 if __name__ == "__main__":
     # Teste direto
@@ -238,9 +342,10 @@ if __name__ == "__main__":
         'pergunta_usuario': 'Teste subprocess - mostre dados reais do terminal',
         'diretorio_dados': '/mnt/b3f9265b-b14c-43a0-adbb-51ada5f71808/Curso I2A2/Instaprice_2/backend/dados/notasfiscais'
     }
-    
+
     async def test():
         result = await run_crewai_subprocess(test_inputs)
         print(f"✅ Resultado do teste: {result}")
-    
-    asyncio.run(test())
\ No newline at end of file
+        await obter_pool().encerrar()
+
+    asyncio.run(test())
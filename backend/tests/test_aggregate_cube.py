@@ -0,0 +1,73 @@
+"""
+Testes do cubo de agregados gerado na validação.
+"""
+import pandas as pd
+import pytest
+
+from models.consulta import ConsultaSpec
+from tools.functions import validar_csv_em_blocos
+from utils.aggregate_cube import carregar_cubo, gerar_cubo
+from utils.query_planner import PlanejadorConsultas
+
+
+@pytest.fixture
+def df_cabecalho():
+    return pd.DataFrame({
+        'NÚMERO': ['1', '2', '3', '4', '5'],
+        'DATA EMISSÃO': ['2024-01-15', '2024-01-15', '2024-01-17', '2024-02-03', '2024-02-04'],
+        'CPF/CNPJ Emitente': ['12345678000190', '12345678000190', '11222333000181', '11222333000181',
+                              '12345678000190'],
+        'RAZÃO SOCIAL EMITENTE': ['EMPRESA A', 'EMPRESA A', 'EMPRESA B', 'EMPRESA B', 'EMPRESA A'],
+        'VALOR NOTA FISCAL': [100.0, 50.0, 10.0, 500.0, 0.5],
+        'UF EMITENTE': ['SP', 'SP', 'RJ', 'RJ', 'SP'],
+        'MUNICÍPIO EMITENTE': ['SÃO PAULO', 'SÃO PAULO', 'NITERÓI', 'NITERÓI', 'CAMPINAS'],
+    })
+
+
+def validar(df: pd.DataFrame, diretorio) -> None:
+    entrada = diretorio / "cabecalho.csv"
+    df.to_csv(entrada, index=False)
+    validar_csv_em_blocos(str(entrada), "cabeçalhos", str(diretorio), chunk_size=2)
+
+
+def planejadores(diretorio):
+    from utils.columnar_dataset import ler_dataframe
+    frames = {"cabecalho": ler_dataframe(diretorio, "cabeçalhos"), "itens": None}
+    return PlanejadorConsultas(frames), PlanejadorConsultas(frames, cubo=carregar_cubo(diretorio))
+
+
+class TestCuboAgregados:
+    def test_cubo_responde_igual_aos_dados_brutos(self, df_cabecalho, tmp_path):
+        validar(df_cabecalho, tmp_path)
+        manifesto = gerar_cubo(tmp_path)
+        assert manifesto["rollups"]["emitente"]["linhas"] == 4  # emitente x dia
+
+        bruto, cubo = planejadores(tmp_path)
+        consultas = [
+            ConsultaSpec(dimensoes=["emitente"], top_k=1),
+            ConsultaSpec(periodo="mes", medidas=[{"metrica": "valor", "agregacao": "media"},
+                                                 {"metrica": "valor", "agregacao": "max"}]),
+            ConsultaSpec(dimensoes=["uf_emitente"],
+                         filtros=[{"campo": "data", "operador": ">=", "valor": "2024-01-16"}]),
+            ConsultaSpec(),
+        ]
+        for esperado, obtido in zip(bruto.executar(consultas), cubo.executar(consultas)):
+            pd.testing.assert_frame_equal(esperado.tabela, obtido.tabela, check_dtype=False)
+            assert (esperado.total_grupos, esperado.linhas_filtradas) == (obtido.total_grupos, obtido.linhas_filtradas)
+        assert cubo.estatisticas()["agrupamentos_cubo"] == 4
+        assert cubo.estatisticas()["varreduras"] == 0
+
+        # Filtro por valor (fora dos rollups) volta aos dados brutos
+        cubo.executar([ConsultaSpec(dimensoes=["emitente"],
+                                    filtros=[{"campo": "valor_nota", "operador": ">", "valor": 20}])])
+        assert cubo.estatisticas()["varreduras"] == 1
+
+    def test_cubo_desatualizado_nao_e_usado(self, df_cabecalho, tmp_path):
+        validar(df_cabecalho, tmp_path)
+        gerar_cubo(tmp_path)
+        assert carregar_cubo(tmp_path) is not None
+
+        validar(pd.concat([df_cabecalho] * 2), tmp_path)
+        assert carregar_cubo(tmp_path) is None
+        gerar_cubo(tmp_path)
+        assert carregar_cubo(tmp_path) is not None
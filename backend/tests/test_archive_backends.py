@@ -0,0 +1,122 @@
+"""
+Testes dos backends de arquivos compactados (leitura em streaming e extração paralela).
+"""
+import gzip
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from utils.archive_backends import (
+    obter_backend, formato_suportado, extrair_arquivos, estatisticas_backends,
+    estatisticas_desde
+)
+from utils.exceptions import ExtractionError, SecurityError
+
+CONTEUDO = ("NÚMERO,VALOR TOTAL\n" + "".join(f"{i},{i}.50\n" for i in range(5000))).encode("utf-8")
+MEMBRO = "dados/202401_NFs_Itens.csv"
+
+
+def criar_zip(caminho):
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as arquivo:
+        arquivo.writestr(MEMBRO, CONTEUDO)
+        arquivo.writestr("dados/", b"")
+
+
+def criar_tar_gz(caminho):
+    with tarfile.open(caminho, "w:gz") as arquivo:
+        info = tarfile.TarInfo(MEMBRO)
+        info.size = len(CONTEUDO)
+        arquivo.addfile(info, io.BytesIO(CONTEUDO))
+
+
+def criar_7z(caminho):
+    py7zr = pytest.importorskip("py7zr")
+    with py7zr.SevenZipFile(caminho, "w") as arquivo:
+        arquivo.writestr(CONTEUDO, MEMBRO)
+
+
+@pytest.fixture(params=["zip", "tar.gz", "7z"])
+def arquivo_compactado(request, tmp_path):
+    caminho = tmp_path / f"notas.{request.param}"
+    {"zip": criar_zip, "tar.gz": criar_tar_gz, "7z": criar_7z}[request.param](caminho)
+    return caminho
+
+
+class TestBackends:
+    """Todos os formatos expõem a mesma interface."""
+
+    def test_listar_e_abrir_em_streaming(self, arquivo_compactado):
+        backend = obter_backend(arquivo_compactado)
+        bytes_antes = backend.estatisticas().bytes
+
+        membros = backend.listar(arquivo_compactado)
+        assert [membro.nome for membro in membros] == [MEMBRO]
+        assert membros[0].tamanho == len(CONTEUDO)
+
+        with backend.abrir(arquivo_compactado, MEMBRO) as stream:
+            assert stream.read() == CONTEUDO
+        assert backend.estatisticas().bytes - bytes_antes == len(CONTEUDO)
+
+    def test_leitura_parcial_libera_o_membro(self, arquivo_compactado):
+        with obter_backend(arquivo_compactado).abrir(arquivo_compactado, MEMBRO) as stream:
+            assert stream.read(10) == CONTEUDO[:10]
+
+    def test_gzip_simples(self, tmp_path):
+        caminho = tmp_path / "202401_NFs_Itens.csv.gz"
+        caminho.write_bytes(gzip.compress(CONTEUDO))
+        backend = obter_backend(caminho)
+
+        membros = backend.listar(caminho)
+        assert [(m.nome, m.tamanho) for m in membros] == [("202401_NFs_Itens.csv", len(CONTEUDO))]
+        with backend.abrir(caminho, membros[0].nome) as stream:
+            assert stream.read() == CONTEUDO
+
+    def test_formato_nao_suportado(self, tmp_path):
+        assert not formato_suportado(tmp_path / "notas.arj")
+        with pytest.raises(ExtractionError):
+            obter_backend(tmp_path / "notas.arj")
+
+
+class TestExtracao:
+    def test_extracao_paralela(self, tmp_path):
+        caminhos = [tmp_path / "janeiro.zip", tmp_path / "fevereiro.tar.gz"]
+        criar_zip(caminhos[0])
+        criar_tar_gz(caminhos[1])
+
+        estatisticas = extrair_arquivos(caminhos, tmp_path / "saida", max_workers=2)
+
+        assert [e.formato for e in estatisticas] == ["zip", "tar"]
+        assert all(e.bytes == len(CONTEUDO) and e.bytes_por_segundo > 0 for e in estatisticas)
+        assert (tmp_path / "saida" / "janeiro.zip" / MEMBRO).read_bytes() == CONTEUDO
+        assert (tmp_path / "saida" / "fevereiro.tar.gz" / MEMBRO).read_bytes() == CONTEUDO
+        assert estatisticas_backends()["zip"].arquivos >= 1
+
+    def test_mesmo_nome_formatos_diferentes(self, tmp_path):
+        caminhos = [tmp_path / "notas.zip", tmp_path / "notas.tar.gz"]
+        criar_zip(caminhos[0])
+        criar_tar_gz(caminhos[1])
+        antes = estatisticas_backends()
+
+        extrair_arquivos(caminhos, tmp_path / "saida", max_workers=2)
+
+        assert (tmp_path / "saida" / "notas.zip" / MEMBRO).exists()
+        assert (tmp_path / "saida" / "notas.tar.gz" / MEMBRO).exists()
+        lidos = estatisticas_desde(antes)
+        assert set(lidos) == {"zip", "tar"}
+        assert lidos["zip"].arquivos == 1 and lidos["zip"].bytes == len(CONTEUDO)
+        assert "MB/s" in lidos["tar"].resumo()
+
+    def test_membro_fora_do_destino(self, tmp_path):
+        caminho = tmp_path / "malicioso.zip"
+        with zipfile.ZipFile(caminho, "w") as arquivo:
+            arquivo.writestr("../../fora.csv", CONTEUDO)
+
+        with pytest.raises(SecurityError):
+            obter_backend(caminho).extrair(caminho, tmp_path / "saida")
+        assert not (tmp_path.parent / "fora.csv").exists()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
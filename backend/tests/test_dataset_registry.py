@@ -0,0 +1,75 @@
+"""
+Testes do registro em memória dos datasets das sessões.
+"""
+import pandas as pd
+import pytest
+
+from models.consulta import ConsultaSpec
+from tools.functions import validar_csv_em_blocos
+from utils import dataset_registry
+from utils.dataset_registry import RegistroDatasets
+
+
+@pytest.fixture
+def df_cabecalho():
+    return pd.DataFrame({
+        'NÚMERO': ['1', '2', '3'],
+        'DATA EMISSÃO': ['2024-01-15', '2024-01-16', '2024-01-17'],
+        'CPF/CNPJ Emitente': ['12345678000190', '12345678000190', '11222333000181'],
+        'RAZÃO SOCIAL EMITENTE': ['EMPRESA A', 'EMPRESA A', 'EMPRESA B'],
+        'VALOR NOTA FISCAL': [100.0, 50.0, 10.0],
+        'UF EMITENTE': ['SP', 'SP', 'RJ'],
+    })
+
+
+def validar(df: pd.DataFrame, diretorio) -> None:
+    entrada = diretorio / "cabecalho.csv"
+    df.to_csv(entrada, index=False)
+    validar_csv_em_blocos(str(entrada), "cabeçalhos", str(diretorio), chunk_size=2)
+
+
+class TestRegistroDatasets:
+    def test_carrega_uma_vez_e_invalida_quando_a_origem_muda(self, df_cabecalho, tmp_path, monkeypatch):
+        validar(df_cabecalho, tmp_path)
+        registro = RegistroDatasets(max_memoria_mb=64)
+
+        primeiro = registro.obter(tmp_path)
+        assert pd.api.types.is_datetime64_any_dtype(primeiro.cabecalho['DATA EMISSÃO'])
+        assert primeiro.itens is None
+        assert isinstance(primeiro.cabecalho['RAZÃO SOCIAL EMITENTE'].dtype, pd.CategoricalDtype)
+        assert set(primeiro.memoria) == {"cabecalho"}
+
+        # Chamadas seguintes devolvem os mesmos objetos, sem ler o dataset
+        monkeypatch.setattr(dataset_registry, "ler_dataframe", lambda *_: pytest.fail("dataset relido"))
+        assert registro.obter(str(tmp_path)) is primeiro
+        assert primeiro.derivado("rag", lambda _: object()) is primeiro.derivado("rag", lambda _: None)
+        primeiro.planejador.executar([ConsultaSpec(dimensoes=["emitente"])])
+        registro.obter(tmp_path).planejador.executar([ConsultaSpec(dimensoes=["emitente"])])
+        assert primeiro.planejador.estatisticas()["agrupamentos"] == 1
+        monkeypatch.undo()
+
+        validar(pd.concat([df_cabecalho] * 2), tmp_path)
+        segundo = registro.obter(tmp_path)
+        assert segundo is not primeiro
+        assert len(segundo.cabecalho) == 6
+        assert registro.estatisticas()["carregamentos"] == 2
+
+    def test_sem_dataset_usa_csvs_e_descarta_lru(self, df_cabecalho, tmp_path):
+        carregados = []
+
+        def carregar(diretorio):
+            carregados.append(diretorio)
+            return pd.read_csv(f"{diretorio}/cabecalho.csv"), None
+
+        registro = RegistroDatasets(max_memoria_mb=64, max_datasets=1)
+        for nome in ("a", "b"):
+            (tmp_path / nome).mkdir()
+            df_cabecalho.to_csv(tmp_path / nome / "cabecalho.csv", index=False)
+            assert registro.obter(tmp_path / nome, carregar).origem == "csv"
+        assert registro.obter(tmp_path / "vazio") is None
+
+        registro.obter(tmp_path / "b", carregar)
+        assert len(carregados) == 2
+        assert registro.estatisticas()["datasets"] == 1
+        registro.obter(tmp_path / "a", carregar)
+        assert len(carregados) == 3
@@ -0,0 +1,62 @@
+"""
+Testes do schema canônico dos frames em memória.
+"""
+import pandas as pd
+import pytest
+
+from models.consulta import ConsultaSpec
+from utils.frame_schema import aplicar_schema, codigo_inteiro, relatorio_memoria
+from utils.query_planner import PlanejadorConsultas
+
+
+@pytest.fixture
+def frames():
+    n = 1000
+    cabecalho = pd.DataFrame({
+        'NÚMERO': [str(i) for i in range(1, n + 1)],
+        'DATA EMISSÃO': ['2024-01-15 10:00:00', '2024-02-01'] * (n // 2),
+        'CPF/CNPJ Emitente': ['12345678000190', '11222333000181'] * (n // 2),
+        'RAZÃO SOCIAL EMITENTE': ['EMPRESA A', 'EMPRESA B'] * (n // 2),
+        'UF EMITENTE': ['SP'] * n,
+        'CHAVE DE ACESSO': [f"{i:044d}" for i in range(n)],
+        'VALOR NOTA FISCAL': pd.array([100, 250] * (n // 2), dtype="Int64"),
+    })
+    itens = pd.DataFrame({
+        'NÚMERO': ['1', '1', '2'],
+        'CÓDIGO NCM/SH': ['04012010', '48025610', '48025610'],
+        'NCM/SH (TIPO DE PRODUTO)': ['Leite', 'Papel', 'Papel'],
+    })
+    return {"cabecalho": cabecalho, "itens": itens}
+
+
+class TestSchemaCanonico:
+    def test_tipos_compactos_e_memoria(self, frames):
+        tipados = aplicar_schema(frames)
+        cabecalho, itens = tipados["cabecalho"], tipados["itens"]
+
+        assert str(cabecalho['NÚMERO'].dtype) == "UInt16"
+        assert str(itens['NÚMERO'].dtype) == "UInt16"  # mesma chave nas duas tabelas
+        assert isinstance(itens['CÓDIGO NCM/SH'].dtype, pd.CategoricalDtype)  # zero à esquerda
+        assert isinstance(cabecalho['RAZÃO SOCIAL EMITENTE'].dtype, pd.CategoricalDtype)
+        assert pd.api.types.is_datetime64_any_dtype(cabecalho['DATA EMISSÃO'])
+        assert cabecalho['CHAVE DE ACESSO'].dtype == object
+        assert frames["cabecalho"]['NÚMERO'].dtype == object  # originais intactos
+
+        memoria = relatorio_memoria(frames, tipados)
+        assert memoria["cabecalho"]["depois_mb"] < memoria["cabecalho"]["antes_mb"] / 2
+
+        assert codigo_inteiro(pd.Series(['12', None, '300']))[1] is pd.NA
+        assert codigo_inteiro(pd.Series(['12', '3A'])) is None
+
+    def test_planejador_responde_igual_com_categorias(self, frames):
+        frames["cabecalho"]['DATA EMISSÃO'] = pd.to_datetime(frames["cabecalho"]['DATA EMISSÃO'], format='mixed')
+        consultas = [
+            ConsultaSpec(dimensoes=["emitente"], periodo="mes"),
+            ConsultaSpec(filtros=[{"campo": "emitente", "operador": "contem", "valor": "empresa b"}]),
+            ConsultaSpec(tabela="itens", dimensoes=["ncm"], medidas=[{"metrica": "notas"}]),
+        ]
+        originais = PlanejadorConsultas(frames).executar(consultas)
+        tipados = PlanejadorConsultas(aplicar_schema(frames)).executar(consultas)
+        for esperado, obtido in zip(originais, tipados):
+            pd.testing.assert_frame_equal(esperado.tabela, obtido.tabela, check_dtype=False,
+                                          check_categorical=False)
@@ -0,0 +1,139 @@
+"""
+Testes da fila de jobs assíncronos (persistência, prioridade e cancelamento).
+"""
+import asyncio
+
+import pytest
+
+from utils.exceptions import RateLimitError
+from utils.job_queue import (Job, JobQueue, JobStore, FILA_INTERATIVA, FILA_LOTE,
+                             PENDENTE, CONCLUIDO, FALHOU, CANCELADO)
+
+
+def criar_fila(tmp_path, executores, **opcoes):
+    return JobQueue(JobStore(tmp_path / "jobs.sqlite3"), executores, **opcoes)
+
+
+class TestJobQueue:
+    def test_prioridade_da_fila_interativa(self, tmp_path):
+        ordem = []
+
+        async def executar(parametros):
+            ordem.append(parametros["nome"])
+            return {"nome": parametros["nome"]}
+
+        async def cenario():
+            fila = criar_fila(tmp_path, {"tarefa": executar}, consumidores=1, reservados_interativos=0)
+            lote = await fila.submeter("tarefa", {"nome": "lote"}, FILA_LOTE)
+            pergunta = await fila.submeter("tarefa", {"nome": "pergunta"}, FILA_INTERATIVA)
+            assert fila.posicao(pergunta.job_id) == 1 and fila.posicao(lote.job_id) == 2
+
+            await fila.iniciar()
+            concluido = await fila.aguardar(lote.job_id)
+            await fila.encerrar()
+            return concluido
+
+        concluido = asyncio.run(cenario())
+        assert ordem == ["pergunta", "lote"]
+        assert concluido.status == CONCLUIDO and concluido.resultado == {"nome": "lote"}
+
+    def test_falha_e_cancelamento(self, tmp_path):
+        liberar = None
+
+        async def falhar(parametros):
+            raise ValueError("dados inválidos")
+
+        async def demorar(parametros):
+            await liberar.wait()
+            return {}
+
+        async def cenario():
+            nonlocal liberar
+            liberar = asyncio.Event()
+            fila = criar_fila(tmp_path, {"falha": falhar, "longo": demorar}, consumidores=1, reservados_interativos=0)
+            await fila.iniciar()
+
+            falho = await fila.aguardar((await fila.submeter("falha", {})).job_id)
+            em_execucao = await fila.submeter("longo", {})
+            pendente = await fila.submeter("longo", {})
+            await asyncio.sleep(0.05)
+
+            cancelado_pendente = await fila.cancelar(pendente.job_id)
+            cancelado_em_execucao = await fila.cancelar(em_execucao.job_id)
+            await fila.encerrar()
+            return falho, cancelado_pendente, cancelado_em_execucao
+
+        falho, cancelado_pendente, cancelado_em_execucao = asyncio.run(cenario())
+        assert falho.status == FALHOU and falho.erro == "dados inválidos" and falho.codigo_erro is None
+        assert cancelado_pendente.status == CANCELADO
+        assert cancelado_em_execucao.status == CANCELADO
+
+    def test_falha_guarda_status_http(self, tmp_path):
+        class NaoEncontrado(Exception):
+            status_code, detail = 404, "Sessão não encontrada"
+
+        async def recusar(parametros):
+            raise NaoEncontrado()
+
+        async def cenario():
+            fila = criar_fila(tmp_path, {"consulta": recusar}, consumidores=1, reservados_interativos=0)
+            await fila.iniciar()
+            falho = await fila.aguardar((await fila.submeter("consulta", {})).job_id)
+            await fila.encerrar()
+            return falho
+
+        falho = asyncio.run(cenario())
+        assert (falho.erro, falho.codigo_erro) == ("Sessão não encontrada", 404)
+        assert JobStore(tmp_path / "jobs.sqlite3").obter(falho.job_id).codigo_erro == 404
+
+    def test_jobs_pendentes_sobrevivem_a_reinicio(self, tmp_path):
+        async def executar(parametros):
+            return {"ok": True}
+
+        async def antes_do_reinicio():
+            fila = criar_fila(tmp_path, {"tarefa": executar}, consumidores=1, max_pendentes=1)
+            job = await fila.submeter("tarefa", {"arquivo": "notas.zip"}, segredos={"apiKey": "segredo"})
+            with pytest.raises(RateLimitError):
+                await fila.submeter("tarefa", {})
+            return job
+
+        job = asyncio.run(antes_do_reinicio())
+        salvo = JobStore(tmp_path / "jobs.sqlite3").obter(job.job_id)
+        assert salvo.status == PENDENTE and salvo.parametros == {"arquivo": "notas.zip"}
+
+        async def depois_do_reinicio():
+            fila = criar_fila(tmp_path, {"tarefa": executar}, consumidores=1)
+            assert await fila.iniciar() == 1
+            concluido = await fila.aguardar(job.job_id)
+            await fila.encerrar()
+            return concluido
+
+        assert asyncio.run(depois_do_reinicio()).status == CONCLUIDO
+
+    def test_jobs_finalizados_apagados_apos_retencao(self, tmp_path):
+        async def executar(parametros):
+            return {}
+
+        async def cenario():
+            fila = criar_fila(tmp_path, {"tarefa": executar}, consumidores=1, reservados_interativos=0,
+                              retencao_segundos=0.05, intervalo_limpeza=0.01)
+            antigo = await fila.submeter("tarefa", {})
+            await fila.iniciar()
+            await fila.aguardar(antigo.job_id)
+            await asyncio.sleep(0.2)
+            apagado = await fila.obter(antigo.job_id)
+            await fila.encerrar()
+            return apagado
+
+        assert asyncio.run(cenario()) is None
+
+    def test_remover_finalizados_preserva_pendentes(self, tmp_path):
+        store = JobStore(tmp_path / "jobs.sqlite3")
+        for job_id, status, concluido_em in (("a", CONCLUIDO, "2026-01-01T00:00:00"),
+                                             ("b", PENDENTE, None),
+                                             ("c", FALHOU, "2026-03-01T00:00:00")):
+            store.salvar(Job(job_id=job_id, tipo="tarefa", fila=FILA_LOTE, status=status,
+                             criado_em="2026-01-01T00:00:00", concluido_em=concluido_em))
+
+        assert store.remover_finalizados("2026-02-01T00:00:00") == 1
+        assert sorted(job.job_id for job in store.listar(PENDENTE, CONCLUIDO, FALHOU)) == ["b", "c"]
@@ -0,0 +1,108 @@
+"""
+Testes do envio em lote dos logs do terminal.
+"""
+import asyncio
+import threading
+
+from utils.log_pump import LogPump
+from utils.websocket_channels import definir_canais
+
+
+class TestLogPump:
+    def test_linhas_de_varias_threads_em_poucos_frames(self):
+        frames = []
+
+        async def enviar(mensagem, canais):
+            frames.append(mensagem)
+
+        async def cenario():
+            pump = LogPump(enviar, intervalo=0.02)
+            pump.iniciar()
+
+            def escrever(thread):
+                for indice in range(500):
+                    pump.publicar(f"thread {thread} linha {indice}\n")
+
+            def executar_threads():
+                threads = [threading.Thread(target=escrever, args=(numero,)) for numero in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            await asyncio.to_thread(executar_threads)
+            await asyncio.sleep(0.05)
+            await pump.encerrar()
+            return pump.estatisticas()
+
+        estatisticas = asyncio.run(cenario())
+        linhas = [linha for frame in frames for linha in frame["data"]["message"].splitlines()]
+        assert len(linhas) == estatisticas["recebidas"] == 2000
+        assert all(linha.startswith("thread ") for linha in linhas)
+        assert len(frames) == estatisticas["frames"] < 100
+
+    def test_fila_cheia_descarta_as_mais_antigas(self):
+        frames = []
+
+        async def enviar(mensagem, canais):
+            frames.append(mensagem["data"]["message"])
+
+        async def cenario():
+            pump = LogPump(enviar, max_linhas=3)
+            for indice in range(5):
+                pump.publicar(f"linha {indice}\n")
+            pump.publicar("sem quebra")
+            pump.iniciar()
+            await pump.encerrar()
+            return pump.estatisticas()
+
+        estatisticas = asyncio.run(cenario())
+        assert frames == ["⚠️ 2 linhas de log descartadas (fila cheia)\nlinha 2\nlinha 3\nlinha 4\nsem quebra\n"]
+        assert estatisticas["descartadas"] == 2
+
+    def test_descarte_e_linhas_sem_canal_nao_vazam_entre_sessoes(self):
+        frames = []
+
+        async def enviar(mensagem, canais):
+            frames.append((canais, mensagem["data"]["message"]))
+
+        async def cenario():
+            pump = LogPump(enviar, max_linhas=3)
+
+            async def sessao(nome, linhas):
+                definir_canais(f"session:{nome}")
+                for indice in range(linhas):
+                    pump.publicar(f"{nome} {indice}\n")
+
+            await asyncio.create_task(sessao("a", 3))
+            await asyncio.create_task(sessao("b", 2))
+            pump.publicar("sem canal\n")
+            pump.iniciar()
+            await pump.encerrar()
+
+        asyncio.run(cenario())
+        assert dict(frames) == {
+            ("session:a",): "⚠️ 3 linhas de log descartadas (fila cheia)\n",
+            ("session:b",): "b 0\nb 1\n",
+            ("*",): "sem canal\n",
+        }
+
+    def test_frames_limitados_por_linhas(self):
+        frames = []
+
+        async def enviar(mensagem, canais):
+            frames.append(mensagem["data"]["lines"])
+
+        async def cenario():
+            pump = LogPump(enviar, intervalo=1.0, max_linhas_frame=50)
+            pump.iniciar()
+            for indice in range(120):
+                pump.publicar(f"linha {indice}\n")
+            # Com um frame cheio, o envio não espera o fim da janela de 1 s
+            await asyncio.sleep(0.1)
+            enviados_antes_da_janela = sum(frames)
+            await pump.encerrar()
+            return enviados_antes_da_janela
+
+        assert asyncio.run(cenario()) == 120
+        assert frames == [50, 50, 20]
@@ -0,0 +1,83 @@
+"""
+Testes da especificação estruturada de consultas e do planejador.
+"""
+import pandas as pd
+import pytest
+from pydantic import ValidationError
+
+from models.consulta import ConsultaSpec, interpretar_consultas
+from utils.query_planner import PlanejadorConsultas, formatar_resultados
+
+
+@pytest.fixture
+def frames():
+    cabecalho = pd.DataFrame({
+        'NÚMERO': ['1', '2', '3', '4', '5'],
+        'DATA EMISSÃO': pd.to_datetime(['2024-01-05', '2024-01-20', '2024-02-03', '2024-02-10', '2024-02-11']),
+        'RAZÃO SOCIAL EMITENTE': ['ALFA LTDA', 'BETA SA', 'ALFA LTDA', 'GAMA ME', 'BETA SA'],
+        'CPF/CNPJ Emitente': ['11222333000181', '44555666000199', '11222333000181', '77888999000100', '44555666000199'],
+        'UF EMITENTE': ['SP', 'MG', 'SP', 'SP', 'MG'],
+        'VALOR NOTA FISCAL': pd.array([10000, 30000, 25000, 5000, None], dtype="Int64"),  # centavos
+    })
+    itens = pd.DataFrame({
+        'NÚMERO': ['1', '1', '2', '3'],
+        'NCM/SH (TIPO DE PRODUTO)': ['Papel', 'Caneta', 'Papel', 'Papel'],
+        'QUANTIDADE': [10.0, 5.0, 30.0, 25.0],
+        'VALOR TOTAL': pd.array([6000, 4000, 30000, 25000], dtype="Int64"),
+    })
+    return {"cabecalho": cabecalho, "itens": itens}
+
+
+class TestQueryPlanner:
+    def test_interpreta_json_no_meio_do_texto(self):
+        consultas = interpretar_consultas(
+            'Especificação:\n```json\n{"consultas": [{"dimensoes": ["emitente"], "top_k": 2}, '
+            '{"tabela": "itens", "dimensoes": ["ncm"], "medidas": [{"metrica": "quantidade"}]}]}\n```'
+        )
+        assert [consulta.tabela for consulta in consultas] == ["cabecalho", "itens"]
+        assert interpretar_consultas("Quais os maiores fornecedores?") == []
+        with pytest.raises(ValidationError):
+            interpretar_consultas('{"dimensoes": ["ncm"]}')  # ncm só existe nos itens
+        with pytest.raises(ValidationError):
+            interpretar_consultas('{"dimensoes": ["emitente"], "codigo": "df.eval(...)"}')
+
+    def test_ranking_filtro_e_periodo(self, frames):
+        planejador = PlanejadorConsultas(frames)
+        por_valor, por_mes, sp = planejador.executar([
+            ConsultaSpec(dimensoes=["emitente"], top_k=2),
+            ConsultaSpec(periodo="mes"),
+            ConsultaSpec(filtros=[{"campo": "uf_emitente", "operador": "=", "valor": "sp"},
+                                  {"campo": "data", "operador": "entre", "valor": ["2024-02-01", "2024-02-29"]}],
+                         medidas=[{"metrica": "valor", "agregacao": "soma"}]),
+        ])
+        assert por_valor.tabela['RAZÃO SOCIAL EMITENTE'].tolist() == ['ALFA LTDA', 'BETA SA']
+        assert por_valor.tabela['valor_soma'].tolist() == [35000, 30000]
+        assert por_valor.tabela['notas_contagem'].tolist() == [2, 2]
+        assert por_valor.total_grupos == 3
+        assert por_mes.tabela['periodo'].tolist() == ['2024-01', '2024-02']
+        assert sp.tabela['valor_soma'].tolist() == [30000]
+        assert sp.linhas_filtradas == 2
+
+        # Filtros monetários chegam em reais e comparam com os centavos
+        acima, = planejador.executar([ConsultaSpec(filtros=[{"campo": "valor_nota", "operador": ">=", "valor": 250}])])
+        assert acima.tabela['notas_contagem'].tolist() == [2]
+
+        texto = formatar_resultados([por_valor])
+        assert "**ALFA LTDA** (11.222.333/0001-81)" in texto
+        assert "R$ 350.00" in texto
+
+    def test_consultas_compostas_compartilham_agrupamento(self, frames):
+        planejador = PlanejadorConsultas(frames)
+        planejador.executar([
+            ConsultaSpec(dimensoes=["emitente"], medidas=[{"metrica": "valor"}], top_k=3),
+            ConsultaSpec(dimensoes=["emitente"], medidas=[{"metrica": "notas"}], ordenar_por="notas_contagem"),
+        ])
+        assert planejador.estatisticas()["agrupamentos"] == 1
+
+        # Repetir a pergunta não refaz filtros nem agrupamentos
+        itens, = planejador.executar([ConsultaSpec(tabela="itens", dimensoes=["ncm"],
+                                                   medidas=[{"metrica": "quantidade"}, {"metrica": "notas"}])])
+        planejador.executar([ConsultaSpec(dimensoes=["emitente"], medidas=[{"metrica": "valor"}])])
+        assert planejador.estatisticas()["agrupamentos"] == 2
+        assert planejador.estatisticas()["varreduras"] == 2
+        assert itens.tabela.set_index('NCM/SH (TIPO DE PRODUTO)')['notas_contagem'].to_dict() == {'Papel': 3, 'Caneta': 1}
@@ -0,0 +1,123 @@
+"""
+Testes de responsividade do servidor enquanto uma análise longa está em execução.
+"""
+import asyncio
+import os
+import sys
+import textwrap
+import time
+
+import pytest
+
+import subprocess_runner
+
+
+WORKER_LENTO = textwrap.dedent("""
+    import os, sys, json, time
+    sys.path.insert(0, {backend!r})
+    import crew_worker
+
+    canal = crew_worker.CanalProtocolo(os.dup(1))
+    resultados = {{}}
+    crew_worker.redirecionar_terminal(canal, resultados)
+    canal.enviar({{"tipo": "pronto", "pid": os.getpid()}})
+    for linha in sys.stdin:
+        job = json.loads(linha)
+        for etapa in range(5):
+            print(f"🔄 etapa {{etapa}}", flush=True)
+            time.sleep(0.2)
+        resultados[job["job_id"]] = {{"tipo": "resultado", "job_id": job["job_id"], "success": True,
+                                     "result": "ok", "memoria_mb": 1.0, "jobs": 1}}
+        print(crew_worker.MARCADOR_FIM + job["job_id"], flush=True)
+""")
+
+
+async def maior_intervalo(parar: asyncio.Event, passo: float = 0.01) -> float:
+    """Maior atraso observado entre ticks do event loop até `parar` ser sinalizado"""
+    maior = 0.0
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(passo)
+        maior = max(maior, time.perf_counter() - inicio - passo)
+    return maior
+
+
+class TestResponsividade:
+    def test_runner_nao_bloqueia_event_loop(self, tmp_path, monkeypatch):
+        script = tmp_path / "worker_lento.py"
+        script.write_text(WORKER_LENTO.format(backend=os.path.dirname(subprocess_runner.WORKER_SCRIPT)))
+        monkeypatch.setattr(subprocess_runner, "WORKER_SCRIPT", str(script))
+
+        async def cenario():
+            pool = subprocess_runner.CrewWorkerPool(1, 10, 4096)
+            await pool.aquecer()
+            runner = subprocess_runner.SubprocessCrewAIRunner(pool=pool)
+            parar = asyncio.Event()
+            medicao = asyncio.create_task(maior_intervalo(parar))
+            inicio = time.perf_counter()
+            resultado = await runner.run_instaprice({"diretorio_saida": str(tmp_path)})
+            duracao = time.perf_counter() - inicio
+            parar.set()
+            atraso = await medicao
+            await pool.encerrar()
+            return resultado, duracao, atraso
+
+        resultado, duracao, atraso = asyncio.run(cenario())
+        assert resultado["success"] and resultado["result"] == "ok"
+        assert len(resultado["output_lines"]) == 5
+        assert duracao >= 1.0
+        assert atraso < 0.1
+
+    def test_health_responde_durante_consulta(self, tmp_path, monkeypatch):
+        pytest.importorskip("fastapi")
+        pytest.importorskip("crewai")
+        httpx = pytest.importorskip("httpx")
+        import server
+        from utils.job_queue import JobQueue, JobStore
+
+        class CrewLenta:
+            def kickoff(self, inputs):
+                time.sleep(1.0)  # CrewAI bloqueia a thread que a executa
+                return "resposta"
+
+        class InstapriceFalso:
+            def montar_crew(self, inputs, somente_consulta=False, preparacao_direta=False):
+                return CrewLenta(), inputs
+
+        # Sem o runner, a consulta usa o fallback em thread (CrewAI no próprio processo)
+        monkeypatch.setitem(sys.modules, "subprocess_runner", None)
+        monkeypatch.setattr(server.analysis_sessions, "get_perfil_dados", lambda session_id: "perfil")
+        fila = JobQueue(JobStore(tmp_path / "jobs.sqlite3"),
+                        {"process": server.executar_processamento, "query": server.executar_consulta},
+                        consumidores=1)
+        monkeypatch.setattr(server, "job_queue", fila)
+
+        session_id = server.analysis_sessions.create_session("arquivo")
+        server.analysis_sessions.set_session_ready(session_id, InstapriceFalso())
+
+        async def cenario():
+            await fila.iniciar()
+            transporte = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+                consulta = asyncio.create_task(
+                    cliente.post(f"/api/query/{session_id}", json={"question": "Total por UF?"})
+                )
+                await asyncio.sleep(0.2)
+                latencias = []
+                while not consulta.done():
+                    inicio = time.perf_counter()
+                    resposta = await cliente.get("/health")
+                    latencias.append(time.perf_counter() - inicio)
+                    assert resposta.status_code == 200
+                    await asyncio.sleep(0.05)
+                resposta_consulta = await consulta
+            await fila.encerrar()
+            return resposta_consulta, latencias
+
+        try:
+            resposta_consulta, latencias = asyncio.run(cenario())
+        finally:
+            server.analysis_sessions.close_session(session_id)
+
+        assert resposta_consulta.status_code == 200
+        assert latencias and max(latencias) < 0.1
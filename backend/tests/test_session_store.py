@@ -0,0 +1,81 @@
+"""
+Testes do armazenamento de sessões (TTL, limite de memória e limpeza).
+"""
+import numpy as np
+import pandas as pd
+
+from utils.session_store import MB, SessionStore, estimar_bytes
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+class TestSessionStore:
+    def test_ids_unicos_e_expiracao_por_inatividade(self):
+        relogio, removidas = Relogio(), []
+        store = SessionStore(ttl_segundos=60, ao_remover=lambda session_id, _: removidas.append(session_id),
+                             relogio=relogio)
+        ids = {store.criar({"indice": indice}) for indice in range(50)}
+        assert len(ids) == 50
+
+        ativa, inativa = sorted(ids)[:2]
+        relogio.agora = 40
+        assert store.obter(ativa) is not None  # renova o prazo
+        relogio.agora = 90
+        assert store.limpar_expiradas() == 49
+        assert store.obter(ativa) is not None
+        assert store.obter(inativa) is None
+        assert inativa in removidas and ativa not in removidas
+        assert store.estatisticas()["expiradas"] == 49
+
+    def test_limite_de_memoria_remove_as_menos_usadas(self):
+        removidas = []
+        ocupadas = set()
+        store = SessionStore(max_memoria_mb=0.5, ao_remover=lambda session_id, _: removidas.append(session_id),
+                             ocupada=lambda session_id: session_id in ocupadas)
+        primeira = store.criar({"dados": "a" * 200_000})
+        segunda = store.criar({"dados": "b" * 200_000})
+        ocupadas.add(primeira)
+        store.obter(segunda)
+
+        # A primeira é a menos usada, mas está em uso: sai a segunda
+        terceira = store.criar({"dados": "c" * 200_000})
+        assert removidas == [segunda]
+        assert store.obter(primeira) is not None and store.obter(terceira) is not None
+
+        # Crescer uma sessão também aplica o limite
+        ocupadas.clear()
+        store.atualizar(terceira, extra="d" * 200_000)
+        assert removidas == [segunda, primeira]
+        estatisticas = store.estatisticas()
+        assert estatisticas["sessoes"] == 1
+        assert estatisticas["removidas_por_limite"] == 2
+        assert estatisticas["memoria_mb"] <= 0.5
+
+    def test_memoria_de_objetos_inclui_atributos(self):
+        class Crew:
+            def __init__(self, frame):
+                self.dados = {"cabecalho": frame}
+
+        class ComSlots:
+            __slots__ = ("valores",)
+
+            def __init__(self, valores):
+                self.valores = valores
+
+        frame = pd.DataFrame({"valor": np.zeros(1_000_000)})  # ~8 MB
+        assert estimar_bytes(Crew(frame)) >= 8 * 1_000_000
+        assert estimar_bytes(ComSlots(np.zeros(1_000_000))) >= 8 * 1_000_000
+
+        # A sessão que guarda a instância passa do orçamento e sai por LRU
+        removidas = []
+        store = SessionStore(max_memoria_mb=10, ao_remover=lambda session_id, _: removidas.append(session_id))
+        primeira = store.criar({"instaprice_instance": Crew(frame.copy())})
+        store.criar({"instaprice_instance": Crew(frame.copy())})
+        assert removidas == [primeira]
+        assert store.estatisticas()["memoria_mb"] <= 10
@@ -0,0 +1,126 @@
+"""
+Testes do armazenamento de uploads endereçado por conteúdo.
+"""
+import hashlib
+
+import pandas as pd
+import pytest
+
+from utils.upload_store import UploadStore
+from utils.columnar_dataset import gerar_perfil, carregar_perfil
+from tools.functions import validar_csv_em_blocos
+from utils.exceptions import FileProcessingError, SecurityError, DataIntegrityError, UploadOffsetError
+
+CONTEUDO = b"PK" + bytes(range(256)) * 100
+
+
+def enviar(store, nome, conteudo, tamanho_bloco=1000, limite=None):
+    gravador = store.novo_upload(nome, limite_bytes=limite)
+    for inicio in range(0, len(conteudo), tamanho_bloco):
+        gravador.escrever(conteudo[inicio:inicio + tamanho_bloco])
+    return gravador.finalizar()
+
+
+class TestUploadStore:
+    def test_hash_calculado_durante_o_envio(self, tmp_path):
+        store = UploadStore(tmp_path)
+        entrada = enviar(store, "202401_NFs.zip", CONTEUDO)
+
+        assert entrada.sha256 == hashlib.sha256(CONTEUDO).hexdigest()
+        assert entrada.tamanho == len(CONTEUDO)
+        assert not entrada.duplicado
+        assert open(entrada.caminho_arquivo, "rb").read() == CONTEUDO
+        assert store.obter(entrada.sha256) == entrada
+
+    def test_reenvio_reaproveita_conteudo(self, tmp_path):
+        store = UploadStore(tmp_path)
+        primeira = enviar(store, "202401_NFs.zip", CONTEUDO)
+        segunda = enviar(store, "copia.zip", CONTEUDO, tamanho_bloco=333)
+
+        assert segunda.duplicado
+        assert segunda.caminho_arquivo == primeira.caminho_arquivo
+        assert segunda.diretorio_dados == primeira.diretorio_dados
+        assert list(store.diretorio_temporario.iterdir()) == []
+
+    def test_limite_de_tamanho_verificado_por_bloco(self, tmp_path):
+        store = UploadStore(tmp_path)
+        with pytest.raises(FileProcessingError):
+            enviar(store, "grande.zip", CONTEUDO, limite=len(CONTEUDO) - 1)
+        assert list(store.diretorio_temporario.iterdir()) == []
+
+    def test_nome_e_identificador_seguros(self, tmp_path):
+        store = UploadStore(tmp_path)
+        entrada = enviar(store, "../../fora.zip", CONTEUDO)
+
+        assert entrada.nome_arquivo == "fora.zip"
+        assert store.obter("../" + entrada.sha256) is None
+        with pytest.raises(SecurityError):
+            store.remover("../fora")
+
+    def test_publicar_dataset_da_sessao(self, tmp_path):
+        store = UploadStore(tmp_path / "conteudo")
+        entrada = enviar(store, "202401_NFs.zip", CONTEUDO)
+        workspace = tmp_path / "sessao" / "dados"
+        assert not store.publicar_dados(entrada.sha256, workspace)
+
+        csv = tmp_path / "cabecalho.csv"
+        pd.DataFrame({"NÚMERO": ["1", "2"], "RAZÃO SOCIAL EMITENTE": ["EMPRESA A", "EMPRESA B"],
+                      "VALOR NOTA FISCAL": [10.0, 20.0]}).to_csv(csv, index=False)
+        validar_csv_em_blocos(str(csv), "cabeçalhos", str(workspace), chunk_size=1000)
+        gerar_perfil(workspace)
+
+        assert store.publicar_dados(entrada.sha256, workspace)
+        assert carregar_perfil(entrada.diretorio_dados) == carregar_perfil(workspace)
+        assert not store.publicar_dados(entrada.sha256, workspace)
+
+
+class TestUploadRetomavel:
+    def test_retomada_apos_reinicio(self, tmp_path):
+        store = UploadStore(tmp_path)
+        gravador = store.novo_upload("202401_NFs.zip", tamanho_esperado=len(CONTEUDO),
+                                     sha256_esperado=hashlib.sha256(CONTEUDO).hexdigest())
+        gravador.escrever(CONTEUDO[:10_000], offset=0)
+        gravador._arquivo.close()  # servidor reiniciado no meio do envio
+
+        reiniciado = UploadStore(tmp_path)
+        retomado = reiniciado.retomar_upload(gravador.upload_id)
+        assert retomado.tamanho == 10_000
+        retomado.escrever(CONTEUDO[10_000:], offset=10_000)
+        entrada = retomado.finalizar()
+
+        assert entrada.sha256 == hashlib.sha256(CONTEUDO).hexdigest()
+        assert open(entrada.caminho_arquivo, "rb").read() == CONTEUDO
+        assert list(store.diretorio_temporario.iterdir()) == []
+        assert reiniciado.retomar_upload(gravador.upload_id) is None
+
+    def test_offset_fora_de_ordem(self, tmp_path):
+        store = UploadStore(tmp_path)
+        gravador = store.novo_upload("202401_NFs.zip")
+        gravador.escrever(CONTEUDO[:100], offset=0)
+
+        with pytest.raises(UploadOffsetError) as erro:
+            gravador.escrever(CONTEUDO[:100], offset=0)
+        assert erro.value.expected_offset == 100
+        assert store.retomar_upload(gravador.upload_id) is gravador
+
+    def test_finalizar_confere_tamanho_e_hash(self, tmp_path):
+        store = UploadStore(tmp_path)
+        gravador = store.novo_upload("202401_NFs.zip", tamanho_esperado=len(CONTEUDO), sha256_esperado="0" * 64)
+        gravador.escrever(CONTEUDO[:100])
+        with pytest.raises(FileProcessingError):
+            gravador.finalizar()
+
+        gravador.escrever(CONTEUDO[100:])
+        with pytest.raises(DataIntegrityError):
+            gravador.finalizar()
+        assert list(store.diretorio_temporario.iterdir()) == []
+
+    def test_tamanho_declarado_acima_do_limite(self, tmp_path):
+        store = UploadStore(tmp_path)
+        with pytest.raises(FileProcessingError):
+            store.novo_upload("grande.zip", limite_bytes=100, tamanho_esperado=101)
+        assert list(store.diretorio_temporario.iterdir()) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
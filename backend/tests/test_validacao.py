@@ -0,0 +1,396 @@
+"""
+Testes do motor de validação vetorizado, comparado ao modo de referência Pydantic.
+"""
+import os
+import threading
+import zipfile
+
+import pytest
+import pandas as pd
+import pyarrow as pa
+
+from models import notas_fiscais
+from tools import functions
+from tools.functions import (
+    validar_csv_em_blocos, catalogar_arquivo, ler_catalogo, assinatura_fonte, ingerir_arquivo
+)
+from utils.exceptions import ExtractionError
+from utils.columnar_dataset import (
+    dataset_atualizado, ler_dataframe, ler_manifesto, schema_tabela,
+    gerar_perfil, carregar_perfil, resumo_perfil, converter_bloco, schema_para_colunas
+)
+from models.notas_fiscais import (
+    validar_dataframe_cabecalho, validar_dataframe_itens, normalizar_cnpj,
+    converter_data_emissao, MODO_PYDANTIC, MODO_VETORIZADO,
+    REGRA_CNPJ_INVALIDO, REGRA_DATA_INVALIDA, REGRA_VALOR_NEGATIVO,
+    REGRA_TOTAL_INCONSISTENTE, REGRA_CAMPO_OBRIGATORIO, REGRA_VALOR_INVALIDO
+)
+
+
+@pytest.fixture
+def df_cabecalho():
+    """Cabeçalhos com linhas válidas e uma falha por regra."""
+    return pd.DataFrame({
+        'NÚMERO': ['1', '2', '3', '4', '5', None],
+        'DATA EMISSÃO': ['2024-01-15 10:30:00', '2024-01-16', '15/01/2024', '2024-01-17', '2024-01-18', '2024-01-19'],
+        'CPF/CNPJ Emitente': ['12.345.678/0001-90', '345678000190', '12345678000190', '123456789012345', '12345678000190', '12345678000190'],
+        'RAZÃO SOCIAL EMITENTE': ['EMPRESA A', 'EMPRESA B', 'EMPRESA C', 'EMPRESA D', 'EMPRESA E', 'EMPRESA F'],
+        'VALOR NOTA FISCAL': [100.0, 250.5, 10.0, 20.0, -5.0, 1.0],
+        'UF EMITENTE': ['SP', 'RJ', 'MG', 'SP', 'SP', 'SP'],
+    })
+
+
+@pytest.fixture
+def df_itens():
+    """Itens com linhas válidas, valores negativos, não numéricos e total inconsistente."""
+    return pd.DataFrame({
+        'NÚMERO': ['1', '1', '2', '3', '4', '5'],
+        'NÚMERO PRODUTO': ['10', '11', '12', '13', '14', '15'],
+        'DESCRIÇÃO DO PRODUTO/SERVIÇO': ['PAPEL A4', 'CANETA', 'LAPIS', 'CADERNO', 'BORRACHA', 'GRAMPO'],
+        'QUANTIDADE': [2, 3, -1, 4, 1, 'abc'],
+        'VALOR UNITÁRIO': [10.0, 1.5, 2.0, 5.0, 3.0, 1.0],
+        'VALOR TOTAL': [20.0, 4.5, -2.0, 25.0, 3.005, 1.0],
+    })
+
+
+class TestValidacaoVetorizada:
+    """Regras do motor vetorizado."""
+
+    def test_cabecalho_regras(self, df_cabecalho):
+        resultado = validar_dataframe_cabecalho(df_cabecalho)
+
+        assert resultado.total_cabecalhos == 2
+        assert resultado.linhas_invalidas == [2, 3, 4, 5]
+        assert resultado.erros_por_regra == {
+            REGRA_CAMPO_OBRIGATORIO: 1,
+            REGRA_DATA_INVALIDA: 1,
+            REGRA_CNPJ_INVALIDO: 1,
+            REGRA_VALOR_NEGATIVO: 1,
+        }
+        assert resultado.erros[0].startswith("Linha 3:")
+        assert resultado.erros[0].endswith("Formato de data inválido: 15/01/2024")
+        assert resultado.erros[1].endswith("CNPJ deve ter 14 dígitos: 123456789012345")
+
+    def test_itens_regras(self, df_itens):
+        resultado = validar_dataframe_itens(df_itens)
+
+        assert resultado.total_itens == 3
+        assert resultado.linhas_invalidas == [2, 3, 5]
+        assert resultado.erros_por_regra[REGRA_VALOR_NEGATIVO] == 1
+        assert resultado.erros_por_regra[REGRA_TOTAL_INCONSISTENTE] == 1
+        assert resultado.erros_por_regra[REGRA_VALOR_INVALIDO] == 1
+
+    def test_coluna_obrigatoria_ausente(self, df_itens):
+        resultado = validar_dataframe_itens(df_itens.drop(columns=['VALOR TOTAL']))
+
+        assert resultado.total_itens == 0
+        assert resultado.erros_por_regra[REGRA_CAMPO_OBRIGATORIO] == len(df_itens)
+
+    def test_mensagens_limitadas_contagens_exatas(self, df_itens):
+        completo = validar_dataframe_itens(df_itens)
+        limitado = validar_dataframe_itens(df_itens, limite_erros=1)
+
+        assert limitado.erros == completo.erros[:1]
+        assert limitado.erros_por_regra == completo.erros_por_regra
+        assert limitado.total_itens == completo.total_itens
+
+    def test_normalizacao_cnpj(self):
+        cnpjs = normalizar_cnpj(pd.Series(['12.345.678/0001-90', '345678000190']))
+        assert cnpjs.tolist() == ['12345678000190', '00345678000190']
+
+    def test_formatos_data(self):
+        datas = converter_data_emissao(pd.Series(['2024-01-15 10:30:00', '2024-01-16', 'ontem']))
+        assert datas.iloc[0] == pd.Timestamp('2024-01-15 10:30:00')
+        assert datas.iloc[1] == pd.Timestamp('2024-01-16')
+        assert pd.isna(datas.iloc[2])
+
+    def test_modo_desconhecido(self, df_itens):
+        with pytest.raises(ValueError):
+            validar_dataframe_itens(df_itens, modo="inexistente")
+
+
+class TestParidadeComPydantic:
+    """O modo vetorizado deve reprovar exatamente as mesmas linhas que o modo Pydantic."""
+
+    def test_cabecalho(self, df_cabecalho):
+        vetorizado = validar_dataframe_cabecalho(df_cabecalho, modo=MODO_VETORIZADO)
+        referencia = validar_dataframe_cabecalho(df_cabecalho, modo=MODO_PYDANTIC)
+
+        assert vetorizado.total_cabecalhos == referencia.total_cabecalhos
+        assert vetorizado.linhas_invalidas == referencia.linhas_invalidas
+        assert vetorizado.erros_por_regra == referencia.erros_por_regra
+
+    def test_itens(self, df_itens):
+        vetorizado = validar_dataframe_itens(df_itens, modo=MODO_VETORIZADO)
+        referencia = validar_dataframe_itens(df_itens, modo=MODO_PYDANTIC)
+
+        assert vetorizado.total_itens == referencia.total_itens
+        assert vetorizado.linhas_invalidas == referencia.linhas_invalidas
+        assert vetorizado.erros_por_regra == referencia.erros_por_regra
+
+    def test_nulos_em_campos_obrigatorios(self, df_cabecalho, df_itens):
+        """
+        Exceção documentada à paridade: NaN em campos obrigatórios.
+        
+        Os modelos Pydantic de referência aceitam NaN: em campos de texto o
+        pydantic converte o float para "nan" e, nos numéricos, NaN passa pelas
+        comparações (NaN < 0 é falso); o texto "nan" vira float NaN. O motor
+        vetorizado trata NaN como campo ausente (campo_obrigatorio) e o texto
+        "nan" como valor_invalido, como pd.to_numeric. Fora dessas linhas, os
+        dois modos continuam iguais.
+        """
+        df_cabecalho.loc[0, 'RAZÃO SOCIAL EMITENTE'] = float('nan')
+        df_cabecalho.loc[1, 'VALOR NOTA FISCAL'] = float('nan')
+        df_itens['QUANTIDADE'] = df_itens['QUANTIDADE'].astype(object)
+        df_itens.loc[0, 'NÚMERO PRODUTO'] = float('nan')
+        df_itens.loc[1, 'QUANTIDADE'] = 'nan'
+        com_nan = [0, 1]
+        divergencias = {
+            validar_dataframe_cabecalho: (df_cabecalho, {REGRA_CAMPO_OBRIGATORIO: 2}),
+            validar_dataframe_itens: (df_itens, {REGRA_CAMPO_OBRIGATORIO: 1, REGRA_VALOR_INVALIDO: 1}),
+        }
+
+        for validar, (df, regras_nan) in divergencias.items():
+            # Linhas com NaN: só o motor vetorizado reprova
+            vetorizado = validar(df.loc[com_nan], modo=MODO_VETORIZADO)
+            referencia = validar(df.loc[com_nan], modo=MODO_PYDANTIC)
+            assert vetorizado.linhas_invalidas == com_nan
+            assert vetorizado.erros_por_regra == regras_nan
+            assert referencia.linhas_invalidas == []
+
+            # Demais linhas: paridade completa
+            restantes = df.drop(index=com_nan)
+            vetorizado = validar(restantes, modo=MODO_VETORIZADO)
+            referencia = validar(restantes, modo=MODO_PYDANTIC)
+            assert vetorizado.linhas_invalidas == referencia.linhas_invalidas
+            assert vetorizado.erros_por_regra == referencia.erros_por_regra
+
+
+class TestValidacaoEmBlocos:
+    """Validação em streaming deve equivaler à validação do arquivo inteiro."""
+
+    def test_itens_em_blocos(self, df_itens, tmp_path):
+        entrada = tmp_path / "202401_NFs_Itens.csv"
+        df_grande = pd.concat([df_itens] * 5, ignore_index=True)
+        df_grande.to_csv(entrada, index=False)
+
+        resultado, total = validar_csv_em_blocos(str(entrada), "itens", str(tmp_path), chunk_size=4)
+        completo = validar_dataframe_itens(pd.read_csv(entrada, dtype=str, keep_default_na=False))
+
+        assert total == len(df_grande)
+        assert resultado.total_itens == completo.total_itens
+        assert resultado.linhas_invalidas == completo.linhas_invalidas
+        assert resultado.erros_por_regra == completo.erros_por_regra
+        assert len(ler_dataframe(tmp_path, "itens", ["NÚMERO"])) == len(df_grande)
+        assert not (tmp_path / "dataset" / "itens.parcial").exists()
+
+    def test_limite_de_mensagens(self, df_itens, tmp_path):
+        entrada = tmp_path / "itens.csv"
+        pd.concat([df_itens] * 10, ignore_index=True).to_csv(entrada, index=False)
+
+        resultado, _ = validar_csv_em_blocos(str(entrada), "itens", str(tmp_path),
+                                             chunk_size=6, limite_erros=4)
+
+        assert len(resultado.erros) == 4
+        assert len(resultado.linhas_invalidas) == 4
+        assert resultado.total_invalidas == 30
+
+        # O manifesto guarda só os índices limitados, com o total exato
+        salvo = ler_manifesto(tmp_path, "itens")["validacao"]["resultado"]
+        assert (len(salvo["linhas_invalidas"]), salvo["total_invalidas"]) == (4, 30)
+
+
+class TestValidacaoParalela:
+    """Resultados do pool de processos devem sair na mesma ordem da validação sequencial."""
+
+    @pytest.fixture(autouse=True)
+    def pool_pequeno(self, monkeypatch):
+        monkeypatch.setattr(notas_fiscais, "MIN_LINHAS_POR_PROCESSO", 3)
+        monkeypatch.setattr(os, "cpu_count", lambda: 4)
+        yield
+        notas_fiscais.encerrar_pool_validacao()
+
+    def test_dataframe_em_fatias(self, df_itens):
+        df_grande = pd.concat([df_itens] * 4, ignore_index=True)
+
+        sequencial = validar_dataframe_itens(df_grande, workers=1)
+        paralelo = validar_dataframe_itens(df_grande, workers=3)
+
+        assert paralelo.total_itens == sequencial.total_itens
+        assert paralelo.linhas_invalidas == sequencial.linhas_invalidas
+        assert paralelo.erros == sequencial.erros
+
+    def test_csv_em_blocos_paralelo(self, df_cabecalho, tmp_path):
+        entrada = tmp_path / "cabecalho.csv"
+        pd.concat([df_cabecalho] * 5, ignore_index=True).to_csv(entrada, index=False)
+
+        sequencial, _ = validar_csv_em_blocos(str(entrada), "cabeçalhos", str(tmp_path / "seq"), 4, workers=1)
+        paralelo, _ = validar_csv_em_blocos(str(entrada), "cabeçalhos", str(tmp_path / "par"), 4, workers=2)
+
+        assert paralelo.linhas_invalidas == sequencial.linhas_invalidas
+        assert paralelo.erros_por_regra == sequencial.erros_por_regra
+        assert ler_dataframe(tmp_path / "par", "cabeçalhos").equals(ler_dataframe(tmp_path / "seq", "cabeçalhos"))
+
+
+class TestDatasetColunar:
+    """O CSV é convertido uma única vez para Arrow tipado e reaproveitado depois."""
+
+    def test_schema_tipado(self, df_cabecalho, df_itens, tmp_path):
+        df_cabecalho.to_csv(tmp_path / "cabecalho.csv", index=False)
+        df_itens.to_csv(tmp_path / "itens.csv", index=False)
+        validar_csv_em_blocos(str(tmp_path / "cabecalho.csv"), "cabeçalhos", str(tmp_path), chunk_size=4)
+        validar_csv_em_blocos(str(tmp_path / "itens.csv"), "itens", str(tmp_path), chunk_size=4)
+
+        assert schema_tabela(tmp_path, "cabeçalhos").field("DATA EMISSÃO").type == pa.timestamp("ns")
+        assert schema_tabela(tmp_path, "cabeçalhos").field("VALOR NOTA FISCAL").type == pa.int64()
+        assert schema_tabela(tmp_path, "itens").field("NÚMERO").type == pa.string()
+
+        datas = ler_dataframe(tmp_path, "cabeçalhos", ["DATA EMISSÃO"])["DATA EMISSÃO"]
+        assert datas.isna().sum() == 1  # "15/01/2024" fica nulo
+
+        df = ler_dataframe(tmp_path, "itens", ["NÚMERO", "QUANTIDADE"])
+        assert list(df.columns) == ["NÚMERO", "QUANTIDADE"]
+        assert df["QUANTIDADE"].isna().sum() == 1  # "abc" vira nulo
+
+        # Valores monetários em centavos inteiros, exatos nas somas
+        valores = ler_dataframe(tmp_path, "cabeçalhos", ["VALOR NOTA FISCAL"])["VALOR NOTA FISCAL"]
+        assert str(valores.dtype) == "Int64"
+        assert valores.tolist() == [10000, 25050, 1000, 2000, -500, 100]
+
+    def test_codigos_so_com_digitos(self, tmp_path):
+        """SÉRIE, CFOP, NCM e chave de acesso numéricos continuam texto no dataset."""
+        entrada = tmp_path / "itens.csv"
+        entrada.write_text(
+            "CHAVE DE ACESSO,MODELO,SÉRIE,NÚMERO,CFOP,CÓDIGO NCM/SH,NÚMERO PRODUTO,"
+            "DESCRIÇÃO DO PRODUTO/SERVIÇO,QUANTIDADE,VALOR UNITÁRIO,VALOR TOTAL\n"
+            "35240112345678000190550010000000011000000017,55,001,1,5102,48025610,10,PAPEL A4,2,10.0,20.0\n"
+        )
+        resultado, total = validar_csv_em_blocos(str(entrada), "itens", str(tmp_path), chunk_size=4)
+
+        assert (total, resultado.total_itens) == (1, 1)
+        df = ler_dataframe(tmp_path, "itens", ["CHAVE DE ACESSO", "SÉRIE", "CFOP", "CÓDIGO NCM/SH"])
+        assert df.iloc[0].tolist() == ["35240112345678000190550010000000011000000017", "001", "5102", "48025610"]
+
+        # Blocos já tipados pelo pandas (códigos inteiros) também são gravados como texto
+        bloco = pd.DataFrame({"CFOP": [5102, 6108], "QUANTIDADE": [1.0, 2.0]})
+        tabela = converter_bloco(bloco, schema_para_colunas(list(bloco.columns), "itens"))
+        assert tabela.column("CFOP").to_pylist() == ["5102", "6108"]
+
+    def test_reaproveita_dataset_atualizado(self, df_itens, tmp_path, monkeypatch):
+        entrada = tmp_path / "itens.csv"
+        df_itens.to_csv(entrada, index=False)
+        primeiro, _ = validar_csv_em_blocos(str(entrada), "itens", str(tmp_path), chunk_size=4)
+        assert dataset_atualizado(tmp_path, "itens", entrada)
+
+        def falhar(*args, **kwargs):
+            raise AssertionError("CSV lido novamente")
+        monkeypatch.setattr(pd, "read_csv", falhar)
+        segundo, total = validar_csv_em_blocos(str(entrada), "itens", str(tmp_path), chunk_size=4)
+
+        assert total == len(df_itens)
+        assert segundo.linhas_invalidas == primeiro.linhas_invalidas
+        assert segundo.erros_por_regra == primeiro.erros_por_regra
+
+
+    def test_perfil_invalidado_quando_a_origem_muda(self, df_cabecalho, tmp_path):
+        entrada = tmp_path / "cabecalho.csv"
+        df_cabecalho.to_csv(entrada, index=False)
+        validar_csv_em_blocos(str(entrada), "cabeçalhos", str(tmp_path), chunk_size=4)
+
+        perfil = gerar_perfil(tmp_path)
+        tabela = perfil["tabelas"]["cabeçalhos"]
+        assert tabela["linhas"] == len(df_cabecalho)
+        assert tabela["linhas_invalidas"] == 3
+        assert tabela["colunas"]["VALOR NOTA FISCAL"]["soma"] == pytest.approx(376.5)
+        assert carregar_perfil(tmp_path) == perfil
+        assert "VALOR NOTA FISCAL" in resumo_perfil(perfil)
+
+        pd.concat([df_cabecalho] * 2).to_csv(entrada, index=False)
+        validar_csv_em_blocos(str(entrada), "cabeçalhos", str(tmp_path), chunk_size=4)
+        assert carregar_perfil(tmp_path) is None
+
+
+class TestIngestaoZip:
+    """CSVs dentro do ZIP são validados em streaming, sem extração em disco."""
+
+    def test_membro_do_zip(self, df_itens, tmp_path):
+        csv = df_itens.to_csv(index=False)
+        caminho_zip = tmp_path / "notas.zip"
+        with zipfile.ZipFile(caminho_zip, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("dados/202401_NFs_Itens.csv", csv)
+            zip_ref.writestr("leiame.txt", "ignorado")
+        destino = tmp_path / "dados"
+
+        catalogo = catalogar_arquivo(str(caminho_zip), str(destino))
+        assert catalogo["csvs"] == ["dados/202401_NFs_Itens.csv"]
+        assert ler_catalogo(str(destino)) == catalogo
+
+        resultado, total = validar_csv_em_blocos(str(caminho_zip), "itens", str(destino), chunk_size=4,
+                                                 membro="dados/202401_NFs_Itens.csv")
+        (tmp_path / "itens.csv").write_text(csv)
+        em_disco, _ = validar_csv_em_blocos(str(tmp_path / "itens.csv"), "itens", str(tmp_path / "disco"), 4)
+
+        assert total == len(df_itens)
+        assert resultado.linhas_invalidas == em_disco.linhas_invalidas
+        assert sorted(p.name for p in destino.iterdir()) == ["_arquivo_origem.json", "dataset"]
+        assert ler_manifesto(destino, "itens")["origem"]["arquivo"] == "202401_NFs_Itens.csv"
+        assert dataset_atualizado(destino, "itens",
+                                  origem=assinatura_fonte(str(caminho_zip), "dados/202401_NFs_Itens.csv"))
+
+    def test_ingestao_completa_sem_agentes(self, df_cabecalho, df_itens, tmp_path):
+        caminho_zip = tmp_path / "notas.zip"
+        with zipfile.ZipFile(caminho_zip, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("202401_NFs_Cabecalho.csv", df_cabecalho.to_csv(index=False))
+            zip_ref.writestr("202401_NFs_Itens.csv", df_itens.to_csv(index=False))
+        destino = tmp_path / "dados"
+        eventos = []
+
+        perfil = ingerir_arquivo(str(caminho_zip), str(destino), chunk_size=4,
+                                 progresso=lambda etapa, detalhes: eventos.append((etapa, detalhes)))
+
+        assert perfil == carregar_perfil(destino)
+        assert {tipo: tabela["linhas"] for tipo, tabela in perfil["tabelas"].items()} == {
+            "cabeçalhos": len(df_cabecalho), "itens": len(df_itens)
+        }
+        etapas = [etapa for etapa, _ in eventos]
+        assert etapas[0] == "extracao" and etapas[-1] == "perfil"
+        assert ("validacao_concluida", {"tipo": "itens", "arquivo": "202401_NFs_Itens.csv",
+                                        "registros": len(df_itens), "invalidos": 3}) in eventos
+
+    def test_ingestao_valida_cabecalhos_e_itens_ao_mesmo_tempo(self, df_cabecalho, df_itens, tmp_path, monkeypatch):
+        caminho_zip = tmp_path / "notas.zip"
+        with zipfile.ZipFile(caminho_zip, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("202401_NFs_Cabecalho.csv", df_cabecalho.to_csv(index=False))
+            zip_ref.writestr("202401_NFs_Itens.csv", df_itens.to_csv(index=False))
+        # Cada validação espera a outra começar: só termina se as duas rodarem juntas
+        iniciadas = threading.Barrier(2, timeout=10)
+        original = functions.validar_csv_em_blocos
+
+        def validar_junto(*args, **kwargs):
+            iniciadas.wait()
+            return original(*args, **kwargs)
+        monkeypatch.setattr(functions, "validar_csv_em_blocos", validar_junto)
+
+        perfil = ingerir_arquivo(str(caminho_zip), str(tmp_path / "dados"), chunk_size=4)
+        assert set(perfil["tabelas"]) == {"cabeçalhos", "itens"}
+
+    def test_ingestao_sem_csvs_de_notas(self, tmp_path):
+        caminho_zip = tmp_path / "notas.zip"
+        with zipfile.ZipFile(caminho_zip, "w") as zip_ref:
+            zip_ref.writestr("outros.csv", "A,B\n1,2\n")
+        with pytest.raises(ExtractionError):
+            ingerir_arquivo(str(caminho_zip), str(tmp_path / "dados"), chunk_size=4)
+
+class TestBenchmark:
+    """O benchmark de validação roda de ponta a ponta com dados sintéticos."""
+
+    def test_benchmark_pequeno(self, monkeypatch, capsys):
+        import benchmark_validacao
+        monkeypatch.setattr("sys.argv", ["benchmark_validacao.py", "--linhas", "2000",
+                                         "--workers", "1", "2", "--chunk-size", "500"])
+        benchmark_validacao.main()
+        assert "✅ Itens válidos:" in capsys.readouterr().out
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
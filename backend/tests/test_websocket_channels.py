@@ -0,0 +1,137 @@
+"""
+Testes dos canais do WebSocket (assinaturas, filas por cliente e backpressure).
+"""
+import asyncio
+
+from utils.websocket_channels import CanalSSE, ConnectionManager, definir_canais
+
+
+class WebSocketFalso:
+    def __init__(self, atraso: float = 0.0):
+        self.atraso = atraso
+        self.recebidas = []
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, mensagem):
+        if self.atraso:
+            await asyncio.sleep(self.atraso)
+        self.recebidas.append(mensagem)
+
+
+def log(texto):
+    return {"type": "agent_log", "data": {"message": texto}}
+
+
+class TestCanaisWebSocket:
+    def test_eventos_so_para_assinantes(self):
+        async def cenario():
+            manager = ConnectionManager()
+            sessao_a, sessao_b, todos = WebSocketFalso(), WebSocketFalso(), WebSocketFalso()
+            await manager.connect(sessao_a, ["session:a"])
+            await manager.connect(sessao_b, ["session:b"])
+            await manager.connect(todos, ["*"])
+
+            await manager.broadcast(log("explícito\n"), ["session:a"])
+            # Sem tópico (nem no contexto): só os assinantes de "*"
+            await manager.broadcast(log("sem tópico\n"))
+
+            async def job_da_sessao_b():
+                definir_canais("job:1", "session:b")
+                await manager.broadcast(log("do contexto\n"))
+
+            await asyncio.create_task(job_da_sessao_b())
+            await asyncio.sleep(0.01)
+            return sessao_a, sessao_b, todos
+
+        sessao_a, sessao_b, todos = asyncio.run(cenario())
+        assert [m["data"]["message"] for m in sessao_a.recebidas] == ["explícito\n"]
+        assert [m["data"]["message"] for m in sessao_b.recebidas] == ["do contexto\n"]
+        assert len(todos.recebidas) == 3
+
+    def test_cliente_lento_nao_atrasa_os_outros(self):
+        async def cenario():
+            manager = ConnectionManager(max_fila_cliente=5)
+            lento, rapido = WebSocketFalso(atraso=0.5), WebSocketFalso()
+            await manager.connect(lento, ["job:1"])
+            await manager.connect(rapido, ["job:1"])
+
+            inicio = asyncio.get_running_loop().time()
+            for indice in range(50):
+                await manager.broadcast(log(f"linha {indice}\n"), ["job:1"])
+                await asyncio.sleep(0)  # o job cede o event loop entre as linhas
+            await manager.broadcast({"type": "processing_completed", "data": {}}, ["job:1"])
+            duracao = asyncio.get_running_loop().time() - inicio
+            await asyncio.sleep(0.05)
+            pendentes = list(manager.clientes[lento]._fila)
+            for websocket in (lento, rapido):
+                await manager.clientes[websocket].encerrar()
+            return duracao, rapido, pendentes
+
+        duracao, rapido, pendentes = asyncio.run(cenario())
+        assert duracao < 0.1
+        # O cliente rápido recebe todo o texto (eventualmente juntado em menos frames)
+        texto = "".join(m["data"].get("message", "") for m in rapido.recebidas)
+        assert texto == "".join(f"linha {indice}\n" for indice in range(50))
+        assert rapido.recebidas[-1]["type"] == "processing_completed"
+        # Logs do cliente lento foram juntados/descartados; o evento de status não se perde
+        assert len(pendentes) <= 5
+        assert pendentes[-1]["type"] == "processing_completed"
+        assert "linha 49\n" in "".join(m["data"].get("message", "") for m in pendentes)
+
+    def test_reconexao_retoma_do_ultimo_seq(self):
+        async def cenario():
+            manager = ConnectionManager(max_eventos_topico=3)
+            primeira = WebSocketFalso()
+            await manager.connect(primeira, ["job:1"])
+            for indice in range(3):
+                await manager.broadcast(log(f"linha {indice}\n"), ["job:1", "session:a"])
+            await asyncio.sleep(0.01)
+            ultimo = primeira.recebidas[-1]["seq"]
+            manager.disconnect(primeira)
+
+            # Publicados enquanto o navegador estava desconectado
+            await manager.broadcast(log("linha 3\n"), ["job:1"])
+            await manager.broadcast(log("outro job\n"), ["job:2"])
+            await manager.broadcast({"type": "processing_completed", "data": {}}, ["job:1"])
+
+            retomada, atrasada = WebSocketFalso(), WebSocketFalso()
+            await manager.connect(retomada)
+            manager.assinar(retomada, ["job:1"], desde=ultimo)
+            await manager.connect(atrasada)
+            manager.assinar(atrasada, ["job:1"], desde=0)
+            await manager.broadcast(log("linha 4\n"), ["job:1"])
+            await asyncio.sleep(0.01)
+            return retomada.recebidas, atrasada.recebidas
+
+        retomada, atrasada = asyncio.run(cenario())
+        assert retomada[0] == {"type": "replay", "topics": ["job:1"], "since": 3, "events": 2, "complete": True}
+        assert [m["data"].get("message") for m in retomada[1:]] == ["linha 3\n", None, "linha 4\n"]
+        assert [m["seq"] for m in retomada[1:]] == [4, 6, 7]
+        # O buffer guarda só os 3 últimos eventos do job: o início foi perdido
+        assert atrasada[0]["complete"] is False
+        assert [m["seq"] for m in atrasada[1:]] == [3, 4, 6, 7]
+
+    def test_sse_usa_seq_como_id(self):
+        async def cenario():
+            manager = ConnectionManager()
+            await manager.broadcast(log("antes\n"), ["job:1"])
+            await manager.broadcast(log("perdida\n"), ["job:1"])
+            canal = CanalSSE(intervalo_ping=0.05)
+            cliente = await manager.connect(canal)
+            manager.assinar(canal, ["job:1"], desde=1)  # Last-Event-ID: 1
+            await manager.broadcast(log("depois\n"), ["job:1"])
+
+            blocos = []
+            async for bloco in canal.eventos(cliente):
+                blocos.append(bloco)
+                if len(blocos) == 4:
+                    manager.disconnect(canal)
+            return blocos
+
+        blocos = asyncio.run(cenario())
+        assert blocos[0] == "retry: 3000\n\n"
+        assert blocos[1].startswith("data: ") and '"replay"' in blocos[1]
+        assert blocos[2].startswith("id: 2\ndata: ") and "perdida" in blocos[2]
+        assert blocos[3].startswith("id: 3\ndata: ") and blocos[3].endswith("\n\n")
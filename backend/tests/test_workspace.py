@@ -0,0 +1,50 @@
+"""
+Testes dos workspaces isolados por sessão.
+"""
+import os
+
+import pytest
+
+from utils.workspace import WorkspaceManager, ARQUIVO_RESPOSTA_FINAL
+from utils.exceptions import SecurityError
+
+
+class TestWorkspaces:
+    def test_sessoes_isoladas(self, tmp_path):
+        workspaces = WorkspaceManager(tmp_path)
+        primeiro = workspaces.criar("session_a")
+        segundo = workspaces.criar("session_b")
+
+        assert primeiro.diretorio_dados != segundo.diretorio_dados
+        assert os.path.isdir(primeiro.diretorio_dados) and os.path.isdir(segundo.diretorio_saida)
+        assert primeiro.resposta_final == os.path.join(primeiro.diretorio_saida, ARQUIVO_RESPOSTA_FINAL)
+
+    def test_removido_apos_ultima_referencia(self, tmp_path):
+        workspaces = WorkspaceManager(tmp_path)
+        workspace = workspaces.criar("session_a")
+
+        with workspaces.em_uso("session_a") as em_uso:
+            assert em_uso == workspace
+            workspaces.encerrar("session_a")
+            assert workspaces.adquirir("session_a") is None
+            assert os.path.isdir(workspace.raiz)
+
+        assert not os.path.exists(workspace.raiz)
+        assert workspaces.referencias("session_a") == 0
+
+    def test_limpar_orfaos(self, tmp_path):
+        (tmp_path / "session_antiga" / "saida").mkdir(parents=True)
+        workspaces = WorkspaceManager(tmp_path)
+        ativo = workspaces.criar("session_a")
+
+        assert workspaces.limpar_orfaos() == 1
+        assert not (tmp_path / "session_antiga").exists()
+        assert os.path.isdir(ativo.raiz)
+
+    def test_identificador_invalido(self, tmp_path):
+        with pytest.raises(SecurityError):
+            WorkspaceManager(tmp_path).criar("../fora")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -1,17 +1,27 @@
 from crewai.tools import tool
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from models.notas_fiscais import validar_dataframe_cabecalho, validar_dataframe_itens
+from config.settings import get_setting
+
+# Adiciona o diretório tools ao path para importar functions
+sys.path.insert(0, os.path.dirname(__file__))
+from functions import validar_csv_em_blocos, assinatura_fonte, listar_fontes_csv, classificar_csv
+from models.notas_fiscais import resolver_workers
+from utils.aggregate_cube import gerar_cubo
+from utils.archive_backends import estatisticas_backends, estatisticas_desde
+from utils.columnar_dataset import caminho_tabela, dataset_atualizado, gerar_perfil
 
 @tool("csv_validator")
 def csv_validator_tool(diretorio_dados: str = "/dados/notasfiscais/") -> str:
     """
-    Valida e estrutura arquivos CSV usando modelos Pydantic.
-    Transforma os CSVs em DataFrames limpos e confiáveis, garantindo
-    a integridade dos dados antes do processamento pelos outros agentes.
+    Valida e estrutura os CSVs de cabeçalhos e itens com o motor de
+    validação vetorizado: os blocos de cada arquivo são validados em um
+    pool de processos e gravados no dataset colunar (Arrow), reaproveitado
+    pelos outros agentes sem nova leitura dos CSVs.
     
     Args:
         diretorio_dados: Diretório onde estão os arquivos CSV extraídos
@@ -24,8 +34,13 @@ def csv_validator_tool(diretorio_dados: str = "/dados/notasfiscais/") -> str:
         if not os.path.exists(diretorio_dados):
             return f"❌ Erro: Diretório {diretorio_dados} não encontrado"
         
-        # Lista arquivos CSV no diretório
-        csv_files = [f for f in os.listdir(diretorio_dados) if f.lower().endswith('.csv')]
+        # CSVs catalogados de um ZIP são lidos direto do arquivo compactado;
+        # caso contrário, usa os CSVs presentes no diretório.
+        # Caminho e membro do ZIP (None para CSV em disco) de cada arquivo
+        fontes = listar_fontes_csv(diretorio_dados)
+        
+        # Lista arquivos CSV disponíveis
+        csv_files = list(fontes)
         
         if not csv_files:
             return f"❌ Erro: Nenhum arquivo CSV encontrado em {diretorio_dados}"
@@ -37,115 +52,98 @@ def csv_validator_tool(diretorio_dados: str = "/dados/notasfiscais/") -> str:
         arquivo_itens = None
         
         for arquivo in csv_files:
-            nome_lower = arquivo.lower()
-            if 'cabecalho' in nome_lower or 'header' in nome_lower:
+            tipo = classificar_csv(arquivo)
+            if tipo == "cabeçalhos":
                 arquivo_cabecalho = arquivo
-            elif 'itens' in nome_lower or 'items' in nome_lower:
+            elif tipo == "itens":
                 arquivo_itens = arquivo
         
         validacoes_realizadas = 0
         total_registros_validos = 0
         erros_encontrados = []
         
-        # Valida arquivo de cabeçalhos
-        if arquivo_cabecalho:
-            resultado += f"📋 Validando {arquivo_cabecalho}...\n"
-            try:
-                # Define tipos específicos para evitar conversões automáticas problemáticas
-                dtype_cabecalho = {
-                    'NÚMERO': str,
-                    'CPF/CNPJ Emitente': str,
-                    'CNPJ DESTINATÁRIO': str
-                }
-                
-                df_cabecalho = pd.read_csv(
-                    os.path.join(diretorio_dados, arquivo_cabecalho),
-                    delimiter=',',
-                    decimal='.',
-                    dtype=dtype_cabecalho,
-                    keep_default_na=False  # Evita conversão de strings para NaN
+        # Lê os CSVs em blocos: a memória fica limitada ao tamanho do bloco
+        chunk_size = get_setting('validation_chunk_size')
+        limite_erros = get_setting('validation_max_error_details')
+        workers = resolver_workers(get_setting('max_workers'))
+        
+        arquivos_para_validar = [
+            item for item in [
+                (arquivo_cabecalho, "cabeçalhos", "📋"),
+                (arquivo_itens, "itens", "📦"),
+            ]
+            if item[0]
+        ]
+        
+        # CSVs já convertidos para o dataset colunar não são lidos novamente
+        reaproveitados = {
+            arquivo for arquivo, tipo, _ in arquivos_para_validar
+            if dataset_atualizado(diretorio_dados, tipo, origem=assinatura_fonte(*fontes[arquivo]))
+        }
+        
+        # Cabeçalhos e itens são validados ao mesmo tempo; os blocos de cada arquivo
+        # são distribuídos no pool de processos (InstapriceSettings.max_workers)
+        leitura_antes = estatisticas_backends()
+        with ThreadPoolExecutor(max_workers=max(1, len(arquivos_para_validar))) as executor:
+            validacoes = {
+                arquivo: executor.submit(
+                    validar_csv_em_blocos,
+                    fontes[arquivo][0],
+                    tipo,
+                    diretorio_dados,
+                    chunk_size,
+                    limite_erros,
+                    workers,
+                    membro=fontes[arquivo][1]
                 )
-                
-                # Usa os nomes originais das colunas do CSV (sem mapeamento)
-                # Os novos modelos Pydantic já usam os nomes reais das colunas
-                df_cabecalho_mapped = df_cabecalho.copy()
-                
-                # Valida com Pydantic usando os novos modelos
-                validacao_cab = validar_dataframe_cabecalho(df_cabecalho_mapped)
-                
-                resultado += f"   ✅ Registros válidos: {validacao_cab.total_cabecalhos}\n"
-                resultado += f"   📊 Total de registros: {len(df_cabecalho)}\n"
-                
-                if validacao_cab.erros:
-                    resultado += f"   ⚠️ Erros encontrados: {len(validacao_cab.erros)}\n"
-                    erros_encontrados.extend(validacao_cab.erros[:5])  # Primeiros 5 erros
-                
-                total_registros_validos += validacao_cab.total_cabecalhos
-                validacoes_realizadas += 1
-                
-                # Salva DataFrame limpo com nomes originais das colunas
-                df_limpo_path = os.path.join(diretorio_dados, "cabecalho_validado.csv")
-                df_cabecalho_mapped.to_csv(df_limpo_path, index=False)
-                resultado += f"   💾 DataFrame limpo salvo em: cabecalho_validado.csv\n"
-                
-            except Exception as e:
-                erro_msg = f"Erro ao processar {arquivo_cabecalho}: {str(e)}"
-                resultado += f"   ❌ {erro_msg}\n"
-                erros_encontrados.append(erro_msg)
-                print(f"DEBUG: Erro detalhado no cabecalho: {e}")
+                for arquivo, tipo, _ in arquivos_para_validar
+            }
         
-        # Valida arquivo de itens
-        if arquivo_itens:
-            resultado += f"\n📦 Validando {arquivo_itens}...\n"
+        for arquivo, tipo, icone in arquivos_para_validar:
+            if arquivo in reaproveitados:
+                resultado += f"{icone} {arquivo} já validado: reaproveitando o dataset colunar...\n"
+            else:
+                resultado += f"{icone} Validando {arquivo} (blocos de {chunk_size:,} linhas, {workers} processo(s))...\n"
             try:
-                # Define tipos específicos para evitar conversões automáticas problemáticas
-                dtype_itens = {
-                    'NÚMERO': str,
-                    'NÚMERO PRODUTO': str,
-                    'CPF/CNPJ Emitente': str,
-                    'CNPJ DESTINATÁRIO': str
-                }
+                validacao, total_registros = validacoes[arquivo].result()
+                registros_validos = validacao.total_cabecalhos if tipo == "cabeçalhos" else validacao.total_itens
                 
-                df_itens = pd.read_csv(
-                    os.path.join(diretorio_dados, arquivo_itens),
-                    delimiter=',',
-                    decimal='.',
-                    dtype=dtype_itens,
-                    keep_default_na=False  # Evita conversão de strings para NaN
-                )
+                resultado += f"   ✅ Registros válidos: {registros_validos}\n"
+                resultado += f"   📊 Total de registros: {total_registros}\n"
                 
-                # Usa os nomes originais das colunas do CSV (sem mapeamento)
-                # Os novos modelos Pydantic já usam os nomes reais das colunas
-                df_itens_mapped = df_itens.copy()
+                if validacao.total_invalidas:
+                    resultado += f"   ⚠️ Erros encontrados: {validacao.total_invalidas}\n"
+                    for regra, quantidade in validacao.erros_por_regra.items():
+                        resultado += f"      • {regra}: {quantidade}\n"
+                    erros_encontrados.extend(validacao.erros[:5])  # Primeiros 5 erros
                 
-                # Valida com Pydantic usando os novos modelos
-                validacao_itens = validar_dataframe_itens(df_itens_mapped)
-                
-                resultado += f"   ✅ Registros válidos: {validacao_itens.total_itens}\n"
-                resultado += f"   📊 Total de registros: {len(df_itens)}\n"
-                
-                if validacao_itens.erros:
-                    resultado += f"   ⚠️ Erros encontrados: {len(validacao_itens.erros)}\n"
-                    erros_encontrados.extend(validacao_itens.erros[:5])  # Primeiros 5 erros
-                
-                total_registros_validos += validacao_itens.total_itens
+                total_registros_validos += registros_validos
                 validacoes_realizadas += 1
                 
-                # Salva DataFrame limpo com nomes originais das colunas
-                df_limpo_path = os.path.join(diretorio_dados, "itens_validado.csv")
-                df_itens_mapped.to_csv(df_limpo_path, index=False)
-                resultado += f"   💾 DataFrame limpo salvo em: itens_validado.csv\n"
+                # Dataset tipado (Arrow) salvo com nomes originais das colunas
+                tabela = os.path.relpath(caminho_tabela(diretorio_dados, tipo), diretorio_dados)
+                resultado += f"   💾 Dataset colunar salvo em: {tabela}\n\n"
                 
             except Exception as e:
-                erro_msg = f"Erro ao processar {arquivo_itens}: {str(e)}"
-                resultado += f"   ❌ {erro_msg}\n"
+                erro_msg = f"Erro ao processar {arquivo}: {str(e)}"
+                resultado += f"   ❌ {erro_msg}\n\n"
                 erros_encontrados.append(erro_msg)
-                print(f"DEBUG: Erro detalhado nos itens: {e}")
+        
+        # Vazão da leitura direta dos arquivos compactados (por formato)
+        for estatisticas in estatisticas_desde(leitura_antes).values():
+            resultado += f"📦 Leitura do arquivo compactado - {estatisticas.resumo()}\n\n"
+        
+        # Perfil do dataset: permite responder novas perguntas sobre o mesmo arquivo sem revalidar
+        if validacoes_realizadas and gerar_perfil(diretorio_dados) is not None:
+            resultado += f"🧾 Perfil do dataset salvo para reaproveitamento\n\n"
+            cubo = gerar_cubo(diretorio_dados)
+            if cubo is not None:
+                resultado += f"🧊 Cubo de agregados gerado: {', '.join(cubo['rollups'])}\n\n"
         
         # Processa outros CSVs se necessário
         outros_csvs = [f for f in csv_files if f != arquivo_cabecalho and f != arquivo_itens]
         if outros_csvs:
-            resultado += f"\n📄 Outros CSVs encontrados: {', '.join(outros_csvs)}\n"
+            resultado += f"📄 Outros CSVs encontrados: {', '.join(outros_csvs)}\n"
             resultado += f"   ℹ️ Processamento básico aplicado (sem validação Pydantic específica)\n"
         
         # Resumo final
@@ -1,9 +1,39 @@
-import zipfile
-import subprocess
 import os
+import sys
+import json
+import logging
+import shutil
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
 from pydantic import BaseModel
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.notas_fiscais import (
+    ProcessamentoResult, validar_bloco, mesclar_resultados, resolver_workers, obter_pool_validacao
+)
+from utils.aggregate_cube import gerar_cubo
+from utils.archive_backends import obter_backend, formato_suportado, estatisticas_backends, estatisticas_desde
+from utils.columnar_dataset import (
+    caminho_tabela, schema_para_colunas, converter_bloco, gravar_parte, nome_parte,
+    assinatura_origem, publicar_tabela, ler_manifesto, dataset_atualizado, gerar_perfil
+)
+from utils.exceptions import ExtractionError
+
+# Logger "instaprice" já configurado pelo servidor (setup_logger); obtido sem reconfigurar,
+# pois este módulo também é importado nos processos do pool de validação
+logger = logging.getLogger("instaprice")
+
+# Catálogo dos CSVs de um arquivo compactado, gravado no diretório de dados no lugar dos arquivos extraídos
+ARQUIVO_CATALOGO = "_arquivo_origem.json"
+
+# Todas as colunas dos CSVs são lidas como texto: códigos só com dígitos (SÉRIE, CFOP,
+# NCM, chave de acesso) não viram inteiros nem perdem zeros à esquerda; a tipagem
+# fica a cargo da validação e do dataset colunar
+DTYPE_CSV = str
+
 class NFs_Cabecalho(BaseModel):
     # Defina os campos de acordo com o cabeçalho do arquivo '202401_NFs_Cabecalho.csv'
     pass
@@ -12,55 +42,104 @@ class NFs_Itens(BaseModel):
     # Defina os campos de acordo com o cabeçalho do arquivo '202401_NFs_Itens.csv'
     pass
 
-def descompactar_arquivo(caminho_arquivo: str, diretorio_destino: str) -> None:
-    pasta_temporaria = diretorio_destino
-    os.makedirs(pasta_temporaria, exist_ok=True)
+def catalogar_arquivo(caminho_arquivo: str, diretorio_destino: str) -> Dict[str, Any]:
+    """
+    Lista os membros do arquivo compactado e registra os CSVs no diretório de dados, sem extraí-los.
+    
+    A validação lê cada membro direto do arquivo (ver abrir_fonte), evitando
+    gravar e reler em disco os dados descompactados.
+    
+    Returns:
+        Catálogo com o caminho do arquivo, os membros CSV e o tamanho descompactado
+    """
+    backend = obter_backend(caminho_arquivo)
+    membros = [
+        info for info in backend.listar(caminho_arquivo)
+        if info.nome.lower().endswith('.csv') and not info.nome.startswith('__MACOSX/')
+    ]
+    
+    catalogo = {
+        "arquivo": os.path.abspath(caminho_arquivo),
+        "formato": backend.formato,
+        "csvs": [info.nome for info in membros],
+        "tamanho_descompactado": sum(info.tamanho for info in membros),
+    }
+    os.makedirs(diretorio_destino, exist_ok=True)
+    with open(os.path.join(diretorio_destino, ARQUIVO_CATALOGO), 'w', encoding='utf-8') as arquivo:
+        json.dump(catalogo, arquivo, ensure_ascii=False, indent=2)
+    return catalogo
 
-    if not os.path.isfile(caminho_arquivo):
-     raise FileNotFoundError(f"Arquivo {caminho_arquivo} não encontrado.")
+def ler_catalogo(diretorio_dados: str) -> Optional[Dict[str, Any]]:
+    """Retorna o catálogo do arquivo compactado registrado no diretório ou None se os CSVs estão em disco"""
+    try:
+        with open(os.path.join(diretorio_dados, ARQUIVO_CATALOGO), 'r', encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
 
-    extensao = caminho_arquivo.lower().split('.')[-1]
-    os.chdir(pasta_temporaria)
+@contextmanager
+def abrir_fonte(caminho: str, membro: Optional[str] = None):
+    """Abre um CSV em disco ou, com `membro`, o CSV dentro do arquivo compactado em streaming"""
+    if membro is None:
+        with open(caminho, 'rb') as arquivo:
+            yield arquivo
+    else:
+        with obter_backend(caminho).abrir(caminho, membro) as arquivo:
+            yield arquivo
 
-    if extensao == 'zip':
-        try:
-            with zipfile.ZipFile(caminho_arquivo, 'r') as zip_ref:
-                zip_ref.extractall()
-            print(f"Arquivo {caminho_arquivo} descompactado com sucesso em {diretorio_destino}.")
-        except Exception as e:
-            print(f"Erro ao descompactar {caminho_arquivo}: {e}")
+def assinatura_fonte(caminho: str, membro: Optional[str] = None) -> Dict[str, Any]:
+    """Identifica o CSV de origem; para membros de arquivo compactado usa tamanho e CRC do índice"""
+    if membro is None:
+        return assinatura_origem(caminho)
+    info = obter_backend(caminho).obter_membro(caminho, membro)
+    return {"arquivo": os.path.basename(membro), "tamanho": info.tamanho, "crc": info.crc}
 
-    elif extensao == 'arj':
-        try:
-            subprocess.run(['arj', 'x', caminho_arquivo], check=True)
-            print(f"Arquivo {caminho_arquivo} descompactado com sucesso em {diretorio_destino}.")
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao descompactar {caminho_arquivo}: {e}")
+def classificar_csv(nome_arquivo: str) -> Optional[str]:
+    """Tipo do CSV pelo nome: "cabeçalhos", "itens" ou None para outros CSVs"""
+    nome_lower = nome_arquivo.lower()
+    if 'cabecalho' in nome_lower or 'header' in nome_lower:
+        return "cabeçalhos"
+    if 'itens' in nome_lower or 'items' in nome_lower:
+        return "itens"
+    return None
 
-    elif extensao == '7z':
-        try:
-            subprocess.run(['7z', 'x', caminho_arquivo], check=True)
-            print(f"Arquivo {caminho_arquivo} descompactado com sucesso em {diretorio_destino}.")
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao descompactar {caminho_arquivo}: {e}")
+def listar_fontes_csv(diretorio_dados: str) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    CSVs disponíveis para a validação: nome -> (caminho, membro).
+    
+    CSVs catalogados de um arquivo compactado são lidos direto do arquivo
+    (membro preenchido); caso contrário, usa os CSVs presentes no diretório.
+    """
+    catalogo = ler_catalogo(diretorio_dados)
+    if catalogo:
+        return {os.path.basename(membro): (catalogo['arquivo'], membro) for membro in catalogo['csvs']}
+    return {
+        nome: (os.path.join(diretorio_dados, nome), None)
+        for nome in sorted(os.listdir(diretorio_dados)) if nome.lower().endswith('.csv')
+    }
 
-    elif extensao in ['tar', 'gz', 'tgz']:
-        try:
-            comando = ['tar', '-xvf' if extensao == 'tar' else '-xzvf', caminho_arquivo]
-            subprocess.run(comando, check=True)
-            print(f"Arquivo {caminho_arquivo} descompactado com sucesso em {diretorio_destino}.")
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao descompactar {caminho_arquivo}: {e}")
+def descompactar_arquivo(caminho_arquivo: str, diretorio_destino: str) -> None:
+    """
+    Prepara um arquivo compactado (ZIP, 7Z, RAR, TAR/GZ) para a validação.
+    
+    Os arquivos não são extraídos: os CSVs são catalogados e lidos em streaming
+    pelos backends de utils.archive_backends, no próprio processo e sem
+    alterar o diretório de trabalho.
+    """
+    os.makedirs(diretorio_destino, exist_ok=True)
 
-    elif extensao == 'iso':
-        try:
-            subprocess.run(['7z', 'x', caminho_arquivo], check=True)
-            print(f"Arquivo {caminho_arquivo} descompactado com sucesso em {diretorio_destino}.")
-        except subprocess.CalledProcessError as e:
-            print(f"Erro ao descompactar {caminho_arquivo}: {e}")
+    if not os.path.isfile(caminho_arquivo):
+     raise FileNotFoundError(f"Arquivo {caminho_arquivo} não encontrado.")
 
-    else:
+    if not formato_suportado(caminho_arquivo):
         print(f"Formato de arquivo {caminho_arquivo} não suportado.")
+        return
+
+    try:
+        catalogar_arquivo(caminho_arquivo, diretorio_destino)
+        print(f"Arquivo {caminho_arquivo} catalogado com sucesso em {diretorio_destino}.")
+    except Exception as e:
+        print(f"Erro ao ler {caminho_arquivo}: {e}")
 
 def ler_e_estruturar_dados(caminho_arquivos):
     arquivos_csv = [f for f in os.listdir(caminho_arquivos) if f.endswith('.csv')]
@@ -84,3 +163,210 @@ def ler_e_estruturar_dados(caminho_arquivos):
             print(f"Erro ao processar {arquivo}: {e}")
 
     return dados_estruturados
+
+def _validar_e_gravar_bloco(bloco: pd.DataFrame, tipo: str, schema, caminho_parte: str,
+                            limite_erros: Optional[int] = None) -> ProcessamentoResult:
+    """Converte o bloco para Arrow, grava a parte do dataset e o valida (executa no pool de processos)"""
+    gravar_parte(converter_bloco(bloco, schema), caminho_parte)
+    return validar_bloco(bloco, tipo, limite_erros=limite_erros)
+
+def resultado_salvo(diretorio_dados: str, tipo: str) -> Optional[Tuple[ProcessamentoResult, int]]:
+    """Recupera o resultado da última validação a partir do manifesto do dataset"""
+    manifesto = ler_manifesto(diretorio_dados, tipo)
+    if manifesto is None or 'validacao' not in manifesto:
+        return None
+    validacao = manifesto['validacao']
+    return ProcessamentoResult(**validacao['resultado']), validacao['total_registros']
+
+def validar_csv_em_blocos(caminho_csv: str, tipo: str, diretorio_dados: str, chunk_size: int,
+                          limite_erros: Optional[int] = None,
+                          workers: Optional[int] = None,
+                          reutilizar: bool = True,
+                          membro: Optional[str] = None,
+                          progresso: Optional[Callable[[int], None]] = None) -> Tuple[ProcessamentoResult, int]:
+    """
+    Valida um CSV de notas fiscais em blocos (streaming) e grava o dataset colunar.
+    
+    Cada bloco é lido, validado e gravado como uma parte Arrow tipada em
+    <diretorio_dados>/dataset/<tabela>, de modo que o uso de memória depende de
+    `chunk_size` e não do tamanho do arquivo. As partes são geradas em um
+    diretório temporário que só substitui a tabela anterior ao final.
+    
+    Este é o único ponto em que o CSV de texto é lido: se o dataset já
+    corresponde ao arquivo (mesmo nome, tamanho e data ou CRC), o resultado
+    salvo no manifesto é devolvido sem reler o CSV. Com `membro`, o CSV é lido
+    em streaming de dentro do ZIP `caminho_csv`, sem arquivo temporário.
+    
+    Com mais de um worker, a validação e a conversão de cada bloco rodam no
+    pool de processos enquanto os próximos são lidos; no máximo 2 × workers
+    blocos ficam em memória e os resultados são mesclados na ordem de leitura.
+    
+    Args:
+        caminho_csv: CSV original (cabeçalhos ou itens) ou o ZIP que o contém
+        tipo: "cabeçalhos" ou "itens"
+        diretorio_dados: Diretório da análise, onde o dataset é gravado
+        chunk_size: Número de linhas por bloco
+        limite_erros: Máximo de mensagens de erro e de índices de linhas inválidas
+            mantidos (contagens e `total_invalidas` continuam exatos)
+        workers: Processos de validação (padrão: InstapriceSettings.max_workers)
+        reutilizar: Reaproveita o dataset existente se ele estiver atualizado
+        membro: Nome do CSV dentro do ZIP (None para CSV em disco)
+        progresso: Chamado com o total de registros lidos após cada bloco
+    
+    Returns:
+        Tupla (resultado mesclado de todos os blocos, total de registros lidos)
+    """
+    origem = assinatura_fonte(caminho_csv, membro)
+    if reutilizar and dataset_atualizado(diretorio_dados, tipo, origem=origem):
+        salvo = resultado_salvo(diretorio_dados, tipo)
+        if salvo is not None:
+            return salvo
+    
+    workers = resolver_workers(workers)
+    pool = obter_pool_validacao(workers) if workers > 1 else None
+    
+    destino = caminho_tabela(diretorio_dados, tipo)
+    diretorio_parcial = destino.with_name(f"{destino.name}.parcial")
+    if diretorio_parcial.exists():
+        shutil.rmtree(diretorio_parcial)
+    diretorio_parcial.mkdir(parents=True)
+    
+    resultados = []
+    em_andamento = deque()  # futuros na ordem de leitura
+    total_registros = 0
+    schema = None
+    
+    try:
+        with abrir_fonte(caminho_csv, membro) as fonte, pd.read_csv(
+            fonte,
+            delimiter=',',
+            decimal='.',
+            dtype=DTYPE_CSV,
+            keep_default_na=False,  # Evita conversão de strings para NaN
+            chunksize=chunk_size
+        ) as leitor:
+            for numero_bloco, bloco in enumerate(leitor):
+                total_registros += len(bloco)
+                if schema is None:
+                    schema = schema_para_colunas(list(bloco.columns), tipo)
+                argumentos = (bloco, tipo, schema, str(diretorio_parcial / nome_parte(numero_bloco)), limite_erros)
+                if progresso is not None:
+                    progresso(total_registros)
+                
+                if pool is None:
+                    resultados.append(_validar_e_gravar_bloco(*argumentos))
+                    continue
+                
+                em_andamento.append(pool.submit(_validar_e_gravar_bloco, *argumentos))
+                if len(em_andamento) >= 2 * workers:
+                    resultados.append(em_andamento.popleft().result())
+        
+        while em_andamento:
+            resultados.append(em_andamento.popleft().result())
+        
+        if total_registros == 0:
+            # CSV só com cabeçalho de colunas: publica uma tabela vazia com o schema
+            with abrir_fonte(caminho_csv, membro) as fonte:
+                colunas = list(pd.read_csv(fonte, nrows=0).columns)
+            schema = schema_para_colunas(colunas, tipo)
+            gravar_parte(schema.empty_table(), diretorio_parcial / nome_parte(0))
+        
+        resultado = mesclar_resultados(resultados, tipo, limite_erros)
+        publicar_tabela(diretorio_parcial, destino, {
+            "tipo": tipo,
+            "origem": origem,
+            "linhas": total_registros,
+            "validacao": {
+                "total_registros": total_registros,
+                "resultado": {
+                    **resultado.dict(),
+                    "linhas_invalidas": [int(linha) for linha in resultado.linhas_invalidas],
+                },
+            },
+        })
+    finally:
+        for futuro in em_andamento:
+            futuro.cancel()
+        if diretorio_parcial.exists():
+            shutil.rmtree(diretorio_parcial, ignore_errors=True)
+    
+    return resultado, total_registros
+
+def ingerir_arquivo(caminho_arquivo: str, diretorio_dados: str, chunk_size: int,
+                    limite_erros: Optional[int] = None,
+                    workers: Optional[int] = None,
+                    progresso: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Ingestão completa de um upload, sem agentes: cataloga o arquivo compactado,
+    valida cabeçalhos e itens gravando o dataset colunar e gera o perfil e o
+    cubo de agregados.
+    
+    É o mesmo trabalho das tarefas de extração e validação da crew, executado
+    direto assim que o upload termina; depois dele, basta a crew de consulta.
+    
+    Args:
+        caminho_arquivo: Arquivo compactado (ZIP, 7Z, RAR, TAR/GZ) ou CSV enviado
+        diretorio_dados: Diretório onde o catálogo e o dataset são gravados
+        chunk_size: Número de linhas por bloco na validação
+        limite_erros: Máximo de mensagens de erro mantidas por arquivo
+        workers: Processos de validação (padrão: InstapriceSettings.max_workers)
+        progresso: Chamado com (etapa, detalhes) a cada etapa e bloco validado
+    
+    Returns:
+        Perfil do dataset (ver utils.columnar_dataset.gerar_perfil)
+    """
+    def avisar(etapa: str, **detalhes):
+        if progresso is not None:
+            progresso(etapa, detalhes)
+    
+    os.makedirs(diretorio_dados, exist_ok=True)
+    leitura_antes = estatisticas_backends()
+    avisar("extracao", arquivo=os.path.basename(caminho_arquivo))
+    if formato_suportado(caminho_arquivo):
+        catalogo = catalogar_arquivo(caminho_arquivo, diretorio_dados)
+        fontes = {os.path.basename(membro): (catalogo['arquivo'], membro) for membro in catalogo['csvs']}
+    elif caminho_arquivo.lower().endswith('.csv'):
+        fontes = {os.path.basename(caminho_arquivo): (caminho_arquivo, None)}
+    else:
+        raise ExtractionError(f"Formato não suportado na ingestão: {caminho_arquivo}", file_path=caminho_arquivo)
+    
+    arquivos = {}
+    for nome, fonte in fontes.items():
+        tipo = classificar_csv(nome)
+        if tipo is not None:
+            arquivos.setdefault(tipo, (nome, fonte))
+    if not arquivos:
+        raise ExtractionError(
+            "Nenhum CSV de cabeçalhos ou itens encontrado",
+            file_path=caminho_arquivo,
+            csvs=list(fontes)
+        )
+    
+    def validar(tipo: str, nome: str, caminho: str, membro: Optional[str]) -> None:
+        avisar("validacao", tipo=tipo, arquivo=nome, registros=0)
+        resultado, total_registros = validar_csv_em_blocos(
+            caminho, tipo, diretorio_dados, chunk_size, limite_erros, workers,
+            membro=membro,
+            progresso=lambda registros: avisar("validacao", tipo=tipo, arquivo=nome, registros=registros)
+        )
+        avisar("validacao_concluida", tipo=tipo, arquivo=nome, registros=total_registros,
+               invalidos=resultado.total_invalidas)
+    
+    # Cabeçalhos e itens são validados ao mesmo tempo, como na ferramenta csv_validator;
+    # os blocos de cada arquivo são distribuídos no pool de processos
+    with ThreadPoolExecutor(max_workers=len(arquivos)) as executor:
+        validacoes = [
+            executor.submit(validar, tipo, nome, caminho, membro)
+            for tipo, (nome, (caminho, membro)) in arquivos.items()
+        ]
+        for validacao in validacoes:
+            validacao.result()
+    for estatisticas in estatisticas_desde(leitura_antes).values():
+        logger.info(f"📦 Leitura do arquivo compactado - {estatisticas.resumo()}")
+    
+    avisar("perfil")
+    perfil = gerar_perfil(diretorio_dados)
+    if perfil is None:
+        raise ExtractionError("Não foi possível gerar o perfil do dataset", file_path=caminho_arquivo)
+    gerar_cubo(diretorio_dados)
+    return perfil
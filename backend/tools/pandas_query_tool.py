@@ -4,10 +4,130 @@ import os
 from datetime import datetime
 import json
 import numpy as np
-from decimal import Decimal, getcontext
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.dataset_registry import DatasetSessao, obter_registro
+from utils.query_planner import formatar_cnpj, formatar_reais, formatar_resultados
+from models.consulta import interpretar_consultas
+from models.notas_fiscais import COLUNAS_CENTAVOS, converter_centavos
+
+# Valores monetários (nomes originais e renomeados dos CSVs) mantidos em centavos inteiros
+COLUNAS_CENTAVOS_CSV = COLUNAS_CENTAVOS + ('valor_total', 'valor_total_item')
+
+
+def carregar_csvs(diretorio_dados: str):
+    """
+    Sem dataset colunar (validação não executada): lê os CSVs do diretório,
+    priorizando os validados, e devolve (cabeçalhos, itens).
+    """
+    df_cabecalho = None
+    df_itens = None
+    csv_files = [f for f in os.listdir(diretorio_dados) if f.endswith('.csv')]
+    
+    # Prioriza arquivos validados (com colunas já mapeadas)
+    for arquivo in csv_files:
+        arquivo_lower = arquivo.lower()
+        caminho_arquivo = os.path.join(diretorio_dados, arquivo)
+        
+        if df_cabecalho is None and 'cabecalho_validado' in arquivo_lower:
+            df_cabecalho = pd.read_csv(caminho_arquivo)
+            # Converte data_emissao se existir e for string
+            if 'data_emissao' in df_cabecalho.columns:
+                try:
+                    df_cabecalho['data_emissao'] = pd.to_datetime(df_cabecalho['data_emissao'])
+                except:
+                    pass
+                    
+        elif df_itens is None and 'itens_validado' in arquivo_lower:
+            df_itens = pd.read_csv(caminho_arquivo)
+            
+        elif df_cabecalho is None and ('cabecalho' in arquivo_lower or 'header' in arquivo_lower):
+            df_cabecalho = pd.read_csv(caminho_arquivo)
+            # Tenta mapear colunas do CSV original
+            mapeamento_cabecalho = {
+                'NÚMERO': 'numero_nf',
+                'DATA EMISSÃO': 'data_emissao', 
+                'CPF/CNPJ Emitente': 'cnpj_emitente',
+                'RAZÃO SOCIAL EMITENTE': 'nome_emitente',
+                'VALOR NOTA FISCAL': 'valor_total',
+                'UF EMITENTE': 'estado',
+                'MUNICÍPIO EMITENTE': 'cidade'
+            }
+            for col_original, col_nova in mapeamento_cabecalho.items():
+                if col_original in df_cabecalho.columns:
+                    df_cabecalho = df_cabecalho.rename(columns={col_original: col_nova})
+            if 'data_emissao' in df_cabecalho.columns:
+                try:
+                    df_cabecalho['data_emissao'] = pd.to_datetime(df_cabecalho['data_emissao'])
+                except:
+                    pass
+                    
+        elif df_itens is None and ('itens' in arquivo_lower or 'items' in arquivo_lower):
+            df_itens = pd.read_csv(caminho_arquivo)
+            # Tenta mapear colunas do CSV original
+            mapeamento_itens = {
+                'NÚMERO': 'numero_nf',
+                'NÚMERO PRODUTO': 'codigo_produto',
+                'DESCRIÇÃO DO PRODUTO/SERVIÇO': 'descricao_produto', 
+                'QUANTIDADE': 'quantidade',
+                'VALOR UNITÁRIO': 'valor_unitario',
+                'VALOR TOTAL': 'valor_total_item',
+                'NCM/SH (TIPO DE PRODUTO)': 'categoria'
+            }
+            for col_original, col_nova in mapeamento_itens.items():
+                if col_original in df_itens.columns:
+                    df_itens = df_itens.rename(columns={col_original: col_nova})
+            
+    # Se não encontrou pelos nomes, tenta identificar pela estrutura
+    if df_cabecalho is None or df_itens is None:
+        for arquivo in csv_files:
+            caminho_arquivo = os.path.join(diretorio_dados, arquivo)
+            df_temp = pd.read_csv(caminho_arquivo, nrows=5)
+            
+            # Arquivo de cabeçalho geralmente tem menos linhas e não tem "PRODUTO"
+            if df_cabecalho is None and 'PRODUTO' not in ' '.join(df_temp.columns).upper():
+                df_cabecalho = pd.read_csv(caminho_arquivo)
+                for col in df_cabecalho.columns:
+                    if 'data' in col.lower() and 'emiss' in col.lower():
+                        df_cabecalho['data_emissao'] = pd.to_datetime(df_cabecalho[col])
+                        break
+                        
+            # Arquivo de itens geralmente tem "PRODUTO" nas colunas
+            elif df_itens is None and 'PRODUTO' in ' '.join(df_temp.columns).upper():
+                df_itens = pd.read_csv(caminho_arquivo)
+    
+    # Como no dataset colunar, valores monetários passam a centavos inteiros na carga
+    for df in (df_cabecalho, df_itens):
+        if df is not None:
+            for coluna in COLUNAS_CENTAVOS_CSV:
+                if coluna in df.columns:
+                    df[coluna] = converter_centavos(df[coluna])
+    
+    return df_cabecalho, df_itens
+
+
+def periodo_emissao(datas: pd.Series) -> str:
+    """Período "dd/mm/aaaa a dd/mm/aaaa" das datas de emissão (já datetime64 no schema canônico)"""
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas)
+    return f"{datas.min().strftime('%d/%m/%Y')} a {datas.max().strftime('%d/%m/%Y')}"
+
+
+def executar_especificacao(consultas: list, dataset: DatasetSessao) -> str:
+    """Executa as consultas estruturadas no planejador do dataset (cache mantido entre chamadas)"""
+    planejador = dataset.planejador
+    antes = planejador.estatisticas()
+    resultados = planejador.executar(consultas)
+    depois = planejador.estatisticas()
+    resultado = f"📊 Consulta estruturada: {len(consultas)} consulta(s)\n\n"
+    resultado += formatar_resultados(resultados)
+    resultado += (f"\n⏱️ {depois['varreduras'] - antes['varreduras']} varredura(s) e "
+                  f"{depois['agrupamentos'] - antes['agrupamentos']} agrupamento(s) "
+                  f"({depois['agrupamentos_cubo'] - antes['agrupamentos_cubo']} pelo cubo) em "
+                  f"{depois['tempo_ms'] - antes['tempo_ms']:.0f} ms\n")
+    resultado += "\n✅ Consulta Pandas executada com sucesso!"
+    return resultado
 
-# Define precisão matemática para cálculos financeiros
-getcontext().prec = 28
 
 @tool("pandas_query_executor")
 def pandas_query_executor_tool(query_description: str, diretorio_dados: str = None) -> str:
@@ -16,8 +136,16 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
     Suporta operações como groupby, sum, filter, mean, join entre cabeçalhos e itens.
     Esta ferramenta trabalha com dados já validados pelo Guardião Pydantic.
     
+    De preferência, query_description deve ser a especificação JSON da consulta
+    produzida pela interpretação (um objeto, uma lista ou {"consultas": [...]}),
+    com tabela ("cabecalho"/"itens"), filtros [{"campo", "operador", "valor"}],
+    dimensoes (emitente, destinatario, uf_emitente, municipio_emitente, ncm, produto...),
+    medidas [{"metrica": "valor"|"notas"|"quantidade"|"itens", "agregacao": "soma"|"media"|"min"|"max"|"contagem"}],
+    periodo (dia, semana, mes, ano), ordenar_por, ordem e top_k. Texto livre
+    ainda é aceito e respondido pelas análises por palavras-chave.
+    
     Args:
-        query_description: Descrição da consulta em linguagem natural
+        query_description: Especificação JSON da consulta ou descrição em linguagem natural
         diretorio_dados: Diretório onde estão os arquivos CSV validados
     
     Returns:
@@ -33,87 +161,22 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
         if not os.path.exists(diretorio_dados):
             return f"❌ Erro: Diretório {diretorio_dados} não encontrado"
         
-        # Carrega dados validados
-        df_cabecalho = None
-        df_itens = None
+        # Especificação estruturada: executada pelo planejador, sem depender de palavras-chave
+        try:
+            consultas = interpretar_consultas(query_description)
+        except ValueError as e:
+            return f"❌ Especificação de consulta inválida: {e}"
         
-        # Lista todos os CSVs disponíveis
-        csv_files = [f for f in os.listdir(diretorio_dados) if f.endswith('.csv')]
+        # Dataset da sessão em memória: carregado (e tipado) só na primeira chamada;
+        # os frames são compartilhados entre chamadas e ferramentas, então não são alterados
+        dataset = obter_registro().obter(diretorio_dados, carregar_csvs)
+        if dataset is None:
+            return "❌ Erro: Nenhum arquivo de dados encontrado"
         
-        # Prioriza arquivos validados (com colunas já mapeadas)
-        for arquivo in csv_files:
-            arquivo_lower = arquivo.lower()
-            caminho_arquivo = os.path.join(diretorio_dados, arquivo)
-            
-            if 'cabecalho_validado' in arquivo_lower:
-                df_cabecalho = pd.read_csv(caminho_arquivo)
-                # Converte data_emissao se existir e for string
-                if 'data_emissao' in df_cabecalho.columns:
-                    try:
-                        df_cabecalho['data_emissao'] = pd.to_datetime(df_cabecalho['data_emissao'])
-                    except:
-                        pass
-                        
-            elif 'itens_validado' in arquivo_lower:
-                df_itens = pd.read_csv(caminho_arquivo)
-                
-            elif df_cabecalho is None and ('cabecalho' in arquivo_lower or 'header' in arquivo_lower):
-                df_cabecalho = pd.read_csv(caminho_arquivo)
-                # Tenta mapear colunas do CSV original
-                mapeamento_cabecalho = {
-                    'NÚMERO': 'numero_nf',
-                    'DATA EMISSÃO': 'data_emissao', 
-                    'CPF/CNPJ Emitente': 'cnpj_emitente',
-                    'RAZÃO SOCIAL EMITENTE': 'nome_emitente',
-                    'VALOR NOTA FISCAL': 'valor_total',
-                    'UF EMITENTE': 'estado',
-                    'MUNICÍPIO EMITENTE': 'cidade'
-                }
-                for col_original, col_nova in mapeamento_cabecalho.items():
-                    if col_original in df_cabecalho.columns:
-                        df_cabecalho = df_cabecalho.rename(columns={col_original: col_nova})
-                if 'data_emissao' in df_cabecalho.columns:
-                    try:
-                        df_cabecalho['data_emissao'] = pd.to_datetime(df_cabecalho['data_emissao'])
-                    except:
-                        pass
-                        
-            elif df_itens is None and ('itens' in arquivo_lower or 'items' in arquivo_lower):
-                df_itens = pd.read_csv(caminho_arquivo)
-                # Tenta mapear colunas do CSV original
-                mapeamento_itens = {
-                    'NÚMERO': 'numero_nf',
-                    'NÚMERO PRODUTO': 'codigo_produto',
-                    'DESCRIÇÃO DO PRODUTO/SERVIÇO': 'descricao_produto', 
-                    'QUANTIDADE': 'quantidade',
-                    'VALOR UNITÁRIO': 'valor_unitario',
-                    'VALOR TOTAL': 'valor_total_item',
-                    'NCM/SH (TIPO DE PRODUTO)': 'categoria'
-                }
-                for col_original, col_nova in mapeamento_itens.items():
-                    if col_original in df_itens.columns:
-                        df_itens = df_itens.rename(columns={col_original: col_nova})
-                
-        # Se não encontrou pelos nomes, tenta identificar pela estrutura
-        if df_cabecalho is None or df_itens is None:
-            for arquivo in csv_files:
-                caminho_arquivo = os.path.join(diretorio_dados, arquivo)
-                df_temp = pd.read_csv(caminho_arquivo, nrows=5)
-                
-                # Arquivo de cabeçalho geralmente tem menos linhas e não tem "PRODUTO"
-                if df_cabecalho is None and 'PRODUTO' not in ' '.join(df_temp.columns).upper():
-                    df_cabecalho = pd.read_csv(caminho_arquivo)
-                    for col in df_cabecalho.columns:
-                        if 'data' in col.lower() and 'emiss' in col.lower():
-                            df_cabecalho['data_emissao'] = pd.to_datetime(df_cabecalho[col])
-                            break
-                            
-                # Arquivo de itens geralmente tem "PRODUTO" nas colunas
-                elif df_itens is None and 'PRODUTO' in ' '.join(df_temp.columns).upper():
-                    df_itens = pd.read_csv(caminho_arquivo)
+        if consultas:
+            return executar_especificacao(consultas, dataset)
         
-        if df_cabecalho is None and df_itens is None:
-            return "❌ Erro: Nenhum arquivo de dados encontrado"
+        df_cabecalho, df_itens = dataset.cabecalho, dataset.itens
         
         # Analisa a query e executa operações
         query_lower = query_description.lower()
@@ -145,10 +208,10 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                 # Valor total se existir coluna de valor
                 if 'valor_total' in df_cabecalho.columns:
                     valor_total = df_cabecalho['valor_total'].sum()
-                    resultado += f"💰 Valor total das notas: R$ {valor_total:,.2f}\n"
+                    resultado += f"💰 Valor total das notas: {formatar_reais(valor_total)}\n"
                 elif 'VALOR NOTA FISCAL' in df_cabecalho.columns:
                     valor_total = df_cabecalho['VALOR NOTA FISCAL'].sum()
-                    resultado += f"💰 Valor total das notas: R$ {valor_total:,.2f}\n"
+                    resultado += f"💰 Valor total das notas: {formatar_reais(valor_total)}\n"
                         
                 return resultado
         
@@ -172,23 +235,17 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
             if nome_col and valor_col:
                 # Agrupamento com nome, CNPJ e valores
                 if cnpj_col:
-                    # Cria um DataFrame agrupado com nome, CNPJ e totais - PRECISÃO MATEMÁTICA
-                    # Converte para Decimal para precisão financeira
-                    df_temp = df_cabecalho.copy()
-                    df_temp[valor_col] = df_temp[valor_col].apply(lambda x: Decimal(str(x)) if pd.notna(x) else Decimal('0'))
-                    
-                    grupo_fornecedores = df_temp.groupby([nome_col, cnpj_col]).agg({
-                        valor_col: ['sum', 'count']
+                    # Agrupa nome, CNPJ e totais - PRECISÃO MATEMÁTICA: soma exata em centavos inteiros
+                    # (observed=True: com dimensões categóricas, só os pares nome/CNPJ existentes)
+                    grupo_fornecedores = df_cabecalho.groupby([nome_col, cnpj_col], observed=True).agg({
+                        valor_col: ['sum', 'size']
                     })
                     
-                    # Converte de volta para float para display, mantendo precisão
-                    grupo_fornecedores.loc[:, (valor_col, 'sum')] = grupo_fornecedores[valor_col, 'sum'].apply(lambda x: round(float(x), 2))
-                    
                     # Ordena por valor total (descendente)
                     grupo_fornecedores_valor = grupo_fornecedores.sort_values((valor_col, 'sum'), ascending=False)
                     
                     # Ordena por quantidade de notas (descendente)
-                    grupo_fornecedores_qtd = grupo_fornecedores.sort_values((valor_col, 'count'), ascending=False)
+                    grupo_fornecedores_qtd = grupo_fornecedores.sort_values((valor_col, 'size'), ascending=False)
                     
                     resultado += f"\n🏢 **PRINCIPAIS FORNECEDORES:**\n\n"
                     
@@ -196,26 +253,22 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                     resultado += f"💰 **Por Valor Total das Notas Fiscais:**\n"
                     for i, ((nome, cnpj), dados) in enumerate(grupo_fornecedores_valor.head(10).iterrows(), 1):
                         valor_total = dados[(valor_col, 'sum')]
-                        qtd_notas = int(dados[(valor_col, 'count')])
-                        # Formata CNPJ
-                        cnpj_str = str(cnpj)
-                        cnpj_formatado = f"{cnpj_str[:2]}.{cnpj_str[2:5]}.{cnpj_str[5:8]}/{cnpj_str[8:12]}-{cnpj_str[12:14]}" if len(cnpj_str) == 14 else cnpj
-                        resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - R$ {valor_total:,.2f} ({qtd_notas} {'nota' if qtd_notas == 1 else 'notas'})\n"
+                        qtd_notas = int(dados[(valor_col, 'size')])
+                        cnpj_formatado = formatar_cnpj(cnpj)
+                        resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - {formatar_reais(valor_total)} ({qtd_notas} {'nota' if qtd_notas == 1 else 'notas'})\n"
                     
                     # Lista por quantidade de notas
                     resultado += f"\n📊 **Por Quantidade de Notas Fiscais:**\n"
                     for i, ((nome, cnpj), dados) in enumerate(grupo_fornecedores_qtd.head(10).iterrows(), 1):
                         valor_total = dados[(valor_col, 'sum')]
-                        qtd_notas = int(dados[(valor_col, 'count')])
-                        # Formata CNPJ
-                        cnpj_str = str(cnpj)
-                        cnpj_formatado = f"{cnpj_str[:2]}.{cnpj_str[2:5]}.{cnpj_str[5:8]}/{cnpj_str[8:12]}-{cnpj_str[12:14]}" if len(cnpj_str) == 14 else cnpj
-                        resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - {qtd_notas} {'nota' if qtd_notas == 1 else 'notas'} - R$ {valor_total:,.2f}\n"
+                        qtd_notas = int(dados[(valor_col, 'size')])
+                        cnpj_formatado = formatar_cnpj(cnpj)
+                        resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - {qtd_notas} {'nota' if qtd_notas == 1 else 'notas'} - {formatar_reais(valor_total)}\n"
                         
                 else:
                     # Fallback sem CNPJ
                     top_fornecedores_qtd = df_cabecalho[nome_col].value_counts().head(10)
-                    top_fornecedores_valor = df_cabecalho.groupby(nome_col)[valor_col].sum().sort_values(ascending=False).head(10)
+                    top_fornecedores_valor = df_cabecalho.groupby(nome_col, observed=True)[valor_col].sum().sort_values(ascending=False).head(10)
                     
                     resultado += f"\n🏢 **PRINCIPAIS FORNECEDORES:**\n\n"
                     resultado += f"📊 **Por Quantidade de Notas Fiscais:**\n"
@@ -224,13 +277,13 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                     
                     resultado += f"\n💰 **Por Valor Total:**\n"
                     for i, (fornecedor, valor) in enumerate(top_fornecedores_valor.items(), 1):
-                        resultado += f"   {i}. {fornecedor}: R$ {valor:,.2f}\n"
+                        resultado += f"   {i}. {fornecedor}: {formatar_reais(valor)}\n"
                 
                 # Valor total geral e estatísticas
                 valor_total_geral = df_cabecalho[valor_col].sum()
                 total_fornecedores = df_cabecalho[nome_col].nunique()
                 resultado += f"\n💵 **RESUMO GERAL:**\n"
-                resultado += f"   • Valor total de todas as notas: R$ {valor_total_geral:,.2f}\n"
+                resultado += f"   • Valor total de todas as notas: {formatar_reais(valor_total_geral)}\n"
                 resultado += f"   • Total de fornecedores únicos: {total_fornecedores}\n"
                 resultado += f"   • Total de notas fiscais: {len(df_cabecalho)}\n"
                 
@@ -259,27 +312,27 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                     
                     if valor_col:
                         valor_total_escritorio = filtro_escritorio[valor_col].sum()
-                        resultado += f"💰 Valor total em itens de escritório: R$ {valor_total_escritorio:,.2f}\n"
+                        resultado += f"💰 Valor total em itens de escritório: {formatar_reais(valor_total_escritorio)}\n"
                         
                         # Top produtos
-                        top_produtos = filtro_escritorio.groupby(desc_col)[valor_col].sum().sort_values(ascending=False).head(3)
+                        top_produtos = filtro_escritorio.groupby(desc_col, observed=True)[valor_col].sum().sort_values(ascending=False).head(3)
                         resultado += f"\n📋 Top 3 produtos de escritório:\n"
                         for produto, valor in top_produtos.items():
-                            resultado += f"   • {produto}: R$ {valor:,.2f}\n"
+                            resultado += f"   • {produto}: {formatar_reais(valor)}\n"
         
         # Operações de agregação por estado
         if 'estado' in query_lower and df_cabecalho is not None:
             if 'estado' in df_cabecalho.columns:
-                por_estado = df_cabecalho.groupby('estado').agg({
+                por_estado = df_cabecalho.groupby('estado', observed=True).agg({
                     'valor_total': ['sum', 'count'],
                     'numero_nf': 'count'
-                }).round(2)
+                })
                 
                 resultado += f"\n🗺️ Análise por Estado:\n"
                 for estado in por_estado.index:
                     valor_total = por_estado.loc[estado, ('valor_total', 'sum')]
                     qtd_nfs = por_estado.loc[estado, ('valor_total', 'count')]
-                    resultado += f"   • {estado}: R$ {valor_total:,.2f} ({qtd_nfs} NFs)\n"
+                    resultado += f"   • {estado}: {formatar_reais(valor_total)} ({qtd_nfs} NFs)\n"
         
         # Operações de comparação temporal
         if 'comparar' in query_lower and 'semana' in query_lower and df_cabecalho is not None:
@@ -297,9 +350,9 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
             percentual = (diferenca / valor_anterior * 100) if valor_anterior > 0 else 0
             
             resultado += f"\n📈 Comparação Temporal:\n"
-            resultado += f"   • {data_base.strftime('%d/%m/%Y')}: R$ {valor_atual:,.2f}\n"
-            resultado += f"   • {data_anterior.strftime('%d/%m/%Y')}: R$ {valor_anterior:,.2f}\n"
-            resultado += f"   • Diferença: R$ {diferenca:,.2f} ({percentual:+.1f}%)\n"
+            resultado += f"   • {data_base.strftime('%d/%m/%Y')}: {formatar_reais(valor_atual)}\n"
+            resultado += f"   • {data_anterior.strftime('%d/%m/%Y')}: {formatar_reais(valor_anterior)}\n"
+            resultado += f"   • Diferença: {formatar_reais(diferenca)} ({percentual:+.1f}%)\n"
         
         # SEMPRE FORÇA ANÁLISE DETALHADA DE FORNECEDORES PARA QUALQUER QUERY RELACIONADA
         if df_cabecalho is not None and (
@@ -324,10 +377,8 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
             valor_col = 'VALOR NOTA FISCAL' if 'VALOR NOTA FISCAL' in df_cabecalho.columns else None
             
             if valor_col and (nome_emitente_col or nome_destinatario_col):
-                df_temp = df_cabecalho.copy()
-                
-                # Converte valores para Decimal para precisão financeira
-                df_temp[valor_col] = df_temp[valor_col].apply(lambda x: Decimal(str(x)) if pd.notna(x) else Decimal('0'))
+                # Valores em centavos inteiros: somas exatas direto no groupby, sem cópia nem conversão
+                df_temp = df_cabecalho
                 
                 resultado += f"\n🏆 **ANÁLISE DOS DADOS REAIS - JANEIRO 2024:**\n\n"
                 
@@ -338,53 +389,43 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                     df_compradores = df_compradores[df_compradores[nome_destinatario_col] != '']
                     
                     if len(df_compradores) > 0:
-                        grupo_compradores = df_compradores.groupby([nome_destinatario_col, cnpj_destinatario_col]).agg({
-                            valor_col: ['sum', 'count']
+                        grupo_compradores = df_compradores.groupby([nome_destinatario_col, cnpj_destinatario_col], observed=True).agg({
+                            valor_col: ['sum', 'size']
                         })
                         
-                        # Converte para display
-                        grupo_compradores.loc[:, (valor_col, 'sum')] = grupo_compradores[valor_col, 'sum'].apply(lambda x: round(float(x), 2))
-                        
                         # Ordena por valor (maiores compradores)
                         grupo_compradores_valor = grupo_compradores.sort_values((valor_col, 'sum'), ascending=False)
                         
                         resultado += f"💰 **MAIORES COMPRADORES EM VALOR GASTO:**\n"
                         for i, ((nome, cnpj), dados) in enumerate(grupo_compradores_valor.head(5).iterrows(), 1):
                             valor_total = dados[(valor_col, 'sum')]
-                            qtd_notas = int(dados[(valor_col, 'count')])
-                            # Formata CNPJ corretamente
-                            cnpj_str = str(cnpj)
-                            cnpj_formatado = f"{cnpj_str[:2]}.{cnpj_str[2:5]}.{cnpj_str[5:8]}/{cnpj_str[8:12]}-{cnpj_str[12:14]}" if len(cnpj_str) == 14 else cnpj
-                            resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - R$ {valor_total:,.2f} ({qtd_notas} notas)\n"
+                            qtd_notas = int(dados[(valor_col, 'size')])
+                            cnpj_formatado = formatar_cnpj(cnpj)
+                            resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - {formatar_reais(valor_total)} ({qtd_notas} notas)\n"
                     else:
                         resultado += f"💰 **MAIORES COMPRADORES EM VALOR GASTO:**\n"
                         resultado += f"   ⚠️ Não foram encontrados dados de destinatários válidos\n"
                 
                 # ANÁLISE DOS VENDEDORES (EMITENTES)
                 if nome_emitente_col and cnpj_emitente_col:
-                    grupo_vendedores = df_temp.groupby([nome_emitente_col, cnpj_emitente_col]).agg({
-                        valor_col: ['sum', 'count']
+                    grupo_vendedores = df_temp.groupby([nome_emitente_col, cnpj_emitente_col], observed=True).agg({
+                        valor_col: ['sum', 'size']
                     })
                     
-                    # Converte para display
-                    grupo_vendedores.loc[:, (valor_col, 'sum')] = grupo_vendedores[valor_col, 'sum'].apply(lambda x: round(float(x), 2))
-                    
                     # Ordena por quantidade de notas (maiores vendedores)
-                    grupo_vendedores_qtd = grupo_vendedores.sort_values((valor_col, 'count'), ascending=False)
+                    grupo_vendedores_qtd = grupo_vendedores.sort_values((valor_col, 'size'), ascending=False)
                     
                     resultado += f"\n📊 **MAIORES VENDEDORES EM NÚMERO DE NOTAS FISCAIS:**\n"
                     for i, ((nome, cnpj), dados) in enumerate(grupo_vendedores_qtd.head(5).iterrows(), 1):
                         valor_total = dados[(valor_col, 'sum')]
-                        qtd_notas = int(dados[(valor_col, 'count')])
-                        # Formata CNPJ corretamente
-                        cnpj_str = str(cnpj)
-                        cnpj_formatado = f"{cnpj_str[:2]}.{cnpj_str[2:5]}.{cnpj_str[5:8]}/{cnpj_str[8:12]}-{cnpj_str[12:14]}" if len(cnpj_str) == 14 else cnpj
-                        resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - {qtd_notas} notas (R$ {valor_total:,.2f})\n"
+                        qtd_notas = int(dados[(valor_col, 'size')])
+                        cnpj_formatado = formatar_cnpj(cnpj)
+                        resultado += f"   {i}. **{nome}** ({cnpj_formatado}) - {qtd_notas} notas ({formatar_reais(valor_total)})\n"
                 
                 # RESUMO GERAL
                 valor_total_geral = df_cabecalho[valor_col].sum()
                 resultado += f"\n💵 **RESUMO GERAL:**\n"
-                resultado += f"   • Valor total das notas fiscais: R$ {valor_total_geral:,.2f}\n"
+                resultado += f"   • Valor total das notas fiscais: {formatar_reais(valor_total_geral)}\n"
                 resultado += f"   • Total de notas fiscais: {len(df_cabecalho)}\n"
                 # Conta empresas únicas (emitentes ou destinatários)
                 if nome_emitente_col:
@@ -395,11 +436,7 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                 # Período dos dados
                 if 'DATA EMISSÃO' in df_cabecalho.columns:
                     try:
-                        df_temp_data = df_cabecalho.copy()
-                        df_temp_data['DATA EMISSÃO'] = pd.to_datetime(df_temp_data['DATA EMISSÃO'])
-                        data_min = df_temp_data['DATA EMISSÃO'].min().strftime('%d/%m/%Y')
-                        data_max = df_temp_data['DATA EMISSÃO'].max().strftime('%d/%m/%Y')
-                        resultado += f"   • Período: {data_min} a {data_max}\n"
+                        resultado += f"   • Período: {periodo_emissao(df_cabecalho['DATA EMISSÃO'])}\n"
                     except:
                         pass
                 
@@ -420,14 +457,12 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                 resultado += f"   • Total de notas fiscais: {len(df_cabecalho):,}\n"
                 
                 if valor_col in df_cabecalho.columns:
-                    resultado += f"   • Valor total geral: R$ {df_cabecalho[valor_col].sum():,.2f}\n"
-                    resultado += f"   • Valor médio por NF: R$ {df_cabecalho[valor_col].mean():,.2f}\n"
+                    resultado += f"   • Valor total geral: {formatar_reais(df_cabecalho[valor_col].sum())}\n"
+                    resultado += f"   • Valor médio por NF: {formatar_reais(df_cabecalho[valor_col].mean())}\n"
                     
                 if data_col in df_cabecalho.columns:
                     try:
-                        data_min = pd.to_datetime(df_cabecalho[data_col]).min().strftime('%d/%m/%Y')
-                        data_max = pd.to_datetime(df_cabecalho[data_col]).max().strftime('%d/%m/%Y')
-                        resultado += f"   • Período: {data_min} a {data_max}\n"
+                        resultado += f"   • Período: {periodo_emissao(df_cabecalho[data_col])}\n"
                     except:
                         pass
             
@@ -439,7 +474,7 @@ def pandas_query_executor_tool(query_description: str, diretorio_dados: str = No
                 resultado += f"   • Total de itens: {len(df_itens):,}\n"
                 
                 if valor_item_col in df_itens.columns:
-                    resultado += f"   • Valor total dos itens: R$ {df_itens[valor_item_col].sum():,.2f}\n"
+                    resultado += f"   • Valor total dos itens: {formatar_reais(df_itens[valor_item_col].sum())}\n"
                     
                 if qtd_col in df_itens.columns:
                     resultado += f"   • Quantidade total: {df_itens[qtd_col].sum():,.0f}\n"
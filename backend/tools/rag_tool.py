@@ -1,7 +1,99 @@
 from crewai.tools import tool
 import pandas as pd
 import os
+import sys
 from typing import List, Dict, Any
+import pyarrow as pa
+import pyarrow.compute as pc
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.columnar_dataset import abrir_tabela, ler_manifesto
+from utils.dataset_registry import DatasetSessao, obter_registro
+from models.consulta import TABELA_CABECALHO, TABELA_ITENS
+from tools.pandas_query_tool import COLUNAS_CENTAVOS_CSV, carregar_csvs
+
+# Linhas inspecionadas por coluna de texto para extrair amostras do dataset colunar
+LINHAS_AMOSTRA = 10_000
+
+# Tabelas do dataset colunar e a descrição usada no contexto
+TABELAS_RAG = [("cabeçalhos", 'cabeçalho das notas fiscais'), ("itens", 'itens das notas fiscais')]
+
+
+def _info_da_tabela(nome: str, tipo_arquivo: str, tabela: pa.Table) -> Dict[str, Any]:
+    """Extrai metadados e amostras direto da tabela Arrow, sem convertê-la para pandas."""
+    arquivo_info = {
+        'nome': nome,
+        'tipo': tipo_arquivo,
+        'linhas': tabela.num_rows,
+        'colunas': tabela.column_names,
+        'tipos_dados': {campo.name: str(campo.type) for campo in tabela.schema},
+        'amostras': {}
+    }
+    
+    for campo, coluna in zip(tabela.schema, tabela.columns):
+        if coluna.null_count == len(coluna):
+            continue
+        if pa.types.is_string(campo.type):
+            valores_unicos = pc.unique(coluna.slice(0, LINHAS_AMOSTRA)).drop_null()[:5]
+            arquivo_info['amostras'][campo.name] = valores_unicos.to_pylist()
+        elif pa.types.is_floating(campo.type) or pa.types.is_integer(campo.type):
+            extremos = pc.min_max(coluna)
+            # Valores monetários estão em centavos; as amostras mostram reais
+            escala = 100 if campo.name in COLUNAS_CENTAVOS_CSV else 1
+            arquivo_info['amostras'][campo.name] = {
+                'min': extremos['min'].as_py() / escala,
+                'max': extremos['max'].as_py() / escala,
+                'media': pc.mean(coluna).as_py() / escala
+            }
+        elif pa.types.is_timestamp(campo.type):
+            extremos = pc.min_max(coluna)
+            arquivo_info['amostras'][campo.name] = {
+                'min': str(extremos['min'].as_py()),
+                'max': str(extremos['max'].as_py())
+            }
+    
+    return arquivo_info
+
+def _info_do_frame(nome: str, tipo_arquivo: str, df: pd.DataFrame) -> Dict[str, Any]:
+    """Metadados e amostras de um frame lido dos CSVs (sem dataset colunar)."""
+    arquivo_info = {
+        'nome': nome,
+        'tipo': tipo_arquivo,
+        'linhas': len(df),
+        'colunas': list(df.columns),
+        'tipos_dados': df.dtypes.to_dict(),
+        'amostras': {}
+    }
+    
+    for coluna in df.columns:
+        if df[coluna].dtype == 'object' or isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            valores_unicos = df[coluna].dropna().unique()[:5]
+            arquivo_info['amostras'][coluna] = valores_unicos.tolist()
+        elif pd.api.types.is_numeric_dtype(df[coluna]):
+            escala = 100 if coluna in COLUNAS_CENTAVOS_CSV else 1
+            arquivo_info['amostras'][coluna] = {
+                'min': float(df[coluna].min()) / escala if not df[coluna].isna().all() else None,
+                'max': float(df[coluna].max()) / escala if not df[coluna].isna().all() else None,
+                'media': float(df[coluna].mean()) / escala if not df[coluna].isna().all() else None
+            }
+    
+    return arquivo_info
+
+
+def _contexto_rag(dataset: DatasetSessao) -> List[Dict[str, Any]]:
+    """Metadados e amostras das tabelas, calculados uma vez por dataset da sessão."""
+    contexto = []
+    if dataset.origem == "dataset":
+        for tipo, tipo_arquivo in TABELAS_RAG:
+            tabela = abrir_tabela(dataset.diretorio, tipo)
+            if tabela is not None:
+                nome = ler_manifesto(dataset.diretorio, tipo)['origem']['arquivo']
+                contexto.append(_info_da_tabela(nome, tipo_arquivo, tabela))
+    else:
+        frames = [(TABELA_CABECALHO, dataset.cabecalho), (TABELA_ITENS, dataset.itens)]
+        for (nome, frame), (_, tipo_arquivo) in zip(frames, TABELAS_RAG):
+            if frame is not None:
+                contexto.append(_info_do_frame(nome, tipo_arquivo, frame))
+    return contexto
 
 @tool("rag_semantic_search")
 def rag_semantic_search_tool(pergunta: str, diretorio_dados: str = None) -> str:
@@ -27,65 +119,19 @@ def rag_semantic_search_tool(pergunta: str, diretorio_dados: str = None) -> str:
         if not os.path.exists(diretorio_dados):
             return f"❌ Erro: Diretório {diretorio_dados} não encontrado"
         
-        # Lista arquivos disponíveis
-        csv_files = [f for f in os.listdir(diretorio_dados) if f.endswith('.csv')]
-        
-        if not csv_files:
+        # Dataset da sessão compartilhado com o pandas_query_tool; o contexto
+        # (metadados e amostras) é calculado só na primeira consulta
+        dataset = obter_registro().obter(diretorio_dados, carregar_csvs)
+        if dataset is None:
             return f"❌ Erro: Nenhum arquivo CSV encontrado para consulta RAG"
+        contexto_completo = dataset.derivado("rag", _contexto_rag)
         
         resultado = f"🔍 Consulta RAG: {pergunta}\n\n"
         
-        # Carrega e analisa conteúdo dos arquivos para contexto semântico
-        contexto_completo = []
-        
         # Estatísticas gerais dos dados
-        total_arquivos = len(csv_files)
-        resultado += f"📁 Arquivos encontrados: {total_arquivos}\n"
-        
-        for arquivo in csv_files:
-            caminho_arquivo = os.path.join(diretorio_dados, arquivo)
-            try:
-                df = pd.read_csv(caminho_arquivo)
-                
-                # Identifica tipo do arquivo
-                tipo_arquivo = 'desconhecido'
-                if 'cabecalho' in arquivo.lower() or 'header' in arquivo.lower():
-                    tipo_arquivo = 'cabeçalho das notas fiscais'
-                elif 'itens' in arquivo.lower() or 'item' in arquivo.lower():
-                    tipo_arquivo = 'itens das notas fiscais'
-                elif 'PRODUTO' in ' '.join(df.columns).upper():
-                    tipo_arquivo = 'itens das notas fiscais'
-                else:
-                    tipo_arquivo = 'cabeçalho das notas fiscais'
-                
-                # Extrai metadados do arquivo
-                arquivo_info = {
-                    'nome': arquivo,
-                    'tipo': tipo_arquivo,
-                    'linhas': len(df),
-                    'colunas': list(df.columns),
-                    'tipos_dados': df.dtypes.to_dict(),
-                    'amostras': {}
-                }
-                
-                resultado += f"📄 {arquivo} ({tipo_arquivo}): {len(df)} registros\n"
-                
-                # Extrai amostras de dados para contexto
-                for coluna in df.columns:
-                    if df[coluna].dtype == 'object':
-                        valores_unicos = df[coluna].dropna().unique()[:5]
-                        arquivo_info['amostras'][coluna] = valores_unicos.tolist()
-                    elif pd.api.types.is_numeric_dtype(df[coluna]):
-                        arquivo_info['amostras'][coluna] = {
-                            'min': float(df[coluna].min()) if not df[coluna].isna().all() else None,
-                            'max': float(df[coluna].max()) if not df[coluna].isna().all() else None,
-                            'media': float(df[coluna].mean()) if not df[coluna].isna().all() else None
-                        }
-                
-                contexto_completo.append(arquivo_info)
-                
-            except Exception as e:
-                resultado += f"⚠️ Erro ao processar {arquivo}: {str(e)}\n"
+        resultado += f"📁 Arquivos encontrados: {len(contexto_completo)}\n"
+        for arquivo_info in contexto_completo:
+            resultado += f"📄 {arquivo_info['nome']} ({arquivo_info['tipo']}): {arquivo_info['linhas']} registros\n"
         
         # Análise semântica da pergunta
         pergunta_lower = pergunta.lower()
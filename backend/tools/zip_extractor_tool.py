@@ -1,21 +1,25 @@
 from crewai.tools import tool
 import os
-import shutil
 import sys
 
 # Adiciona o diretório tools ao path para importar functions
 sys.path.insert(0, os.path.dirname(__file__))
-from functions import descompactar_arquivo
+from functions import descompactar_arquivo, ler_catalogo, classificar_csv, ARQUIVO_CATALOGO
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from utils.columnar_dataset import DIRETORIO_DATASET
 
 @tool("zip_extractor")
-def zip_extractor_tool(caminho_arquivo_zip: str) -> str:
+def zip_extractor_tool(caminho_arquivo_zip: str, diretorio_destino: str = "") -> str:
     """
-    Extrai arquivos ZIP, 7Z, RAR, ARJ para o diretório dados/notasfiscais.
+    Extrai arquivos ZIP, 7Z, RAR, TAR/GZ para o diretório de dados da sessão.
     Esta ferramenta usa a função descompactar_arquivo do functions.py
     e é especializada em descompactar arquivos contendo dados fiscais.
+    O conteúdo não é gravado em disco: os CSVs são catalogados e lidos
+    direto do arquivo compactado na validação.
     
     Args:
         caminho_arquivo_zip: Caminho completo para o arquivo compactado
+        diretorio_destino: Diretório de dados da sessão (padrão: dados/notasfiscais ao lado do arquivo)
     
     Returns:
         Mensagem de sucesso ou erro com detalhes da extração
@@ -25,21 +29,20 @@ def zip_extractor_tool(caminho_arquivo_zip: str) -> str:
         if not os.path.exists(caminho_arquivo_zip):
             return f"❌ Erro: Arquivo não encontrado em {caminho_arquivo_zip}"
         
-        # Define o diretório de destino baseado no arquivo ZIP
-        # Se o arquivo está em uploads/, extrai para uploads/dados/notasfiscais
-        destino = os.path.join(os.path.dirname(caminho_arquivo_zip), 'dados', 'notasfiscais')
+        # Cada sessão tem o seu diretório de dados; sem ele, usa dados/notasfiscais
+        # ao lado do arquivo (uploads/ -> uploads/dados/notasfiscais)
+        destino = diretorio_destino or os.path.join(os.path.dirname(caminho_arquivo_zip), 'dados', 'notasfiscais')
         
         # Cria o diretório de destino se não existir
         os.makedirs(destino, exist_ok=True)
         
-        # Limpa o diretório de destino
+        # Limpa CSVs e catálogo anteriores; o dataset colunar é mantido e só é
+        # reaproveitado pela validação se corresponder aos novos CSVs
         for arquivo in os.listdir(destino):
             caminho_arquivo = os.path.join(destino, arquivo)
             try:
                 if os.path.isfile(caminho_arquivo):
                     os.unlink(caminho_arquivo)
-                elif os.path.isdir(caminho_arquivo):
-                    shutil.rmtree(caminho_arquivo)
             except Exception as e:
                 print(f"⚠️ Aviso: Não foi possível limpar {caminho_arquivo}: {e}")
         
@@ -47,8 +50,12 @@ def zip_extractor_tool(caminho_arquivo_zip: str) -> str:
         print(f"🔄 Iniciando extração de {caminho_arquivo_zip} para {destino}")
         descompactar_arquivo(caminho_arquivo_zip, destino)
         
-        # Verifica os arquivos extraídos
-        arquivos_extraidos = os.listdir(destino)
+        # Verifica os arquivos catalogados (ou extraídos por versões anteriores)
+        catalogo = ler_catalogo(destino)
+        if catalogo is not None:
+            arquivos_extraidos = [os.path.basename(membro) for membro in catalogo['csvs']]
+        else:
+            arquivos_extraidos = [f for f in os.listdir(destino) if f not in (ARQUIVO_CATALOGO, DIRETORIO_DATASET)]
         csv_files = [f for f in arquivos_extraidos if f.lower().endswith('.csv')]
         
         if not csv_files:
@@ -59,15 +66,17 @@ def zip_extractor_tool(caminho_arquivo_zip: str) -> str:
         itens_file = None
         
         for arquivo in csv_files:
-            nome_lower = arquivo.lower()
-            if 'cabecalho' in nome_lower or 'header' in nome_lower:
+            tipo = classificar_csv(arquivo)
+            if tipo == "cabeçalhos":
                 cabecalho_file = arquivo
-            elif 'itens' in nome_lower or 'items' in nome_lower:
+            elif tipo == "itens":
                 itens_file = arquivo
         
         # Monta o relatório de resultado
         resultado = f"✅ Extração concluída com sucesso usando functions.py!\n"
         resultado += f"📂 Destino: {destino}\n"
+        if catalogo is not None:
+            resultado += f"📦 CSVs lidos direto do arquivo {catalogo['formato'].upper()}, sem extração em disco ({catalogo['tamanho_descompactado'] / 1024 / 1024:.1f} MB descompactados)\n"
         resultado += f"📄 Arquivos extraídos: {len(arquivos_extraidos)}\n"
         resultado += f"📊 CSVs encontrados: {len(csv_files)}\n"
         
@@ -0,0 +1,219 @@
+"""
+Cubo de agregados pré-calculados do dataset validado.
+
+Quase toda pergunta é valor total e número de notas por emitente,
+destinatário, UF/município, dia ou NCM. Logo após a validação, cada rollup
+abaixo é agregado uma vez, por dia de emissão, e gravado ao lado do dataset:
+
+    <diretorio_dados>/dataset/_cubo/<rollup>.arrow
+    <diretorio_dados>/dataset/_cubo/_manifesto.json
+
+Cada linha de um rollup guarda, para as colunas de métricas da tabela, soma,
+contagem, mínimo e máximo, além do número de linhas de origem (e de notas
+distintas, nos itens). Essas medidas se reagregam sem voltar aos dados
+brutos: o planejador (`utils/query_planner.py`) responde pelo menor rollup
+que cobre as dimensões, os filtros e as medidas da consulta e, quando nenhum
+cobre, agrupa os frames completos.
+
+O manifesto guarda as origens das tabelas; o cubo só é usado enquanto elas
+forem as mesmas do dataset.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+
+from models.consulta import COLUNA_DATA, DIMENSOES, METRICAS, TABELA_CABECALHO, TABELA_ITENS
+from utils.columnar_dataset import (ARQUIVO_MANIFESTO, DIRETORIO_DATASET, TABELAS, VERSAO_FORMATO,
+                                    gravar_parte, ler_dataframe, ler_manifesto)
+
+DIRETORIO_CUBO = "_cubo"
+
+# Rollups materializados: tabela e dimensões (sempre agrupados também pelo dia de emissão)
+ROLLUPS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "emitente": (TABELA_CABECALHO, ("emitente",)),
+    "destinatario": (TABELA_CABECALHO, ("destinatario",)),
+    "municipio_emitente": (TABELA_CABECALHO, ("uf_emitente", "municipio_emitente")),
+    "uf_destinatario": (TABELA_CABECALHO, ("uf_destinatario",)),
+    "ncm": (TABELA_ITENS, ("ncm",)),
+}
+
+# Tipo do dataset colunar de cada tabela ("cabecalho" -> "cabeçalhos")
+TIPOS = {tabela: tipo for tipo, tabela in TABELAS.items()}
+
+# Agregações guardadas por coluna de métrica; a média sai de soma / contagem
+FUNCOES_CUBO = ("sum", "count", "min", "max")
+COLUNA_NOTAS = "NÚMERO"
+
+
+def nome_medida(coluna: Optional[str], funcao: str) -> str:
+    """Nome da coluna de uma agregação (coluna None conta linhas): "VALOR TOTAL|sum", "*|size" """
+    return f"{coluna or '*'}|{funcao}"
+
+
+def colunas_dimensoes(dimensoes: Iterable[str]) -> List[str]:
+    return [coluna for dimensao in dimensoes for coluna in DIMENSOES[dimensao][0]]
+
+
+def colunas_metricas(tabela: str) -> List[str]:
+    """Colunas somáveis da tabela (a coluna de notas só entra na contagem de distintos)"""
+    colunas = {coluna for coluna, _ in METRICAS[tabela].values() if coluna and coluna != COLUNA_NOTAS}
+    return sorted(colunas)
+
+
+def diretorio_cubo(diretorio_dados: Union[str, Path]) -> Path:
+    return Path(diretorio_dados) / DIRETORIO_DATASET / DIRETORIO_CUBO
+
+
+def agregar_rollup(frame: pd.DataFrame, dimensoes: Sequence[str], metricas: Sequence[str],
+                   notas: bool) -> pd.DataFrame:
+    """Agrupa o frame pelas colunas das dimensões e pelo dia de emissão"""
+    dia = pd.to_datetime(frame[COLUNA_DATA], errors='coerce').dt.normalize()
+    chaves = [frame[coluna] for coluna in dimensoes] + [dia]
+    nomeadas = {nome_medida(None, "size"): (dimensoes[0], "size")}
+    for coluna in metricas:
+        for funcao in FUNCOES_CUBO:
+            nomeadas[nome_medida(coluna, funcao)] = (coluna, funcao)
+    if notas:
+        nomeadas[nome_medida(COLUNA_NOTAS, "nunique")] = (COLUNA_NOTAS, "nunique")
+    return frame.groupby(chaves, dropna=False, observed=True, sort=False).agg(**nomeadas).reset_index()
+
+
+def gerar_cubo(diretorio_dados: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    Materializa os rollups a partir do dataset validado e grava o manifesto.
+
+    Rollups cujas colunas não existem no dataset são ignorados. Retorna o
+    manifesto ou None se não há tabelas validadas.
+    """
+    destino = diretorio_cubo(diretorio_dados)
+    parcial = destino.with_name(f"{DIRETORIO_CUBO}.parcial")
+    shutil.rmtree(parcial, ignore_errors=True)
+    parcial.mkdir(parents=True)
+
+    try:
+        origens, rollups, frames = {}, {}, {}
+        for nome, (tabela, dimensoes) in ROLLUPS.items():
+            tipo = TIPOS[tabela]
+            manifesto = ler_manifesto(diretorio_dados, tipo)
+            if manifesto is None:
+                continue
+            if tipo not in frames:
+                # Uma leitura por tabela com as colunas de todos os rollups dela
+                colunas = [COLUNA_DATA, COLUNA_NOTAS] + colunas_metricas(tabela)
+                colunas += [coluna for outra, dimensoes_outra in ROLLUPS.values() if outra == tabela
+                            for coluna in colunas_dimensoes(dimensoes_outra)]
+                frames[tipo] = ler_dataframe(diretorio_dados, tipo, list(dict.fromkeys(colunas)))
+            frame = frames[tipo]
+
+            colunas_dim = colunas_dimensoes(dimensoes)
+            if frame is None or any(coluna not in frame.columns for coluna in colunas_dim + [COLUNA_DATA]):
+                continue
+            metricas = [coluna for coluna in colunas_metricas(tabela) if coluna in frame.columns]
+            notas = tabela == TABELA_ITENS and COLUNA_NOTAS in frame.columns
+            cubo = agregar_rollup(frame, colunas_dim, metricas, notas)
+            gravar_parte(pa.Table.from_pandas(cubo, preserve_index=False), parcial / f"{nome}.arrow")
+            rollups[nome] = {"tabela": tabela, "dimensoes": list(dimensoes), "linhas": len(cubo),
+                             "linhas_origem": len(frame)}
+            origens[tipo] = manifesto["origem"]
+
+        if not rollups:
+            return None
+        manifesto = {"versao": VERSAO_FORMATO, "origens": origens, "rollups": rollups}
+        with open(parcial / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=2, default=str)
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(parcial, destino)
+        return manifesto
+    finally:
+        shutil.rmtree(parcial, ignore_errors=True)
+
+
+def ler_manifesto_cubo(diretorio_dados: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Manifesto do cubo, se ainda corresponde às origens do dataset; senão None"""
+    try:
+        with open(diretorio_cubo(diretorio_dados) / ARQUIVO_MANIFESTO, 'r', encoding='utf-8') as arquivo:
+            manifesto = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+    if manifesto.get("versao") != VERSAO_FORMATO:
+        return None
+    for tipo, origem in manifesto["origens"].items():
+        atual = ler_manifesto(diretorio_dados, tipo)
+        if atual is None or atual.get("origem") != origem:
+            return None
+    return manifesto
+
+
+class Rollup:
+    """Um rollup carregado: tabela, colunas das dimensões (além do dia) e o frame agregado"""
+
+    def __init__(self, nome: str, tabela: str, colunas: List[str], frame: pd.DataFrame):
+        self.nome = nome
+        self.tabela = tabela
+        self.colunas = colunas
+        self.frame = frame
+
+    def cobre(self, agregacao: Tuple[Optional[str], str], colunas_consulta: Sequence[str]) -> bool:
+        coluna, funcao = agregacao
+        if coluna is None:
+            return True
+        if funcao == "nunique":
+            # Uma nota tem um só dia: notas distintas somam entre dias, mas não entre outras dimensões
+            return nome_medida(coluna, funcao) in self.frame.columns and set(colunas_consulta) == set(self.colunas)
+        necessarias = ("sum", "count") if funcao == "mean" else (funcao,)
+        return all(nome_medida(coluna, f) in self.frame.columns for f in necessarias)
+
+
+class CuboAgregados:
+    """Rollups de um dataset, com a escolha do menor que responde a uma consulta"""
+
+    def __init__(self, rollups: List[Rollup]):
+        self.rollups = rollups
+
+    def escolher(self, tabela: str, colunas: Sequence[str], colunas_filtro: Iterable[str],
+                 agregacoes: Iterable[Tuple[Optional[str], str]]) -> Optional[Rollup]:
+        """
+        Menor rollup da tabela que contém as colunas de agrupamento e de filtro
+        (o dia cobre filtros de data e períodos) e todas as medidas; None se nenhum.
+        """
+        agregacoes = list(agregacoes)
+        candidatos = []
+        for rollup in self.rollups:
+            disponiveis = set(rollup.colunas)
+            if rollup.tabela != tabela or not set(colunas) <= disponiveis:
+                continue
+            if not set(colunas_filtro) <= disponiveis | {COLUNA_DATA}:
+                continue
+            if all(rollup.cobre(agregacao, colunas) for agregacao in agregacoes):
+                candidatos.append(rollup)
+        return min(candidatos, key=lambda rollup: len(rollup.frame), default=None)
+
+
+def carregar_cubo(diretorio_dados: Union[str, Path]) -> Optional[CuboAgregados]:
+    """Rollups gravados para o dataset atual; None se não há cubo ou ele ficou desatualizado"""
+    manifesto = ler_manifesto_cubo(diretorio_dados)
+    if manifesto is None:
+        return None
+    rollups = []
+    for nome, info in manifesto["rollups"].items():
+        caminho = diretorio_cubo(diretorio_dados) / f"{nome}.arrow"
+        try:
+            tabela = pa.ipc.open_file(pa.memory_map(str(caminho), 'r')).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+        frame = tabela.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+        rollups.append(Rollup(nome, info["tabela"], colunas_dimensoes(info["dimensoes"]), frame))
+    return CuboAgregados(rollups)
+
+
+def assinatura_cubo(diretorio_dados: Union[str, Path]) -> Optional[int]:
+    """Data de modificação do manifesto do cubo (muda a cada geração)"""
+    try:
+        return os.stat(diretorio_cubo(diretorio_dados) / ARQUIVO_MANIFESTO).st_mtime_ns
+    except OSError:
+        return None
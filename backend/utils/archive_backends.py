@@ -0,0 +1,445 @@
+"""
+Backends de leitura de arquivos compactados (ZIP, 7Z, RAR e TAR/GZ) no próprio processo.
+
+Cada formato implementa a mesma interface: listar os membros, abrir um membro
+em streaming (sem gravar em disco) e extrair para um diretório. Os backends não
+alteram o diretório de trabalho nem chamam binários externos via subprocess
+(exceto o rarfile para RARs comprimidos, ver RarBackend).
+Cada backend acumula os bytes lidos e o tempo gasto para comparar a vazão
+entre formatos.
+"""
+import gzip
+import io
+import os
+import queue
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from utils.exceptions import ExtractionError, SecurityError
+
+try:
+    import py7zr
+    from py7zr.io import Py7zIO, WriterFactory
+    PY7ZR_AVAILABLE = True
+except ImportError:
+    PY7ZR_AVAILABLE = False
+    Py7zIO = WriterFactory = object
+
+try:
+    import rarfile
+    RARFILE_AVAILABLE = True
+except ImportError:
+    RARFILE_AVAILABLE = False
+
+# Tamanho do bloco de cópia na extração
+TAMANHO_BLOCO = 1024 * 1024
+
+
+class MembroArquivo(BaseModel):
+    """Arquivo contido em um arquivo compactado."""
+    nome: str = Field(..., description="Caminho do membro dentro do arquivo compactado")
+    tamanho: int = Field(..., description="Tamanho descompactado em bytes")
+    crc: Optional[int] = Field(None, description="CRC32 do conteúdo, quando o formato informa")
+
+
+class EstatisticasExtracao(BaseModel):
+    """Bytes descompactados e tempo gasto por um backend."""
+    formato: str
+    arquivos: int = 0
+    membros: int = 0
+    bytes: int = 0
+    segundos: float = 0.0
+
+    @property
+    def bytes_por_segundo(self) -> float:
+        return self.bytes / self.segundos if self.segundos > 0 else 0.0
+
+    def resumo(self) -> str:
+        mb = 1024 * 1024
+        return (f"{self.formato.upper()}: {self.bytes / mb:.1f} MB em {self.segundos:.2f} s "
+                f"({self.bytes_por_segundo / mb:.1f} MB/s)")
+
+
+class _LeitorMedido(io.RawIOBase):
+    """Envolve o stream de um membro e contabiliza bytes e tempo de leitura no backend."""
+
+    def __init__(self, stream, backend: "ArchiveBackend"):
+        self._stream = stream
+        self._backend = backend
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        inicio = time.perf_counter()
+        dados = self._stream.read(len(buffer))
+        quantidade = len(dados)
+        buffer[:quantidade] = dados
+        self._backend.registrar_leitura(quantidade, time.perf_counter() - inicio)
+        return quantidade
+
+
+class ArchiveBackend(ABC):
+    """Interface comum dos formatos de arquivo compactado."""
+
+    formato: str = ""
+    extensoes: tuple = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estatisticas = EstatisticasExtracao(formato=self.formato)
+
+    def aceita(self, caminho: Union[str, Path]) -> bool:
+        nome = str(caminho).lower()
+        return any(nome.endswith(extensao) for extensao in self.extensoes)
+
+    @abstractmethod
+    def listar(self, caminho: Union[str, Path]) -> List[MembroArquivo]:
+        """Lista os arquivos (não diretórios) contidos no arquivo compactado."""
+
+    @abstractmethod
+    def _abrir(self, caminho: Union[str, Path], membro: str):
+        """Context manager que devolve um stream binário do membro."""
+
+    @contextmanager
+    def abrir(self, caminho: Union[str, Path], membro: str) -> Iterator[io.BufferedReader]:
+        """Abre um membro em streaming, sem gravá-lo em disco."""
+        with self._abrir(caminho, membro) as stream:
+            with io.BufferedReader(_LeitorMedido(stream, self), TAMANHO_BLOCO) as leitor:
+                yield leitor
+
+    def obter_membro(self, caminho: Union[str, Path], membro: str) -> MembroArquivo:
+        for info in self.listar(caminho):
+            if info.nome == membro:
+                return info
+        raise ExtractionError(f"Membro {membro} não encontrado em {caminho}", file_path=str(caminho))
+
+    def extrair(self, caminho: Union[str, Path], destino: Union[str, Path],
+                membros: Optional[List[str]] = None) -> EstatisticasExtracao:
+        """
+        Extrai os membros (todos, por padrão) para `destino` copiando em streaming.
+
+        Returns:
+            Bytes e tempo desta extração
+        """
+        destino = Path(destino).resolve()
+        selecionados = membros if membros is not None else [info.nome for info in self.listar(caminho)]
+        estatisticas = EstatisticasExtracao(formato=self.formato, arquivos=1)
+        inicio = time.perf_counter()
+
+        for membro in selecionados:
+            caminho_saida = (destino / membro).resolve()
+            if destino not in caminho_saida.parents:
+                raise SecurityError(f"Membro fora do diretório de destino: {membro}", file_path=str(caminho))
+            caminho_saida.parent.mkdir(parents=True, exist_ok=True)
+            with self._abrir(caminho, membro) as stream, open(caminho_saida, 'wb') as saida:
+                for bloco in iter(lambda: stream.read(TAMANHO_BLOCO), b""):
+                    saida.write(bloco)
+                    estatisticas.bytes += len(bloco)
+            estatisticas.membros += 1
+
+        estatisticas.segundos = time.perf_counter() - inicio
+        with self._lock:
+            self._estatisticas.arquivos += 1
+            self._estatisticas.membros += estatisticas.membros
+            self._estatisticas.bytes += estatisticas.bytes
+            self._estatisticas.segundos += estatisticas.segundos
+        return estatisticas
+
+    def registrar_leitura(self, quantidade: int, segundos: float) -> None:
+        with self._lock:
+            self._estatisticas.bytes += quantidade
+            self._estatisticas.segundos += segundos
+
+    def estatisticas(self) -> EstatisticasExtracao:
+        with self._lock:
+            return self._estatisticas.copy()
+
+
+class ZipBackend(ArchiveBackend):
+    formato = "zip"
+    extensoes = (".zip",)
+
+    def listar(self, caminho):
+        with zipfile.ZipFile(caminho, 'r') as arquivo:
+            return [
+                MembroArquivo(nome=info.filename, tamanho=info.file_size, crc=info.CRC)
+                for info in arquivo.infolist()
+                if not info.is_dir()
+            ]
+
+    @contextmanager
+    def _abrir(self, caminho, membro):
+        with zipfile.ZipFile(caminho, 'r') as arquivo, arquivo.open(membro) as stream:
+            yield stream
+
+
+class TarBackend(ArchiveBackend):
+    """TAR (com ou sem compressão) e arquivos .gz simples, que contêm um único membro."""
+    formato = "tar"
+    extensoes = (".tar", ".tar.gz", ".tgz", ".gz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+    @staticmethod
+    def _gzip_simples(caminho) -> bool:
+        return str(caminho).lower().endswith(".gz") and not tarfile.is_tarfile(caminho)
+
+    def listar(self, caminho):
+        if self._gzip_simples(caminho):
+            # O tamanho descompactado (módulo 2^32) fica nos últimos 4 bytes do gzip
+            with open(caminho, 'rb') as arquivo:
+                arquivo.seek(-4, os.SEEK_END)
+                tamanho = struct.unpack('<I', arquivo.read(4))[0]
+            return [MembroArquivo(nome=Path(caminho).name[:-3], tamanho=tamanho)]
+        try:
+            with tarfile.open(caminho, 'r:*') as arquivo:
+                return [
+                    MembroArquivo(nome=info.name, tamanho=info.size)
+                    for info in arquivo.getmembers()
+                    if info.isfile()
+                ]
+        except tarfile.ReadError as e:
+            raise ExtractionError(f"Arquivo TAR inválido: {e}", file_path=str(caminho))
+
+    @contextmanager
+    def _abrir(self, caminho, membro):
+        if self._gzip_simples(caminho):
+            with gzip.open(caminho, 'rb') as stream:
+                yield stream
+            return
+        with tarfile.open(caminho, 'r:*') as arquivo:
+            stream = arquivo.extractfile(membro)
+            if stream is None:
+                raise ExtractionError(f"Membro {membro} não é um arquivo regular", file_path=str(caminho))
+            with stream:
+                yield stream
+
+
+class _Fila7z(Py7zIO):
+    """Destino da descompressão do py7zr que repassa os blocos para uma fila limitada."""
+
+    def __init__(self, limite_blocos: int = 16):
+        self.fila = queue.Queue(maxsize=limite_blocos)
+        self.cancelado = threading.Event()
+        self._tamanho = 0
+
+    def _colocar(self, item) -> None:
+        while not self.cancelado.is_set():
+            try:
+                self.fila.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, s) -> int:
+        self._colocar(bytes(s))
+        self._tamanho += len(s)
+        return len(s)
+
+    def read(self, size=None) -> bytes:
+        return b""
+
+    def seek(self, offset, whence=0) -> int:
+        return self._tamanho
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return self._tamanho
+
+    def finalizar(self, erro: Optional[BaseException] = None) -> None:
+        self._colocar(erro)
+        self._colocar(None)
+
+
+class _FabricaFila7z(WriterFactory):
+    def __init__(self, destino: _Fila7z):
+        self.destino = destino
+
+    def create(self, filename):
+        return self.destino
+
+
+class _LeitorFila7z(io.RawIOBase):
+    """Lado de leitura da fila: devolve os blocos na ordem em que foram descompactados."""
+
+    def __init__(self, origem: _Fila7z):
+        self._origem = origem
+        self._pendente = b""
+        self._fim = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pendente and not self._fim:
+            item = self._origem.fila.get()
+            if isinstance(item, BaseException):
+                raise ExtractionError(f"Erro ao descompactar 7z: {item}")
+            if item is None:
+                self._fim = True
+            else:
+                self._pendente = item
+        quantidade = min(len(buffer), len(self._pendente))
+        buffer[:quantidade] = self._pendente[:quantidade]
+        self._pendente = self._pendente[quantidade:]
+        return quantidade
+
+
+class SevenZipBackend(ArchiveBackend):
+    """
+    7z via py7zr. A descompressão roda em uma thread que entrega os blocos a
+    uma fila limitada, de modo que o membro é lido em streaming sem ficar
+    inteiro em memória nem ser gravado em disco.
+    """
+    formato = "7z"
+    extensoes = (".7z",)
+
+    def _verificar(self):
+        if not PY7ZR_AVAILABLE:
+            raise ExtractionError("Suporte a 7z requer o pacote py7zr")
+
+    def listar(self, caminho):
+        self._verificar()
+        with py7zr.SevenZipFile(caminho, 'r') as arquivo:
+            return [
+                MembroArquivo(nome=info.filename, tamanho=info.uncompressed, crc=info.crc32)
+                for info in arquivo.list()
+                if not info.is_directory
+            ]
+
+    @contextmanager
+    def _abrir(self, caminho, membro):
+        self._verificar()
+        if membro not in {info.nome for info in self.listar(caminho)}:
+            raise ExtractionError(f"Membro {membro} não encontrado em {caminho}", file_path=str(caminho))
+
+        destino = _Fila7z()
+
+        def descompactar():
+            try:
+                with py7zr.SevenZipFile(caminho, 'r') as arquivo:
+                    arquivo.extract(targets=[membro], factory=_FabricaFila7z(destino))
+            except BaseException as e:
+                destino.finalizar(e)
+            else:
+                destino.finalizar()
+
+        produtor = threading.Thread(target=descompactar, name=f"7z-{Path(caminho).name}", daemon=True)
+        produtor.start()
+        try:
+            yield _LeitorFila7z(destino)
+        finally:
+            destino.cancelado.set()
+            produtor.join()
+
+
+class RarBackend(ArchiveBackend):
+    """
+    RAR via rarfile. Membros armazenados sem compressão são lidos direto do
+    arquivo; os comprimidos dependem do descompactador (unrar/unar/bsdtar)
+    que o rarfile encontrar instalado, pois não há decodificador RAR em Python.
+    """
+    formato = "rar"
+    extensoes = (".rar",)
+
+    def _verificar(self):
+        if not RARFILE_AVAILABLE:
+            raise ExtractionError("Suporte a RAR requer o pacote rarfile")
+
+    def listar(self, caminho):
+        self._verificar()
+        with rarfile.RarFile(caminho, 'r') as arquivo:
+            return [
+                MembroArquivo(nome=info.filename, tamanho=info.file_size, crc=info.CRC)
+                for info in arquivo.infolist()
+                if not info.is_dir()
+            ]
+
+    @contextmanager
+    def _abrir(self, caminho, membro):
+        self._verificar()
+        with rarfile.RarFile(caminho, 'r') as arquivo, arquivo.open(membro) as stream:
+            yield stream
+
+
+# Backends registrados, na ordem de verificação da extensão
+_BACKENDS: List[ArchiveBackend] = [ZipBackend(), TarBackend(), SevenZipBackend(), RarBackend()]
+
+
+def registrar_backend(backend: ArchiveBackend) -> None:
+    """Adiciona (ou substitui, pelo formato) um backend de arquivo compactado."""
+    _BACKENDS[:] = [atual for atual in _BACKENDS if atual.formato != backend.formato]
+    _BACKENDS.insert(0, backend)
+
+
+def obter_backend(caminho: Union[str, Path]) -> ArchiveBackend:
+    """
+    Retorna o backend adequado à extensão do arquivo.
+
+    Raises:
+        ExtractionError: Se o formato não é suportado
+    """
+    for backend in _BACKENDS:
+        if backend.aceita(caminho):
+            return backend
+    raise ExtractionError(f"Formato de arquivo não suportado: {Path(caminho).name}", file_path=str(caminho))
+
+
+def formato_suportado(caminho: Union[str, Path]) -> bool:
+    return any(backend.aceita(caminho) for backend in _BACKENDS)
+
+
+def extrair_arquivos(caminhos: List[Union[str, Path]], destino: Union[str, Path],
+                     max_workers: Optional[int] = None) -> List[EstatisticasExtracao]:
+    """
+    Extrai vários arquivos compactados em paralelo em um pool de threads.
+
+    Cada arquivo vai para `destino/<nome do arquivo>` (nome completo, para que
+    `notas.zip` e `notas.tar.gz` não se sobrescrevam). A descompressão (zlib, lzma, bz2) libera o GIL, então as threads
+    aproveitam mais de um núcleo.
+
+    Returns:
+        Estatísticas de cada arquivo, na ordem recebida
+    """
+    def extrair(caminho):
+        pasta = Path(destino) / Path(caminho).name
+        return obter_backend(caminho).extrair(caminho, pasta)
+
+    max_workers = max_workers or min(len(caminhos), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(extrair, caminhos))
+
+
+def estatisticas_backends() -> Dict[str, EstatisticasExtracao]:
+    """Vazão acumulada de cada backend (bytes descompactados e segundos)."""
+    return {backend.formato: backend.estatisticas() for backend in _BACKENDS}
+
+
+def estatisticas_desde(antes: Dict[str, EstatisticasExtracao]) -> Dict[str, EstatisticasExtracao]:
+    """
+    Bytes e tempo de cada backend desde o retrato `antes` (de estatisticas_backends),
+    só dos que leram algo; com execuções simultâneas, inclui as leituras delas.
+    """
+    diferencas = {}
+    for formato, atual in estatisticas_backends().items():
+        anterior = antes.get(formato, EstatisticasExtracao(formato=formato))
+        if atual.bytes > anterior.bytes:
+            diferencas[formato] = EstatisticasExtracao(
+                formato=formato,
+                arquivos=atual.arquivos - anterior.arquivos,
+                membros=atual.membros - anterior.membros,
+                bytes=atual.bytes - anterior.bytes,
+                segundos=atual.segundos - anterior.segundos,
+            )
+    return diferencas
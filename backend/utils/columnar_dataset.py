@@ -0,0 +1,308 @@
+"""
+Dataset colunar (Apache Arrow IPC) das notas fiscais validadas.
+
+Os CSVs de texto são lidos uma única vez, durante a validação, e gravados em
+arquivos Arrow com schema explícito para cabeçalhos e itens. As ferramentas
+abrem esses arquivos por memory mapping e convertem para pandas apenas as
+colunas de que precisam, sem repetir o parse do texto a cada chamada.
+
+Estrutura em disco:
+    <diretorio_dados>/dataset/<tabela>/part-00000.arrow
+    <diretorio_dados>/dataset/<tabela>/_manifesto.json
+    <diretorio_dados>/dataset/_perfil.json
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from models.notas_fiscais import COLUNAS_CENTAVOS, centavos_para_reais, converter_centavos, converter_data_emissao
+
+DIRETORIO_DATASET = "dataset"
+ARQUIVO_MANIFESTO = "_manifesto.json"
+ARQUIVO_PERFIL = "_perfil.json"
+VERSAO_FORMATO = 2  # 2: valores monetários em centavos (int64)
+
+# Nome da tabela no disco para cada tipo usado na validação
+TABELAS = {"cabeçalhos": "cabecalho", "itens": "itens"}
+
+# Colunas conhecidas dos CSVs de NF-e e seus tipos; colunas extras são gravadas como texto
+_CAMPOS_COMUNS = {
+    'CHAVE DE ACESSO': pa.string(),
+    'MODELO': pa.string(),
+    'SÉRIE': pa.string(),
+    'NÚMERO': pa.string(),
+    'NATUREZA DA OPERAÇÃO': pa.string(),
+    'DATA EMISSÃO': pa.timestamp('ns'),
+    'CPF/CNPJ Emitente': pa.string(),
+    'RAZÃO SOCIAL EMITENTE': pa.string(),
+    'INSCRIÇÃO ESTADUAL EMITENTE': pa.string(),
+    'UF EMITENTE': pa.string(),
+    'MUNICÍPIO EMITENTE': pa.string(),
+    'CNPJ DESTINATÁRIO': pa.string(),
+    'NOME DESTINATÁRIO': pa.string(),
+    'UF DESTINATÁRIO': pa.string(),
+    'INDICADOR IE DESTINATÁRIO': pa.string(),
+    'DESTINO DA OPERAÇÃO': pa.string(),
+    'CONSUMIDOR FINAL': pa.string(),
+    'PRESENÇA DO COMPRADOR': pa.string(),
+}
+
+CAMPOS_CABECALHO = {
+    **_CAMPOS_COMUNS,
+    'EVENTO MAIS RECENTE': pa.string(),
+    'DATA/HORA EVENTO MAIS RECENTE': pa.string(),
+    'VALOR NOTA FISCAL': pa.int64(),  # centavos
+}
+
+CAMPOS_ITENS = {
+    **_CAMPOS_COMUNS,
+    'NÚMERO PRODUTO': pa.string(),
+    'DESCRIÇÃO DO PRODUTO/SERVIÇO': pa.string(),
+    'CÓDIGO NCM/SH': pa.string(),
+    'NCM/SH (TIPO DE PRODUTO)': pa.string(),
+    'CFOP': pa.string(),
+    'QUANTIDADE': pa.float64(),
+    'UNIDADE': pa.string(),
+    'VALOR UNITÁRIO': pa.float64(),
+    'VALOR TOTAL': pa.int64(),  # centavos
+}
+
+CAMPOS_POR_TIPO = {"cabeçalhos": CAMPOS_CABECALHO, "itens": CAMPOS_ITENS}
+
+
+def caminho_tabela(diretorio_dados: Union[str, Path], tipo: str) -> Path:
+    """Diretório da tabela colunar de um tipo ("cabeçalhos" ou "itens")."""
+    return Path(diretorio_dados) / DIRETORIO_DATASET / TABELAS[tipo]
+
+
+def schema_para_colunas(colunas: List[str], tipo: str) -> pa.Schema:
+    """Monta o schema explícito na ordem das colunas do CSV."""
+    campos = CAMPOS_POR_TIPO[tipo]
+    return pa.schema([pa.field(coluna, campos.get(coluna, pa.string())) for coluna in colunas])
+
+
+def converter_bloco(bloco: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """
+    Converte um bloco lido do CSV (texto) para uma tabela Arrow tipada.
+
+    Valores que não podem ser convertidos (já reportados pela validação)
+    são gravados como nulos.
+    """
+    colunas = {}
+    for campo in schema:
+        serie = bloco[campo.name]
+        if pa.types.is_timestamp(campo.type):
+            serie = converter_data_emissao(serie)
+        elif campo.name in COLUNAS_CENTAVOS:
+            serie = converter_centavos(serie)
+        elif pa.types.is_floating(campo.type):
+            serie = pd.to_numeric(serie, errors='coerce')
+        else:
+            # Blocos que não vieram do CSV como texto podem trazer códigos numéricos
+            if not pd.api.types.is_object_dtype(serie):
+                serie = serie.astype(str).where(serie.notna())
+            serie = serie.astype(object).where(serie.notna(), None)
+        colunas[campo.name] = pa.array(serie, type=campo.type, from_pandas=True)
+    return pa.Table.from_pydict(colunas, schema=schema)
+
+
+def gravar_parte(tabela: pa.Table, caminho: Union[str, Path]) -> None:
+    """Grava uma parte da tabela em Arrow IPC sem compressão (requisito para memory mapping)."""
+    with pa.OSFile(str(caminho), 'wb') as arquivo:
+        with pa.ipc.new_file(arquivo, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+
+
+def nome_parte(numero: int) -> str:
+    return f"part-{numero:05d}.arrow"
+
+
+def assinatura_origem(caminho_csv: Union[str, Path]) -> Dict[str, Any]:
+    """Identifica o CSV de origem (nome, tamanho e data de modificação)."""
+    info = os.stat(caminho_csv)
+    return {"arquivo": os.path.basename(caminho_csv), "tamanho": info.st_size, "mtime_ns": info.st_mtime_ns}
+
+
+def publicar_tabela(diretorio_parcial: Union[str, Path], destino: Union[str, Path],
+                    manifesto: Dict[str, Any]) -> None:
+    """Grava o manifesto e substitui a tabela anterior pela recém-gerada."""
+    diretorio_parcial = Path(diretorio_parcial)
+    destino = Path(destino)
+    manifesto = {"versao": VERSAO_FORMATO, **manifesto}
+    with open(diretorio_parcial / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2, default=str)
+
+    if destino.exists():
+        shutil.rmtree(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(diretorio_parcial, destino)
+
+
+def ler_manifesto(diretorio_dados: Union[str, Path], tipo: str) -> Optional[Dict[str, Any]]:
+    """Retorna o manifesto da tabela ou None se o dataset não existe."""
+    caminho = caminho_tabela(diretorio_dados, tipo) / ARQUIVO_MANIFESTO
+    try:
+        with open(caminho, 'r', encoding='utf-8') as arquivo:
+            manifesto = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+    return manifesto if manifesto.get("versao") == VERSAO_FORMATO else None
+
+
+def dataset_atualizado(diretorio_dados: Union[str, Path], tipo: str,
+                       caminho_csv: Optional[Union[str, Path]] = None,
+                       origem: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Indica se a tabela colunar existe e corresponde ao CSV de origem.
+
+    A origem pode ser dada pelo caminho do CSV ou diretamente pela assinatura
+    (ex.: membro de um ZIP). Sem nenhuma das duas, basta a tabela existir.
+    """
+    manifesto = ler_manifesto(diretorio_dados, tipo)
+    if manifesto is None:
+        return False
+    if origem is None:
+        if caminho_csv is None or not os.path.exists(caminho_csv):
+            return True
+        origem = assinatura_origem(caminho_csv)
+    return manifesto.get("origem") == origem
+
+
+def abrir_tabela(diretorio_dados: Union[str, Path], tipo: str,
+                 colunas: Optional[List[str]] = None) -> Optional[pa.Table]:
+    """
+    Abre a tabela por memory mapping, sem copiar os dados para a memória.
+
+    Args:
+        diretorio_dados: Diretório dos dados da análise
+        tipo: "cabeçalhos" ou "itens"
+        colunas: Colunas desejadas (as inexistentes são ignoradas); None para todas
+
+    Returns:
+        Tabela Arrow apoiada nos arquivos mapeados ou None se não houver dataset
+    """
+    if ler_manifesto(diretorio_dados, tipo) is None:
+        return None
+
+    partes = []
+    for caminho in sorted(caminho_tabela(diretorio_dados, tipo).glob("part-*.arrow")):
+        leitor = pa.ipc.open_file(pa.memory_map(str(caminho), 'r'))
+        tabela = leitor.read_all()
+        if colunas is not None:
+            tabela = tabela.select([coluna for coluna in colunas if coluna in tabela.column_names])
+        partes.append(tabela)
+
+    if not partes:
+        return None
+    return pa.concat_tables(partes)
+
+
+def ler_dataframe(diretorio_dados: Union[str, Path], tipo: str,
+                  colunas: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """
+    Lê apenas as colunas pedidas da tabela colunar como DataFrame.
+
+    Inteiros (centavos) viram Int64 anulável, para que valores nulos não
+    convertam a coluna para float.
+    """
+    tabela = abrir_tabela(diretorio_dados, tipo, colunas)
+    if tabela is None:
+        return None
+    return tabela.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+
+def schema_tabela(diretorio_dados: Union[str, Path], tipo: str) -> Optional[pa.Schema]:
+    """Schema da tabela, lido do primeiro arquivo sem carregar dados."""
+    partes = sorted(caminho_tabela(diretorio_dados, tipo).glob("part-*.arrow"))
+    if ler_manifesto(diretorio_dados, tipo) is None or not partes:
+        return None
+    return pa.ipc.open_file(pa.memory_map(str(partes[0]), 'r')).schema
+
+
+def gerar_perfil(diretorio_dados: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    Resume o dataset validado (linhas, colunas, período, totais e erros de validação)
+    e grava em <dados>/dataset/_perfil.json.
+
+    O perfil é reaproveitado quando o mesmo arquivo é enviado novamente, para
+    responder perguntas sem repetir extração e validação.
+    """
+    tabelas = {}
+    for tipo in TABELAS:
+        manifesto = ler_manifesto(diretorio_dados, tipo)
+        tabela = abrir_tabela(diretorio_dados, tipo)
+        if manifesto is None or tabela is None:
+            continue
+
+        colunas = {}
+        for campo, coluna in zip(tabela.schema, tabela.columns):
+            info = {"tipo": str(campo.type), "nulos": coluna.null_count}
+            if coluna.null_count < len(coluna):
+                if pa.types.is_timestamp(campo.type):
+                    extremos = pc.min_max(coluna)
+                    info["min"] = str(extremos["min"].as_py())
+                    info["max"] = str(extremos["max"].as_py())
+                elif campo.name in COLUNAS_CENTAVOS:
+                    info["tipo"] = "centavos"
+                    info["soma"] = centavos_para_reais(pc.sum(coluna).as_py())
+                elif pa.types.is_floating(campo.type):
+                    info["soma"] = pc.sum(coluna).as_py()
+            colunas[campo.name] = info
+
+        validacao = manifesto.get("validacao", {}).get("resultado", {})
+        tabelas[tipo] = {
+            "origem": manifesto["origem"],
+            "linhas": tabela.num_rows,
+            "colunas": colunas,
+            "erros_por_regra": validacao.get("erros_por_regra", {}),
+            "linhas_invalidas": validacao.get("total_invalidas", len(validacao.get("linhas_invalidas", []))),
+        }
+
+    if not tabelas:
+        return None
+
+    perfil = {"versao": VERSAO_FORMATO, "tabelas": tabelas}
+    with open(Path(diretorio_dados) / DIRETORIO_DATASET / ARQUIVO_PERFIL, 'w', encoding='utf-8') as arquivo:
+        json.dump(perfil, arquivo, ensure_ascii=False, indent=2, default=str)
+    return perfil
+
+
+def carregar_perfil(diretorio_dados: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """Retorna o perfil salvo se ele ainda corresponde às tabelas do dataset; senão None."""
+    try:
+        with open(Path(diretorio_dados) / DIRETORIO_DATASET / ARQUIVO_PERFIL, 'r', encoding='utf-8') as arquivo:
+            perfil = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+    if perfil.get("versao") != VERSAO_FORMATO:
+        return None
+    for tipo, tabela in perfil["tabelas"].items():
+        manifesto = ler_manifesto(diretorio_dados, tipo)
+        if manifesto is None or manifesto.get("origem") != tabela["origem"]:
+            return None
+    return perfil
+
+
+def resumo_perfil(perfil: Dict[str, Any]) -> str:
+    """Texto curto do perfil, usado como contexto no lugar dos relatórios de extração e validação."""
+    linhas = []
+    for tipo, tabela in perfil["tabelas"].items():
+        linhas.append(f"{tipo.upper()} ({tabela['origem']['arquivo']}): {tabela['linhas']} registros, "
+                      f"{tabela['linhas_invalidas']} inválidos")
+        for regra, quantidade in tabela["erros_por_regra"].items():
+            linhas.append(f"  - {regra}: {quantidade}")
+        for nome, coluna in tabela["colunas"].items():
+            detalhe = ""
+            if "min" in coluna:
+                detalhe = f" de {coluna['min']} a {coluna['max']}"
+            elif "soma" in coluna:
+                detalhe = f" soma {coluna['soma']:,.2f}"
+            linhas.append(f"  • {nome} ({coluna['tipo']}){detalhe}")
+    return "\n".join(linhas)
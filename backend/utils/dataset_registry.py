@@ -0,0 +1,214 @@
+"""
+Registro em memória dos datasets das sessões, compartilhado pelas ferramentas.
+
+Os frames tipados de cabeçalhos e itens de um diretório de dados (o workspace
+de uma sessão ou o dataset publicado de um upload) são carregados uma única
+vez por processo e entregues por referência ao `pandas_query_tool` e ao
+`rag_tool`; chamadas seguintes não leem nem convertem nada. Junto com os
+frames ficam o planejador de consultas (com o seu cache de filtros e
+agregações e, no dataset colunar, o cubo de agregados) e valores derivados,
+como o contexto do RAG.
+
+Na carga, os frames passam pelo schema canônico (`utils/frame_schema.py`:
+dimensões categóricas, códigos inteiros compactos, datas datetime64) e a
+memória de cada frame antes e depois fica em `DatasetSessao.memoria`.
+
+A entrada é invalidada quando a assinatura da origem muda: o hash das
+origens gravadas nos manifestos do dataset colunar (arquivo, tamanho e
+mtime do CSV) e do manifesto do cubo ou, sem dataset, dos próprios CSVs do
+diretório. Os frames são compartilhados: quem os recebe não deve alterá-los
+(use `.copy()` antes).
+
+O registro tem orçamento de memória: acima de `max_memoria_mb` (ou de
+`max_datasets` entradas), os datasets usados há mais tempo são descartados.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from models.consulta import TABELA_CABECALHO, TABELA_ITENS
+from utils.aggregate_cube import CuboAgregados, assinatura_cubo, carregar_cubo
+from utils.columnar_dataset import TABELAS, ler_dataframe, ler_manifesto
+from utils.frame_schema import aplicar_schema, relatorio_memoria
+from utils.logger import setup_logger
+from utils.query_planner import PlanejadorConsultas
+from utils.session_store import MB, estimar_bytes
+
+logger = setup_logger()
+
+# Carrega (cabeçalhos, itens) dos CSVs de um diretório sem dataset colunar
+CarregadorCSV = Callable[[str], Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]]
+
+
+class DatasetSessao:
+    """Frames de um diretório de dados, com o planejador e valores derivados deles"""
+
+    def __init__(self, diretorio: str, assinatura: str, origem: str,
+                 cabecalho: Optional[pd.DataFrame], itens: Optional[pd.DataFrame],
+                 cubo: Optional[CuboAgregados] = None, memoria: Optional[Dict[str, Dict[str, float]]] = None):
+        self.diretorio = diretorio
+        self.assinatura = assinatura
+        self.origem = origem  # "dataset" (colunar) ou "csv"
+        self.cabecalho = cabecalho
+        self.itens = itens
+        self.cubo = cubo
+        self.memoria = memoria or {}  # MB por frame antes/depois do schema canônico
+        self.planejador = PlanejadorConsultas({TABELA_CABECALHO: cabecalho, TABELA_ITENS: itens}, cubo=cubo)
+        self._derivados: Dict[str, Any] = {}
+        self._trava = threading.Lock()
+        self.bytes = estimar_bytes([cabecalho, itens] + [rollup.frame for rollup in (cubo.rollups if cubo else [])])
+
+    def derivado(self, nome: str, calcular: Callable[["DatasetSessao"], Any]) -> Any:
+        """Valor calculado uma vez a partir do dataset (ex.: amostras do RAG)"""
+        with self._trava:
+            if nome not in self._derivados:
+                self._derivados[nome] = calcular(self)
+            return self._derivados[nome]
+
+
+def _assinatura(partes: List[Any]) -> str:
+    conteudo = json.dumps(partes, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def assinatura_dataset(diretorio_dados: Union[str, Path]) -> Optional[str]:
+    """Hash das origens do dataset colunar (None se não há tabelas validadas)"""
+    manifestos = [(tipo, ler_manifesto(diretorio_dados, tipo)) for tipo in TABELAS]
+    if all(manifesto is None for _, manifesto in manifestos):
+        return None
+    partes = [(tipo, manifesto and manifesto.get("origem"), manifesto and manifesto.get("linhas"))
+              for tipo, manifesto in manifestos]
+    return _assinatura(partes + [("cubo", assinatura_cubo(diretorio_dados))])
+
+
+def assinatura_csvs(diretorio_dados: Union[str, Path]) -> Optional[str]:
+    """Hash de nome, tamanho e data de modificação dos CSVs do diretório"""
+    try:
+        nomes = sorted(nome for nome in os.listdir(diretorio_dados) if nome.endswith('.csv'))
+    except OSError:
+        return None
+    if not nomes:
+        return None
+    partes = []
+    for nome in nomes:
+        info = os.stat(os.path.join(diretorio_dados, nome))
+        partes.append((nome, info.st_size, info.st_mtime_ns))
+    return _assinatura(partes)
+
+
+class RegistroDatasets:
+    """
+    Datasets em memória por diretório de dados, com invalidação pela assinatura
+    da origem e descarte LRU por memória estimada.
+    """
+
+    def __init__(self, max_memoria_mb: float, max_datasets: int = 16):
+        self.max_bytes = int(max_memoria_mb * MB)
+        self.max_datasets = max_datasets
+        self._datasets: "OrderedDict[str, DatasetSessao]" = OrderedDict()
+        self._carregando: Dict[str, threading.Lock] = {}
+        self._trava = threading.Lock()
+        self.carregamentos = 0
+        self.acertos = 0
+        self.descartes = 0
+
+    def obter(self, diretorio_dados: Union[str, Path],
+              carregar_csv: Optional[CarregadorCSV] = None) -> Optional[DatasetSessao]:
+        """
+        Dataset do diretório, carregado na primeira chamada e reaproveitado
+        enquanto a origem não mudar.
+
+        Sem dataset colunar, usa `carregar_csv` (se informado) sobre os CSVs
+        do diretório. Retorna None quando não há dados.
+        """
+        chave = str(Path(diretorio_dados).resolve())
+        origem, assinatura = "dataset", assinatura_dataset(chave)
+        if assinatura is None and carregar_csv is not None:
+            origem, assinatura = "csv", assinatura_csvs(chave)
+
+        # Um carregamento por diretório; outros diretórios seguem em paralelo
+        with self._trava:
+            carregando = self._carregando.setdefault(chave, threading.Lock())
+        with carregando:
+            with self._trava:
+                dataset = self._datasets.get(chave)
+                if dataset is not None and dataset.assinatura == assinatura:
+                    self._datasets.move_to_end(chave)
+                    self.acertos += 1
+                    return dataset
+                if dataset is not None:
+                    # Origem mudou (novo upload validado) ou os dados sumiram
+                    del self._datasets[chave]
+                    self.descartes += 1
+            if assinatura is None:
+                return None
+
+            cubo = None
+            if origem == "dataset":
+                cabecalho = ler_dataframe(chave, "cabeçalhos")
+                itens = ler_dataframe(chave, "itens")
+                cubo = carregar_cubo(chave)
+            else:
+                cabecalho, itens = carregar_csv(chave)
+            if cabecalho is None and itens is None:
+                return None
+
+            brutos = {TABELA_CABECALHO: cabecalho, TABELA_ITENS: itens}
+            tipados = aplicar_schema(brutos)
+            memoria = relatorio_memoria(brutos, tipados)
+            for nome, uso in memoria.items():
+                logger.info(f"🗜️ {nome}: {uso['antes_mb']:.1f} MB → {uso['depois_mb']:.1f} MB com o schema canônico")
+            dataset = DatasetSessao(chave, assinatura, origem, tipados[TABELA_CABECALHO], tipados[TABELA_ITENS],
+                                    cubo, memoria)
+            with self._trava:
+                self.carregamentos += 1
+                self._datasets[chave] = dataset
+                self._aplicar_limites(chave)
+            logger.info(f"📦 Dataset carregado em memória: {chave} ({origem}, {dataset.bytes / MB:.1f} MB)")
+            return dataset
+
+    def remover(self, diretorio_dados: Union[str, Path]) -> bool:
+        with self._trava:
+            return self._datasets.pop(str(Path(diretorio_dados).resolve()), None) is not None
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._trava:
+            return {
+                "datasets": len(self._datasets),
+                "memoria_mb": round(sum(d.bytes for d in self._datasets.values()) / MB, 1),
+                "carregamentos": self.carregamentos,
+                "acertos": self.acertos,
+                "descartes": self.descartes,
+            }
+
+    def _aplicar_limites(self, preservar: str) -> None:
+        """Descarta os datasets menos usados (nunca o recém-carregado); chamado com a trava"""
+        total = sum(dataset.bytes for dataset in self._datasets.values())
+        while len(self._datasets) > 1 and (total > self.max_bytes or len(self._datasets) > self.max_datasets):
+            chave = next(iter(self._datasets))
+            if chave == preservar:
+                break
+            total -= self._datasets.pop(chave).bytes
+            self.descartes += 1
+            logger.info(f"🧹 Dataset descartado da memória (LRU): {chave}")
+
+
+_registro: Optional[RegistroDatasets] = None
+_trava_registro = threading.Lock()
+
+
+def obter_registro() -> RegistroDatasets:
+    """Registro único do processo (servidor ou worker da crew)"""
+    global _registro
+    with _trava_registro:
+        if _registro is None:
+            from config.settings import get_setting
+            _registro = RegistroDatasets(get_setting('dataset_registry_max_mb'),
+                                         get_setting('dataset_registry_max_count'))
+        return _registro
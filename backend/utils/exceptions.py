@@ -68,6 +68,14 @@ class ExtractionError(FileProcessingError):
     pass
 
 
+class UploadOffsetError(FileProcessingError):
+    """Bloco de upload enviado fora da posição esperada."""
+
+    def __init__(self, message: str, expected_offset: Optional[int] = None, **kwargs):
+        self.expected_offset = expected_offset
+        super().__init__(message, expected_offset=expected_offset, **kwargs)
+
+
 class CSVProcessingError(FileProcessingError):
     """Erro específico de processamento de CSV."""
     
@@ -0,0 +1,139 @@
+"""
+Schema canônico dos frames de cabeçalhos e itens em memória.
+
+Aplicado na carga (registro de datasets), depois de ler o dataset colunar ou
+os CSVs:
+
+- dimensões em texto (razão social, CNPJ, destinatário, UF, município, NCM,
+  descrição...) viram `category`: cada valor distinto é guardado uma vez e as
+  linhas só carregam o código inteiro, o que também acelera filtros e groupby;
+- NÚMERO e códigos (série, modelo, CFOP, NCM, produto) viram o menor inteiro
+  sem sinal que os comporta, quando a conversão não perde nada (sem zeros à
+  esquerda nem letras); senão, `category`;
+- datas de emissão viram datetime64.
+
+Colunas fora do schema, centavos (já Int64) e quantidades ficam como estão.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.notas_fiscais import converter_data_emissao
+from utils.session_store import MB, estimar_bytes
+
+CATEGORIA = "categoria"
+CODIGO = "codigo"
+DATA = "data"
+
+# Colunas do dataset e os nomes mapeados pelo carregador de CSVs legado
+SCHEMA_CANONICO: Dict[str, str] = {
+    'NÚMERO': CODIGO,
+    'numero_nf': CODIGO,
+    'MODELO': CODIGO,
+    'SÉRIE': CODIGO,
+    'CFOP': CODIGO,
+    'CÓDIGO NCM/SH': CODIGO,
+    'NÚMERO PRODUTO': CODIGO,
+    'codigo_produto': CODIGO,
+    'DATA EMISSÃO': DATA,
+    'data_emissao': DATA,
+    'CPF/CNPJ Emitente': CATEGORIA,
+    'cnpj_emitente': CATEGORIA,
+    'RAZÃO SOCIAL EMITENTE': CATEGORIA,
+    'nome_emitente': CATEGORIA,
+    'INSCRIÇÃO ESTADUAL EMITENTE': CATEGORIA,
+    'UF EMITENTE': CATEGORIA,
+    'estado': CATEGORIA,
+    'MUNICÍPIO EMITENTE': CATEGORIA,
+    'cidade': CATEGORIA,
+    'CNPJ DESTINATÁRIO': CATEGORIA,
+    'NOME DESTINATÁRIO': CATEGORIA,
+    'UF DESTINATÁRIO': CATEGORIA,
+    'NATUREZA DA OPERAÇÃO': CATEGORIA,
+    'INDICADOR IE DESTINATÁRIO': CATEGORIA,
+    'DESTINO DA OPERAÇÃO': CATEGORIA,
+    'CONSUMIDOR FINAL': CATEGORIA,
+    'PRESENÇA DO COMPRADOR': CATEGORIA,
+    'EVENTO MAIS RECENTE': CATEGORIA,
+    'DESCRIÇÃO DO PRODUTO/SERVIÇO': CATEGORIA,
+    'descricao_produto': CATEGORIA,
+    'NCM/SH (TIPO DE PRODUTO)': CATEGORIA,
+    'categoria': CATEGORIA,
+    'UNIDADE': CATEGORIA,
+}
+
+# Menor tipo inteiro sem sinal (anulável) por valor máximo
+_INTEIROS_SEM_SINAL = [(np.iinfo(tipo).max, nome) for tipo, nome in
+                       ((np.uint8, "UInt8"), (np.uint16, "UInt16"), (np.uint32, "UInt32"), (np.uint64, "UInt64"))]
+
+
+def codigo_inteiro(serie: pd.Series) -> Optional[pd.Series]:
+    """
+    Código como o menor inteiro sem sinal (anulável) que o comporta; None se
+    a conversão perderia informação ("007", "12A", "1.5", vazio).
+    """
+    if pd.api.types.is_float_dtype(serie):
+        # CSV lido pelo pandas: códigos com nulos chegam como float
+        if not (serie.round().eq(serie) | serie.isna()).all():
+            return None
+        serie = serie.astype("Int64")
+    codigos, distintos = pd.factorize(serie)
+    texto = pd.Series(distintos, dtype=object).map(str)
+    if len(texto) == 0 or not texto.str.fullmatch(r"0|[1-9][0-9]{0,17}").all():
+        return None
+
+    valores = texto.astype(np.int64).to_numpy()
+    maximo = int(valores.max())
+    nome = next(nome for limite, nome in _INTEIROS_SEM_SINAL if maximo <= limite)
+    # Código -1 (nulo) indexa um valor qualquer, escondido pela máscara
+    dados = pd.arrays.IntegerArray(valores[codigos].astype(nome.lower()), codigos == -1)
+    return pd.Series(dados, index=serie.index, name=serie.name)
+
+
+def aplicar_schema(frames: Dict[str, Optional[pd.DataFrame]]) -> Dict[str, Optional[pd.DataFrame]]:
+    """
+    Aplica o schema canônico aos frames (`{"cabecalho": df, "itens": df}`),
+    devolvendo frames novos.
+
+    Um código só vira inteiro se a conversão for exata em todos os frames
+    que o têm, e com o mesmo tipo neles, para que chaves como NÚMERO
+    continuem casando entre cabeçalhos e itens.
+    """
+    presentes = {nome: frame for nome, frame in frames.items() if frame is not None}
+    inteiros: Dict[str, Dict[str, pd.Series]] = {}
+    for nome, frame in presentes.items():
+        for coluna in frame.columns:
+            if SCHEMA_CANONICO.get(coluna) == CODIGO:
+                inteiros.setdefault(coluna, {})[nome] = codigo_inteiro(frame[coluna])
+    for coluna, series in inteiros.items():
+        if all(serie is not None for serie in series.values()):
+            # Mesmo tipo em todas as tabelas (o do maior código)
+            tipo = max((serie.dtype for serie in series.values()), key=lambda dtype: dtype.itemsize)
+            inteiros[coluna] = {nome: serie.astype(tipo) for nome, serie in series.items()}
+
+    tipados = dict(frames)
+    for nome, frame in presentes.items():
+        colunas = {}
+        for coluna in frame.columns:
+            tipo, serie = SCHEMA_CANONICO.get(coluna), frame[coluna]
+            if tipo == CODIGO and all(convertida is not None for convertida in inteiros[coluna].values()):
+                serie = inteiros[coluna][nome]
+            elif tipo in (CODIGO, CATEGORIA) and not isinstance(serie.dtype, pd.CategoricalDtype):
+                serie = serie.astype("category")
+            elif tipo == DATA and not pd.api.types.is_datetime64_any_dtype(serie):
+                serie = converter_data_emissao(serie)
+            colunas[coluna] = serie
+        tipados[nome] = pd.DataFrame(colunas, index=frame.index)
+    return tipados
+
+
+def relatorio_memoria(antes: Dict[str, Optional[pd.DataFrame]],
+                      depois: Dict[str, Optional[pd.DataFrame]]) -> Dict[str, Dict[str, float]]:
+    """Memória (MB, com strings) de cada frame antes e depois do schema canônico"""
+    relatorio = {}
+    for nome, frame in antes.items():
+        if frame is not None:
+            relatorio[nome] = {"antes_mb": round(estimar_bytes(frame) / MB, 2),
+                               "depois_mb": round(estimar_bytes(depois[nome]) / MB, 2)}
+    return relatorio
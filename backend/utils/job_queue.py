@@ -0,0 +1,367 @@
+"""
+Fila de jobs assíncronos do servidor (análises e consultas).
+
+Cada requisição vira um job persistido em SQLite e devolvido na hora com o seu
+id; consumidores em segundo plano executam os jobs respeitando o limite de
+concorrência e a prioridade das filas:
+
+    interativa   perguntas seguintes de uma sessão (respostas curtas, usuário esperando)
+    lote         processamento completo de um arquivo
+
+Consumidores gerais atendem a fila interativa antes da de lote; os reservados
+atendem só a interativa, de modo que uma pergunta não espera análises longas.
+Jobs pendentes (e os interrompidos no meio) voltam para a fila quando o
+servidor reinicia; os finalizados são apagados depois do prazo de retenção.
+
+O SQLite é acessado fora do event loop (asyncio.to_thread): gravações e
+leituras do disco não atrasam as outras requisições.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from utils.exceptions import RateLimitError
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+FILA_INTERATIVA = "interativa"
+FILA_LOTE = "lote"
+FILAS = (FILA_INTERATIVA, FILA_LOTE)  # ordem de prioridade
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+FALHOU = "falhou"
+CANCELADO = "cancelado"
+STATUS_FINAIS = (CONCLUIDO, FALHOU, CANCELADO)
+
+
+class Job(BaseModel):
+    """Estado de um job; `parametros` é persistido, segredos (chave da API) não."""
+    job_id: str
+    tipo: str
+    fila: str
+    status: str = PENDENTE
+    parametros: Dict[str, Any] = {}
+    resultado: Optional[Dict[str, Any]] = None
+    erro: Optional[str] = None
+    codigo_erro: Optional[int] = None  # status HTTP da falha do executor (HTTPException), se houver
+    criado_em: str
+    iniciado_em: Optional[str] = None
+    concluido_em: Optional[str] = None
+
+    @property
+    def finalizado(self) -> bool:
+        return self.status in STATUS_FINAIS
+
+
+class JobStore:
+    """Persistência dos jobs em um arquivo SQLite local."""
+
+    def __init__(self, caminho: Union[str, Path]):
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        self._conexao = sqlite3.connect(str(caminho), check_same_thread=False)
+        self._trava = threading.Lock()
+        with self._trava, self._conexao:
+            self._conexao.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    fila TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    parametros TEXT NOT NULL,
+                    resultado TEXT,
+                    erro TEXT,
+                    criado_em TEXT NOT NULL,
+                    iniciado_em TEXT,
+                    concluido_em TEXT
+                )
+                """
+            )
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, criado_em)")
+            colunas = {linha[1] for linha in self._conexao.execute("PRAGMA table_info(jobs)")}
+            if "codigo_erro" not in colunas:
+                # Bancos criados antes do status HTTP das falhas
+                self._conexao.execute("ALTER TABLE jobs ADD COLUMN codigo_erro INTEGER")
+
+    def salvar(self, job: Job) -> None:
+        with self._trava, self._conexao:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, tipo, fila, status, parametros, resultado, erro, "
+                "criado_em, iniciado_em, concluido_em, codigo_erro) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.job_id, job.tipo, job.fila, job.status,
+                    json.dumps(job.parametros, ensure_ascii=False),
+                    json.dumps(job.resultado, ensure_ascii=False) if job.resultado is not None else None,
+                    job.erro, job.criado_em, job.iniciado_em, job.concluido_em, job.codigo_erro
+                )
+            )
+
+    @staticmethod
+    def _job(linha) -> Job:
+        return Job(
+            job_id=linha[0], tipo=linha[1], fila=linha[2], status=linha[3],
+            parametros=json.loads(linha[4]),
+            resultado=json.loads(linha[5]) if linha[5] is not None else None,
+            erro=linha[6], criado_em=linha[7], iniciado_em=linha[8], concluido_em=linha[9],
+            codigo_erro=linha[10]
+        )
+
+    def obter(self, job_id: str) -> Optional[Job]:
+        with self._trava:
+            linha = self._conexao.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(linha) if linha else None
+
+    def listar(self, *status: str) -> List[Job]:
+        """Jobs com os status informados, do mais antigo para o mais novo."""
+        marcadores = ", ".join("?" for _ in status)
+        with self._trava:
+            linhas = self._conexao.execute(
+                f"SELECT * FROM jobs WHERE status IN ({marcadores}) ORDER BY criado_em", status
+            ).fetchall()
+        return [self._job(linha) for linha in linhas]
+
+    def remover_finalizados(self, concluidos_antes: str) -> int:
+        """Apaga os jobs finalizados antes da data informada (ISO); devolve quantos saíram."""
+        marcadores = ", ".join("?" for _ in STATUS_FINAIS)
+        with self._trava, self._conexao:
+            cursor = self._conexao.execute(
+                f"DELETE FROM jobs WHERE status IN ({marcadores}) AND concluido_em < ?",
+                (*STATUS_FINAIS, concluidos_antes)
+            )
+        return cursor.rowcount
+
+    def fechar(self) -> None:
+        with self._trava:
+            self._conexao.close()
+
+
+Executor = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """
+    Fila limitada de jobs com prioridade entre filas.
+
+    `executores` associa cada tipo de job a uma corrotina que recebe os parâmetros
+    (mais os segredos, mantidos só em memória, e o `job_id`) e devolve o
+    resultado serializável. Cada job roda em uma tarefa própria.
+    `ao_mudar`, se informado, é chamado a cada mudança de status.
+    Com `retencao_segundos`, jobs finalizados há mais tempo que isso são
+    apagados a cada `intervalo_limpeza` segundos.
+    """
+
+    def __init__(self, store: JobStore, executores: Dict[str, Executor], consumidores: int,
+                 reservados_interativos: int = 1, max_pendentes: int = 100,
+                 ao_mudar: Optional[Callable[[Job], Awaitable[None]]] = None,
+                 retencao_segundos: Optional[float] = None, intervalo_limpeza: float = 60):
+        self.store = store
+        self.executores = executores
+        self.consumidores = consumidores
+        self.reservados_interativos = reservados_interativos
+        self.max_pendentes = max_pendentes
+        self.ao_mudar = ao_mudar
+        self.retencao_segundos = retencao_segundos
+        self.intervalo_limpeza = intervalo_limpeza
+        self._pendentes: Dict[str, Deque[str]] = {fila: deque() for fila in FILAS}
+        self._segredos: Dict[str, Dict[str, Any]] = {}
+        self._em_execucao: Dict[str, asyncio.Task] = {}
+        self._finalizados: Dict[str, asyncio.Event] = {}
+        self._condicao = asyncio.Condition()
+        self._consumidores: List[asyncio.Task] = []
+        self._encerrando = False
+
+    async def iniciar(self) -> int:
+        """Recoloca na fila os jobs pendentes ou interrompidos e inicia os consumidores."""
+        recuperados = await asyncio.to_thread(self.store.listar, PENDENTE, EXECUTANDO)
+        for job in recuperados:
+            if job.status == EXECUTANDO:
+                job.status, job.iniciado_em = PENDENTE, None
+                await asyncio.to_thread(self.store.salvar, job)
+            self._pendentes[job.fila].append(job.job_id)
+        if recuperados:
+            logger.info(f"{len(recuperados)} job(s) recuperado(s) da execução anterior")
+
+        self._encerrando = False
+        self._consumidores = [
+            asyncio.create_task(self._consumir(FILAS)) for _ in range(self.consumidores)
+        ] + [
+            asyncio.create_task(self._consumir((FILA_INTERATIVA,))) for _ in range(self.reservados_interativos)
+        ]
+        if self.retencao_segundos is not None:
+            self._consumidores.append(asyncio.create_task(self._limpar_periodicamente()))
+        return len(recuperados)
+
+    async def encerrar(self) -> None:
+        """Para os consumidores; jobs interrompidos ficam pendentes para o próximo início."""
+        self._encerrando = True
+        for tarefa in self._consumidores:
+            tarefa.cancel()
+        await asyncio.gather(*self._consumidores, return_exceptions=True)
+        self._consumidores = []
+
+    def pendentes(self) -> int:
+        return sum(len(fila) for fila in self._pendentes.values())
+
+    async def submeter(self, tipo: str, parametros: Dict[str, Any], fila: str = FILA_LOTE,
+                       segredos: Optional[Dict[str, Any]] = None) -> Job:
+        if tipo not in self.executores:
+            raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        if fila not in FILAS:
+            raise ValueError(f"Fila desconhecida: {fila}")
+        if self.pendentes() >= self.max_pendentes:
+            raise RateLimitError("Fila de jobs cheia, tente novamente em instantes",
+                                 retry_after=30, pendentes=self.pendentes())
+
+        job = Job(job_id=uuid.uuid4().hex, tipo=tipo, fila=fila, parametros=parametros,
+                  criado_em=datetime.now().isoformat())
+        await asyncio.to_thread(self.store.salvar, job)
+        if segredos:
+            self._segredos[job.job_id] = segredos
+        async with self._condicao:
+            self._pendentes[fila].append(job.job_id)
+            self._condicao.notify_all()
+        await self._notificar(job)
+        return job
+
+    async def obter(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self.store.obter, job_id)
+
+    async def limpar_finalizados(self) -> int:
+        """Apaga os jobs finalizados há mais que `retencao_segundos`."""
+        if self.retencao_segundos is None:
+            return 0
+        limite = (datetime.now() - timedelta(seconds=self.retencao_segundos)).isoformat()
+        return await asyncio.to_thread(self.store.remover_finalizados, limite)
+
+    async def _limpar_periodicamente(self) -> None:
+        while True:
+            try:
+                removidos = await self.limpar_finalizados()
+                if removidos:
+                    logger.info(f"🧹 {removidos} job(s) finalizado(s) apagado(s) após a retenção")
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao apagar jobs finalizados: {e}")
+            await asyncio.sleep(self.intervalo_limpeza)
+
+    def posicao(self, job_id: str) -> Optional[int]:
+        """Posição (a partir de 1) entre os pendentes, considerando a prioridade das filas."""
+        posicao = 0
+        for fila in FILAS:
+            if job_id in self._pendentes[fila]:
+                return posicao + list(self._pendentes[fila]).index(job_id) + 1
+            posicao += len(self._pendentes[fila])
+        return None
+
+    async def cancelar(self, job_id: str) -> Optional[Job]:
+        """Cancela o job pendente ou em execução; jobs já finalizados não mudam."""
+        job = await self.obter(job_id)
+        if job is None or job.finalizado:
+            return job
+
+        async with self._condicao:
+            pendente = job_id in self._pendentes[job.fila]
+            if pendente:
+                self._pendentes[job.fila].remove(job_id)
+        if pendente:
+            await self._finalizar(job, CANCELADO)
+            return job
+
+        # Já retirado da fila por um consumidor (ou finalizado durante a leitura)
+        tarefa = self._em_execucao.get(job_id)
+        if tarefa is not None:
+            tarefa.cancel()
+            await asyncio.wait([tarefa])
+        job = await self.obter(job_id)
+        if job is not None and not job.finalizado:
+            # Cancelado antes de o executor começar (ainda lendo o job do banco)
+            await self._finalizar(job, CANCELADO)
+        return job
+
+    async def aguardar(self, job_id: str) -> Optional[Job]:
+        """Espera o job terminar (concluído, com falha ou cancelado)."""
+        # O evento é criado antes da leitura: o job pode terminar enquanto o banco é lido
+        finalizado = self._finalizados.setdefault(job_id, asyncio.Event())
+        job = await self.obter(job_id)
+        if job is None or job.finalizado:
+            if self._finalizados.get(job_id) is finalizado:
+                del self._finalizados[job_id]
+            return job
+        await finalizado.wait()
+        return await self.obter(job_id)
+
+    async def _notificar(self, job: Job) -> None:
+        if self.ao_mudar is None:
+            return
+        try:
+            await self.ao_mudar(job)
+        except Exception as e:
+            logger.warning(f"Falha ao notificar status do job {job.job_id}: {e}")
+
+    async def _finalizar(self, job: Job, status: str, resultado: Optional[dict] = None,
+                         erro: Optional[str] = None, codigo_erro: Optional[int] = None) -> None:
+        job.status, job.resultado, job.erro, job.codigo_erro = status, resultado, erro, codigo_erro
+        job.concluido_em = datetime.now().isoformat()
+        await asyncio.to_thread(self.store.salvar, job)
+        self._segredos.pop(job.job_id, None)
+        self._finalizados.pop(job.job_id, asyncio.Event()).set()
+        await self._notificar(job)
+
+    def _proximo(self, filas) -> Optional[str]:
+        for fila in filas:
+            if self._pendentes[fila]:
+                return fila
+        return None
+
+    async def _consumir(self, filas) -> None:
+        while True:
+            async with self._condicao:
+                await self._condicao.wait_for(lambda: self._proximo(filas) is not None)
+                job_id = self._pendentes[self._proximo(filas)].popleft()
+
+            tarefa = asyncio.create_task(self._executar(job_id))
+            self._em_execucao[job_id] = tarefa
+            try:
+                await tarefa
+            except asyncio.CancelledError:
+                # Cancelamento do job (DELETE) não derruba o consumidor
+                if self._encerrando:
+                    raise
+            finally:
+                self._em_execucao.pop(job_id, None)
+
+    async def _executar(self, job_id: str) -> None:
+        job = await self.obter(job_id)
+        if job is None or job.status != PENDENTE:
+            return
+        job.status, job.iniciado_em = EXECUTANDO, datetime.now().isoformat()
+        await asyncio.to_thread(self.store.salvar, job)
+        await self._notificar(job)
+
+        try:
+            resultado = await self.executores[job.tipo](
+                {**job.parametros, **self._segredos.get(job_id, {}), "job_id": job_id}
+            )
+        except asyncio.CancelledError:
+            if self._encerrando:
+                job.status, job.iniciado_em = PENDENTE, None
+                await asyncio.to_thread(self.store.salvar, job)
+            else:
+                await self._finalizar(job, CANCELADO)
+            raise
+        except Exception as e:
+            # HTTPException traz a mensagem em `detail` e o status em `status_code`
+            await self._finalizar(job, FALHOU, erro=str(getattr(e, "detail", None) or e),
+                                  codigo_erro=getattr(e, "status_code", None))
+            return
+        await self._finalizar(job, CONCLUIDO, resultado=resultado)
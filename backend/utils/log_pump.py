@@ -0,0 +1,153 @@
+"""
+Envio dos logs do terminal para o WebSocket por uma única tarefa assíncrona.
+
+Qualquer thread (stdout capturado, handlers de logging, threads do CrewAI)
+chama `publicar`, que só enfileira o texto em uma fila limitada. Uma tarefa
+no event loop do servidor esvazia a fila a cada `intervalo` segundos (ou a
+cada `max_linhas_frame` linhas) e envia as linhas acumuladas em um único
+frame, no lugar de uma thread e um event loop por escrita.
+
+Cada linha guarda os canais do WebSocket (job/sessão) de quem a escreveu, e
+o frame vai só para os assinantes desses canais. Linhas sem canal (threads
+que não copiaram o contexto) vão só para os assinantes de `*`.
+"""
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+from utils.websocket_channels import TODOS, canais_atuais
+
+logger = setup_logger()
+
+
+class LogPump:
+    """
+    Fila limitada de linhas de log com um consumidor no event loop.
+
+    Fragmentos sem quebra de linha ficam pendentes até a linha terminar (ou até
+    o próximo envio). Com a fila cheia, as linhas mais antigas são descartadas
+    e o total descartado é informado no frame seguinte dos mesmos canais.
+    """
+
+    def __init__(self, enviar: Callable[[dict, Tuple[str, ...]], Awaitable[None]], max_linhas: int = 10_000,
+                 intervalo: float = 0.05, max_linhas_frame: int = 200):
+        self.enviar = enviar
+        self.intervalo = intervalo
+        self.max_linhas_frame = max_linhas_frame
+        self._linhas: Deque[Tuple[Tuple[str, ...], str]] = deque(maxlen=max_linhas)
+        self._parcial: Dict[Tuple[str, ...], str] = {}
+        self._trava = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._evento: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self._aguardando = False
+        self._descartadas_lote: Dict[Tuple[str, ...], int] = {}
+        self.recebidas = 0
+        self.descartadas = 0
+        self.frames = 0
+
+    def iniciar(self) -> None:
+        """Inicia o consumidor no event loop atual"""
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+        self._cheio = asyncio.Event()
+        self._tarefa = asyncio.create_task(self._consumir())
+
+    async def encerrar(self) -> None:
+        """Envia o que restou na fila e para o consumidor"""
+        if self._tarefa is None:
+            return
+        self._tarefa.cancel()
+        await asyncio.gather(self._tarefa, return_exceptions=True)
+        self._tarefa = None
+        await self._enviar_pendentes()
+
+    def publicar(self, texto: str) -> None:
+        """Enfileira texto do terminal; pode ser chamado de qualquer thread"""
+        if not texto:
+            return
+        canais = canais_atuais() or (TODOS,)
+        with self._trava:
+            partes = (self._parcial.pop(canais, "") + texto).split("\n")
+            if partes[-1]:
+                self._parcial[canais] = partes[-1]
+            for linha in partes[:-1]:
+                if len(self._linhas) == self._linhas.maxlen:
+                    canais_descartada = self._linhas[0][0]
+                    self._descartadas_lote[canais_descartada] = self._descartadas_lote.get(canais_descartada, 0) + 1
+                    self.descartadas += 1
+                self._linhas.append((canais, linha))
+                self.recebidas += 1
+            # Acorda o consumidor uma vez por lote, não a cada escrita; com um frame
+            # inteiro acumulado, envia sem esperar o fim da janela
+            acordar = bool(self._linhas or self._parcial) and not self._aguardando
+            if acordar:
+                self._aguardando = True
+            cheio = len(self._linhas) >= self.max_linhas_frame
+        if self._loop is None or self._loop.is_closed():
+            return
+        if acordar:
+            self._loop.call_soon_threadsafe(self._evento.set)
+        if cheio:
+            self._loop.call_soon_threadsafe(self._cheio.set)
+
+    def _retirar(self):
+        with self._trava:
+            linhas = list(self._linhas)
+            self._linhas.clear()
+            for canais, parcial in self._parcial.items():
+                linhas.append((canais, parcial))
+                self.recebidas += 1
+            self._parcial.clear()
+            descartadas, self._descartadas_lote = self._descartadas_lote, {}
+            self._aguardando = False
+        return linhas, descartadas
+
+    async def _enviar_pendentes(self) -> None:
+        linhas, descartadas = self._retirar()
+        # Um frame por conjunto de canais, mantendo a ordem das linhas de cada um
+        por_canais: Dict[Tuple[str, ...], List[str]] = {}
+        for canais, linha in linhas:
+            if linha.strip():
+                por_canais.setdefault(canais, []).append(linha)
+        # O aviso de descarte vai para os canais das linhas descartadas
+        for canais, quantidade in descartadas.items():
+            por_canais.setdefault(canais, []).insert(0, f"⚠️ {quantidade} linhas de log descartadas (fila cheia)")
+
+        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+        for canais, texto in por_canais.items():
+            for inicio in range(0, len(texto), self.max_linhas_frame):
+                bloco = texto[inicio:inicio + self.max_linhas_frame]
+                self.frames += 1
+                try:
+                    await self.enviar({
+                        "type": "agent_log",
+                        "data": {
+                            "message": "\n".join(bloco) + "\n",
+                            "timestamp": timestamp,
+                            "raw_terminal": True,
+                            "lines": len(bloco)
+                        }
+                    }, canais)
+                except Exception as e:
+                    logger.warning(f"Falha ao enviar logs pelo WebSocket: {e}")
+
+    async def _consumir(self) -> None:
+        while True:
+            await self._evento.wait()
+            self._evento.clear()
+            # Janela curta para juntar as linhas escritas em sequência em um só frame
+            # (ou até acumular `max_linhas_frame` linhas)
+            try:
+                await asyncio.wait_for(self._cheio.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._cheio.clear()
+            await self._enviar_pendentes()
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {"recebidas": self.recebidas, "descartadas": self.descartadas,
+                "frames": self.frames, "na_fila": len(self._linhas)}
@@ -0,0 +1,383 @@
+"""
+Planejador das consultas estruturadas (`models/consulta.py`).
+
+Executa uma ou mais `ConsultaSpec` sobre os DataFrames de cabeçalhos e itens:
+
+    1. filtra a tabela (cada conjunto de filtros é avaliado uma vez);
+    2. agrupa pelas dimensões e período, calculando em um único groupby todas
+       as medidas pedidas pelas consultas com o mesmo agrupamento;
+    3. ordena e aplica o top-k de cada consulta.
+
+Filtros e agregações ficam em cache no planejador (os `max_cache` mais
+recentes), então perguntas repetidas ou compostas (ex.: maiores fornecedores
+em valor e em número de notas) reaproveitam as mesmas varreduras.
+
+Com um cubo de agregados (`utils/aggregate_cube.py`), o agrupamento sai do
+menor rollup que cobre a consulta, sem varrer os dados brutos; consultas que
+nenhum rollup cobre seguem pelos frames completos.
+"""
+import json
+import time
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from models.consulta import (COLUNA_DATA, DIMENSOES, METRICAS, PERIODOS, ConsultaSpec, Filtro,
+                             coluna_do_campo)
+from models.notas_fiscais import COLUNAS_CENTAVOS, centavos_para_reais
+from utils.aggregate_cube import CuboAgregados, Rollup, nome_medida
+
+# Nome da métrica -> função do pandas (contagens de linhas e de notas distintas à parte)
+FUNCOES = {"soma": "sum", "media": "mean", "min": "min", "max": "max", "contagem": "count"}
+METRICAS_MONETARIAS = ("valor", "valor_unitario")  # "valor" em centavos, "valor_unitario" em reais
+COLUNAS_CNPJ = ("CPF/CNPJ Emitente", "CNPJ DESTINATÁRIO")
+MAX_LINHAS_TEXTO = 50
+MAX_CACHE = 64
+
+Agregacao = Tuple[Optional[str], str]  # (coluna, função); coluna None conta linhas
+
+
+class ResultadoConsulta(BaseModel):
+    """Tabela final de uma consulta, com as linhas filtradas e o total de grupos antes do top-k"""
+    consulta: ConsultaSpec
+    tabela: pd.DataFrame
+    linhas_filtradas: int
+    total_grupos: int
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+def _agregacao(consulta: ConsultaSpec, metrica: str, agregacao: str) -> Agregacao:
+    coluna = METRICAS[consulta.tabela][metrica][0]
+    if coluna is None:
+        return None, "size"
+    if metrica == "notas":
+        return coluna, "nunique"
+    return coluna, FUNCOES[agregacao]
+
+
+def _nome_agregacao(agregacao: Agregacao) -> str:
+    return nome_medida(*agregacao)
+
+
+def _por_distintos(serie: pd.Series, condicao: Callable[[pd.Series], pd.Series]) -> np.ndarray:
+    """Avalia a condição só nos valores distintos (nomes, UFs e CNPJs se repetem muito)"""
+    codigos, distintos = pd.factorize(serie)
+    if len(distintos) == 0:
+        return np.zeros(len(serie), dtype=bool)
+    aceitos = np.append(np.asarray(condicao(pd.Series(distintos)), dtype=bool), False)
+    return aceitos[codigos]  # código -1 (nulo) cai no False acrescentado
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    return serie.astype(str).str.strip().str.casefold()
+
+
+def _digitos(valor) -> str:
+    return "".join(caractere for caractere in str(valor) if caractere.isdigit())
+
+
+def _mascara(serie: pd.Series, filtro: Filtro, coluna: str) -> np.ndarray:
+    operador, valor = filtro.operador, filtro.valor
+
+    if coluna == COLUNA_DATA:
+        datas = pd.to_datetime(serie, errors='coerce').dt.normalize()
+        if operador == "entre":
+            inicio, fim = (pd.Timestamp(v).normalize() for v in valor)
+            return ((datas >= inicio) & (datas <= fim)).to_numpy()
+        if operador == "em":
+            return datas.isin([pd.Timestamp(v).normalize() for v in valor]).to_numpy()
+        valor = pd.Timestamp(valor).normalize()
+        serie = datas
+    elif pd.api.types.is_numeric_dtype(serie):
+        # Valores monetários estão em centavos; o filtro chega em reais
+        converter = (lambda v: round(float(v) * 100)) if coluna in COLUNAS_CENTAVOS else float
+        if operador == "entre":
+            return serie.between(converter(valor[0]), converter(valor[1])).fillna(False).to_numpy(dtype=bool)
+        if operador == "em":
+            return serie.isin([converter(v) for v in valor]).fillna(False).to_numpy(dtype=bool)
+        if operador == "contem":
+            raise ValueError(f"o operador 'contem' não se aplica ao campo numérico {filtro.campo}")
+        valor = converter(valor)
+    else:
+        # Texto: sem diferenciar maiúsculas; CNPJs comparados só pelos dígitos
+        normalizar = (lambda s: s.astype(str).str.replace(r'\D', '', regex=True)) if coluna in COLUNAS_CNPJ else _texto
+        normalizar_valor = _digitos if coluna in COLUNAS_CNPJ else (lambda v: str(v).strip().casefold())
+        if operador == "contem":
+            termo = normalizar_valor(valor)
+            return _por_distintos(serie, lambda s: normalizar(s).str.contains(termo, regex=False))
+        if operador == "em":
+            termos = {normalizar_valor(v) for v in valor}
+            return _por_distintos(serie, lambda s: normalizar(s).isin(termos))
+        if operador == "entre":
+            inicio, fim = normalizar_valor(valor[0]), normalizar_valor(valor[1])
+            return _por_distintos(serie, lambda s: normalizar(s).between(inicio, fim))
+        termo = normalizar_valor(valor)
+        comparacoes = {"=": "__eq__", "!=": "__ne__", ">": "__gt__", ">=": "__ge__", "<": "__lt__", "<=": "__le__"}
+        return _por_distintos(serie, lambda s: getattr(normalizar(s), comparacoes[operador])(termo))
+
+    comparacoes = {"=": serie == valor, "!=": serie != valor, ">": serie > valor,
+                   ">=": serie >= valor, "<": serie < valor, "<=": serie <= valor}
+    return comparacoes[operador].fillna(False).to_numpy(dtype=bool)
+
+
+def _aplicar_filtros(frame: pd.DataFrame, consulta: ConsultaSpec) -> pd.DataFrame:
+    mascara = np.ones(len(frame), dtype=bool)
+    for filtro in consulta.filtros:
+        coluna = coluna_do_campo(filtro.campo)
+        if coluna not in frame.columns:
+            raise ValueError(f"Coluna {coluna} (filtro {filtro.campo}) não existe na tabela {consulta.tabela}")
+        mascara &= _mascara(frame[coluna], filtro, coluna)
+    return frame if mascara.all() else frame[mascara]
+
+
+def _chave_periodo(datas: pd.Series, periodo: str) -> pd.Series:
+    return pd.to_datetime(datas, errors='coerce').dt.to_period(PERIODOS[periodo]).astype(str).rename("periodo")
+
+
+def _agrupar_rollup(rollup: Rollup, consulta: ConsultaSpec, colunas: Tuple[str, ...], periodo: Optional[str],
+                    agregacoes: set) -> Tuple[pd.DataFrame, int]:
+    """
+    Reagrega as medidas de um rollup: somas e contagens somam, mínimos e máximos
+    se combinam e a média sai de soma / contagem.
+    """
+    frame = _aplicar_filtros(rollup.frame, consulta)
+    linhas_col = nome_medida(None, "size")
+    nomeadas = {}
+    for coluna, funcao in agregacoes:
+        nome = nome_medida(coluna, funcao)
+        if coluna is None:
+            nomeadas[nome] = (linhas_col, "sum")
+        elif funcao == "mean":
+            nomeadas[nome + "#soma"] = (nome_medida(coluna, "sum"), "sum")
+            nomeadas[nome + "#contagem"] = (nome_medida(coluna, "count"), "sum")
+        elif funcao in ("min", "max"):
+            nomeadas[nome] = (nome, funcao)
+        else:
+            nomeadas[nome] = (nome, "sum")  # sum, count e nunique (notas distintas por dia)
+
+    chaves = [frame[coluna] for coluna in colunas]
+    if periodo:
+        chaves.append(_chave_periodo(frame[COLUNA_DATA], periodo))
+    if chaves:
+        agregado = frame.groupby(chaves, dropna=False, observed=True, sort=False).agg(**nomeadas).reset_index()
+    else:
+        agregado = pd.DataFrame({nome: [getattr(frame[origem], funcao)()]
+                                 for nome, (origem, funcao) in nomeadas.items()})
+
+    for coluna, funcao in agregacoes:
+        if funcao == "mean":
+            nome = nome_medida(coluna, funcao)
+            contagem = agregado.pop(nome + "#contagem").astype(float)
+            agregado[nome] = agregado.pop(nome + "#soma").astype(float) / contagem.where(contagem > 0)
+    return agregado, int(frame[linhas_col].sum())
+
+
+class PlanejadorConsultas:
+    """
+    Executa consultas estruturadas sobre os DataFrames da sessão
+    (`{"cabecalho": df, "itens": df}`), com cache de filtros e agregações
+    e, se houver, respondendo pelo cubo de agregados.
+    """
+
+    def __init__(self, frames: Dict[str, Optional[pd.DataFrame]], max_cache: int = MAX_CACHE,
+                 cubo: Optional[CuboAgregados] = None):
+        self.frames = frames
+        self.max_cache = max_cache
+        self.cubo = cubo
+        self._filtrados: Dict[Tuple, pd.DataFrame] = {}
+        # chave do agrupamento -> (agregações calculadas, resultado, linhas filtradas)
+        self._agregados: Dict[Tuple, Tuple[FrozenSet[Agregacao], pd.DataFrame, int]] = {}
+        self.varreduras = 0
+        self.agrupamentos = 0
+        self.agrupamentos_cubo = 0
+        self.tempo_ms = 0.0
+
+    def executar(self, consultas: Sequence[ConsultaSpec]) -> List[ResultadoConsulta]:
+        inicio = time.perf_counter()
+        # Uma passada de agregação por agrupamento, com a união das medidas das consultas
+        pendentes: Dict[Tuple, Tuple[ConsultaSpec, set]] = {}
+        for consulta in consultas:
+            self._frame(consulta.tabela)
+            pendentes.setdefault(self._chave_grupo(consulta), (consulta, set()))[1].update(
+                _agregacao(consulta, medida.metrica, medida.agregacao) for medida in consulta.medidas
+            )
+        for chave, (consulta, agregacoes) in pendentes.items():
+            self._agrupar(chave, agregacoes, consulta)
+
+        resultados = [self._resultado(consulta) for consulta in consultas]
+        self.tempo_ms += (time.perf_counter() - inicio) * 1000
+        return resultados
+
+    def estatisticas(self) -> Dict[str, float]:
+        return {"varreduras": self.varreduras, "agrupamentos": self.agrupamentos,
+                "agrupamentos_cubo": self.agrupamentos_cubo, "tempo_ms": round(self.tempo_ms, 1)}
+
+    def _guardar(self, cache: dict, chave: Tuple, valor) -> None:
+        """Guarda no cache descartando as entradas mais antigas além de `max_cache`"""
+        cache.pop(chave, None)
+        cache[chave] = valor
+        while len(cache) > self.max_cache:
+            del cache[next(iter(cache))]
+
+    def _frame(self, tabela: str) -> pd.DataFrame:
+        frame = self.frames.get(tabela)
+        if frame is None:
+            raise ValueError(f"Tabela {tabela} não está disponível no dataset")
+        return frame
+
+    @staticmethod
+    def _chave_filtros(consulta: ConsultaSpec) -> str:
+        filtros = [json.dumps(filtro.dict(), ensure_ascii=False, sort_keys=True, default=str)
+                   for filtro in consulta.filtros]
+        return "[" + ",".join(sorted(filtros)) + "]"
+
+    def _chave_grupo(self, consulta: ConsultaSpec) -> Tuple:
+        return (consulta.tabela, self._chave_filtros(consulta),
+                tuple(consulta.colunas_agrupamento()), consulta.periodo)
+
+    def _filtrar(self, tabela: str, filtros: str, consulta: ConsultaSpec) -> pd.DataFrame:
+        chave = (tabela, filtros)
+        if chave not in self._filtrados:
+            self.varreduras += 1
+            self._guardar(self._filtrados, chave, _aplicar_filtros(self._frame(tabela), consulta))
+        return self._filtrados[chave]
+
+    def _agrupar(self, chave: Tuple, agregacoes: set, consulta: ConsultaSpec) -> Tuple[pd.DataFrame, int]:
+        tabela, filtros, colunas, periodo = chave
+        em_cache = self._agregados.get(chave)
+        if em_cache is not None and agregacoes <= em_cache[0]:
+            return em_cache[1], em_cache[2]
+        if em_cache is not None:
+            agregacoes = agregacoes | em_cache[0]
+
+        rollup = None
+        if self.cubo is not None:
+            rollup = self.cubo.escolher(tabela, colunas, [coluna_do_campo(f.campo) for f in consulta.filtros],
+                                        agregacoes)
+        if rollup is not None:
+            agregado, linhas = _agrupar_rollup(rollup, consulta, colunas, periodo, agregacoes)
+            self.agrupamentos += 1
+            self.agrupamentos_cubo += 1
+            self._guardar(self._agregados, chave, (frozenset(agregacoes), agregado, linhas))
+            return agregado, linhas
+
+        frame = self._filtrar(tabela, filtros, consulta)
+        for coluna in set(colunas) | {coluna for coluna, _ in agregacoes if coluna}:
+            if coluna not in frame.columns:
+                raise ValueError(f"Coluna {coluna} não existe na tabela {tabela}")
+
+        chaves = [frame[coluna] for coluna in colunas]
+        if periodo:
+            chaves.append(_chave_periodo(frame[COLUNA_DATA], periodo))
+
+        if chaves:
+            # `size` precisa de uma coluna de referência; qualquer uma serve
+            referencia = colunas[0] if colunas else COLUNA_DATA
+            nomeadas = {_nome_agregacao(a): (a[0] or referencia, a[1]) for a in agregacoes}
+            agregado = frame.groupby(chaves, dropna=False, observed=True, sort=False).agg(**nomeadas).reset_index()
+        else:
+            agregado = pd.DataFrame({
+                _nome_agregacao(a): [len(frame) if a[0] is None else getattr(frame[a[0]], a[1])()]
+                for a in agregacoes
+            })
+        self.agrupamentos += 1
+        self._guardar(self._agregados, chave, (frozenset(agregacoes), agregado, len(frame)))
+        return agregado, len(frame)
+
+    def _resultado(self, consulta: ConsultaSpec) -> ResultadoConsulta:
+        chave = self._chave_grupo(consulta)
+        agregacoes = {_agregacao(consulta, medida.metrica, medida.agregacao) for medida in consulta.medidas}
+        agregado, linhas = self._agrupar(chave, agregacoes, consulta)
+
+        colunas = list(consulta.colunas_agrupamento()) + (["periodo"] if consulta.periodo else [])
+        tabela = agregado[colunas].copy()
+        for medida in consulta.medidas:
+            tabela[medida.coluna_resultado] = agregado[
+                _nome_agregacao(_agregacao(consulta, medida.metrica, medida.agregacao))
+            ].to_numpy()
+
+        ordenar_por = consulta.ordenar_por or consulta.medidas[0].coluna_resultado
+        if ordenar_por in DIMENSOES:
+            ordenar_por = DIMENSOES[ordenar_por][0][0]
+        if consulta.periodo and not consulta.ordenar_por and not consulta.dimensoes:
+            ordenar_por, crescente = "periodo", True  # série temporal em ordem cronológica
+        else:
+            crescente = consulta.ordem == "asc"
+        tabela = tabela.sort_values(ordenar_por, ascending=crescente, kind="stable", na_position="last")
+
+        total_grupos = len(tabela)
+        if consulta.top_k:
+            tabela = tabela.head(consulta.top_k)
+        return ResultadoConsulta(consulta=consulta, tabela=tabela.reset_index(drop=True),
+                                 linhas_filtradas=linhas, total_grupos=total_grupos)
+
+
+def formatar_reais(centavos) -> str:
+    """Valor em centavos exibido em reais (a única conversão para reais acontece na exibição)"""
+    if pd.isna(centavos):
+        return "R$ -"
+    return f"R$ {centavos_para_reais(centavos):,.2f}"
+
+
+def formatar_cnpj(cnpj) -> str:
+    texto = str(cnpj)
+    if len(texto) == 14 and texto.isdigit():
+        return f"{texto[:2]}.{texto[2:5]}.{texto[5:8]}/{texto[8:12]}-{texto[12:14]}"
+    return texto
+
+
+def _descrever(consulta: ConsultaSpec) -> str:
+    if consulta.titulo:
+        return consulta.titulo
+    medidas = ", ".join(medida.coluna_resultado for medida in consulta.medidas)
+    grupos = " e ".join(consulta.dimensoes + ([f"período ({consulta.periodo})"] if consulta.periodo else []))
+    return f"{medidas} por {grupos}" if grupos else medidas
+
+
+def _formatar_valor(consulta: ConsultaSpec, coluna: str, valor) -> str:
+    if pd.isna(valor):
+        return "-"
+    medida = next(medida for medida in consulta.medidas if medida.coluna_resultado == coluna)
+    if medida.agregacao == "contagem":
+        return f"{int(valor):,}"
+    if METRICAS[consulta.tabela][medida.metrica][0] in COLUNAS_CENTAVOS:
+        return formatar_reais(valor)
+    if medida.metrica in METRICAS_MONETARIAS:
+        return f"R$ {float(valor):,.2f}"
+    return f"{float(valor):,.2f}"
+
+
+def formatar_resultados(resultados: Sequence[ResultadoConsulta]) -> str:
+    """Texto markdown dos resultados, com nomes e CNPJs reais, para os agentes seguintes"""
+    partes = []
+    for resultado in resultados:
+        consulta = resultado.consulta
+        texto = f"📊 **{_descrever(consulta)}** (tabela {consulta.tabela})\n"
+        if consulta.filtros:
+            filtros = "; ".join(f"{f.campo} {f.operador} {f.valor}" for f in consulta.filtros)
+            texto += f"🔎 Filtros: {filtros}\n"
+        texto += f"📋 {resultado.linhas_filtradas:,} registros considerados, {resultado.total_grupos:,} grupo(s)\n"
+
+        colunas_medidas = [medida.coluna_resultado for medida in consulta.medidas]
+        for posicao, linha in enumerate(resultado.tabela.head(MAX_LINHAS_TEXTO).itertuples(index=False), 1):
+            valores = dict(zip(resultado.tabela.columns, linha))
+            rotulos = []
+            for dimensao in consulta.dimensoes:
+                colunas = DIMENSOES[dimensao][0]
+                rotulo = f"**{valores[colunas[0]]}**"
+                if len(colunas) > 1:
+                    rotulo += f" ({formatar_cnpj(valores[colunas[1]])})"
+                rotulos.append(rotulo)
+            if consulta.periodo:
+                rotulos.append(str(valores["periodo"]))
+            medidas = " | ".join(f"{coluna}: {_formatar_valor(consulta, coluna, valores[coluna])}"
+                                 for coluna in colunas_medidas)
+            texto += f"   {posicao}. {' · '.join(rotulos) + ' - ' if rotulos else ''}{medidas}\n"
+        if len(resultado.tabela) > MAX_LINHAS_TEXTO:
+            texto += f"   … mais {len(resultado.tabela) - MAX_LINHAS_TEXTO} linha(s)\n"
+        partes.append(texto)
+    return "\n".join(partes)
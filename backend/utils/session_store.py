@@ -0,0 +1,228 @@
+"""
+Armazenamento em memória das sessões de análise.
+
+Cada sessão ganha um id UUID e guarda um dicionário com o seu estado
+(workspace, perfil do dataset, instância da crew...). O armazenamento limita
+o que o servidor acumula ao longo do tempo:
+
+    TTL        sessões sem acesso há mais de `ttl_segundos` expiram
+    memória    acima de `max_memoria_mb`, as menos usadas recentemente saem (LRU)
+    quantidade no máximo `max_sessoes` sessões
+
+Sessões em uso por uma execução (`ocupada`) nunca são removidas por TTL ou
+LRU. `ao_remover` é chamado para cada sessão removida, fora da trava, para
+liberar recursos como o workspace em disco.
+"""
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+MB = 1024 * 1024
+
+# Não pertencem à sessão: módulos, classes e funções são compartilhados pelo processo
+_NAO_PERCORRIDOS = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+# Objetos aninhados além disso contam só pelo `sys.getsizeof`
+_PROFUNDIDADE_MAXIMA = 64
+
+
+def _atributos(valor: Any) -> List[Any]:
+    """Valores em `__dict__` e `__slots__` de um objeto (instâncias de classes Python)"""
+    atributos = list(getattr(valor, "__dict__", {}).values())
+    for classe in type(valor).__mro__:
+        for nome in getattr(classe, "__slots__", ()):
+            if nome not in ("__dict__", "__weakref__") and hasattr(valor, nome):
+                atributos.append(getattr(valor, nome))
+    return atributos
+
+
+def estimar_bytes(valor: Any, _vistos: Optional[set] = None, _profundidade: int = 0) -> int:
+    """
+    Tamanho aproximado de um valor em memória: recursivo em coleções e nos atributos
+    de objetos (a instância da crew guarda frames e ferramentas), `memory_usage` para
+    DataFrames, `nbytes` para arrays e tabelas; o resto pelo `sys.getsizeof`.
+    """
+    vistos = set() if _vistos is None else _vistos
+    if id(valor) in vistos or isinstance(valor, _NAO_PERCORRIDOS):
+        return 0
+    vistos.add(id(valor))
+
+    if hasattr(valor, "memory_usage") and callable(valor.memory_usage):
+        try:
+            return int(valor.memory_usage(deep=True).sum())
+        except Exception:
+            pass
+    if isinstance(getattr(valor, "nbytes", None), int):
+        return valor.nbytes
+    tamanho = sys.getsizeof(valor)
+    if _profundidade >= _PROFUNDIDADE_MAXIMA or isinstance(valor, (str, bytes, bytearray)):
+        return tamanho
+    proximo = _profundidade + 1
+    if isinstance(valor, dict):
+        tamanho += sum(estimar_bytes(chave, vistos, proximo) + estimar_bytes(item, vistos, proximo)
+                       for chave, item in valor.items())
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        tamanho += sum(estimar_bytes(item, vistos, proximo) for item in valor)
+    else:
+        tamanho += sum(estimar_bytes(atributo, vistos, proximo) for atributo in _atributos(valor))
+    return tamanho
+
+
+class SessionStore:
+    """
+    Sessões com expiração por inatividade e orçamento de memória (LRU).
+
+    `obter` renova o último acesso da sessão; `atualizar` altera campos e
+    recalcula o tamanho estimado, aplicando os limites.
+    """
+
+    def __init__(self, ttl_segundos: float = 3600, max_memoria_mb: float = 512, max_sessoes: int = 100,
+                 ao_remover: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 ocupada: Optional[Callable[[str], bool]] = None,
+                 relogio: Callable[[], float] = time.monotonic):
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = int(max_memoria_mb * MB)
+        self.max_sessoes = max_sessoes
+        self.ao_remover = ao_remover
+        self.ocupada = ocupada
+        self.relogio = relogio
+        # Da menos para a mais recentemente usada
+        self._sessoes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._acessos: Dict[str, float] = {}
+        self._tamanhos: Dict[str, int] = {}
+        self._trava = threading.RLock()
+        self.criadas = 0
+        self.expiradas = 0
+        self.removidas_por_limite = 0
+
+    def __len__(self) -> int:
+        return len(self._sessoes)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.obter(session_id) is not None
+
+    def criar(self, dados: Dict[str, Any], prefixo: str = "session_") -> str:
+        session_id = f"{prefixo}{uuid.uuid4().hex}"
+        with self._trava:
+            self._sessoes[session_id] = dados
+            self._acessos[session_id] = self.relogio()
+            self._tamanhos[session_id] = estimar_bytes(dados)
+            self.criadas += 1
+            removidas = self._aplicar_limites(preservar=session_id)
+        self._notificar(removidas)
+        return session_id
+
+    def obter(self, session_id: str) -> Optional[Dict[str, Any]]:
+        removidas: List[Tuple[str, Dict[str, Any]]] = []
+        with self._trava:
+            dados = self._sessoes.get(session_id)
+            if dados is not None:
+                if self._expirada(session_id) and not self._em_uso(session_id):
+                    removidas.append((session_id, self._retirar(session_id)))
+                    self.expiradas += 1
+                    dados = None
+                else:
+                    self._tocar(session_id)
+        self._notificar(removidas)
+        return dados
+
+    def atualizar(self, session_id: str, **campos: Any) -> bool:
+        with self._trava:
+            dados = self._sessoes.get(session_id)
+            if dados is None:
+                return False
+            dados.update(campos)
+            self._tamanhos[session_id] = estimar_bytes(dados)
+            self._tocar(session_id)
+            removidas = self._aplicar_limites(preservar=session_id)
+        self._notificar(removidas)
+        return True
+
+    def remover(self, session_id: str) -> bool:
+        with self._trava:
+            if session_id not in self._sessoes:
+                return False
+            dados = self._retirar(session_id)
+        self._notificar([(session_id, dados)])
+        return True
+
+    def limpar_expiradas(self) -> int:
+        """Remove as sessões inativas há mais que o TTL (exceto as em uso)"""
+        with self._trava:
+            expiradas = [
+                session_id for session_id in self._sessoes
+                if self._expirada(session_id) and not self._em_uso(session_id)
+            ]
+            removidas = [(session_id, self._retirar(session_id)) for session_id in expiradas]
+            self.expiradas += len(removidas)
+        self._notificar(removidas)
+        return len(removidas)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._trava:
+            agora = self.relogio()
+            return {
+                "sessoes": len(self._sessoes),
+                "memoria_mb": round(sum(self._tamanhos.values()) / MB, 2),
+                "max_memoria_mb": round(self.max_bytes / MB, 2),
+                "max_sessoes": self.max_sessoes,
+                "ttl_segundos": self.ttl_segundos,
+                "mais_antiga_inativa_s": round(max((agora - acesso for acesso in self._acessos.values()), default=0), 1),
+                "criadas": self.criadas,
+                "expiradas": self.expiradas,
+                "removidas_por_limite": self.removidas_por_limite
+            }
+
+    def _tocar(self, session_id: str) -> None:
+        self._acessos[session_id] = self.relogio()
+        self._sessoes.move_to_end(session_id)
+
+    def _expirada(self, session_id: str) -> bool:
+        return self.relogio() - self._acessos[session_id] > self.ttl_segundos
+
+    def _em_uso(self, session_id: str) -> bool:
+        if self.ocupada is None:
+            return False
+        try:
+            return self.ocupada(session_id)
+        except Exception:
+            return True
+
+    def _retirar(self, session_id: str) -> Dict[str, Any]:
+        self._acessos.pop(session_id, None)
+        self._tamanhos.pop(session_id, None)
+        return self._sessoes.pop(session_id)
+
+    def _aplicar_limites(self, preservar: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Remove as sessões menos usadas até caber nos limites (chamado com a trava)"""
+        removidas = []
+        total = sum(self._tamanhos.values())
+        for session_id in list(self._sessoes):
+            if total <= self.max_bytes and len(self._sessoes) <= self.max_sessoes:
+                break
+            if session_id == preservar or self._em_uso(session_id):
+                continue
+            total -= self._tamanhos[session_id]
+            removidas.append((session_id, self._retirar(session_id)))
+            self.removidas_por_limite += 1
+        if total > self.max_bytes or len(self._sessoes) > self.max_sessoes:
+            logger.warning(f"⚠️ Sessões acima do limite ({total / MB:.1f} MB, {len(self._sessoes)} sessões): "
+                           f"as restantes estão em uso")
+        return removidas
+
+    def _notificar(self, removidas: List[Tuple[str, Dict[str, Any]]]) -> None:
+        for session_id, dados in removidas:
+            logger.info(f"🧹 Sessão {session_id} removida da memória")
+            if self.ao_remover is None:
+                continue
+            try:
+                self.ao_remover(session_id, dados)
+            except Exception as e:
+                logger.warning(f"Falha ao liberar recursos da sessão {session_id}: {e}")
@@ -0,0 +1,284 @@
+"""
+Armazenamento de uploads endereçado por conteúdo (SHA-256).
+
+O hash é calculado enquanto o arquivo é recebido, sem reler o arquivo depois.
+Cada conteúdo é guardado uma única vez em:
+
+    <raiz>/<sha256>/<nome original>
+    <raiz>/<sha256>/_upload.json
+    <raiz>/<sha256>/dados/notasfiscais/     (dataset validado e perfil)
+
+Reenviar o mesmo arquivo devolve a entrada existente, com o dataset já
+validado, de modo que o processamento pode ir direto para as perguntas.
+
+Uploads grandes podem ser enviados em partes: o arquivo parcial fica em
+`<raiz>/.tmp/upload_<upload_id>` e o envio continua do último byte gravado.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from utils.columnar_dataset import DIRETORIO_DATASET, carregar_perfil
+from utils.exceptions import FileProcessingError, SecurityError, DataIntegrityError, UploadOffsetError
+
+ARQUIVO_METADADOS = "_upload.json"
+SUBDIRETORIO_DADOS = os.path.join("dados", "notasfiscais")
+PADRAO_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+PADRAO_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+BLOCO_LEITURA = 1024 * 1024
+
+
+class EntradaUpload(BaseModel):
+    """Arquivo armazenado e o diretório de dados associado ao seu conteúdo."""
+    sha256: str
+    nome_arquivo: str
+    tamanho: int
+    caminho_arquivo: str
+    diretorio_dados: str
+    criado_em: datetime
+    duplicado: bool = Field(False, description="O conteúdo já existia no armazenamento")
+
+
+class GravadorUpload:
+    """
+    Recebe um upload em blocos, calculando o SHA-256 e verificando o limite de
+    tamanho a cada bloco. O arquivo só entra no armazenamento em `finalizar`.
+
+    O arquivo parcial e seus metadados ficam em `.tmp/` com o `upload_id`, de modo
+    que o envio pode ser retomado a partir de `tamanho` (inclusive após reiniciar
+    o servidor, quando o hash é recalculado a partir do que já foi gravado).
+    """
+
+    def __init__(self, store: "UploadStore", nome_arquivo: str, limite_bytes: Optional[int] = None,
+                 tamanho_esperado: Optional[int] = None, sha256_esperado: Optional[str] = None,
+                 upload_id: Optional[str] = None):
+        self.store = store
+        self.nome_arquivo = nome_seguro(nome_arquivo)
+        self.limite_bytes = limite_bytes
+        self.tamanho_esperado = tamanho_esperado
+        self.sha256_esperado = sha256_esperado.lower() if sha256_esperado else None
+        self.upload_id = upload_id or uuid.uuid4().hex
+        self.caminho_temporario = str(store.diretorio_temporario / f"upload_{self.upload_id}")
+        self.caminho_metadados = self.caminho_temporario + ".json"
+        self.tamanho = 0
+        self._hash = hashlib.sha256()
+        self._trava = threading.Lock()
+
+        if upload_id is None:
+            if tamanho_esperado is not None and limite_bytes is not None and tamanho_esperado > limite_bytes:
+                raise FileProcessingError(
+                    f"Arquivo muito grande: mais de {limite_bytes} bytes",
+                    file_path=self.nome_arquivo,
+                    file_size=tamanho_esperado
+                )
+            self._arquivo = open(self.caminho_temporario, 'xb')
+            with open(self.caminho_metadados, 'w', encoding='utf-8') as arquivo:
+                json.dump(self._metadados(), arquivo)
+        else:
+            self._arquivo = open(self.caminho_temporario, 'r+b')
+            while bloco := self._arquivo.read(BLOCO_LEITURA):
+                self._hash.update(bloco)
+                self.tamanho += len(bloco)
+
+    def _metadados(self) -> dict:
+        return {
+            "nome_arquivo": self.nome_arquivo,
+            "limite_bytes": self.limite_bytes,
+            "tamanho_esperado": self.tamanho_esperado,
+            "sha256_esperado": self.sha256_esperado,
+        }
+
+    def escrever(self, bloco: bytes, offset: Optional[int] = None) -> int:
+        """
+        Acrescenta um bloco ao arquivo. Com `offset`, o bloco só é aceito se
+        começar exatamente onde o arquivo parcial termina.
+
+        Returns:
+            Total de bytes recebidos até agora
+        """
+        with self._trava:
+            if offset is not None and offset != self.tamanho:
+                raise UploadOffsetError(
+                    f"Bloco fora de ordem: esperado offset {self.tamanho}, recebido {offset}",
+                    expected_offset=self.tamanho,
+                    file_path=self.nome_arquivo
+                )
+            limite = min(
+                (valor for valor in (self.limite_bytes, self.tamanho_esperado) if valor is not None),
+                default=None
+            )
+            if limite is not None and self.tamanho + len(bloco) > limite:
+                self.descartar()
+                raise FileProcessingError(
+                    f"Arquivo muito grande: mais de {limite} bytes",
+                    file_path=self.nome_arquivo,
+                    file_size=self.tamanho + len(bloco)
+                )
+            self._arquivo.write(bloco)
+            self._hash.update(bloco)
+            self.tamanho += len(bloco)
+            return self.tamanho
+
+    def finalizar(self) -> EntradaUpload:
+        """
+        Confere tamanho e SHA-256 declarados e move o arquivo para o armazenamento.
+        Um upload incompleto continua retomável; um hash divergente descarta o arquivo.
+        """
+        with self._trava:
+            if self.tamanho_esperado is not None and self.tamanho != self.tamanho_esperado:
+                raise FileProcessingError(
+                    f"Upload incompleto: {self.tamanho} de {self.tamanho_esperado} bytes recebidos",
+                    file_path=self.nome_arquivo,
+                    received_bytes=self.tamanho
+                )
+            sha256 = self._hash.hexdigest()
+            if self.sha256_esperado and sha256 != self.sha256_esperado:
+                self.descartar()
+                raise DataIntegrityError(
+                    "SHA-256 do arquivo recebido não confere com o informado",
+                    expected_checksum=self.sha256_esperado,
+                    actual_checksum=sha256
+                )
+            self._arquivo.close()
+            self.store._esquecer(self.upload_id)
+            if os.path.exists(self.caminho_metadados):
+                os.unlink(self.caminho_metadados)
+            return self.store.registrar(self.caminho_temporario, sha256, self.nome_arquivo, self.tamanho)
+
+    def descartar(self) -> None:
+        self._arquivo.close()
+        self.store._esquecer(self.upload_id)
+        for caminho in (self.caminho_temporario, self.caminho_metadados):
+            if os.path.exists(caminho):
+                os.unlink(caminho)
+
+
+def nome_seguro(nome_arquivo: str) -> str:
+    """Mantém só o nome base do arquivo enviado, sem diretórios."""
+    nome = Path(nome_arquivo or "").name.strip()
+    return nome if nome not in ("", ".", "..") else "upload"
+
+
+class UploadStore:
+    """Uploads deduplicados pelo SHA-256 do conteúdo."""
+
+    def __init__(self, raiz: Union[str, Path]):
+        self.raiz = Path(raiz)
+        self.diretorio_temporario = self.raiz / ".tmp"
+        self.diretorio_temporario.mkdir(parents=True, exist_ok=True)
+        self._pendentes: Dict[str, GravadorUpload] = {}
+        self._trava = threading.Lock()
+
+    def novo_upload(self, nome_arquivo: str, limite_bytes: Optional[int] = None,
+                    tamanho_esperado: Optional[int] = None,
+                    sha256_esperado: Optional[str] = None) -> GravadorUpload:
+        gravador = GravadorUpload(self, nome_arquivo, limite_bytes, tamanho_esperado, sha256_esperado)
+        with self._trava:
+            self._pendentes[gravador.upload_id] = gravador
+        return gravador
+
+    def retomar_upload(self, upload_id: str) -> Optional[GravadorUpload]:
+        """Upload em andamento pelo seu id, reabrindo o arquivo parcial se preciso; None se não existir."""
+        if not PADRAO_UPLOAD_ID.match(upload_id):
+            return None
+        with self._trava:
+            gravador = self._pendentes.get(upload_id)
+            if gravador is None:
+                caminho_metadados = self.diretorio_temporario / f"upload_{upload_id}.json"
+                try:
+                    with open(caminho_metadados, 'r', encoding='utf-8') as arquivo:
+                        metadados = json.load(arquivo)
+                    gravador = GravadorUpload(self, upload_id=upload_id, **metadados)
+                except (OSError, ValueError):
+                    return None
+                self._pendentes[upload_id] = gravador
+        return gravador
+
+    def _esquecer(self, upload_id: str) -> None:
+        with self._trava:
+            self._pendentes.pop(upload_id, None)
+
+    def _diretorio(self, sha256: str) -> Path:
+        if not PADRAO_SHA256.match(sha256):
+            raise SecurityError("Identificador de upload inválido", file_id=sha256[:80])
+        return self.raiz / sha256
+
+    def registrar(self, caminho_temporario: str, sha256: str, nome_arquivo: str, tamanho: int) -> EntradaUpload:
+        """Move o arquivo recebido para o armazenamento ou o descarta se o conteúdo já existe."""
+        existente = self.obter(sha256)
+        if existente is not None:
+            os.unlink(caminho_temporario)
+            return existente.copy(update={"duplicado": True})
+
+        diretorio = self._diretorio(sha256)
+        try:
+            diretorio.mkdir()
+        except FileExistsError:
+            # Outro upload do mesmo conteúdo terminou ao mesmo tempo e ainda está gravando os metadados
+            os.unlink(caminho_temporario)
+            existente = self.obter(sha256)
+            if existente is None:
+                raise FileProcessingError("Upload concorrente do mesmo arquivo em andamento", file_path=nome_arquivo)
+            return existente.copy(update={"duplicado": True})
+
+        caminho_arquivo = diretorio / nome_arquivo
+        os.replace(caminho_temporario, caminho_arquivo)
+        entrada = EntradaUpload(
+            sha256=sha256,
+            nome_arquivo=nome_arquivo,
+            tamanho=tamanho,
+            caminho_arquivo=str(caminho_arquivo.absolute()),
+            diretorio_dados=str((diretorio / SUBDIRETORIO_DADOS).absolute()),
+            criado_em=datetime.now()
+        )
+        (diretorio / SUBDIRETORIO_DADOS).mkdir(parents=True, exist_ok=True)
+        with open(diretorio / ARQUIVO_METADADOS, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(entrada.json(exclude={"duplicado"}))
+        return entrada
+
+    def obter(self, sha256: str) -> Optional[EntradaUpload]:
+        """Entrada de um conteúdo já armazenado ou None (também para identificadores que não são SHA-256)."""
+        if not PADRAO_SHA256.match(sha256):
+            return None
+        try:
+            with open(self._diretorio(sha256) / ARQUIVO_METADADOS, 'r', encoding='utf-8') as arquivo:
+                return EntradaUpload(**json.load(arquivo))
+        except (OSError, ValueError):
+            return None
+
+    def remover(self, sha256: str) -> None:
+        shutil.rmtree(self._diretorio(sha256), ignore_errors=True)
+
+    def publicar_dados(self, sha256: str, diretorio_dados: Union[str, Path]) -> bool:
+        """
+        Copia o dataset validado em um workspace de sessão para o diretório de dados do
+        conteúdo, onde reenvios do mesmo arquivo o encontram. Mantém o dataset já
+        publicado se ele tiver um perfil válido.
+
+        Returns:
+            True se o dataset foi publicado
+        """
+        entrada = self.obter(sha256)
+        origem = Path(diretorio_dados) / DIRETORIO_DATASET
+        if entrada is None or carregar_perfil(diretorio_dados) is None:
+            return False
+
+        destino = Path(entrada.diretorio_dados) / DIRETORIO_DATASET
+        temporario = destino.with_name(f"{DIRETORIO_DATASET}.{uuid.uuid4().hex}")
+        shutil.copytree(origem, temporario)
+        with self._trava:
+            if carregar_perfil(entrada.diretorio_dados) is not None:
+                shutil.rmtree(temporario, ignore_errors=True)
+                return False
+            shutil.rmtree(destino, ignore_errors=True)
+            os.replace(temporario, destino)
+        return True
@@ -0,0 +1,383 @@
+"""
+Canais do WebSocket por sessão, job e arquivo.
+
+Cada cliente assina tópicos (`job:<id>`, `session:<id>`, `file:<sha256>` ou
+`*` para todos) e recebe apenas os eventos desses tópicos. O envio para um
+cliente passa por uma fila própria, limitada, esvaziada por uma tarefa
+escritora: `broadcast` só enfileira, então um navegador lento não atrasa os
+jobs nem os outros clientes, e o custo depende apenas dos assinantes do
+tópico.
+
+Os tópicos de um evento podem ser informados no `broadcast` ou herdados do
+contexto da tarefa (`definir_canais`/`adicionar_canal`), de modo que o código
+de um job não precisa repassá-los a cada chamada.
+
+Os frames vão em JSON ou, se o cliente pedir na conexão e o pacote msgpack
+estiver instalado, em MessagePack binário.
+
+Cada evento publicado recebe um número de sequência (`seq`) e fica guardado em
+memória, nos últimos `max_eventos` de cada tópico. Um cliente que reconecta no
+meio de um job assina os tópicos informando o último `seq` recebido e recebe
+os eventos perdidos antes dos novos, sem reler logs do disco. O mesmo fluxo
+pode ser consumido por Server-Sent Events (`CanalSSE`), que retoma pelo
+cabeçalho Last-Event-ID.
+"""
+import asyncio
+import contextvars
+import json
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.logger import setup_logger
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+logger = setup_logger()
+
+TODOS = "*"
+CODIFICACAO_PADRAO = "json"
+TIPOS_DESCARTAVEIS = ("agent_log", "log")
+
+_canais: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("canais_websocket", default=())
+
+
+def definir_canais(*topicos: str) -> None:
+    """Tópicos dos eventos emitidos pela tarefa atual (e pelas threads que ela inicia com to_thread)"""
+    _canais.set(tuple(topicos))
+
+
+def adicionar_canal(topico: str) -> None:
+    if topico not in _canais.get():
+        _canais.set(_canais.get() + (topico,))
+
+
+def canais_atuais() -> Tuple[str, ...]:
+    return _canais.get()
+
+
+def negociar_codificacao(pedida: Optional[str]) -> str:
+    """Codificação dos frames pedida na conexão: `msgpack` (binário, se instalado) ou JSON"""
+    if pedida == "msgpack" and MSGPACK_AVAILABLE:
+        return "msgpack"
+    return CODIFICACAO_PADRAO
+
+
+class ClienteWebSocket:
+    """
+    Conexão com a sua fila de envio.
+
+    Com a fila cheia, um log novo é juntado ao último log pendente; outros
+    eventos abrem espaço juntando logs pendentes consecutivos ou, se não houver,
+    descartando o log mais antigo. Se só houver eventos que não podem ser
+    descartados, o cliente é desconectado.
+    """
+
+    def __init__(self, websocket, max_fila: int = 1000, timeout_envio: float = 5.0,
+                 codificacao: str = CODIFICACAO_PADRAO):
+        self.websocket = websocket
+        self.codificacao = codificacao
+        self.max_fila = max_fila
+        self.timeout_envio = timeout_envio
+        self.topicos: Set[str] = set()
+        self.descartadas = 0
+        self._fila: Deque[dict] = deque()
+        self._evento = asyncio.Event()
+        self._escritor: Optional[asyncio.Task] = None
+        self.ativo = True
+
+    def iniciar(self) -> None:
+        self._escritor = asyncio.create_task(self._escrever())
+
+    def fechar(self) -> None:
+        """Para de aceitar eventos; o escritor termina depois de enviar o que já está na fila"""
+        self.ativo = False
+        self._evento.set()
+
+    async def encerrar(self) -> None:
+        self.ativo = False
+        if self._escritor is not None:
+            self._escritor.cancel()
+            await asyncio.gather(self._escritor, return_exceptions=True)
+
+    def enfileirar(self, mensagem: dict) -> bool:
+        """Enfileira sem esperar; False se o cliente não acompanha mais o fluxo"""
+        if not self.ativo:
+            return False
+        if len(self._fila) >= self.max_fila:
+            if self._fila[-1].get("type") == "agent_log" and mensagem.get("type") == "agent_log":
+                self._fila[-1] = self._juntar(self._fila[-1], mensagem)
+                return True
+            if not (self._juntar_pendentes() or self._descartar_log()):
+                self.fechar()
+                return False
+        self._fila.append(mensagem)
+        self._evento.set()
+        return True
+
+    @staticmethod
+    def _juntar(primeira: dict, segunda: dict) -> dict:
+        """Um único frame com o texto dos dois logs (e o `seq` do mais novo)"""
+        dados = dict(primeira["data"])
+        dados["message"] = dados.get("message", "") + segunda["data"].get("message", "")
+        juntado = {**primeira, "data": dados}
+        if "seq" in segunda:
+            juntado["seq"] = segunda["seq"]
+        return juntado
+
+    def _juntar_pendentes(self) -> bool:
+        """Abre espaço juntando os dois primeiros logs consecutivos, sem perder texto"""
+        for indice in range(len(self._fila) - 1):
+            if self._fila[indice].get("type") == self._fila[indice + 1].get("type") == "agent_log":
+                self._fila[indice] = self._juntar(self._fila[indice], self._fila[indice + 1])
+                del self._fila[indice + 1]
+                return True
+        return False
+
+    def _descartar_log(self) -> bool:
+        for indice, pendente in enumerate(self._fila):
+            if pendente.get("type") in TIPOS_DESCARTAVEIS:
+                del self._fila[indice]
+                self.descartadas += 1
+                return True
+        return False
+
+    async def _escrever(self) -> None:
+        try:
+            while self.ativo or self._fila:
+                if not self._fila:
+                    self._evento.clear()
+                    if not self.ativo:
+                        break
+                    await self._evento.wait()
+                    continue
+                mensagem = self._fila.popleft()
+                if self.codificacao == "msgpack":
+                    envio = self.websocket.send_bytes(msgpack.packb(mensagem, use_bin_type=True))
+                else:
+                    envio = self.websocket.send_json(mensagem)
+                await asyncio.wait_for(envio, timeout=self.timeout_envio)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Removendo conexão lenta ou morta: {e}")
+        finally:
+            self.ativo = False
+
+
+Registro = Tuple[int, Tuple[str, ...], dict]
+
+
+class HistoricoEventos:
+    """
+    Buffers circulares com os últimos eventos de cada tópico.
+
+    Os eventos são numerados por uma sequência única do servidor, de modo que
+    um cliente com vários tópicos retoma de um só número. Guarda no máximo
+    `max_topicos` tópicos (os usados há mais tempo saem primeiro); os eventos
+    são compartilhados entre os tópicos, sem cópia.
+    """
+
+    def __init__(self, max_eventos: int = 1000, max_topicos: int = 64):
+        self.max_eventos = max_eventos
+        self.max_topicos = max_topicos
+        # Identifica esta execução do servidor: após um reinício a sequência recomeça
+        self.fluxo = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._topicos: "OrderedDict[str, Deque[Registro]]" = OrderedDict()
+        self._todos: Deque[Registro] = deque(maxlen=max_eventos)
+        # Último `seq` que saiu de cada buffer (e dos tópicos removidos)
+        self._descartado_ate: Dict[str, int] = {}
+        self._removido_ate = 0
+
+    def registrar(self, evento: dict, topicos: Tuple[str, ...]) -> dict:
+        """Numera o evento e o guarda nos buffers dos seus tópicos"""
+        self.seq += 1
+        numerado = {**evento, "seq": self.seq}
+        registro = (self.seq, topicos, numerado)
+        self._guardar(TODOS, self._todos, registro)
+        for topico in set(topicos) - {TODOS}:
+            buffer = self._topicos.get(topico)
+            if buffer is None:
+                buffer = self._topicos[topico] = deque(maxlen=self.max_eventos)
+                while len(self._topicos) > self.max_topicos:
+                    removido, antigo = self._topicos.popitem(last=False)
+                    self._descartado_ate.pop(removido, None)
+                    self._removido_ate = max(self._removido_ate, antigo[-1][0] if antigo else 0)
+            else:
+                self._topicos.move_to_end(topico)
+            self._guardar(topico, buffer, registro)
+        return numerado
+
+    def _guardar(self, topico: str, buffer: Deque[Registro], registro: Registro) -> None:
+        if len(buffer) == buffer.maxlen:
+            self._descartado_ate[topico] = buffer[0][0]
+        buffer.append(registro)
+
+    def desde(self, seq: int, topicos: Iterable[str],
+              excluir: Iterable[str] = ()) -> Tuple[List[dict], bool]:
+        """
+        Eventos dos tópicos com número maior que `seq`, em ordem, sem os que
+        também pertencem a `excluir` (já entregues ao cliente). O segundo valor
+        é False se parte dos eventos pedidos já saiu dos buffers.
+        """
+        topicos, excluir = set(topicos), set(excluir)
+        if TODOS in excluir:
+            return [], True
+        if TODOS in topicos:
+            buffers, topicos = [(TODOS, self._todos)], {TODOS}
+        else:
+            buffers = [(topico, self._topicos.get(topico)) for topico in topicos]
+
+        completo = True
+        registros: Dict[int, Registro] = {}
+        for topico, buffer in buffers:
+            if buffer is None:
+                completo = completo and seq >= self._removido_ate
+                continue
+            completo = completo and seq >= self._descartado_ate.get(topico, 0)
+            for registro in reversed(buffer):
+                if registro[0] <= seq:
+                    break
+                registros[registro[0]] = registro
+        eventos = [
+            evento for numero, topicos_evento, evento in sorted(registros.values(), key=lambda r: r[0])
+            if not excluir.intersection(topicos_evento)
+        ]
+        return eventos, completo
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {"seq": self.seq, "topicos": len(self._topicos),
+                "eventos": len({registro[0] for buffer in self._topicos.values() for registro in buffer})}
+
+
+def formatar_sse(mensagem: dict) -> str:
+    """Evento no formato text/event-stream; o `seq` vira o id usado no Last-Event-ID"""
+    linhas = []
+    if "seq" in mensagem:
+        linhas.append(f"id: {mensagem['seq']}")
+    linhas.append(f"data: {json.dumps(mensagem, ensure_ascii=False)}")
+    return "\n".join(linhas) + "\n\n"
+
+
+class CanalSSE:
+    """
+    Resposta Server-Sent Events no papel do websocket de um ClienteWebSocket:
+    os eventos passam pela mesma fila limitada e pelas mesmas regras de
+    backpressure, e `eventos` entrega o texto a ser transmitido.
+    """
+
+    def __init__(self, intervalo_ping: float = 15.0, retry_ms: int = 3000):
+        self.intervalo_ping = intervalo_ping
+        self.retry_ms = retry_ms
+        self._saida: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_json(self, mensagem: dict) -> None:
+        await self._saida.put(mensagem)
+
+    async def eventos(self, cliente: ClienteWebSocket) -> AsyncIterator[str]:
+        yield f"retry: {self.retry_ms}\n\n"
+        while cliente.ativo or not self._saida.empty():
+            try:
+                mensagem = await asyncio.wait_for(self._saida.get(), timeout=self.intervalo_ping)
+            except asyncio.TimeoutError:
+                # Comentário SSE: mantém proxies e o navegador com a conexão aberta
+                yield ": ping\n\n"
+                continue
+            yield formatar_sse(mensagem)
+
+
+class ConnectionManager:
+    """Gerencia as conexões, as assinaturas de tópicos e o histórico para retomada"""
+
+    def __init__(self, max_fila_cliente: int = 1000, max_eventos_topico: int = 1000,
+                 max_topicos_historico: int = 64):
+        self.max_fila_cliente = max_fila_cliente
+        self.clientes: Dict[object, ClienteWebSocket] = {}
+        self.assinantes: Dict[str, Set[ClienteWebSocket]] = {}
+        self.historico = HistoricoEventos(max_eventos_topico, max_topicos_historico)
+
+    @property
+    def active_connections(self) -> list:
+        return [websocket for websocket, cliente in self.clientes.items() if cliente.ativo]
+
+    async def connect(self, websocket, topicos: Iterable[str] = (),
+                      codificacao: str = CODIFICACAO_PADRAO) -> ClienteWebSocket:
+        await websocket.accept()
+        cliente = ClienteWebSocket(websocket, self.max_fila_cliente, codificacao=codificacao)
+        cliente.iniciar()
+        self.clientes[websocket] = cliente
+        self.assinar(websocket, topicos)
+        logger.info(f"Nova conexão WebSocket estabelecida. Total: {len(self.clientes)}")
+        return cliente
+
+    def disconnect(self, websocket) -> None:
+        cliente = self.clientes.pop(websocket, None)
+        if cliente is None:
+            return
+        self.cancelar_assinatura(websocket, list(cliente.topicos))
+        cliente.fechar()
+        logger.info(f"Conexão WebSocket encerrada. Total: {len(self.clientes)}")
+
+    def assinar(self, websocket, topicos: Iterable[str], desde: Optional[int] = None) -> Set[str]:
+        """
+        Assina os tópicos. Com `desde`, reenvia antes os eventos guardados desses
+        tópicos com `seq` maior, precedidos de uma mensagem "replay" que informa
+        se o histórico ainda cobria todo o intervalo.
+        """
+        cliente = self.clientes.get(websocket)
+        if cliente is None:
+            return set()
+        anteriores = set(cliente.topicos)
+        novos = [topico for topico in topicos if topico and topico not in anteriores]
+        if desde is not None and novos:
+            eventos, completo = self.historico.desde(desde, novos, excluir=anteriores)
+            cliente.enfileirar({"type": "replay", "topics": sorted(novos), "since": desde,
+                                "events": len(eventos), "complete": completo})
+            for evento in eventos:
+                cliente.enfileirar(evento)
+        for topico in novos:
+            cliente.topicos.add(topico)
+            self.assinantes.setdefault(topico, set()).add(cliente)
+        return cliente.topicos
+
+    def cancelar_assinatura(self, websocket, topicos: Iterable[str]) -> Set[str]:
+        cliente = self.clientes.get(websocket)
+        if cliente is None:
+            return set()
+        for topico in topicos:
+            cliente.topicos.discard(topico)
+            assinantes = self.assinantes.get(topico)
+            if assinantes is not None:
+                assinantes.discard(cliente)
+                if not assinantes:
+                    del self.assinantes[topico]
+        return cliente.topicos
+
+    def destinatarios(self, topicos: Iterable[str]) -> Set[ClienteWebSocket]:
+        """
+        Assinantes dos tópicos mais os de `*`. Um evento sem tópico vai só para
+        os assinantes de `*`: o que deve chegar a todos precisa de um tópico explícito.
+        """
+        destinatarios = set(self.assinantes.get(TODOS, ()))
+        for topico in topicos:
+            destinatarios.update(self.assinantes.get(topico, ()))
+        return destinatarios
+
+    async def broadcast(self, message: dict, topicos: Optional[Iterable[str]] = None):
+        """Numera, guarda e enfileira o evento para os assinantes dos tópicos (ou do contexto atual)"""
+        topicos = tuple(canais_atuais() if topicos is None else topicos)
+        evento = self.historico.registrar(message, topicos)
+        mortos = []
+        for cliente in self.destinatarios(topicos):
+            if not cliente.enfileirar(evento):
+                mortos.append(cliente.websocket)
+        for websocket in mortos:
+            self.disconnect(websocket)
@@ -0,0 +1,136 @@
+"""
+Diretórios de trabalho isolados por sessão de análise.
+
+Cada sessão recebe o seu próprio workspace, de modo que análises simultâneas
+não apagam nem sobrescrevem os dados umas das outras:
+
+    <raiz>/<session_id>/dados/notasfiscais/   (catálogo, CSVs e dataset colunar)
+    <raiz>/<session_id>/saida/                (resposta_final_porta_voz.md e relatórios)
+
+O workspace é removido quando a sessão é encerrada e nenhuma execução o está
+usando mais (contagem de referências).
+"""
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+from pydantic import BaseModel
+
+from utils.exceptions import SecurityError
+
+ARQUIVO_RESPOSTA_FINAL = "resposta_final_porta_voz.md"
+PADRAO_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+
+class Workspace(BaseModel):
+    """Caminhos de trabalho de uma sessão."""
+    session_id: str
+    raiz: str
+    diretorio_dados: str
+    diretorio_saida: str
+
+    @property
+    def resposta_final(self) -> str:
+        return os.path.join(self.diretorio_saida, ARQUIVO_RESPOSTA_FINAL)
+
+
+class WorkspaceManager:
+    """
+    Cria e remove workspaces de sessão.
+
+    `criar` devolve o workspace com uma referência (a da própria sessão);
+    cada execução que usa o workspace chama `adquirir`/`liberar` (ou `em_uso`).
+    `encerrar` solta a referência da sessão; o diretório é apagado quando a
+    contagem chega a zero.
+    """
+
+    def __init__(self, raiz: Union[str, Path]):
+        self.raiz = Path(raiz)
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        self._workspaces: Dict[str, Workspace] = {}
+        self._referencias: Dict[str, int] = {}
+        self._encerrados = set()
+        self._trava = threading.Lock()
+
+    def _diretorio(self, session_id: str) -> Path:
+        if not PADRAO_SESSION_ID.match(session_id):
+            raise SecurityError("Identificador de sessão inválido", session_id=session_id[:80])
+        return self.raiz / session_id
+
+    def criar(self, session_id: str) -> Workspace:
+        diretorio = self._diretorio(session_id)
+        with self._trava:
+            if session_id in self._workspaces:
+                raise ValueError(f"Workspace da sessão {session_id} já existe")
+            workspace = Workspace(
+                session_id=session_id,
+                raiz=str(diretorio.absolute()),
+                diretorio_dados=str((diretorio / "dados" / "notasfiscais").absolute()),
+                diretorio_saida=str((diretorio / "saida").absolute())
+            )
+            os.makedirs(workspace.diretorio_dados, exist_ok=True)
+            os.makedirs(workspace.diretorio_saida, exist_ok=True)
+            self._workspaces[session_id] = workspace
+            self._referencias[session_id] = 1
+        return workspace
+
+    def obter(self, session_id: str) -> Optional[Workspace]:
+        with self._trava:
+            return self._workspaces.get(session_id)
+
+    def adquirir(self, session_id: str) -> Optional[Workspace]:
+        """Registra mais um uso do workspace; None se a sessão não existe ou já foi encerrada."""
+        with self._trava:
+            if session_id not in self._workspaces or session_id in self._encerrados:
+                return None
+            self._referencias[session_id] += 1
+            return self._workspaces[session_id]
+
+    def liberar(self, session_id: str) -> None:
+        with self._trava:
+            if session_id not in self._workspaces:
+                return
+            self._referencias[session_id] -= 1
+            remover = self._referencias[session_id] <= 0
+            if remover:
+                workspace = self._workspaces.pop(session_id)
+                self._referencias.pop(session_id)
+                self._encerrados.discard(session_id)
+        if remover:
+            shutil.rmtree(workspace.raiz, ignore_errors=True)
+
+    def encerrar(self, session_id: str) -> None:
+        """Solta a referência da sessão; o diretório sai quando a última execução terminar."""
+        with self._trava:
+            if session_id not in self._workspaces or session_id in self._encerrados:
+                return
+            self._encerrados.add(session_id)
+        self.liberar(session_id)
+
+    @contextmanager
+    def em_uso(self, session_id: str) -> Iterator[Optional[Workspace]]:
+        workspace = self.adquirir(session_id)
+        try:
+            yield workspace
+        finally:
+            if workspace is not None:
+                self.liberar(session_id)
+
+    def referencias(self, session_id: str) -> int:
+        with self._trava:
+            return self._referencias.get(session_id, 0)
+
+    def limpar_orfaos(self) -> int:
+        """Remove workspaces sem sessão ativa (por exemplo, de uma execução anterior do servidor)."""
+        with self._trava:
+            ativos = set(self._workspaces)
+        removidos = 0
+        for diretorio in self.raiz.iterdir():
+            if diretorio.is_dir() and diretorio.name not in ativos:
+                shutil.rmtree(diretorio, ignore_errors=True)
+                removidos += 1
+        return removidos
@@ -40,8 +40,11 @@ const AnalysisPage = ({ user }) => {
       navigate('/dashboard')
     }
 
-    // Conecta WebSocket para logs em tempo real
+    // Conecta WebSocket para logs em tempo real (apenas os eventos deste arquivo)
     wsManager.connect('ws://localhost:8000/ws')
+    if (savedData) {
+      wsManager.subscribe([`file:${JSON.parse(savedData).file.serverFileId}`])
+    }
     
     // Listener para logs dos agentes
     wsManager.on('agent_log', (data) => {
@@ -131,6 +134,7 @@ const AnalysisPage = ({ user }) => {
         if (response.data.session_id) {
           setSessionId(response.data.session_id)
           setIsSessionReady(true)
+          wsManager.subscribe([`session:${response.data.session_id}`])
           console.log('AnalysisPage: Sessão criada:', response.data.session_id)
         }
       } else {
@@ -10,6 +10,10 @@ class WebSocketManager {
     this.isConnecting = false
     this.heartbeatInterval = null
     this.connectionUrl = null
+    this.topics = new Set()
+    // Último evento recebido, para retomar do ponto certo após reconectar
+    this.lastSeq = null
+    this.stream = null
   }
 
   connect(url = 'ws://localhost:8000/ws') {
@@ -30,6 +34,14 @@ class WebSocketManager {
         this.reconnectAttempts = 0
         this.notifyListeners('connected', true)
         this.startHeartbeat()
+        // Reenvia as assinaturas após reconexão, pedindo os eventos perdidos
+        if (this.topics.size > 0) {
+          const subscription = { type: 'subscribe', topics: [...this.topics] }
+          if (this.lastSeq !== null) {
+            subscription.since = this.lastSeq
+          }
+          this.send(subscription)
+        }
       }
 
       this.ws.onmessage = (event) => {
@@ -40,6 +52,21 @@ class WebSocketManager {
           if (data.type === 'pong') {
             return
           }
+
+          // Na primeira conexão, retoma a partir do momento em que conectou;
+          // se o servidor reiniciou, a numeração dos eventos recomeçou
+          if (data.type === 'connected' && data.stream) {
+            if (this.stream && this.stream !== data.stream) {
+              this.lastSeq = 0
+            } else if (this.lastSeq === null) {
+              this.lastSeq = data.seq ?? null
+            }
+            this.stream = data.stream
+          }
+
+          if (typeof data.seq === 'number' && data.type !== 'connected') {
+            this.lastSeq = Math.max(this.lastSeq ?? 0, data.seq)
+          }
           
           this.notifyListeners('message', data)
           
@@ -77,6 +104,8 @@ class WebSocketManager {
 
   disconnect() {
     this.stopHeartbeat()
+    this.topics.clear()
+    this.lastSeq = null
     if (this.ws) {
       this.ws.close(1000, 'Cliente desconectando')
       this.ws = null
@@ -107,6 +136,22 @@ class WebSocketManager {
     }
   }
 
+  // Assina os eventos de um job, sessão ou arquivo (ex.: 'session:<id>', 'file:<id>').
+  // Com `since` (0 para todo o histórico guardado), recebe antes os eventos já publicados
+  subscribe(topics, { since } = {}) {
+    topics.forEach(topic => this.topics.add(topic))
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.send(since === undefined ? { type: 'subscribe', topics } : { type: 'subscribe', topics, since })
+    }
+  }
+
+  unsubscribe(topics) {
+    topics.forEach(topic => this.topics.delete(topic))
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.send({ type: 'unsubscribe', topics })
+    }
+  }
+
   attemptReconnect() {
     if (this.isConnecting) {
       return